@@ -0,0 +1,36 @@
+"""add frog_gpt_cache_enabled to users
+
+Revision ID: add_frog_gpt_cache_pref
+Revises: add_import_content_hash
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'add_frog_gpt_cache_pref'
+down_revision = 'add_import_content_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    if 'users' not in inspector.get_table_names():
+        return
+    
+    columns = [col['name'] for col in inspector.get_columns('users')]
+    if 'frog_gpt_cache_enabled' not in columns:
+        op.add_column(
+            'users',
+            sa.Column('frog_gpt_cache_enabled', sa.Boolean(), nullable=False, server_default=sa.text('true'), comment='FrogGPT是否使用回答缓存')
+        )
+
+
+def downgrade():
+    try:
+        op.drop_column('users', 'frog_gpt_cache_enabled')
+    except Exception:
+        pass
@@ -0,0 +1,66 @@
+"""add import content hash and row hash index
+
+Revision ID: add_import_content_hash
+Revises: add_order_detail_tasks_table
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+# revision identifiers, used by Alembic.
+revision = 'add_import_content_hash'
+down_revision = 'add_order_detail_tasks_table'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = inspect(op.get_bind())
+    existing_tables = inspector.get_table_names()
+    
+    # 新增导入类型：利润表订单列表
+    # SQLAlchemy按枚举名称存储（create_all创建的类型），历史迁移按枚举值创建，两者都补齐
+    op.execute("ALTER TYPE importtype ADD VALUE IF NOT EXISTS 'ORDER_LIST'")
+    op.execute("ALTER TYPE importtype ADD VALUE IF NOT EXISTS 'order_list'")
+    
+    if 'import_history' in existing_tables:
+        columns = [col['name'] for col in inspector.get_columns('import_history')]
+        if 'file_hash' not in columns:
+            op.add_column('import_history', sa.Column('file_hash', sa.String(64), nullable=True, comment='文件内容SHA-256，用于识别重复上传'))
+        existing_indexes = [idx['name'] for idx in inspector.get_indexes('import_history')]
+        if 'ix_import_history_file_hash' not in existing_indexes:
+            op.create_index('ix_import_history_file_hash', 'import_history', ['file_hash'])
+        # 跨店铺导入（订单列表）没有店铺ID
+        op.alter_column('import_history', 'shop_id', existing_type=sa.Integer(), nullable=True)
+    
+    if 'import_row_hashes' not in existing_tables:
+        op.create_table(
+            'import_row_hashes',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('import_type', sa.String(30), nullable=False, comment='导入类型'),
+            sa.Column('shop_id', sa.Integer(), nullable=False, server_default='0', comment='店铺ID（0表示不区分店铺）'),
+            sa.Column('natural_key', sa.String(255), nullable=False, comment='自然键（order_sn/parent_order_sn/SKU ID）'),
+            sa.Column('row_hash', sa.String(64), nullable=False, comment='行内容SHA-256'),
+            sa.Column('import_id', sa.Integer(), nullable=True, comment='最近一次写入该行的导入记录ID'),
+            sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.text('now()'), comment='更新时间'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('import_type', 'shop_id', 'natural_key', name='uq_import_row_hash_key'),
+            comment='导入行哈希索引，用于增量导入'
+        )
+        op.create_index('ix_import_row_hashes_id', 'import_row_hashes', ['id'])
+
+
+def downgrade():
+    try:
+        op.drop_index('ix_import_row_hashes_id', table_name='import_row_hashes')
+        op.drop_table('import_row_hashes')
+    except Exception:
+        pass
+    try:
+        op.drop_index('ix_import_history_file_hash', table_name='import_history')
+        op.drop_column('import_history', 'file_hash')
+    except Exception:
+        pass
+    # PostgreSQL 不支持删除枚举值，shop_id 可空与新增的枚举值保留
@@ -560,6 +560,7 @@ def get_sales_overview(
     """
     from app.services.unified_statistics import UnifiedStatisticsService
     from app.core.redis_client import RedisClient
+    from app.core.metrics import Metrics
     import hashlib
     from loguru import logger
     
@@ -577,6 +578,7 @@ def get_sales_overview(
     # 如果不需要刷新缓存，尝试从缓存获取
     if not refresh_cache:
         cached_data = RedisClient.get(cache_key)
+        Metrics.record_cache("sales_overview", bool(cached_data))
         if cached_data:
             logger.debug(f"从缓存获取销售统计: {cache_key}")
             return cached_data
@@ -10,17 +10,84 @@ import httpx
 from loguru import logger
 import traceback
 import json
+import time
 
+from app.core.concurrency import run_blocking, loop_lag_monitor
+from app.core.config import settings
 from app.core.database import get_db
+from app.core.auth_cache import principal_cache
 from app.core.security import get_current_user
 from app.models.user import User
 from app.services.frog_gpt_service import frog_gpt_service
+from app.services.frog_gpt_context_service import frog_gpt_context_service
+from app.services.frog_gpt_response_cache import FrogGPTResponseCache
 from app.services.unified_statistics import UnifiedStatisticsService
+from app.services.file_parse_service import FileParseService
 import base64
 import io
+import os
+import tempfile
 
 router = APIRouter(prefix="/frog-gpt", tags=["FrogGPT"])
 
+# 表格类附件：生成画像摘要发送给AI，而不是把全文塞进上下文
+TABULAR_FILE_EXTENSIONS = {'.xlsx', '.xls', '.csv'}
+UPLOAD_READ_BLOCK_SIZE = 1024 * 1024
+
+# 回款相关问题的关键词：命中时在系统上下文中注入回款数据
+PAYMENT_KEYWORDS = ["回款", "回款金额", "回款数据", "回款统计", "未来一周回款", "未来7天回款",
+                    "未来一个月回款", "未来30天回款", "payment collection", "payout"]
+
+
+def _detect_payment_days(user_message: str) -> Optional[int]:
+    """检测用户问题是否涉及回款数据，返回需要注入的回款天数（不涉及时返回None）"""
+    if not any(keyword in user_message for keyword in PAYMENT_KEYWORDS):
+        return None
+    
+    logger.info(f"检测到回款相关问题，注入回款数据: {user_message[:100]}")
+    # 尝试从问题中提取日期范围，默认30天
+    if "一周" in user_message or "7天" in user_message:
+        return 7
+    if "一个月" in user_message or "30天" in user_message:
+        return 30
+    if "两周" in user_message or "14天" in user_message:
+        return 14
+    return 30
+
+
+async def _profile_tabular_file(file: UploadFile) -> str:
+    """
+    将表格附件流式落盘后生成画像（按文件哈希缓存），返回给AI的文本摘要
+    
+    画像在有界线程池中执行，不阻塞事件循环。
+    """
+    suffix = os.path.splitext(file.filename or '')[1].lower()
+    fd, temp_path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                block = await file.read(UPLOAD_READ_BLOCK_SIZE)
+                if not block:
+                    break
+                f.write(block)
+        
+        profile = await run_blocking(FileParseService.profile_file, temp_path)
+        summary = {
+            key: profile.get(key)
+            for key in ('summary', 'rows', 'columns', 'column_names', 'data_types',
+                        'statistics', 'null_counts', 'sample_data', 'truncated')
+        }
+        return (
+            f"[文件: {file.filename}]\n"
+            f"以下为文件的结构与统计画像（样例为随机抽样行）:\n"
+            f"{json.dumps(summary, ensure_ascii=False, default=str)}"
+        )
+    finally:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+
 
 class ChatMessage(BaseModel):
     """聊天消息模型"""
@@ -37,6 +104,7 @@ class ChatRequest(BaseModel):
     include_system_data: bool = True  # 是否包含系统数据上下文
     data_summary_days: Optional[int] = None  # 数据摘要天数，None表示全部时间数据
     shop_id: Optional[int] = None  # 店铺ID（可选，用于筛选数据）
+    use_cache: Optional[bool] = None  # 是否使用回答缓存，None表示按用户偏好设置
 
 
 class ChatResponse(BaseModel):
@@ -46,6 +114,44 @@ class ChatResponse(BaseModel):
     content: str  # 提取的消息内容
     choices: Optional[List[Dict[str, Any]]] = None
     usage: Optional[Dict[str, Any]] = None
+    cached: bool = False  # 是否来自回答缓存
+
+
+class CachePreference(BaseModel):
+    """回答缓存偏好设置"""
+    enabled: bool
+
+
+def _response_cache_target(
+    request: ChatRequest,
+    messages: List[Dict[str, Any]],
+    current_user: User,
+    snapshot_version: Optional[str]
+) -> Optional[tuple]:
+    """
+    确定回答缓存的范围和问题
+    
+    Returns:
+        (scope, prompt)；不使用缓存（全局关闭、用户关闭、上下文获取失败、包含非文本内容）时返回None
+    """
+    if not settings.FROGGPT_RESPONSE_CACHE_ENABLED or snapshot_version is None:
+        return None
+    use_cache = request.use_cache if request.use_cache is not None else getattr(current_user, "frog_gpt_cache_enabled", True)
+    if not use_cache:
+        return None
+    
+    split = FrogGPTResponseCache.split_prompt(messages)
+    if not split:
+        return None
+    prompt, history_digest = split
+    scope = FrogGPTResponseCache.build_scope(
+        model=request.model or frog_gpt_service.default_model,
+        snapshot_version=snapshot_version,
+        history_digest=history_digest,
+        shop_id=request.shop_id,
+        days=request.data_summary_days
+    )
+    return scope, prompt
 
 
 class ModelsResponse(BaseModel):
@@ -71,137 +177,23 @@ async def chat(
         # 构建消息列表
         messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
         
-        # 检测用户问题是否涉及回款数据，如果是则主动查询
+        # 检测用户问题是否涉及回款数据，如果是则注入预计算的回款块
         user_message = next((msg.content for msg in request.messages if msg.role == "user"), "")
-        payment_collection_data = None
+        payment_days = _detect_payment_days(user_message)
         
-        # 检测关键词：回款、回款金额、回款数据、未来一周回款、未来7天回款等
-        payment_keywords = ["回款", "回款金额", "回款数据", "回款统计", "未来一周回款", "未来7天回款", 
-                          "未来一个月回款", "未来30天回款", "payment collection", "payout"]
-        if any(keyword in user_message for keyword in payment_keywords):
-            try:
-                logger.info(f"检测到回款相关问题，主动查询回款数据: {user_message[:100]}")
-                from app.api.analytics import get_payment_collection
-                from datetime import datetime, timedelta
-                
-                # 解析日期范围（尝试从问题中提取，否则使用默认值）
-                days = 30  # 默认30天
-                if "一周" in user_message or "7天" in user_message:
-                    days = 7
-                elif "一个月" in user_message or "30天" in user_message:
-                    days = 30
-                elif "两周" in user_message or "14天" in user_message:
-                    days = 14
-                
-                # 调用回款API获取数据
-                payment_collection_data = get_payment_collection(
-                    shop_ids=[request.shop_id] if request.shop_id else None,
-                    days=days,
-                    db=db,
-                    current_user=current_user
-                )
-                logger.info(f"成功获取回款数据: summary.total_amount={payment_collection_data.get('summary', {}).get('total_amount', 0)}")
-            except Exception as e:
-                logger.warning(f"获取回款数据失败: {e}")
-                logger.debug(traceback.format_exc())
+        # 数据快照版本（回答缓存键的一部分），不包含系统数据时为固定值
+        snapshot_version = None if request.include_system_data else "none"
         
         # 如果需要包含系统数据上下文，在消息前添加系统提示
         if request.include_system_data:
             try:
-                # 使用统一端点逻辑获取系统数据摘要（带缓存，性能更好）
-                from app.api.statistics_unified import get_cached_or_compute, generate_cache_key
-                import json
-                
-                # 如果提供了shop_id，只获取该店铺的数据
-                shop_ids = [request.shop_id] if request.shop_id else None
-                
-                # 构建缓存键
-                params = {
-                    "shop_ids": sorted(shop_ids) if shop_ids else None,
-                    "days": request.data_summary_days,
-                }
-                cache_key = generate_cache_key("summary", params)
-                
-                def compute():
-                    # 解析日期范围
-                    start_dt, end_dt = UnifiedStatisticsService.parse_date_range(
-                        None, None, request.data_summary_days
-                    )
-                    
-                    # 构建查询条件
-                    filters = UnifiedStatisticsService.build_base_filters(
-                        db, start_dt, end_dt, shop_ids, None, None, None
-                    )
-                    
-                    # 计算总览统计
-                    overview = UnifiedStatisticsService.calculate_order_statistics(db, filters)
-                    
-                    # 计算利润率
-                    profit_margin = (
-                        (overview['total_profit'] / overview['total_gmv'] * 100)
-                        if overview['total_gmv'] > 0 else 0
-                    )
-                    
-                    # 获取Top SKU（前10）
-                    top_skus = UnifiedStatisticsService.get_sku_statistics(db, filters, limit=10)
-                    
-                    # 获取Top负责人（前10）
-                    top_managers = UnifiedStatisticsService.get_manager_statistics(db, filters)[:10]
-                    
-                    return {
-                        "overview": {
-                            "total_orders": overview['order_count'],
-                            "total_quantity": overview['total_quantity'],
-                            "total_gmv": round(overview['total_gmv'], 2),
-                            "total_cost": round(overview['total_cost'], 2),
-                            "total_profit": round(overview['total_profit'], 2),
-                            "profit_margin": round(profit_margin, 2),
-                            "delay_rate": round(overview.get('delay_rate', 0), 2),
-                            "delay_count": overview.get('delay_count', 0),
-                        },
-                        "top_skus": top_skus,
-                        "top_managers": top_managers,
-                    }
-                
-                # 获取数据（带缓存）
-                summary_data = get_cached_or_compute(
-                    cache_key,
-                    compute,
-                    ttl=300,  # 5分钟缓存
-                    use_redis=True
+                # 从上下文快照读取（快照的读取/构建在线程池中执行）
+                snapshot = await frog_gpt_context_service.get_snapshot_async(
+                    shop_ids=[request.shop_id] if request.shop_id else None,
+                    days=request.data_summary_days
                 )
-                
-                # 转换为AI模块需要的格式
-                data_summary = {
-                    "overview": summary_data["overview"],
-                    "top_skus": summary_data["top_skus"],
-                    "top_managers": summary_data["top_managers"],
-                }
-                
-                # 构建系统上下文
-                system_context = frog_gpt_service.build_system_context(data_summary, db)
-                
-                # 如果获取了回款数据，添加到系统上下文中
-                if payment_collection_data:
-                    payment_context = "\n\n## 回款数据（已自动查询）\n"
-                    period = payment_collection_data.get('period', {})
-                    payment_context += f"- **查询日期范围**: {period.get('start_date', 'N/A')} 至 {period.get('end_date', 'N/A')}\n"
-                    summary = payment_collection_data.get('summary', {})
-                    payment_context += f"- **总回款金额**: ¥{summary.get('total_amount', 0):,.2f}\n"
-                    payment_context += f"- **总回款订单数**: {summary.get('total_orders', 0)}\n"
-                    
-                    # 添加每日回款数据（最近7天）
-                    table_data = payment_collection_data.get('table_data', [])
-                    if table_data:
-                        payment_context += "\n**最近7天回款明细**（按日期倒序）：\n"
-                        recent_days = table_data[:7]  # 已经是倒序排列
-                        for day_data in recent_days:
-                            date = day_data.get('date', 'N/A')
-                            amount = day_data.get('total', 0)
-                            payment_context += f"- {date}: ¥{amount:,.2f}\n"
-                    
-                    system_context += payment_context
-                    logger.info("已将回款数据注入系统上下文")
+                system_context = frog_gpt_context_service.assemble(snapshot, payment_days)
+                snapshot_version = snapshot.get("version")
                 
                 # 在消息列表前添加系统消息
                 messages.insert(0, {
@@ -213,14 +205,32 @@ async def chat(
                 logger.warning(f"获取系统数据摘要失败，将不包含系统上下文: {e}")
                 logger.debug(traceback.format_exc())
         
+        # 相同数据快照下的相同问题直接返回缓存的回答
+        cache_target = _response_cache_target(request, messages, current_user, snapshot_version)
+        if cache_target:
+            cached = await run_blocking(FrogGPTResponseCache.get, *cache_target)
+            if cached:
+                logger.info(f"FrogGPT回答缓存命中: model={cached.get('model')}, user={current_user.username}")
+                return {
+                    "id": cached.get("id", ""),
+                    "model": cached.get("model") or request.model or "unknown",
+                    "content": cached["content"],
+                    "choices": [{"message": {"role": "assistant", "content": cached["content"]}, "finish_reason": "stop"}],
+                    "usage": cached.get("usage"),
+                    "cached": True,
+                }
+        
         # 检查是否有 API Key
-        api_key = frog_gpt_service.get_api_key(db)
+        api_key = await run_blocking(frog_gpt_service.get_api_key, db)
         if not api_key:
             raise HTTPException(
                 status_code=400,
                 detail="未配置 OpenRouter API Key，请在高级设置中配置 API Key"
             )
         
+        # 长对话按token预算压缩历史（较早的对话替换为缓存的滚动摘要）
+        messages = await frog_gpt_service.compact_messages(messages, model=request.model, db=db)
+        
         # 记录请求信息（用于调试）
         logger.info(f"收到聊天请求: model={request.model}, temperature={request.temperature}, messages_count={len(messages)}, include_system_data={request.include_system_data}")
         
@@ -251,14 +261,22 @@ async def chat(
                         detail="OpenRouter API 返回的内容为空"
                     )
                 
-                # 返回标准化的响应格式
-                return {
+                result = {
                     "id": response.get("id", ""),
                     "model": response.get("model", request.model or "unknown"),
                     "content": content,
                     "choices": response.get("choices", []),
                     "usage": response.get("usage"),
                 }
+                
+                if cache_target:
+                    try:
+                        await run_blocking(FrogGPTResponseCache.set, *cache_target, result)
+                    except Exception as e:
+                        logger.warning(f"写入FrogGPT回答缓存失败: {e}")
+                
+                # 返回标准化的响应格式
+                return result
             else:
                 # 如果没有 choices，尝试直接返回响应或提取错误信息
                 error_message = response.get("error", {}).get("message", "OpenRouter API 返回了无效的响应格式")
@@ -354,167 +372,23 @@ async def chat_stream(
             # 构建消息列表
             messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
             
-            # 检测用户问题是否涉及回款数据，如果是则主动查询
+            # 检测用户问题是否涉及回款数据，如果是则注入预计算的回款块
             user_message = next((msg.content for msg in request.messages if msg.role == "user"), "")
-            payment_collection_data = None
+            payment_days = _detect_payment_days(user_message)
             
-            # 检测关键词：回款、回款金额、回款数据、未来一周回款、未来7天回款等
-            payment_keywords = ["回款", "回款金额", "回款数据", "回款统计", "未来一周回款", "未来7天回款", 
-                              "未来一个月回款", "未来30天回款", "payment collection", "payout"]
-            if any(keyword in user_message for keyword in payment_keywords):
-                try:
-                    logger.info(f"检测到回款相关问题，主动查询回款数据: {user_message[:100]}")
-                    from app.api.analytics import get_payment_collection
-                    from datetime import datetime, timedelta
-                    import asyncio
-                    from concurrent.futures import ThreadPoolExecutor
-                    
-                    # 解析日期范围（尝试从问题中提取，否则使用默认值）
-                    days = 30  # 默认30天
-                    if "一周" in user_message or "7天" in user_message:
-                        days = 7
-                    elif "一个月" in user_message or "30天" in user_message:
-                        days = 30
-                    elif "两周" in user_message or "14天" in user_message:
-                        days = 14
-                    
-                    # 限制最大查询天数为30天，避免查询时间过长
-                    if days > 30:
-                        days = 30
-                    
-                    # 在后台线程中执行数据库查询，避免阻塞异步事件循环
-                    # 注意：需要在后台线程中创建新的数据库会话，因为SQLAlchemy会话不能跨线程使用
-                    try:
-                        from app.core.database import SessionLocal
-                        
-                        def query_payment_collection():
-                            """在后台线程中执行查询，创建新的数据库会话"""
-                            db_session = SessionLocal()
-                            try:
-                                return get_payment_collection(
-                                    shop_ids=[request.shop_id] if request.shop_id else None,
-                                    days=days,
-                                    db=db_session,
-                                    current_user=current_user
-                                )
-                            finally:
-                                db_session.close()
-                        
-                        loop = asyncio.get_event_loop()
-                        with ThreadPoolExecutor(max_workers=1) as executor:
-                            payment_collection_data = await asyncio.wait_for(
-                                loop.run_in_executor(executor, query_payment_collection),
-                                timeout=8.0  # 8秒超时
-                            )
-                        logger.info(f"成功获取回款数据: summary.total_amount={payment_collection_data.get('summary', {}).get('total_amount', 0)}")
-                    except asyncio.TimeoutError:
-                        logger.warning(f"获取回款数据超时（8秒），将跳过回款数据查询")
-                        payment_collection_data = None
-                    except Exception as query_error:
-                        logger.warning(f"获取回款数据失败: {query_error}")
-                        logger.debug(traceback.format_exc())
-                        payment_collection_data = None
-                except Exception as e:
-                    logger.warning(f"获取回款数据失败: {e}")
-                    logger.debug(traceback.format_exc())
-                    # 不抛出异常，继续执行，只是不包含回款数据
-                    payment_collection_data = None
+            # 数据快照版本（回答缓存键的一部分），不包含系统数据时为固定值
+            snapshot_version = None if request.include_system_data else "none"
             
             # 如果需要包含系统数据上下文，在消息前添加系统提示
             if request.include_system_data:
                 try:
-                    # 使用统一端点逻辑获取系统数据摘要（带缓存，性能更好）
-                    from app.api.statistics_unified import get_cached_or_compute, generate_cache_key
-                    
-                    # 如果提供了shop_id，只获取该店铺的数据
-                    shop_ids = [request.shop_id] if request.shop_id else None
-                    
-                    # 构建缓存键
-                    params = {
-                        "shop_ids": sorted(shop_ids) if shop_ids else None,
-                        "days": request.data_summary_days,
-                    }
-                    cache_key = generate_cache_key("summary", params)
-                    
-                    def compute():
-                        # 解析日期范围
-                        start_dt, end_dt = UnifiedStatisticsService.parse_date_range(
-                            None, None, request.data_summary_days
-                        )
-                        
-                        # 构建查询条件
-                        filters = UnifiedStatisticsService.build_base_filters(
-                            db, start_dt, end_dt, shop_ids, None, None, None
-                        )
-                        
-                        # 计算总览统计
-                        overview = UnifiedStatisticsService.calculate_order_statistics(db, filters)
-                        
-                        # 计算利润率
-                        profit_margin = (
-                            (overview['total_profit'] / overview['total_gmv'] * 100)
-                            if overview['total_gmv'] > 0 else 0
-                        )
-                        
-                        # 获取Top SKU（前10）
-                        top_skus = UnifiedStatisticsService.get_sku_statistics(db, filters, limit=10)
-                        
-                        # 获取Top负责人（前10）
-                        top_managers = UnifiedStatisticsService.get_manager_statistics(db, filters)[:10]
-                        
-                        return {
-                            "overview": {
-                                "total_orders": overview['order_count'],
-                                "total_quantity": overview['total_quantity'],
-                                "total_gmv": round(overview['total_gmv'], 2),
-                                "total_cost": round(overview['total_cost'], 2),
-                                "total_profit": round(overview['total_profit'], 2),
-                                "profit_margin": round(profit_margin, 2),
-                                "delay_rate": round(overview.get('delay_rate', 0), 2),
-                                "delay_count": overview.get('delay_count', 0),
-                            },
-                            "top_skus": top_skus,
-                            "top_managers": top_managers,
-                        }
-                    
-                    # 获取数据（带缓存）
-                    summary_data = get_cached_or_compute(
-                        cache_key,
-                        compute,
-                        ttl=300,  # 5分钟缓存
-                        use_redis=True
+                    # 从上下文快照读取（快照的读取/构建在线程池中执行）
+                    snapshot = await frog_gpt_context_service.get_snapshot_async(
+                        shop_ids=[request.shop_id] if request.shop_id else None,
+                        days=request.data_summary_days
                     )
-                    
-                    # 转换为AI模块需要的格式
-                    data_summary = {
-                        "overview": summary_data["overview"],
-                        "top_skus": summary_data["top_skus"],
-                        "top_managers": summary_data["top_managers"],
-                    }
-                    
-                    system_context = frog_gpt_service.build_system_context(data_summary, db=db)
-                    
-                    # 如果获取了回款数据，添加到系统上下文中
-                    if payment_collection_data:
-                        payment_context = "\n\n## 回款数据（已自动查询）\n"
-                        period = payment_collection_data.get('period', {})
-                        payment_context += f"- **查询日期范围**: {period.get('start_date', 'N/A')} 至 {period.get('end_date', 'N/A')}\n"
-                        summary = payment_collection_data.get('summary', {})
-                        payment_context += f"- **总回款金额**: ¥{summary.get('total_amount', 0):,.2f}\n"
-                        payment_context += f"- **总回款订单数**: {summary.get('total_orders', 0)}\n"
-                        
-                        # 添加每日回款数据（最近7天）
-                        table_data = payment_collection_data.get('table_data', [])
-                        if table_data:
-                            payment_context += "\n**最近7天回款明细**（按日期倒序）：\n"
-                            recent_days = table_data[:7]  # 已经是倒序排列
-                            for day_data in recent_days:
-                                date = day_data.get('date', 'N/A')
-                                amount = day_data.get('total', 0)
-                                payment_context += f"- {date}: ¥{amount:,.2f}\n"
-                        
-                        system_context += payment_context
-                        logger.info("已将回款数据注入系统上下文")
+                    system_context = frog_gpt_context_service.assemble(snapshot, payment_days)
+                    snapshot_version = snapshot.get("version")
                     
                     messages.insert(0, {
                         "role": "system",
@@ -523,19 +397,41 @@ async def chat_stream(
                 except Exception as e:
                     logger.warning(f"获取系统数据摘要失败，将不包含系统上下文: {e}")
             
+            # 相同数据快照下的相同问题直接回放缓存的回答
+            cache_target = _response_cache_target(request, messages, current_user, snapshot_version)
+            if cache_target:
+                cached = await run_blocking(FrogGPTResponseCache.get, *cache_target)
+                if cached:
+                    logger.info(f"FrogGPT回答缓存命中（流式回放）: model={cached.get('model')}, user={current_user.username}")
+                    async for chunk in FrogGPTResponseCache.replay_stream(cached):
+                        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    return
+            
             # 检测供应商
             provider = frog_gpt_service._detect_provider_from_model(request.model or frog_gpt_service.default_model)
             
             # 检查是否有 API Key（根据供应商）
-            api_key = frog_gpt_service.get_api_key(db, provider)
+            api_key = await run_blocking(frog_gpt_service.get_api_key, db, provider)
             if not api_key:
                 provider_name = "OpenRouter" if provider == "openrouter" else provider.upper()
                 yield f"data: {json.dumps({'type': 'error', 'error': f'未配置 {provider_name} API Key，请在高级设置中配置 API Key'})}\n\n"
                 return
             
+            # 长对话按token预算压缩历史（较早的对话替换为缓存的滚动摘要）
+            messages = await frog_gpt_service.compact_messages(messages, model=request.model, db=db)
+            
             logger.info(f"收到流式聊天请求: model={request.model}, provider={provider}, temperature={request.temperature}, messages_count={len(messages)}")
             
             # 调用流式方法
+            # 记录数据块间隔和期间的事件循环延迟，用于确认流式输出没有被阻塞调用卡住
+            stream_started = time.monotonic()
+            last_chunk_at = stream_started
+            chunk_count = 0
+            max_chunk_gap = 0.0
+            # 完整收到的回答写入缓存
+            content_parts = []
+            response_meta = {}
+            completed = False
             try:
                 async for chunk in frog_gpt_service.chat_completion_stream(
                     messages=messages,
@@ -544,6 +440,23 @@ async def chat_stream(
                     max_tokens=request.max_tokens,
                     db=db
                 ):
+                    now = time.monotonic()
+                    if chunk_count:
+                        max_chunk_gap = max(max_chunk_gap, now - last_chunk_at)
+                    last_chunk_at = now
+                    chunk_count += 1
+                    if cache_target:
+                        chunk_type = chunk.get("type")
+                        if chunk_type == "content":
+                            content_parts.append(chunk.get("content", ""))
+                            response_meta.setdefault("id", chunk.get("id") or "")
+                            response_meta.setdefault("model", chunk.get("model") or request.model or "")
+                        elif chunk_type == "usage":
+                            response_meta["usage"] = chunk.get("usage")
+                        elif chunk_type == "done":
+                            completed = True
+                        elif chunk_type == "error":
+                            cache_target = None
                     try:
                         # 将数据块转换为 SSE 格式
                         yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
@@ -551,6 +464,23 @@ async def chat_stream(
                         logger.error(f"序列化数据块失败: {e}")
                         # 继续处理下一个数据块
                         continue
+                
+                logger.info(
+                    f"流式响应完成: chunks={chunk_count}, "
+                    f"耗时={time.monotonic() - stream_started:.2f}秒, "
+                    f"最大块间隔={max_chunk_gap * 1000:.0f}ms, "
+                    f"期间最大事件循环延迟={loop_lag_monitor.max_lag_since(stream_started):.0f}ms"
+                )
+                
+                if cache_target and completed and content_parts:
+                    try:
+                        await run_blocking(
+                            FrogGPTResponseCache.set,
+                            *cache_target,
+                            {**response_meta, "content": "".join(content_parts)}
+                        )
+                    except Exception as e:
+                        logger.warning(f"写入FrogGPT回答缓存失败: {e}")
             except Exception as stream_error:
                 logger.error(f"流式响应生成错误: {stream_error}")
                 logger.error(traceback.format_exc())
@@ -618,6 +548,17 @@ async def chat_with_files(
         # 处理文件
         if files:
             for file in files:
+                # 表格文件：生成画像摘要
+                if os.path.splitext(file.filename or '')[1].lower() in TABULAR_FILE_EXTENSIONS:
+                    try:
+                        message_list.append({
+                            "role": "user",
+                            "content": await _profile_tabular_file(file)
+                        })
+                    except Exception as e:
+                        logger.warning(f"解析表格文件失败: {file.filename}, 错误: {e}")
+                    continue
+                
                 # 读取文件内容
                 content = await file.read()
                 
@@ -654,73 +595,11 @@ async def chat_with_files(
         # 如果需要包含系统数据上下文
         if include_system_data:
             try:
-                # 使用统一端点逻辑获取系统数据摘要（带缓存，性能更好）
-                from app.api.statistics_unified import get_cached_or_compute, generate_cache_key
-                
-                # 构建缓存键
-                params = {
-                    "shop_ids": None,
-                    "days": data_summary_days,
-                }
-                cache_key = generate_cache_key("summary", params)
-                
-                def compute():
-                    # 解析日期范围
-                    start_dt, end_dt = UnifiedStatisticsService.parse_date_range(
-                        None, None, data_summary_days
-                    )
-                    
-                    # 构建查询条件
-                    filters = UnifiedStatisticsService.build_base_filters(
-                        db, start_dt, end_dt, None, None, None, None
-                    )
-                    
-                    # 计算总览统计
-                    overview = UnifiedStatisticsService.calculate_order_statistics(db, filters)
-                    
-                    # 计算利润率
-                    profit_margin = (
-                        (overview['total_profit'] / overview['total_gmv'] * 100)
-                        if overview['total_gmv'] > 0 else 0
-                    )
-                    
-                    # 获取Top SKU（前10）
-                    top_skus = UnifiedStatisticsService.get_sku_statistics(db, filters, limit=10)
-                    
-                    # 获取Top负责人（前10）
-                    top_managers = UnifiedStatisticsService.get_manager_statistics(db, filters)[:10]
-                    
-                    return {
-                        "overview": {
-                            "total_orders": overview['order_count'],
-                            "total_quantity": overview['total_quantity'],
-                            "total_gmv": round(overview['total_gmv'], 2),
-                            "total_cost": round(overview['total_cost'], 2),
-                            "total_profit": round(overview['total_profit'], 2),
-                            "profit_margin": round(profit_margin, 2),
-                            "delay_rate": round(overview.get('delay_rate', 0), 2),
-                            "delay_count": overview.get('delay_count', 0),
-                        },
-                        "top_skus": top_skus,
-                        "top_managers": top_managers,
-                    }
-                
-                # 获取数据（带缓存）
-                summary_data = get_cached_or_compute(
-                    cache_key,
-                    compute,
-                    ttl=300,  # 5分钟缓存
-                    use_redis=True
+                # 从上下文快照读取（快照的读取/构建在线程池中执行）
+                system_context = await frog_gpt_context_service.get_system_context(
+                    shop_ids=None,
+                    days=data_summary_days
                 )
-                
-                # 转换为AI模块需要的格式
-                data_summary = {
-                    "overview": summary_data["overview"],
-                    "top_skus": summary_data["top_skus"],
-                    "top_managers": summary_data["top_managers"],
-                }
-                
-                system_context = frog_gpt_service.build_system_context(data_summary, db=db)
                 message_list.insert(0, {
                     "role": "system",
                     "content": system_context
@@ -729,13 +608,16 @@ async def chat_with_files(
                 pass
         
         # 检查是否有 API Key
-        api_key = frog_gpt_service.get_api_key(db)
+        api_key = await run_blocking(frog_gpt_service.get_api_key, db)
         if not api_key:
             raise HTTPException(
                 status_code=400,
                 detail="未配置 OpenRouter API Key，请在高级设置中配置 API Key"
             )
         
+        # 长对话按token预算压缩历史（较早的对话替换为缓存的滚动摘要）
+        message_list = await frog_gpt_service.compact_messages(message_list, model=model, db=db)
+        
         # 调用OpenRouter API（传递db以从数据库读取API key）
         response = await frog_gpt_service.chat_completion(
             messages=message_list,
@@ -800,7 +682,7 @@ async def get_models(
     """
     try:
         # 检查是否有 API Key
-        api_key = frog_gpt_service.get_api_key(db)
+        api_key = await run_blocking(frog_gpt_service.get_api_key, db)
         if not api_key:
             # 如果没有 API Key，返回提示信息
             return {
@@ -816,6 +698,43 @@ async def get_models(
         raise HTTPException(status_code=500, detail=f"获取模型列表失败: {str(e)}")
 
 
+@router.get("/providers/stats")
+def get_provider_stats(current_user: User = Depends(get_current_user)):
+    """
+    获取AI供应商连接池统计
+    
+    包括每个供应商的请求数、失败数、进行中请求数、对冲次数/胜出次数，
+    以及首token耗时和总耗时的P50/P95（毫秒）。
+    """
+    return {
+        "hedge_enabled": settings.AI_HEDGE_ENABLED,
+        "providers": frog_gpt_service.pool.get_all_stats(),
+    }
+
+
+@router.get("/cache/preference", response_model=CachePreference)
+def get_cache_preference(current_user: User = Depends(get_current_user)):
+    """获取当前用户的回答缓存偏好"""
+    return {"enabled": current_user.frog_gpt_cache_enabled}
+
+
+@router.put("/cache/preference", response_model=CachePreference)
+def update_cache_preference(
+    preference: CachePreference,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """设置当前用户是否使用回答缓存（关闭后每次提问都请求模型）"""
+    # current_user 可能来自认证缓存，不属于当前会话，按 id 重新查询后修改
+    user = db.query(User).filter(User.id == current_user.id).first()
+    if user is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    user.frog_gpt_cache_enabled = preference.enabled
+    db.commit()
+    principal_cache.invalidate(user.username)
+    return {"enabled": user.frog_gpt_cache_enabled}
+
+
 @router.get("/data-summary")
 async def get_data_summary_for_ai(
     days: Optional[int] = None,
@@ -890,8 +809,9 @@ async def get_data_summary_for_ai(
                 }
             }
         
-        # 获取数据（带缓存）
-        return get_cached_or_compute(
+        # 获取数据（带缓存，在线程池中执行，不阻塞事件循环）
+        return await run_blocking(
+            get_cached_or_compute,
             cache_key,
             compute,
             ttl=300,  # 5分钟缓存
@@ -1048,7 +968,7 @@ async def verify_api_key(
     
     try:
         if provider == "openrouter":
-            api_key = frog_gpt_service.get_api_key(db)
+            api_key = await run_blocking(frog_gpt_service.get_api_key, db)
             if not api_key:
                 return {
                     "valid": False,
@@ -1108,22 +1028,26 @@ async def update_all_providers_api_keys(
             )
             db.add(config_item)
     
-    # 更新各个供应商的API Key
-    updated_keys = []
-    if config.openrouter:
-        update_or_create_key("openrouter_api_key", config.openrouter, "OpenRouter API密钥")
-        updated_keys.append("OpenRouter")
-    if config.openai:
-        update_or_create_key("openai_api_key", config.openai, "OpenAI API密钥")
-        updated_keys.append("OpenAI")
-    if config.anthropic:
-        update_or_create_key("anthropic_api_key", config.anthropic, "Anthropic API密钥")
-        updated_keys.append("Anthropic")
-    if config.gemini:
-        update_or_create_key("gemini_api_key", config.gemini, "Google Gemini API密钥")
-        updated_keys.append("Gemini")
+    def save_keys() -> List[str]:
+        """更新各个供应商的API Key（在线程池中执行）"""
+        updated_keys = []
+        if config.openrouter:
+            update_or_create_key("openrouter_api_key", config.openrouter, "OpenRouter API密钥")
+            updated_keys.append("OpenRouter")
+        if config.openai:
+            update_or_create_key("openai_api_key", config.openai, "OpenAI API密钥")
+            updated_keys.append("OpenAI")
+        if config.anthropic:
+            update_or_create_key("anthropic_api_key", config.anthropic, "Anthropic API密钥")
+            updated_keys.append("Anthropic")
+        if config.gemini:
+            update_or_create_key("gemini_api_key", config.gemini, "Google Gemini API密钥")
+            updated_keys.append("Gemini")
+        
+        db.commit()
+        return updated_keys
     
-    db.commit()
+    updated_keys = await run_blocking(save_keys)
     
     # 如果更新了 OpenRouter API Key，尝试验证
     if config.openrouter:
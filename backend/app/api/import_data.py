@@ -95,6 +95,8 @@ async def import_orders(
                 message_parts.append(f"新增{created_count}条")
             if updated_count > 0:
                 message_parts.append(f"更新{updated_count}条")
+            if result.skipped_rows:
+                message_parts.append(f"内容未变化跳过{result.skipped_rows}条")
             if message_parts:
                 message = f"订单数据导入完成：{', '.join(message_parts)}"
             else:
@@ -5,7 +5,7 @@ from typing import Optional, List
 from datetime import datetime
 from pydantic import BaseModel
 
-from app.core.database import get_db
+from app.core.database import get_batch_db, get_db
 from app.core.security import get_current_user
 from app.models.user import User
 from app.services.order_cost_service import OrderCostCalculationService
@@ -43,13 +43,14 @@ class DailyCollectionForecast(BaseModel):
 @router.post("/calculate", response_model=CalculateCostResponse)
 async def calculate_order_costs(
     request: CalculateCostRequest,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_batch_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     计算订单成本和利润
     
     将商品列表中的供货价格、成本价格带入到订单列表中，计算每个订单的成本和利润
+    （使用批处理连接池，全量重算不会占用 API 请求的连接）
     """
     try:
         service = OrderCostCalculationService(db)
@@ -2,6 +2,7 @@
 import os
 import shutil
 import re
+import json
 import pandas as pd
 from typing import List, Optional, Dict, Any
 from datetime import datetime
@@ -10,9 +11,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_, text
 
 from app.core.database import get_db
+from app.core.redis_client import RedisClient
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.order import Order
+from app.models.import_history import ImportHistory, ImportType, ImportStatus
+from app.services.import_dedup_service import ImportDedupService
 
 router = APIRouter(prefix="/profit-statement", tags=["利润表"])
 
@@ -20,6 +24,14 @@ router = APIRouter(prefix="/profit-statement", tags=["利润表"])
 UPLOAD_DIR = "/tmp/profit_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# 解析结果缓存时间（秒），按文件内容哈希缓存，相同文件重复上传直接返回
+PARSE_CACHE_TTL = 86400
+
+
+def _parse_cache_key(kind: str, file_hash: str) -> str:
+    """上传文件解析结果的缓存键"""
+    return f"profit_upload:{kind}:{file_hash}"
+
 
 def parse_csv_file(file_path: str) -> pd.DataFrame:
     """解析CSV文件"""
@@ -89,6 +101,12 @@ async def upload_collection_file(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        # 相同内容的文件已解析过，直接返回缓存结果
+        cache_key = _parse_cache_key("collection", ImportDedupService.compute_file_hash(file_path))
+        cached_result = RedisClient.get(cache_key)
+        if isinstance(cached_result, dict):
+            return cached_result
+        
         # 解析文件
         if file.filename.endswith('.csv'):
             df = parse_csv_file(file_path)
@@ -167,12 +185,14 @@ async def upload_collection_file(
         # 转换为列表
         data = list(po_data_map.values())
         
-        return {
+        result = {
             "success": True,
             "message": f"成功解析{len(data)}个PO单号的结算数据",
             "data": data,
             "total": len(data)
         }
+        RedisClient.set(cache_key, result, ttl=PARSE_CACHE_TTL)
+        return result
         
     except HTTPException:
         raise
@@ -210,6 +230,12 @@ async def upload_shipping_file(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        # 相同内容的文件已解析过，直接返回缓存结果
+        cache_key = _parse_cache_key("shipping", ImportDedupService.compute_file_hash(file_path))
+        cached_result = RedisClient.get(cache_key)
+        if isinstance(cached_result, dict):
+            return cached_result
+        
         # 解析文件
         if file.filename.endswith('.csv'):
             df = parse_csv_file(file_path)
@@ -284,12 +310,14 @@ async def upload_shipping_file(
                     item["chargeable_weight"] = chargeable_weight
                 data.append(item)
         
-        return {
+        result = {
             "success": True,
             "message": f"成功解析{len(data)}条头程运费记录",
             "data": data,
             "total": len(data)
         }
+        RedisClient.set(cache_key, result, ttl=PARSE_CACHE_TTL)
+        return result
         
     except HTTPException:
         raise
@@ -327,6 +355,12 @@ async def upload_last_mile_shipping_file(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        # 相同内容的文件已解析过，直接返回缓存结果
+        cache_key = _parse_cache_key("last_mile_shipping", ImportDedupService.compute_file_hash(file_path))
+        cached_result = RedisClient.get(cache_key)
+        if isinstance(cached_result, dict):
+            return cached_result
+        
         # 解析文件
         if file.filename.endswith('.csv'):
             df = parse_csv_file(file_path)
@@ -373,12 +407,14 @@ async def upload_last_mile_shipping_file(
                     "last_mile_cost": last_mile_cost
                 })
         
-        return {
+        result = {
             "success": True,
             "message": f"成功解析{len(data)}条尾程运费记录",
             "data": data,
             "total": len(data)
         }
+        RedisClient.set(cache_key, result, ttl=PARSE_CACHE_TTL)
+        return result
         
     except HTTPException:
         raise
@@ -416,6 +452,12 @@ async def upload_deduction_file(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        # 相同内容的文件已解析过，直接返回缓存结果
+        cache_key = _parse_cache_key("deduction", ImportDedupService.compute_file_hash(file_path))
+        cached_result = RedisClient.get(cache_key)
+        if isinstance(cached_result, dict):
+            return cached_result
+        
         # 解析文件
         if file.filename.endswith('.csv'):
             df = parse_csv_file(file_path)
@@ -479,12 +521,14 @@ async def upload_deduction_file(
                 "deduction": total_deduction
             })
         
-        return {
+        result = {
             "success": True,
             "message": f"成功解析{len(data)}条扣款记录",
             "data": data,
             "total": len(data)
         }
+        RedisClient.set(cache_key, result, ttl=PARSE_CACHE_TTL)
+        return result
         
     except HTTPException:
         raise
@@ -527,6 +571,23 @@ async def upload_order_list_file(
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        # 相同内容的文件已完整处理过（全部匹配并写入），直接返回上次结果
+        dedup_service = ImportDedupService(db)
+        file_hash = dedup_service.compute_file_hash(file_path)
+        previous = dedup_service.find_completed_import(ImportType.ORDER_LIST, file_hash)
+        if previous and previous.success_log:
+            previous_data = json.loads(previous.success_log)
+            return {
+                "success": True,
+                "message": f"文件内容与上次上传相同，已跳过处理（共{previous_data.get('total', 0)}条订单记录）",
+                "data": {
+                    **previous_data,
+                    "updated": 0,
+                    "unchanged": previous_data.get('total', 0),
+                    "duplicate_of": previous.id
+                }
+            }
+        
         # 解析文件
         if file.filename.endswith('.csv'):
             df = parse_csv_file(file_path)
@@ -650,10 +711,19 @@ async def upload_order_list_file(
         # 匹配系统内的订单并更新
         updated_count = 0
         matched_count = 0
+        unchanged_count = 0
         unmatched_orders = []
         
+        # 行内容哈希：与上次成功写入相同的订单记录直接跳过
+        known_hashes = dedup_service.load_row_hashes(ImportType.ORDER_LIST, order_data_map.keys())
+        applied_hashes = {}
+        
         for order_data in order_data_map.values():
             order_sn = order_data['order_sn']
+            row_hash = dedup_service.compute_row_hash(order_data)
+            if known_hashes.get(order_sn) == row_hash:
+                unchanged_count += 1
+                continue
             
             # 查询系统内匹配的订单（优先匹配parent_order_sn，如果没有则匹配order_sn）
             matched_orders = db.query(Order).filter(
@@ -691,6 +761,8 @@ async def upload_order_list_file(
             
             if matched_orders:
                 matched_count += 1
+                # 未匹配的记录不登记哈希，订单同步入库后再次上传仍会处理
+                applied_hashes[order_sn] = row_hash
                 # 更新所有匹配的订单
                 for order in matched_orders:
                     updated = False
@@ -743,6 +815,42 @@ async def upload_order_list_file(
             else:
                 unmatched_orders.append(order_sn)
         
+        # 统计有包裹号数据的记录数
+        records_with_package = sum(1 for order_data in order_data_map.values() if order_data.get('package_sn'))
+        
+        result_data = {
+            "total": len(order_data_map),
+            "matched": matched_count,
+            "updated": updated_count,
+            "unchanged": unchanged_count,
+            "unmatched": len(unmatched_orders),
+            "unmatched_orders": unmatched_orders[:100],  # 只返回前100个未匹配的订单号
+            "has_package_sn_col": package_sn_col is not None,
+            "package_sn_col_name": package_sn_col if package_sn_col else None,  # 返回识别到的包裹号列名
+            "records_with_package": records_with_package,  # 有包裹号数据的记录数
+            "has_address_cols": len(found_address_cols) > 0
+        }
+        
+        # 记录导入历史（文件哈希）和本次写入行的内容哈希
+        # 有未匹配的订单时记为部分成功，相同文件再次上传不会被短路
+        import_record = ImportHistory(
+            shop_id=None,
+            import_type=ImportType.ORDER_LIST,
+            file_name=file.filename,
+            file_size=os.path.getsize(file_path),
+            file_hash=file_hash,
+            total_rows=len(order_data_map),
+            success_rows=matched_count,
+            failed_rows=len(unmatched_orders),
+            skipped_rows=unchanged_count,
+            status=ImportStatus.PARTIAL if unmatched_orders else ImportStatus.SUCCESS,
+            success_log=json.dumps(result_data, ensure_ascii=False),
+            completed_at=datetime.utcnow()
+        )
+        db.add(import_record)
+        db.flush()
+        dedup_service.save_row_hashes(ImportType.ORDER_LIST, applied_hashes, import_record.id)
+        
         # 提交更改
         db.commit()
         
@@ -767,23 +875,13 @@ async def upload_order_list_file(
         if len(unmatched_orders) > 0:
             message_parts.append(f"，{len(unmatched_orders)}条未匹配")
         
-        # 统计有包裹号数据的记录数
-        records_with_package = sum(1 for order_data in order_data_map.values() if order_data.get('package_sn'))
+        if unchanged_count > 0:
+            message_parts.append(f"，{unchanged_count}条内容未变化已跳过")
         
         return {
             "success": True,
             "message": "".join(message_parts),
-            "data": {
-                "total": len(order_data_map),
-                "matched": matched_count,
-                "updated": updated_count,
-                "unmatched": len(unmatched_orders),
-                "unmatched_orders": unmatched_orders[:100],  # 只返回前100个未匹配的订单号
-                "has_package_sn_col": package_sn_col is not None,
-                "package_sn_col_name": package_sn_col if package_sn_col else None,  # 返回识别到的包裹号列名
-                "records_with_package": records_with_package,  # 有包裹号数据的记录数
-                "has_address_cols": len(found_address_cols) > 0
-            }
+            "data": result_data
         }
         
     except HTTPException:
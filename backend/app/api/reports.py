@@ -1,13 +1,15 @@
 """报表API"""
-from typing import Optional
+from typing import List, Optional
 from datetime import date, timedelta
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
+from loguru import logger
 
-from app.core.database import get_db
+from app.core.database import get_db, BatchSessionLocal
 from app.core.security import get_current_user
 from app.models.user import User
 from app.services.report_service import ReportService
+from app.services.report_backfill_service import ReportBackfillService
 
 router = APIRouter(prefix="/reports", tags=["报表"])
 
@@ -156,3 +158,79 @@ def compare_reports(
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+
+def _run_report_backfill(
+    start_date: date,
+    end_date: date,
+    shop_ids: Optional[List[int]],
+    include_rollups: bool,
+    resume: bool
+):
+    """后台执行报表回填（使用独立的批处理数据库会话）"""
+    db = BatchSessionLocal()
+    try:
+        ReportBackfillService(db).run(
+            start_date,
+            end_date,
+            shop_ids=shop_ids,
+            include_rollups=include_rollups,
+            resume=resume
+        )
+    except Exception as e:
+        logger.error(f"报表回填任务失败: {e}")
+    finally:
+        db.close()
+
+
+@router.post("/backfill")
+def backfill_reports(
+    background_tasks: BackgroundTasks,
+    start_date: str = Query(..., description="开始日期 (YYYY-MM-DD)"),
+    end_date: str = Query(..., description="结束日期 (YYYY-MM-DD)"),
+    shop_ids: Optional[List[int]] = Query(None, description="店铺ID列表，默认所有启用的店铺"),
+    include_rollups: bool = Query(True, description="是否由日报汇总生成周报/月报"),
+    resume: bool = Query(True, description="是否从上次中断处继续"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    回填历史报表快照（仅管理员）
+    
+    后台执行，返回任务ID，通过 GET /reports/backfill/{job_id} 查询进度。
+    相同参数重复提交会从上次完成的日期继续，结果幂等；执行进程中断后（进度长时间未刷新）可重新提交继续。
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="仅管理员可以回填报表")
+    
+    try:
+        start_dt = date.fromisoformat(start_date)
+        end_dt = date.fromisoformat(end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"日期格式错误: {str(e)}")
+    
+    if start_dt > end_dt:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+    
+    job_id = ReportBackfillService.make_job_id(start_dt, end_dt, shop_ids, include_rollups)
+    progress = ReportBackfillService.get_progress(job_id)
+    if ReportBackfillService.is_running(progress):
+        return {"job_id": job_id, "started": False, "progress": progress}
+    
+    background_tasks.add_task(
+        _run_report_backfill, start_dt, end_dt, shop_ids, include_rollups, resume
+    )
+    
+    return {"job_id": job_id, "started": True, "progress": progress}
+
+
+@router.get("/backfill/{job_id}")
+def get_backfill_progress(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    查询报表回填进度
+    """
+    progress = ReportBackfillService.get_progress(job_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="回填任务不存在或已过期")
+    return progress
@@ -9,6 +9,7 @@ from loguru import logger
 from app.core.database import get_db
 from app.core.security import get_current_user
 from app.core.redis_client import RedisClient
+from app.core.metrics import Metrics
 from app.services.unified_statistics import UnifiedStatisticsService
 from app.models.user import User
 
@@ -44,6 +45,7 @@ def get_cached_or_compute(
     # 尝试从Redis获取
     if use_redis:
         cached = RedisClient.get(cache_key)
+        Metrics.record_cache("stats:unified", bool(cached))
         if cached:
             logger.debug(f"从Redis缓存获取: {cache_key}")
             return cached
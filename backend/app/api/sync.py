@@ -8,11 +8,12 @@ import json
 from datetime import datetime, timedelta
 from loguru import logger
 
-from app.core.database import get_db
+from app.core.database import WorkerSessionLocal, get_db
 from app.core.security import get_current_user
 from app.models.shop import Shop
 from app.models.user import User
-from app.services.sync_service import sync_shop_data, sync_all_shops, SyncService
+from app.services.sync_service import sync_shop_data, sync_all_shops, SyncService, SYNC_PHASE_LABELS
+from app.core.tracing import tracer
 
 router = APIRouter(prefix="/sync", tags=["sync"])
 
@@ -88,13 +89,15 @@ def _set_sync_progress(shop_id: int, progress_data: Dict[str, Any]):
         _sync_progress[shop_id] = progress_data
 
 
-def _add_sync_log(shop_id: int, log_message: str, log_level: str = "info"):
-    """添加同步日志到Redis或内存（最新的在前）"""
+def _add_sync_log(shop_id: int, log_message: str, log_level: str = "info", extra: Optional[Dict[str, Any]] = None):
+    """添加同步日志到Redis或内存（最新的在前），extra 为附加到日志条目的结构化数据"""
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "level": log_level,
         "message": log_message
     }
+    if extra:
+        log_entry.update(extra)
     
     if _use_redis:
         try:
@@ -142,6 +145,22 @@ def _get_sync_logs(shop_id: int, limit: int = 100) -> List[Dict[str, Any]]:
         return []
 
 
+def _add_sync_trace_log(shop_id: int, summary: Dict[str, Any]):
+    """订单同步的耗时分布写入同步日志（第一行附带完整摘要，供同步状态接口展示瀑布图）"""
+    lines = tracer.format_summary(summary, SYNC_PHASE_LABELS)
+    _add_sync_log(shop_id, "📊 订单同步耗时分布", "info", extra={"trace": summary})
+    for line in lines:
+        _add_sync_log(shop_id, line, "info")
+
+
+def _get_last_sync_trace(shop_id: int) -> Optional[Dict[str, Any]]:
+    """从同步日志中查找最近一次订单同步的耗时分布摘要"""
+    for log_entry in _get_sync_logs(shop_id, limit=1000):
+        if log_entry.get("trace"):
+            return log_entry["trace"]
+    return None
+
+
 def _delete_sync_progress(shop_id: int):
     """删除同步进度和日志"""
     if _use_redis:
@@ -318,10 +337,13 @@ async def sync_shop_products(
                 logger.warning(f"关闭Temu服务时出错: {e}")
 
 
-async def _sync_shop_with_progress(shop_id: int, full_sync: bool, db: Session):
-    """执行同步并更新进度"""
+async def _sync_shop_with_progress(shop_id: int, full_sync: bool, db: Optional[Session] = None):
+    """执行同步并更新进度（未传入会话时使用后台工作连接池的独立会话）"""
     sync_service = None
     start_time = datetime.now()  # 定义开始时间
+    own_session = db is None
+    if own_session:
+        db = WorkerSessionLocal()
     try:
         # 初始化进度
         _set_sync_progress(shop_id, {
@@ -428,6 +450,9 @@ async def _sync_shop_with_progress(shop_id: int, full_sync: bool, db: Session):
             }
             _set_sync_progress(shop_id, current)
         
+        if sync_service.last_trace:
+            _add_sync_trace_log(shop_id, sync_service.last_trace)
+        
         # 同步商品
         current = _get_sync_progress(shop_id)
         current.update({
@@ -548,6 +573,8 @@ async def _sync_shop_with_progress(shop_id: int, full_sync: bool, db: Session):
                 await sync_service.temu_service.close()
             except Exception as e:
                 logger.warning(f"关闭Temu服务时出错: {e}")
+        if own_session:
+            db.close()
 
 
 @router.post("/shops/{shop_id}/all")
@@ -592,8 +619,8 @@ async def sync_shop_all_data(
             }
         }
     
-    # 在后台任务中执行同步
-    background_tasks.add_task(_sync_shop_with_progress, shop_id, full_sync, db)
+    # 在后台任务中执行同步（使用独立会话，不占用请求的连接）
+    background_tasks.add_task(_sync_shop_with_progress, shop_id, full_sync)
     
     return {
         "success": True,
@@ -713,7 +740,7 @@ async def get_sync_status(
     获取店铺的同步状态
     
     Returns:
-        店铺同步信息
+        店铺同步信息，last_sync_trace 为最近一次订单同步的耗时分布（同步日志保留1小时）
     """
     shop = db.query(Shop).filter(Shop.id == shop_id).first()
     if not shop:
@@ -740,5 +767,6 @@ async def get_sync_status(
         "data_count": {
             "orders": order_count,
             "products": product_count
-        }
+        },
+        "last_sync_trace": _get_last_sync_trace(shop_id),
     }
@@ -1,6 +1,7 @@
 """系统配置API"""
-from typing import Dict
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
@@ -115,6 +116,96 @@ def get_scheduler_status(current_user: User = Depends(get_current_user)):
         )
 
 
+@router.get("/event-loop")
+def get_event_loop_status(current_user: User = Depends(get_current_user)):
+    """获取当前工作进程的事件循环延迟和阻塞调用线程池使用情况"""
+    from app.core.concurrency import loop_lag_monitor, get_blocking_pool_stats
+    
+    return {
+        "loop_lag": loop_lag_monitor.get_stats(),
+        "blocking_pool": get_blocking_pool_stats(),
+    }
+
+
+@router.get("/request-metrics")
+def get_request_metrics(current_user: User = Depends(get_current_user)):
+    """获取当前工作进程按路由统计的请求耗时直方图（毫秒）"""
+    from app.core.middleware import request_metrics
+    
+    return request_metrics.snapshot()
+
+
+@router.get("/sql-profile")
+def get_sql_profile(top: int = 20, current_user: User = Depends(get_current_user)):
+    """获取当前工作进程的SQL查询统计：按路由的查询次数和耗时、最耗时的语句、慢查询（含执行计划）和疑似N+1查询（仅管理员）"""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="仅管理员可以查看SQL查询统计")
+    from app.core.query_profiler import query_profiler
+    
+    return query_profiler.snapshot(top=top)
+
+
+@router.post("/profiler/start")
+def start_profiler(
+    seconds: float = Query(30, gt=0, description="分析时长（秒），不超过 PROFILER_MAX_SECONDS"),
+    scope: str = Query("worker", pattern="^(worker|all)$", description="worker: 当前工作进程；all: gunicorn 的所有工作进程"),
+    threads: Optional[List[str]] = Query(None, description="只采样名称以这些前缀开头的线程，如 MainThread、order-detail-worker、scheduler:"),
+    include_idle: bool = Query(False, description="是否计入空闲等待的调用栈"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    开始进程内采样分析（仅管理员）
+    
+    后台采样，立即返回。到期后结果保存为 speedscope 和折叠栈文件，
+    通过 GET /system/profiler/profiles 查看、GET /system/profiler/profiles/{id} 下载。
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="仅管理员可以开启性能分析")
+    from app.core.sampling_profiler import sampling_profiler
+    
+    if scope == "all":
+        batch_id = sampling_profiler.request_all_workers(seconds, threads=threads, include_idle=include_idle)
+        return {"batch_id": batch_id, "scope": scope, "seconds": min(seconds, sampling_profiler.max_seconds)}
+    session = sampling_profiler.start("manual", seconds, threads=threads, include_idle=include_idle)
+    return {"id": session.id, "scope": scope, "seconds": min(seconds, sampling_profiler.max_seconds)}
+
+
+@router.get("/profiler/profiles")
+def list_profiles(current_user: User = Depends(get_current_user)):
+    """采样分析结果列表（所有工作进程，按开始时间倒序，仅管理员）"""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="仅管理员可以查看性能分析结果")
+    from app.core.sampling_profiler import sampling_profiler
+    
+    return sampling_profiler.list_profiles()
+
+
+@router.get("/profiler/profiles/{profile_id}")
+def download_profile(
+    profile_id: str,
+    format: str = Query("speedscope", pattern="^(speedscope|folded)$", description="speedscope: speedscope.app 打开；folded: flamegraph.pl 折叠栈"),
+    current_user: User = Depends(get_current_user)
+):
+    """下载采样分析结果（仅管理员）"""
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="仅管理员可以下载性能分析结果")
+    from app.core.sampling_profiler import FORMATS, sampling_profiler
+    
+    path = sampling_profiler.get_profile_path(profile_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="分析结果不存在或尚未完成")
+    media_type = "application/json" if format == "speedscope" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=profile_id + FORMATS[format])
+
+
+@router.get("/temu-transfer-stats")
+def get_temu_transfer_stats(current_user: User = Depends(get_current_user)):
+    """获取当前工作进程从代理服务器接收的字节数（压缩传输 / 解压后）"""
+    from app.temu.client import proxy_transfer_stats
+    
+    return proxy_transfer_stats.snapshot()
+
+
 class AIConfigUpdate(BaseModel):
     """AI配置更新模型"""
     provider: str  # deepseek/openai
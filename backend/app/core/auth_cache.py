@@ -0,0 +1,193 @@
+"""认证缓存
+
+get_current_user 每个请求都要解析JWT、查询用户并提交 last_login_at，
+仪表盘一次加载十几个并行请求就是十几次查询和UPDATE。这里提供：
+- PrincipalCache: 已解析的令牌（进程内LRU）和用户信息（进程内LRU + Redis，短TTL），
+  命中时不访问数据库；用户被停用或修改后最多TTL秒生效，修改用户的代码应调用 invalidate
+- LastLoginRecorder: 合并 last_login_at 更新，后台线程定期批量写入
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import bindparam, or_, update
+
+from app.core.config import settings
+from app.core.redis_client import RedisClient
+
+
+class PrincipalCache:
+    """令牌与用户信息缓存"""
+
+    CACHE_PREFIX = "auth_principal"
+    # 缓存的用户字段（不包含密码哈希）
+    FIELDS = (
+        "id", "username", "email", "is_active", "is_superuser",
+        "frog_gpt_cache_enabled", "created_at", "updated_at", "last_login_at",
+    )
+    _DATETIME_FIELDS = ("created_at", "updated_at", "last_login_at")
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        # {token: (令牌过期时间戳, payload)}
+        self._tokens: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # {username: (缓存过期时间戳, 用户信息)}
+        self._principals: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _put(self, cache: OrderedDict, key: str, value: Tuple[float, Dict[str, Any]]) -> None:
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.maxsize:
+                cache.popitem(last=False)
+
+    def _get(self, cache: OrderedDict, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = cache.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                cache.pop(key, None)
+                return None
+            cache.move_to_end(key)
+            return item[1]
+
+    def get_token(self, token: str) -> Optional[Dict[str, Any]]:
+        """获取已解析的令牌（过期的令牌不会返回）"""
+        return self._get(self._tokens, token)
+
+    def set_token(self, token: str, payload: Dict[str, Any]) -> None:
+        expires_at = payload.get("exp")
+        if not isinstance(expires_at, (int, float)):
+            return
+        self._put(self._tokens, token, (float(expires_at), payload))
+
+    @classmethod
+    def _redis_key(cls, username: str) -> str:
+        return f"{cls.CACHE_PREFIX}:{username}"
+
+    def get_principal(self, username: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的用户信息（先进程内，再Redis）"""
+        if settings.AUTH_PRINCIPAL_CACHE_TTL <= 0:
+            return None
+        principal = self._get(self._principals, username)
+        if principal is not None:
+            return principal
+
+        principal = RedisClient.get(self._redis_key(username))
+        if isinstance(principal, dict):
+            self._put(self._principals, username, (time.time() + settings.AUTH_PRINCIPAL_CACHE_TTL, principal))
+            return principal
+        return None
+
+    def set_principal(self, user) -> None:
+        """缓存用户信息"""
+        ttl = settings.AUTH_PRINCIPAL_CACHE_TTL
+        if ttl <= 0:
+            return
+        principal = {}
+        for field in self.FIELDS:
+            value = getattr(user, field, None)
+            principal[field] = value.isoformat() if isinstance(value, datetime) else value
+        self._put(self._principals, user.username, (time.time() + ttl, principal))
+        RedisClient.set(self._redis_key(user.username), principal, ttl=ttl)
+
+    def to_user(self, principal: Dict[str, Any]):
+        """由缓存的用户信息构造用户对象（不属于任何数据库会话，修改需重新查询）"""
+        from app.models.user import User
+
+        fields = dict(principal)
+        for field in self._DATETIME_FIELDS:
+            if isinstance(fields.get(field), str):
+                fields[field] = datetime.fromisoformat(fields[field])
+        return User(**fields)
+
+    def invalidate(self, username: str) -> None:
+        """用户被修改（停用、权限、偏好）后清除其缓存"""
+        with self._lock:
+            self._principals.pop(username, None)
+        RedisClient.delete(self._redis_key(username))
+
+
+class LastLoginRecorder:
+    """合并 last_login_at 更新，定期批量写入"""
+
+    def __init__(self, flush_interval: float = 60.0):
+        self.flush_interval = flush_interval
+        # {user_id: 最近一次请求时间}
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def touch(self, user_id: int, at: Optional[datetime] = None) -> None:
+        """记录用户的请求时间（只写内存）"""
+        with self._lock:
+            self._pending[user_id] = at or datetime.utcnow()
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="last-login-flush", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """将合并后的 last_login_at 一次性写入数据库，返回更新的用户数"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        from app.core.database import WorkerSessionLocal
+        from app.models.user import User
+
+        rows = [{"uid": user_id, "ts": at} for user_id, at in pending.items()]
+        db = WorkerSessionLocal()
+        try:
+            db.execute(
+                update(User.__table__)
+                .where(User.__table__.c.id == bindparam("uid"))
+                .where(or_(User.__table__.c.last_login_at.is_(None), User.__table__.c.last_login_at < bindparam("ts")))
+                .values(last_login_at=bindparam("ts")),
+                rows
+            )
+            db.commit()
+            logger.debug(f"批量更新最后登录时间: {len(rows)} 个用户")
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"批量更新最后登录时间失败: {e}")
+            # 放回待写入，下次重试（保留更新的时间）
+            with self._lock:
+                for user_id, at in pending.items():
+                    if user_id not in self._pending or self._pending[user_id] < at:
+                        self._pending[user_id] = at
+            return 0
+        finally:
+            db.close()
+
+    def stop(self) -> None:
+        """停止后台线程并写入剩余的更新"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+
+# 全局实例
+principal_cache = PrincipalCache(maxsize=settings.AUTH_PRINCIPAL_CACHE_SIZE)
+last_login_recorder = LastLoginRecorder(flush_interval=settings.AUTH_LAST_LOGIN_FLUSH_INTERVAL)
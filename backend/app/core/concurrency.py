@@ -0,0 +1,295 @@
+"""异步处理器中的阻塞调用与事件循环延迟监控
+
+- run_blocking: 将同步的数据库/Redis调用放到有界线程池执行，避免阻塞事件循环；
+  线程数上限独立于 Starlette 默认线程池，长时间聚合查询不会占满同步端点的线程
+- EventLoopLagMonitor: 定期测量事件循环的调度延迟（实际唤醒时间 - 预期唤醒时间）和线程池饱和度，
+  用于确认SSE流式响应不会因阻塞调用而卡顿；事件循环被阻塞时记录阻塞位置的调用栈
+"""
+import asyncio
+import functools
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import anyio
+from loguru import logger
+
+from app.core.config import settings
+from app.core.metrics import Metrics
+
+T = TypeVar("T")
+
+# 按事件循环分别创建的容量限制器：定时任务线程中 asyncio.run 的事件循环不能与Web进程的事件循环共用同一个限制器
+_blocking_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, anyio.CapacityLimiter]" = weakref.WeakKeyDictionary()
+_blocking_limiters_lock = threading.Lock()
+
+
+def _live_blocking_limiters() -> Dict[asyncio.AbstractEventLoop, anyio.CapacityLimiter]:
+    """未关闭的事件循环的限制器（已关闭事件循环的限制器同时移除；需持有 _blocking_limiters_lock）"""
+    for loop in [loop for loop in _blocking_limiters.keys() if loop.is_closed()]:
+        del _blocking_limiters[loop]
+    return dict(_blocking_limiters.items())
+
+
+def get_blocking_limiter() -> anyio.CapacityLimiter:
+    """获取当前事件循环的阻塞调用线程池容量限制器（需在事件循环中调用）"""
+    loop = asyncio.get_running_loop()
+    with _blocking_limiters_lock:
+        limiter = _blocking_limiters.get(loop)
+        if limiter is None:
+            _live_blocking_limiters()
+            limiter = _blocking_limiters[loop] = anyio.CapacityLimiter(settings.BLOCKING_THREADPOOL_SIZE)
+    return limiter
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在有界线程池中执行同步函数
+
+    注意：数据库会话不是线程安全的，同一会话不要在多个 run_blocking 调用中并发使用。
+    """
+    if kwargs:
+        func = functools.partial(func, **kwargs)
+    return await anyio.to_thread.run_sync(func, *args, limiter=get_blocking_limiter())
+
+
+def get_blocking_pool_stats() -> Dict[str, Any]:
+    """阻塞调用线程池的使用情况（进程内所有事件循环合计）"""
+    with _blocking_limiters_lock:
+        limiters = list(_live_blocking_limiters().values())
+    if not limiters:
+        return {"total": settings.BLOCKING_THREADPOOL_SIZE, "borrowed": 0, "waiting": 0}
+    borrowed = waiting = 0
+    for limiter in limiters:
+        stats = limiter.statistics()
+        borrowed += stats.borrowed_tokens
+        waiting += stats.tasks_waiting
+    return {
+        "total": sum(int(limiter.total_tokens) for limiter in limiters),
+        "borrowed": borrowed,
+        "waiting": waiting,
+    }
+
+
+def get_default_pool_stats() -> Dict[str, Any]:
+    """AnyIO 默认线程池（同步 def 端点、run_in_threadpool）的使用情况（需在事件循环中调用）"""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    stats = limiter.statistics()
+    return {
+        "total": int(limiter.total_tokens),
+        "borrowed": stats.borrowed_tokens,
+        "waiting": stats.tasks_waiting,
+    }
+
+
+class EventLoopLagMonitor:
+    """
+    事件循环延迟和线程池饱和度监控
+
+    - 事件循环中的采样任务测量调度延迟，同时记录 AnyIO 默认线程池和阻塞调用线程池的在用线程数、等待任务数
+    - 看门狗线程检查采样任务的心跳：事件循环被阻塞超过阈值时，记录事件循环线程当时的调用栈
+      （阻塞结束后才能测到延迟，那时已看不到是谁阻塞的）
+    - get_health 汇总最近的延迟和线程池排队情况，供 /health 报告响应能力下降
+    """
+
+    # 最近多少秒内的采样用于健康判断
+    HEALTH_WINDOW_SECONDS = 60
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        warn_threshold_ms: float = 200.0,
+        window_seconds: int = 300,
+        stack_log_cooldown: float = 60.0
+    ):
+        """
+        Args:
+            interval: 采样间隔（秒）
+            warn_threshold_ms: 超过该延迟时记录警告日志和事件循环线程的调用栈（毫秒）
+            window_seconds: 统计窗口（秒）
+            stack_log_cooldown: 两次记录调用栈 / 线程池排队警告的最小间隔（秒）
+        """
+        self.interval = interval
+        self.warn_threshold_ms = warn_threshold_ms
+        self.stack_log_cooldown = stack_log_cooldown
+        maxlen = max(1, int(window_seconds / interval))
+        # (采样时间, 延迟毫秒)
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=maxlen)
+        # (采样时间, {线程池: {total, borrowed, waiting}})
+        self._pool_samples: Deque[Tuple[float, Dict[str, Dict[str, int]]]] = deque(maxlen=maxlen)
+        # 最近记录的阻塞调用栈
+        self._stalls: Deque[Dict[str, Any]] = deque(maxlen=10)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._last_stack_log = 0.0
+        self._last_pool_warning = 0.0
+
+    def start(self) -> None:
+        """在当前事件循环中启动监控和看门狗线程"""
+        if self._task is None or self._task.done():
+            self._loop_thread_id = threading.get_ident()
+            self._heartbeat = time.monotonic()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            self._stop_event.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+            self._watchdog.start()
+            logger.info(f"事件循环延迟监控已启动: 采样间隔 {self.interval}秒, 告警阈值 {self.warn_threshold_ms}ms")
+
+    async def stop(self) -> None:
+        """停止监控"""
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag_ms = max(0.0, (now - expected) * 1000)
+            self._samples.append((now, lag_ms))
+            pools = {"default": get_default_pool_stats(), "blocking": get_blocking_pool_stats()}
+            self._pool_samples.append((now, pools))
+            Metrics.observe_event_loop(lag_ms / 1000, pools)
+            if lag_ms >= self.warn_threshold_ms:
+                logger.warning(f"事件循环延迟 {lag_ms:.0f}ms，可能有阻塞调用在事件循环线程中执行")
+            self._check_pools(now, pools)
+
+    def _check_pools(self, now: float, pools: Dict[str, Dict[str, int]]) -> None:
+        """线程池已满且有任务排队时记录警告（按间隔限频）"""
+        saturated = {name: stats for name, stats in pools.items() if stats["waiting"] > 0}
+        if not saturated or now - self._last_pool_warning < self.stack_log_cooldown:
+            return
+        self._last_pool_warning = now
+        details = ", ".join(
+            f"{name}: {stats['borrowed']}/{stats['total']}在用, {stats['waiting']}个等待" for name, stats in saturated.items()
+        )
+        logger.warning(f"线程池已满，任务排队等待: {details}")
+
+    def _watch(self) -> None:
+        """看门狗线程：事件循环超过阈值没有心跳时记录事件循环线程的调用栈（每次阻塞只记录一次）"""
+        threshold = self.warn_threshold_ms / 1000
+        check_interval = min(self.interval, max(0.05, threshold / 4))
+        reported_heartbeat = None
+        while not self._stop_event.wait(check_interval):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            now = time.monotonic()
+            if now - self._last_stack_log < self.stack_log_cooldown:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._last_stack_log = now
+            stack = traceback.format_stack(frame)
+            self._stalls.append({
+                "timestamp": time.time(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": [line.strip() for line in stack[-12:]],
+            })
+            logger.warning(
+                f"事件循环已阻塞 {blocked * 1000:.0f}ms，事件循环线程当前调用栈:\n{''.join(stack[-12:])}"
+            )
+
+    def max_lag_since(self, since: float) -> float:
+        """指定时间点（time.monotonic()）之后的最大延迟（毫秒）"""
+        return max((lag for ts, lag in self._samples if ts >= since), default=0.0)
+
+    def blocked_ms(self) -> float:
+        """事件循环当前已阻塞的时间（毫秒，未阻塞时为0）"""
+        if self._task is None:
+            return 0.0
+        return max(0.0, (time.monotonic() - self._heartbeat - self.interval) * 1000)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """统计窗口内的延迟分布（毫秒）、线程池使用情况和最近记录的阻塞调用栈"""
+        lags = sorted(lag for _, lag in self._samples)
+        if not lags:
+            return {"running": self._task is not None, "samples": 0}
+
+        def percentile(p: float) -> float:
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))], 2)
+
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "samples": len(lags),
+            "current_ms": round(self._samples[-1][1], 2),
+            "blocked_ms": round(self.blocked_ms(), 2),
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(lags[-1], 2),
+            "over_threshold": sum(1 for lag in lags if lag >= self.warn_threshold_ms),
+            "warn_threshold_ms": self.warn_threshold_ms,
+            "threadpools": self._pool_summary(),
+            "recent_stalls": list(self._stalls),
+        }
+
+    def _pool_summary(self, since: float = 0.0) -> Dict[str, Dict[str, Any]]:
+        """各线程池的当前值、窗口内的最大在用线程数/等待任务数和有任务排队的采样比例"""
+        samples = [pools for ts, pools in self._pool_samples if ts >= since]
+        if not samples:
+            return {}
+        summary = {}
+        for name, latest in samples[-1].items():
+            history = [pools[name] for pools in samples if name in pools]
+            summary[name] = {
+                **latest,
+                "max_borrowed": max(item["borrowed"] for item in history),
+                "max_waiting": max(item["waiting"] for item in history),
+                "queued_ratio": round(sum(1 for item in history if item["waiting"] > 0) / len(history), 3),
+            }
+        return summary
+
+    def get_health(self) -> Dict[str, Any]:
+        """
+        响应能力：最近 HEALTH_WINDOW_SECONDS 秒内事件循环延迟 P95 超过阈值、事件循环当前被阻塞、
+        或线程池当前有任务排队时为 degraded（每个工作进程独立统计）
+        """
+        if self._task is None:
+            return {"status": "unknown", "reasons": ["事件循环延迟监控未启动"]}
+        since = time.monotonic() - self.HEALTH_WINDOW_SECONDS
+        lags = sorted(lag for ts, lag in self._samples if ts >= since)
+        p95 = lags[min(len(lags) - 1, int(len(lags) * 0.95))] if lags else 0.0
+        blocked = self.blocked_ms()
+        pools = self._pool_summary(since)
+
+        reasons = []
+        if blocked >= self.warn_threshold_ms:
+            reasons.append(f"事件循环已阻塞 {blocked:.0f}ms")
+        if p95 >= self.warn_threshold_ms:
+            reasons.append(f"最近{self.HEALTH_WINDOW_SECONDS}秒事件循环延迟P95 {p95:.0f}ms")
+        for name, stats in pools.items():
+            if stats["waiting"] > 0:
+                reasons.append(f"{name}线程池已满（{stats['borrowed']}/{stats['total']}），{stats['waiting']}个任务等待")
+        return {
+            "status": "degraded" if reasons else "ok",
+            "reasons": reasons,
+            "loop_lag_p95_ms": round(p95, 2),
+            "loop_blocked_ms": round(blocked, 2),
+            "threadpools": pools,
+        }
+
+
+# 全局实例
+loop_lag_monitor = EventLoopLagMonitor(
+    interval=settings.EVENT_LOOP_LAG_INTERVAL,
+    warn_threshold_ms=settings.EVENT_LOOP_LAG_WARN_MS,
+    stack_log_cooldown=settings.EVENT_LOOP_STACK_LOG_COOLDOWN
+)
@@ -15,6 +15,11 @@ class Settings(BaseSettings):
     # SECRET_KEY: 生产环境必须通过环境变量设置，开发环境允许使用随机生成的值
     SECRET_KEY: Optional[str] = Field(default=None, description="JWT密钥，生产环境必须设置")
     
+    # 认证缓存（已解析的令牌和用户信息短时缓存，last_login_at 合并批量写入）
+    AUTH_PRINCIPAL_CACHE_TTL: int = 60  # 用户信息缓存时间（秒），0表示每次请求都查询数据库
+    AUTH_PRINCIPAL_CACHE_SIZE: int = 1024  # 进程内缓存的令牌/用户数上限
+    AUTH_LAST_LOGIN_FLUSH_INTERVAL: float = 60.0  # 批量写入 last_login_at 的间隔（秒）
+    
     # 数据库配置
     # DATABASE_URL: 生产环境必须通过环境变量设置，开发环境允许使用SQLite默认值
     DATABASE_URL: Optional[str] = Field(default=None, description="数据库连接URL，生产环境必须设置")
@@ -96,6 +101,12 @@ class Settings(BaseSettings):
     API_RETRY_BACKOFF_FACTOR: float = 2.0  # 重试退避因子（指数退避）
     API_RETRY_INITIAL_DELAY: float = 1.0  # 初始重试延迟（秒）
     
+    # Temu API批量调用（通过代理服务器的 /api/proxy/batch，一次请求携带多个调用）
+    TEMU_BATCH_ENABLED: bool = True  # 关闭后批量调用逐个发送
+    TEMU_BATCH_SIZE: int = 20  # 每个批量请求的最大调用数（订单同步时也是并发拉取的页数）
+    TEMU_BATCH_CONCURRENCY: int = 5  # 每批的并发调用数
+    TEMU_PROXY_COMPRESSION: bool = True  # 接受代理服务器的 gzip/zstd 压缩响应（zstd 需安装 zstandard）
+    
     # HTTP客户端配置
     HTTP_TIMEOUT: float = 30.0  # HTTP请求超时时间（秒）
     HTTP_CONNECT_TIMEOUT: float = 10.0  # HTTP连接超时时间（秒）
@@ -103,18 +114,77 @@ class Settings(BaseSettings):
     HTTP_MAX_CONNECTIONS: int = 100  # 最大连接数
     HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # 最大保持活跃连接数
     
-    # 数据库配置
+    # 数据库配置（API 请求的连接池；每个进程的连接数为各连接池之和）
     DB_POOL_SIZE: int = 10  # 数据库连接池大小
     DB_MAX_OVERFLOW: int = 20  # 数据库连接池最大溢出数
-    DB_POOL_TIMEOUT: int = 30  # 获取数据库连接超时时间（秒）
-    DB_POOL_RECYCLE: int = 3600  # 数据库连接回收时间（秒）
+    DB_POOL_TIMEOUT: int = 30  # 获取数据库连接超时时间（秒，所有连接池）
+    DB_POOL_RECYCLE: int = 3600  # 数据库连接回收时间（秒，所有连接池）
     DB_QUERY_TIMEOUT: int = 30  # 数据库查询超时时间（秒）
+    DB_POOL_PRE_PING: bool = True  # 取出连接时检查连接是否有效（每次多一次往返，连接稳定时可关闭）
+    DB_ISOLATION_LEVEL: Optional[str] = None  # 事务隔离级别，如 READ COMMITTED、REPEATABLE READ，留空为数据库默认
+    
+    # 后台工作连接池（定时任务、订单详情补齐线程、后台同步）
+    DB_WORKER_POOL_SIZE: int = 5
+    DB_WORKER_MAX_OVERFLOW: int = 5
+    DB_WORKER_QUERY_TIMEOUT: int = 300  # 查询超时（秒）
+    DB_WORKER_ISOLATION_LEVEL: Optional[str] = None
+    
+    # 批处理连接池（成本重算、报表生成和回填）
+    DB_BATCH_POOL_SIZE: int = 2
+    DB_BATCH_MAX_OVERFLOW: int = 1
+    DB_BATCH_QUERY_TIMEOUT: int = 3600  # 查询超时（秒），0表示不限制
+    DB_BATCH_ISOLATION_LEVEL: Optional[str] = None
+    DB_BATCH_FETCH_SIZE: int = 1000  # 报表汇总等大结果集查询用服务端游标分批读取，每次读取的行数
+    
+    # DATABASE_URL 指向 PgBouncer（事务池模式）时开启：查询超时改为每个事务 SET LOCAL（PgBouncer 不支持 options 启动参数）
+    DB_PGBOUNCER: bool = False
+    
+    # SQL 查询分析（/api/system/sql-profile）
+    SQL_PROFILER_ENABLED: bool = True  # 记录语句指纹、每个路由的查询次数和耗时
+    SQL_SLOW_QUERY_MS: float = 500.0  # 慢查询阈值（毫秒）
+    SQL_EXPLAIN_SAMPLE_RATE: float = 0.1  # 慢查询在后台执行 EXPLAIN (ANALYZE, BUFFERS) 的比例（0-1，仅PostgreSQL的SELECT）
+    SQL_EXPLAIN_INTERVAL: float = 600.0  # 同一语句指纹两次 EXPLAIN 的最小间隔（秒）
+    SQL_N_PLUS_ONE_THRESHOLD: int = 20  # 同一请求中同一语句超过该次数记录为疑似N+1查询
+    
+    # 异步处理器中阻塞调用（数据库/Redis）的线程池
+    BLOCKING_THREADPOOL_SIZE: int = 16  # 最大并发线程数
+    EVENT_LOOP_LAG_INTERVAL: float = 0.5  # 事件循环延迟采样间隔（秒）
+    EVENT_LOOP_LAG_WARN_MS: float = 200.0  # 事件循环延迟告警阈值（毫秒），阻塞超过该值时记录事件循环线程的调用栈
+    EVENT_LOOP_STACK_LOG_COOLDOWN: float = 60.0  # 两次记录阻塞调用栈 / 线程池排队警告的最小间隔（秒）
+    
+    # 请求中间件
+    REQUEST_TIMEOUT: float = 300.0  # 响应开始前的超时时间（秒），流式响应开始后不受限制
+    ACCESS_LOG_SAMPLE_RATE: float = 0.01  # 访问日志采样比例（0-1），5xx和慢请求始终记录
+    SLOW_REQUEST_MS: float = 1000.0  # 慢请求阈值（毫秒）
+    
+    # Prometheus 指标（/metrics）
+    METRICS_ENABLED: bool = True  # 需安装 prometheus_client；gunicorn 多进程部署需设置环境变量 PROMETHEUS_MULTIPROC_DIR
+    METRICS_TOKEN: Optional[str] = None  # 设置后抓取 /metrics 需携带 Authorization: Bearer <token>
+    
+    # 同步分段追踪（耗时分布附加到同步日志和 /sync/shops/{id}/status，可导出为 OTLP/JSON）
+    TRACING_ENABLED: bool = True
+    TRACING_EXPORT_FILE: Optional[str] = None  # 导出文件（每次同步一行 OTLP/JSON），如 logs/traces.jsonl
+    TRACING_OTLP_ENDPOINT: Optional[str] = None  # OTLP/HTTP 地址，如 http://otel-collector:4318
+    TRACING_SERVICE_NAME: str = "temu-omni-backend"
+    
+    # 进程内采样分析（/api/system/profiler，结果为 speedscope / 火焰图折叠栈）
+    PROFILER_OUTPUT_DIR: str = "logs/profiles"  # 结果目录，gunicorn 多个 worker 需共享
+    PROFILER_SAMPLE_INTERVAL_MS: float = 10.0  # 采样间隔（毫秒）
+    PROFILER_MAX_SECONDS: float = 300.0  # 单次分析的最长时间（秒）
+    PROFILER_MAX_FILES: int = 50  # 最多保留的结果数
+    PROFILER_REQUEST_TOKEN: Optional[str] = None  # 设置后请求头 X-Profile-Token 等于该值的请求会被单独分析
     
     # 同步任务配置
     SYNC_TASK_TIMEOUT: int = 3600  # 同步任务超时时间（秒，1小时）
     SYNC_BATCH_SIZE: int = 100  # 同步批次大小
     SYNC_MAX_RETRIES: int = 3  # 同步任务最大重试次数
     
+    # 飞书在线表格配置
+    FEISHU_APP_ID: Optional[str] = Field(default=None, description="飞书应用ID（配置后通过开放API分片读取表格）")
+    FEISHU_APP_SECRET: Optional[str] = Field(default=None, description="飞书应用密钥")
+    FEISHU_READ_CHUNK_ROWS: int = 2000  # 每个分片读取的行数
+    FEISHU_READ_CONCURRENCY: int = 4  # 并发读取分片数
+    
     # 时区配置
     TIMEZONE: str = "Asia/Shanghai"
     
@@ -131,6 +201,36 @@ class Settings(BaseSettings):
     OPENROUTER_HTTP_REFERER: Optional[str] = Field(default=None, description="HTTP Referer（用于免费使用）")
     OPENROUTER_X_TITLE: str = "Temu Omni"  # X-Title头
     
+    # AI供应商连接池（共享长连接、并发上限、延迟统计）与对冲请求
+    AI_PROVIDER_CONCURRENCY: int = 8  # 每个供应商的最大并发请求数
+    AI_HEDGE_ENABLED: bool = False  # 首token超过P95时向对冲目标发起第二个请求
+    AI_HEDGE_MODEL: Optional[str] = None  # 对冲使用的模型，为空时使用相同模型
+    AI_HEDGE_MIN_SAMPLES: int = 20  # 计算P95所需的最少样本数，不足时不对冲
+    AI_HEDGE_MIN_DELAY: float = 1.0  # 对冲前最少等待时间（秒）
+    AI_HEDGE_MAX_RATIO: float = 0.1  # 最近请求中触发对冲的比例上限
+    
+    # 报表AI总结（定时生成日报/周报/月报时可选生成）
+    REPORT_AI_SUMMARY_ENABLED: bool = False
+    REPORT_AI_SUMMARY_CONCURRENCY: int = 4  # 并发生成总结的最大店铺数
+    
+    # FrogGPT系统上下文快照（按店铺集合+天数窗口缓存，订单同步后后台刷新）
+    FROGGPT_CONTEXT_TTL: int = 1800  # 快照缓存时间（秒）
+    FROGGPT_CONTEXT_WINDOWS: List[int] = [0, 7, 30]  # 同步后预热的天数窗口，0表示全部时间
+    
+    # FrogGPT回答缓存（相同数据快照下的相同问题直接返回缓存的回答）
+    FROGGPT_RESPONSE_CACHE_ENABLED: bool = True
+    FROGGPT_RESPONSE_CACHE_TTL: int = 0  # 缓存时间（秒），0表示与自动同步间隔一致
+    FROGGPT_RESPONSE_CACHE_SIMILARITY: float = 0.0  # 相似问题命中阈值（0-1），0表示只精确匹配
+    
+    # FrogGPT对话历史压缩（超出token预算时较早的对话替换为滚动摘要）
+    FROGGPT_HISTORY_COMPACTION_ENABLED: bool = True
+    FROGGPT_HISTORY_TOKEN_BUDGET: int = 16000  # 系统上下文 + 摘要 + 最近对话的token预算
+    FROGGPT_HISTORY_MIN_RECENT_MESSAGES: int = 2  # 始终保留原文的最近消息数
+    FROGGPT_HISTORY_SUMMARY_STEP: int = 6  # 压缩边界对齐的消息数（后续几轮复用同一份摘要）
+    FROGGPT_HISTORY_SUMMARY_MAX_TOKENS: int = 800  # 摘要的最大token数
+    FROGGPT_HISTORY_SUMMARY_MODEL: Optional[str] = None  # 生成摘要的模型，为空时使用对话模型
+    FROGGPT_HISTORY_SUMMARY_TTL: int = 86400  # 摘要缓存时间（秒）
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,4 +1,12 @@
-"""数据库配置和会话管理"""
+"""数据库配置和会话管理
+
+按负载类型使用独立的引擎（连接池、查询超时、隔离级别分别配置），长时间的批处理不会占满 API 请求的连接：
+- SessionLocal / get_db: API 请求
+- WorkerSessionLocal: 定时任务、订单详情补齐线程、后台同步
+- BatchSessionLocal / get_batch_db: 成本重算、报表生成和回填
+
+DATABASE_URL 指向 PgBouncer（事务池模式）时设置 DB_PGBOUNCER=True。
+"""
 from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -6,45 +14,132 @@ from sqlalchemy.pool import QueuePool
 from sqlalchemy.exc import DisconnectionError, OperationalError
 from contextlib import contextmanager
 from loguru import logger
+from typing import Optional
 import time
 from app.core.config import settings
+from app.core.metrics import Metrics
+from app.core.query_profiler import query_profiler
 
-# 创建数据库引擎
-# 增强的连接池配置，提高稳定性和性能
-engine = create_engine(
-    settings.DATABASE_URL,
-    poolclass=QueuePool,
-    pool_pre_ping=True,  # 连接前检查连接是否有效
-    pool_size=10,  # 连接池大小
-    max_overflow=20,  # 最大溢出连接数
-    pool_timeout=30,  # 获取连接的超时时间（秒）
-    pool_recycle=3600,  # 连接回收时间（1小时），防止连接过期
-    pool_reset_on_return='commit',  # 返回连接时重置
-    echo=False,  # 不打印SQL语句
-    connect_args={
-        "connect_timeout": 10,  # 连接超时（秒）
-        "options": "-c statement_timeout=30000"  # 查询超时（30秒）
-    } if "postgresql" in settings.DATABASE_URL else {}
-)
+IS_POSTGRESQL = "postgresql" in settings.DATABASE_URL
 
-# 添加连接池事件监听，记录连接状态
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_conn, connection_record):
-    """设置SQLite连接参数（如果使用SQLite）"""
-    if "sqlite" in settings.DATABASE_URL:
-        from sqlalchemy import text
-        dbapi_conn.execute(text("PRAGMA foreign_keys=ON"))
-        dbapi_conn.execute(text("PRAGMA journal_mode=WAL"))
 
-@event.listens_for(engine, "checkout")
-def receive_checkout(dbapi_conn, connection_record, connection_proxy):
-    """连接从池中取出时的事件"""
-    logger.debug("数据库连接从池中取出")
+def create_profile_engine(
+    name: str,
+    pool_size: int,
+    max_overflow: int,
+    statement_timeout: int,
+    isolation_level: Optional[str] = None,
+    pre_ping: bool = True
+):
+    """
+    按负载类型创建数据库引擎（每种负载独立的连接池，长时间的批处理不会占满 API 请求的连接）
+    
+    Args:
+        name: 负载类型（api / worker / batch），用于连接池指标和 application_name
+        pool_size: 连接池大小
+        max_overflow: 最大溢出连接数
+        statement_timeout: 查询超时（秒），0 表示不限制
+        isolation_level: 事务隔离级别，None 为数据库默认
+        pre_ping: 取出连接时是否检查连接有效
+    """
+    connect_args = {}
+    if IS_POSTGRESQL:
+        connect_args = {
+            "connect_timeout": 10,  # 连接超时（秒）
+            "application_name": f"{settings.TRACING_SERVICE_NAME}-{name}",
+        }
+        if statement_timeout and not settings.DB_PGBOUNCER:
+            connect_args["options"] = f"-c statement_timeout={statement_timeout * 1000}"
+    
+    options = {}
+    if isolation_level:
+        options["isolation_level"] = isolation_level
+    
+    profile_engine = create_engine(
+        settings.DATABASE_URL,
+        poolclass=QueuePool,
+        pool_pre_ping=pre_ping,  # 连接前检查连接是否有效
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,  # 获取连接的超时时间（秒）
+        pool_recycle=settings.DB_POOL_RECYCLE,  # 连接回收时间，防止连接过期
+        pool_reset_on_return='commit',  # 返回连接时重置
+        echo=False,  # 不打印SQL语句
+        connect_args=connect_args,
+        **options
+    )
+    
+    # 添加连接池事件监听，记录连接状态
+    @event.listens_for(profile_engine, "connect")
+    def set_sqlite_pragma(dbapi_conn, connection_record):
+        """设置SQLite连接参数（如果使用SQLite）"""
+        if "sqlite" in settings.DATABASE_URL:
+            from sqlalchemy import text
+            dbapi_conn.execute(text("PRAGMA foreign_keys=ON"))
+            dbapi_conn.execute(text("PRAGMA journal_mode=WAL"))
+    
+    @event.listens_for(profile_engine, "checkout")
+    def receive_checkout(dbapi_conn, connection_record, connection_proxy):
+        """连接从池中取出时的事件"""
+        logger.debug(f"数据库连接从池中取出 ({name})")
+        Metrics.update_db_pool(profile_engine.pool, name)
+    
+    @event.listens_for(profile_engine, "checkin")
+    def receive_checkin(dbapi_conn, connection_record):
+        """连接返回池中时的事件"""
+        logger.debug(f"数据库连接返回池中 ({name})")
+        Metrics.update_db_pool(profile_engine.pool, name)
+    
+    if IS_POSTGRESQL and settings.DB_PGBOUNCER and statement_timeout:
+        # PgBouncer 事务池模式不支持 options 启动参数，会话级 SET 也会泄漏到其他客户端，改为每个事务 SET LOCAL
+        @event.listens_for(profile_engine, "begin")
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {statement_timeout * 1000}")
+    
+    if settings.SQL_PROFILER_ENABLED:
+        @event.listens_for(profile_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            """记录语句开始时间"""
+            if context is not None:
+                context._query_start_time = time.perf_counter()
+        
+        @event.listens_for(profile_engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            """记录语句耗时（指纹统计、按路由统计、慢查询、N+1检测）"""
+            started = getattr(context, "_query_start_time", None)
+            if started is not None:
+                query_profiler.record(conn, statement, parameters, time.perf_counter() - started, executemany)
+    
+    return profile_engine
+
+
+# API 请求：短查询，查询超时较短
+engine = create_profile_engine(
+    "api",
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    statement_timeout=settings.DB_QUERY_TIMEOUT,
+    isolation_level=settings.DB_ISOLATION_LEVEL,
+    pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+# 后台工作：定时任务、订单详情补齐线程、后台同步
+worker_engine = create_profile_engine(
+    "worker",
+    pool_size=settings.DB_WORKER_POOL_SIZE,
+    max_overflow=settings.DB_WORKER_MAX_OVERFLOW,
+    statement_timeout=settings.DB_WORKER_QUERY_TIMEOUT,
+    isolation_level=settings.DB_WORKER_ISOLATION_LEVEL,
+)
 
-@event.listens_for(engine, "checkin")
-def receive_checkin(dbapi_conn, connection_record):
-    """连接返回池中时的事件"""
-    logger.debug("数据库连接返回池中")
+# 批处理：成本重算、报表生成和回填，查询超时长
+batch_engine = create_profile_engine(
+    "batch",
+    pool_size=settings.DB_BATCH_POOL_SIZE,
+    max_overflow=settings.DB_BATCH_MAX_OVERFLOW,
+    statement_timeout=settings.DB_BATCH_QUERY_TIMEOUT,
+    isolation_level=settings.DB_BATCH_ISOLATION_LEVEL,
+)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(
@@ -53,19 +148,17 @@ SessionLocal = sessionmaker(
     bind=engine,
     expire_on_commit=False  # 提交后不过期对象，提高性能
 )
+WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine, expire_on_commit=False)
+BatchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=batch_engine, expire_on_commit=False)
 
 # 创建基础模型类
 Base = declarative_base()
 
 
-def get_db():
-    """
-    获取数据库会话（依赖注入）
-    
-    使用try-finally确保会话总是被关闭，即使发生异常
-    """
+def _session_scope(session_factory):
+    """会话依赖：正常时提交、异常时回滚，总是关闭"""
     from fastapi import HTTPException
-    db = SessionLocal()
+    db = session_factory()
     try:
         yield db
         db.commit()  # 正常情况提交事务
@@ -81,14 +174,31 @@ def get_db():
         db.close()  # 确保会话关闭
 
 
+def get_db():
+    """
+    获取数据库会话（依赖注入）
+    
+    使用try-finally确保会话总是被关闭，即使发生异常
+    """
+    yield from _session_scope(SessionLocal)
+
+
+def get_batch_db():
+    """获取批处理数据库会话（依赖注入），用于在请求中执行的长时间批处理（如成本重算）"""
+    yield from _session_scope(BatchSessionLocal)
+
+
 @contextmanager
-def get_db_context():
+def get_db_context(session_factory=SessionLocal):
     """
     获取数据库会话（上下文管理器）
     
     用于需要手动管理事务的场景
+    
+    Args:
+        session_factory: 会话工厂（SessionLocal / WorkerSessionLocal / BatchSessionLocal）
     """
-    db = SessionLocal()
+    db = session_factory()
     try:
         yield db
         db.commit()
@@ -0,0 +1,198 @@
+"""Prometheus 指标
+
+/metrics 以 Prometheus 文本格式导出以下指标：
+- Temu API 调用耗时（按接口和结果）、限流等待时间和剩余令牌
+- 订单同步数量和速度（按店铺）
+- 缓存命中/未命中（按缓存键前缀）
+- 数据库连接池已取出/溢出连接数
+- 订单详情补齐队列长度、定时任务耗时、HTTP请求耗时
+- 事件循环延迟、线程池在用线程数和等待任务数
+
+gunicorn 多进程部署时设置环境变量 PROMETHEUS_MULTIPROC_DIR（gunicorn.conf.py 在启动时清空该目录、
+在 worker 退出时清理其数据），各 worker 的指标写入该目录下的 mmap 文件，抓取时汇总；未设置时为单进程模式。
+记录指标只是一次内存（mmap）加法，可以在生产环境常开。未安装 prometheus_client 或
+METRICS_ENABLED=False 时所有记录方法为空操作。
+"""
+import os
+from typing import Dict, Tuple
+
+from app.core.config import settings
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        REGISTRY,
+        generate_latest,
+    )
+    from prometheus_client import multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+ENABLED = PROMETHEUS_AVAILABLE and settings.METRICS_ENABLED
+
+# 耗时直方图的桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+if ENABLED:
+    TEMU_API_SECONDS = Histogram(
+        "temu_api_request_seconds", "Temu API 调用耗时（秒）",
+        ["api_type", "status"], buckets=LATENCY_BUCKETS
+    )
+    RATE_LIMIT_WAIT_SECONDS = Histogram(
+        "temu_rate_limiter_wait_seconds", "Temu API 限流等待时间（秒）",
+        ["key"], buckets=(0.0, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    )
+    RATE_LIMIT_TOKENS = Gauge(
+        "temu_rate_limiter_tokens", "限流令牌桶剩余令牌数（各进程之和）",
+        ["key"], multiprocess_mode="livesum"
+    )
+    SYNC_ORDERS_TOTAL = Counter(
+        "temu_sync_orders_total", "同步处理的订单数", ["shop_id"]
+    )
+    SYNC_ORDERS_PER_SECOND = Gauge(
+        "temu_sync_orders_per_second", "最近一次订单同步的速度（订单/秒）",
+        ["shop_id"], multiprocess_mode="mostrecent"
+    )
+    CACHE_REQUESTS_TOTAL = Counter(
+        "cache_requests_total", "缓存查询次数", ["family", "result"]
+    )
+    DB_POOL_CHECKED_OUT = Gauge(
+        "db_pool_checked_out", "数据库连接池已取出的连接数（各进程之和）",
+        ["engine"], multiprocess_mode="livesum"
+    )
+    DB_POOL_OVERFLOW = Gauge(
+        "db_pool_overflow", "数据库连接池溢出连接数（各进程之和）",
+        ["engine"], multiprocess_mode="livesum"
+    )
+    SCHEDULER_JOB_SECONDS = Histogram(
+        "scheduler_job_duration_seconds", "定时任务耗时（秒）",
+        ["job", "status"], buckets=JOB_BUCKETS
+    )
+    HTTP_REQUEST_SECONDS = Histogram(
+        "http_request_duration_seconds", "HTTP请求耗时（秒）",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS
+    )
+    EVENT_LOOP_LAG_SECONDS = Histogram(
+        "event_loop_lag_seconds", "事件循环调度延迟（秒）",
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+    )
+    THREADPOOL_BORROWED = Gauge(
+        "threadpool_borrowed_threads", "线程池在用线程数（各进程之和）",
+        ["pool"], multiprocess_mode="livesum"
+    )
+    THREADPOOL_WAITING = Gauge(
+        "threadpool_waiting_tasks", "等待线程池的任务数（各进程之和）",
+        ["pool"], multiprocess_mode="livesum"
+    )
+
+
+class _QueueDepthCollector:
+    """抓取时读取的全局指标（存放在Redis中，与进程无关，不经过多进程汇总）"""
+
+    NAME = "order_detail_queue_depth"
+    DOCUMENTATION = "订单详情补齐队列待处理任务数"
+
+    def describe(self):
+        yield GaugeMetricFamily(self.NAME, self.DOCUMENTATION)
+
+    def collect(self):
+        from app.services.order_detail_enrichment_service import OrderDetailEnrichmentService
+        from app.core.redis_client import RedisClient
+
+        gauge = GaugeMetricFamily(self.NAME, self.DOCUMENTATION)
+        gauge.add_metric([], RedisClient.llen(OrderDetailEnrichmentService.QUEUE_KEY))
+        yield gauge
+
+
+if ENABLED and not MULTIPROCESS:
+    REGISTRY.register(_QueueDepthCollector())
+
+
+class Metrics:
+    """指标记录（未启用时为空操作）"""
+
+    @staticmethod
+    def observe_temu_request(api_type: str, status: str, seconds: float) -> None:
+        """
+        记录一次 Temu API 调用
+
+        Args:
+            api_type: 接口类型
+            status: success / error（业务错误）/ http_<状态码> / network
+            seconds: 耗时（秒）
+        """
+        if ENABLED:
+            TEMU_API_SECONDS.labels(api_type, status).observe(seconds)
+
+    @staticmethod
+    def observe_rate_limit(key: str, wait_seconds: float, tokens: float) -> None:
+        """记录一次限流令牌获取：等待时间和获取后剩余的令牌数"""
+        if ENABLED:
+            RATE_LIMIT_WAIT_SECONDS.labels(key).observe(wait_seconds)
+            RATE_LIMIT_TOKENS.labels(key).set(tokens)
+
+    @staticmethod
+    def add_sync_orders(shop_id: int, count: int) -> None:
+        if ENABLED and count:
+            SYNC_ORDERS_TOTAL.labels(str(shop_id)).inc(count)
+
+    @staticmethod
+    def set_sync_speed(shop_id: int, orders_per_second: float) -> None:
+        if ENABLED:
+            SYNC_ORDERS_PER_SECOND.labels(str(shop_id)).set(orders_per_second)
+
+    @staticmethod
+    def record_cache(family: str, hit: bool) -> None:
+        """记录一次缓存查询（family 为缓存键前缀，如 stats:unified）"""
+        if ENABLED:
+            CACHE_REQUESTS_TOTAL.labels(family, "hit" if hit else "miss").inc()
+
+    @staticmethod
+    def update_db_pool(pool, engine_name: str = "default") -> None:
+        """连接取出/归还时更新连接池指标"""
+        if ENABLED:
+            try:
+                DB_POOL_CHECKED_OUT.labels(engine_name).set(pool.checkedout())
+                DB_POOL_OVERFLOW.labels(engine_name).set(max(0, pool.overflow()))
+            except Exception:
+                pass
+
+    @staticmethod
+    def observe_scheduler_job(job_id: str, status: str, seconds: float) -> None:
+        if ENABLED:
+            SCHEDULER_JOB_SECONDS.labels(job_id, status).observe(seconds)
+
+    @staticmethod
+    def observe_http_request(method: str, route: str, status_code: int, seconds: float) -> None:
+        if ENABLED:
+            HTTP_REQUEST_SECONDS.labels(method, route, f"{status_code // 100}xx").observe(seconds)
+
+    @staticmethod
+    def observe_event_loop(lag_seconds: float, pools: Dict[str, Dict[str, int]]) -> None:
+        """记录一次事件循环延迟采样和各线程池的在用线程数、等待任务数"""
+        if ENABLED:
+            EVENT_LOOP_LAG_SECONDS.observe(lag_seconds)
+            for pool, stats in pools.items():
+                THREADPOOL_BORROWED.labels(pool).set(stats["borrowed"])
+                THREADPOOL_WAITING.labels(pool).set(stats["waiting"])
+
+    @staticmethod
+    def render() -> Tuple[bytes, str]:
+        """生成 Prometheus 文本格式的指标（多进程模式下汇总所有 worker）"""
+        if not ENABLED:
+            return b"# metrics disabled\n", CONTENT_TYPE_LATEST
+        if not MULTIPROCESS:
+            return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_QueueDepthCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
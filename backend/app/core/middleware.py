@@ -1,119 +1,263 @@
-"""全局中间件"""
+"""全局中间件
+
+RequestMiddleware 是纯ASGI中间件，合并了原来的超时、异常处理和请求日志三个
+BaseHTTPMiddleware：
+- 不创建额外的任务、不包装响应，流式响应（SSE）的数据块直接透传
+- 请求耗时记录到按路由统计的直方图（RequestMetrics），不再每个请求写两行日志
+- 访问日志按比例采样，5xx和慢请求始终记录
+- 超时只作用于响应开始之前：开始返回数据后（如流式聊天）不再受超时限制
+- 请求头 X-Profile-Token 有效时对该请求做采样分析，响应头 X-Profile-Id 返回结果ID
+"""
+import asyncio
+import random
+import threading
 import time
-from fastapi import Request, Response, HTTPException
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
-from loguru import logger
 import traceback
-from sqlalchemy.exc import OperationalError, DisconnectionError
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
 from httpx import RequestError, TimeoutException
+from loguru import logger
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import Metrics
+from app.core.query_profiler import QueryProfiler, RequestQueries, query_profiler
+from app.core.sampling_profiler import REQUEST_THREADS, ProfileSession, SamplingProfiler, sampling_profiler
+
+
+class RequestMetrics:
+    """按路由统计的请求耗时直方图（进程内）"""
+
+    # 直方图桶上限（毫秒），最后一个桶为 +Inf
+    BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+    def __init__(self):
+        # {(method, route): [各桶计数..., 总数, 总耗时ms, 5xx数]}
+        self._routes: Dict[Tuple[str, str], List[float]] = {}
+        self._status: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status_code: int, duration_ms: float) -> None:
+        bucket_count = len(self.BUCKETS_MS) + 1
+        key = (method, route)
+        index = bisect_left(self.BUCKETS_MS, duration_ms)
+        status_class = f"{status_code // 100}xx"
+        with self._lock:
+            row = self._routes.get(key)
+            if row is None:
+                row = self._routes[key] = [0] * (bucket_count + 3)
+            row[index] += 1
+            row[bucket_count] += 1
+            row[bucket_count + 1] += duration_ms
+            if status_code >= 500:
+                row[bucket_count + 2] += 1
+            self._status[status_class] = self._status.get(status_class, 0) + 1
+
+    def _quantile(self, buckets: List[float], total: float, q: float) -> Optional[float]:
+        """由直方图估算分位数（取所在桶的上限）"""
+        if not total:
+            return None
+        target = total * q
+        cumulative = 0
+        for index, count in enumerate(buckets):
+            cumulative += count
+            if cumulative >= target:
+                return float(self.BUCKETS_MS[index]) if index < len(self.BUCKETS_MS) else float("inf")
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """直方图快照：每个路由的桶计数、次数、平均耗时和估算的P50/P95/P99"""
+        bucket_count = len(self.BUCKETS_MS) + 1
+        with self._lock:
+            rows = {key: list(row) for key, row in self._routes.items()}
+            status = dict(self._status)
+
+        routes = []
+        for (method, route), row in rows.items():
+            buckets, total, total_ms, errors = row[:bucket_count], row[bucket_count], row[bucket_count + 1], row[bucket_count + 2]
+            routes.append({
+                "method": method,
+                "route": route,
+                "count": int(total),
+                "errors": int(errors),
+                "avg_ms": round(total_ms / total, 2) if total else None,
+                "p50_ms": self._quantile(buckets, total, 0.50),
+                "p95_ms": self._quantile(buckets, total, 0.95),
+                "p99_ms": self._quantile(buckets, total, 0.99),
+                "buckets": {
+                    (str(le) if i < len(self.BUCKETS_MS) else "+Inf"): int(count)
+                    for i, (le, count) in enumerate(zip(list(self.BUCKETS_MS) + [None], buckets))
+                },
+            })
+        routes.sort(key=lambda item: item["count"], reverse=True)
+        return {"bucket_bounds_ms": list(self.BUCKETS_MS), "status": status, "routes": routes}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+            self._status.clear()
+
+
+# 全局实例
+request_metrics = RequestMetrics()
 
 
-class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
-    """全局异常处理中间件"""
-    
-    async def dispatch(self, request: Request, call_next):
+class RequestMiddleware:
+    """请求中间件（纯ASGI）：超时、异常处理、耗时直方图、采样访问日志"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        timeout: float = 300.0,
+        log_sample_rate: float = 0.01,
+        slow_request_ms: float = 1000.0,
+        metrics: Optional[RequestMetrics] = None,
+        debug: bool = False
+    ):
+        """
+        Args:
+            app: 下游ASGI应用
+            timeout: 响应开始前的超时时间（秒）
+            log_sample_rate: 访问日志采样比例（0-1），5xx和慢请求始终记录
+            slow_request_ms: 慢请求阈值（毫秒）
+            metrics: 耗时直方图
+            debug: 调试模式下500响应包含异常信息
+        """
+        self.app = app
+        self.timeout = timeout
+        self.log_sample_rate = log_sample_rate
+        self.slow_request_ms = slow_request_ms
+        self.metrics = metrics or request_metrics
+        self.debug = debug
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        # [响应是否已开始, 状态码, 是否超时]
+        state = [False, 500, False]
+        profile = self._start_profile(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                state[0] = True
+                state[1] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-process-time", f"{time.perf_counter() - start:.6f}".encode("latin-1")))
+                if profile is not None:
+                    headers.append((b"x-profile-id", profile.id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        task = asyncio.current_task()
+        timer = asyncio.get_running_loop().call_later(self.timeout, self._on_timeout, task, state)
+        queries_token = QueryProfiler.begin_request(f"{scope['method']} {scope['path']}")
+        error: Optional[BaseException] = None
         try:
-            response = await call_next(request)
-            return response
-        except (OperationalError, DisconnectionError) as e:
-            logger.error(f"数据库连接错误: {e}")
-            logger.error(traceback.format_exc())
-            return JSONResponse(
-                status_code=503,
-                content={
-                    "detail": "数据库连接失败，请稍后重试",
-                    "error": str(e)
-                }
-            )
-        except (RequestError, TimeoutException) as e:
-            logger.error(f"HTTP请求错误: {e}")
-            logger.error(traceback.format_exc())
-            return JSONResponse(
-                status_code=504,
-                content={
-                    "detail": "外部服务请求超时或失败，请稍后重试",
-                    "error": str(e)
-                }
-            )
-        except HTTPException as http_exc:
-            # 重新抛出 HTTP 异常，让 FastAPI 处理
-            raise http_exc
+            await self.app(scope, receive, send_wrapper)
+        except asyncio.CancelledError:
+            if not state[2]:
+                # 客户端断开等外部取消
+                if not state[0]:
+                    state[1] = 499
+                raise
+            # 超时由本中间件取消，恢复任务的取消计数后返回504
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+            logger.error(f"请求超时: {scope['method']} {scope['path']}")
+            await self._send_error(send, state, 504, {
+                "detail": f"请求处理超时（超过{self.timeout}秒）",
+                "error": "Request timeout"
+            })
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"未处理的异常: {e}")
+            error = e
+            if state[0]:
+                # 响应已开始（如流式响应中途出错），无法再返回错误响应
+                logger.error(f"响应过程中出错: {scope['method']} {scope['path']} - {e}")
+                raise
+            status_code, content = self._error_response(e)
+            logger.error(f"{content['detail']}: {scope['method']} {scope['path']} - {e}")
             logger.error(traceback.format_exc())
-            # 检查是否是调试模式
-            debug_mode = getattr(request.app, 'debug', False) if hasattr(request.app, 'debug') else False
-            return JSONResponse(
-                status_code=500,
-                content={
-                    "detail": "服务器内部错误",
-                    "error": str(e) if debug_mode else "Internal server error"
-                }
-            )
-
-
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    """请求日志中间件"""
-    
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # 记录请求信息
-        logger.info(
-            f"请求开始: {request.method} {request.url.path} - "
-            f"客户端: {request.client.host if request.client else 'unknown'}"
+            await self._send_error(send, state, status_code, content)
+        finally:
+            timer.cancel()
+            if profile is not None:
+                # 保存结果涉及文件写入，放到线程池，不阻塞事件循环
+                asyncio.get_running_loop().run_in_executor(None, sampling_profiler.stop, profile)
+            queries = QueryProfiler.end_request(queries_token)
+            self._record(scope, state[1], (time.perf_counter() - start) * 1000, error, queries)
+
+    @staticmethod
+    def _start_profile(scope: Scope) -> Optional[ProfileSession]:
+        """请求头 X-Profile-Token 有效时开始分析该请求（只采样事件循环和 AnyIO 线程池）"""
+        token = next((value for key, value in scope.get("headers", []) if key == b"x-profile-token"), None)
+        if token is None or not SamplingProfiler.request_token_matches(token.decode("latin-1")):
+            return None
+        return sampling_profiler.start(
+            label=f"{scope['method']} {scope['path']}",
+            seconds=sampling_profiler.max_seconds,
+            threads=REQUEST_THREADS,
         )
-        
-        try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # 记录响应信息
-            logger.info(
-                f"请求完成: {request.method} {request.url.path} - "
-                f"状态码: {response.status_code} - "
-                f"耗时: {process_time:.3f}秒"
-            )
-            
-            # 添加处理时间到响应头
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
-        except Exception as e:
-            process_time = time.time() - start_time
-            logger.error(
-                f"请求失败: {request.method} {request.url.path} - "
-                f"错误: {e} - "
-                f"耗时: {process_time:.3f}秒"
-            )
-            raise
 
+    @staticmethod
+    def _on_timeout(task: Optional[asyncio.Task], state: list) -> None:
+        """超时回调：响应尚未开始时取消请求"""
+        if task is not None and not state[0]:
+            state[2] = True
+            task.cancel()
 
-class TimeoutMiddleware(BaseHTTPMiddleware):
-    """请求超时中间件"""
-    
-    def __init__(self, app: ASGIApp, timeout: float = 300.0):
-        super().__init__(app)
-        self.timeout = timeout
-    
-    async def dispatch(self, request: Request, call_next):
-        import asyncio
-        
-        try:
-            response = await asyncio.wait_for(
-                call_next(request),
-                timeout=self.timeout
-            )
-            return response
-        except asyncio.TimeoutError:
-            logger.error(f"请求超时: {request.method} {request.url.path}")
-            return JSONResponse(
-                status_code=504,
-                content={
-                    "detail": f"请求处理超时（超过{self.timeout}秒）",
-                    "error": "Request timeout"
-                }
-            )
+    def _error_response(self, exc: Exception) -> Tuple[int, Dict[str, Any]]:
+        if isinstance(exc, (OperationalError, DisconnectionError)):
+            return 503, {"detail": "数据库连接失败，请稍后重试", "error": str(exc)}
+        if isinstance(exc, (RequestError, TimeoutException)):
+            return 504, {"detail": "外部服务请求超时或失败，请稍后重试", "error": str(exc)}
+        return 500, {
+            "detail": "服务器内部错误",
+            "error": str(exc) if self.debug else "Internal server error"
+        }
+
+    @staticmethod
+    async def _send_error(send: Send, state: list, status_code: int, content: Dict[str, Any]) -> None:
+        if state[0]:
+            return
+        state[0] = True
+        state[1] = status_code
+        response = JSONResponse(status_code=status_code, content=content)
+        await send({"type": "http.response.start", "status": status_code, "headers": response.raw_headers})
+        await send({"type": "http.response.body", "body": response.body})
 
+    def _record(
+        self,
+        scope: Scope,
+        status_code: int,
+        duration_ms: float,
+        error: Optional[BaseException],
+        queries: Optional[RequestQueries] = None
+    ) -> None:
+        """记录耗时直方图和SQL查询统计，按采样比例输出访问日志"""
+        route = scope.get("route")
+        route_path = getattr(route, "path", None) or "<unmatched>"
+        method = scope["method"]
+        self.metrics.observe(method, route_path, status_code, duration_ms)
+        Metrics.observe_http_request(method, route_path, status_code, duration_ms / 1000)
+        query_profiler.finish_request(method, route_path, queries)
+
+        if status_code >= 500 or error is not None or duration_ms >= self.slow_request_ms:
+            log = logger.warning
+        elif self.log_sample_rate > 0 and random.random() < self.log_sample_rate:
+            log = logger.info
+        else:
+            return
+        client = scope.get("client")
+        sql = f" - SQL: {queries.count}次/{queries.seconds:.3f}秒" if queries is not None and queries.count else ""
+        log(
+            f"{method} {scope['path']} - 状态码: {status_code} - 耗时: {duration_ms / 1000:.3f}秒{sql} - "
+            f"客户端: {client[0] if client else 'unknown'}"
+        )
@@ -0,0 +1,293 @@
+"""SQL 查询分析
+
+database.py 在 before/after_cursor_execute 事件中调用 query_profiler.record()：
+- 语句指纹：参数、字面量、IN 列表归一化后取哈希，同一类查询归为一条统计
+- 按路由统计每个请求的查询次数和数据库耗时（RequestMiddleware 在请求开始/结束时调用）
+- 慢查询：超过阈值的语句保留最近若干条，按比例在后台线程执行 EXPLAIN (ANALYZE, BUFFERS)
+  采集执行计划（仅 PostgreSQL 的 SELECT，在回滚的事务中执行，不阻塞原请求）
+- N+1 检测：同一请求中同一指纹执行超过阈值次数时记录警告，如循环中逐条查询商品价格、逐个 refresh 订单
+
+请求之外（同步服务、定时任务）的查询只计入指纹统计和慢查询。
+"""
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, Token
+from functools import lru_cache
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|(?<![:\w]):[A-Za-z_]\w*")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"(\(\?\+\))(?:\s*,\s*\(\?\+\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+# 慢查询语句保留的最大长度
+MAX_STATEMENT_LENGTH = 2000
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> Tuple[str, str]:
+    """
+    计算语句指纹
+
+    Returns:
+        (指纹ID, 归一化后的语句)
+    """
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _BIND_PARAM.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(?+)", normalized)
+    normalized = _VALUES_LIST.sub(r"\1, ...", normalized)
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    return hashlib.md5(normalized.encode("utf-8")).hexdigest()[:12], normalized
+
+
+class RequestQueries:
+    """单个请求内的查询统计"""
+
+    __slots__ = ("label", "count", "seconds", "by_fingerprint")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.by_fingerprint: Counter = Counter()
+
+
+_current_request: ContextVar[Optional[RequestQueries]] = ContextVar("sql_request_queries", default=None)
+
+
+class QueryProfiler:
+    """SQL 查询分析器（进程内）"""
+
+    def __init__(
+        self,
+        slow_query_ms: float = 500.0,
+        explain_sample_rate: float = 0.1,
+        explain_interval: float = 600.0,
+        n_plus_one_threshold: int = 20,
+        max_slow_queries: int = 50
+    ):
+        """
+        Args:
+            slow_query_ms: 慢查询阈值（毫秒）
+            explain_sample_rate: 慢查询执行 EXPLAIN 的比例（0-1）
+            explain_interval: 同一指纹两次 EXPLAIN 的最小间隔（秒）
+            n_plus_one_threshold: 同一请求中同一指纹超过该次数视为 N+1
+            max_slow_queries: 保留的慢查询条数
+        """
+        self.slow_query_ms = slow_query_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_interval = explain_interval
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        # {指纹: {statement, count, total_ms, max_ms}}
+        self._fingerprints: Dict[str, Dict[str, Any]] = {}
+        # {(method, route): {requests, queries, db_ms, max_queries}}
+        self._routes: Dict[Tuple[str, str], Dict[str, float]] = {}
+        # {(method, route, 指纹): {statement, requests, max_count, last_seen}}
+        self._n_plus_one: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=max_slow_queries)
+        self._last_explain: Dict[str, float] = {}
+        self._explain_pending = 0
+        self._explain_executor: Optional[ThreadPoolExecutor] = None
+        self._explaining = threading.local()
+
+    # ---- 请求范围 ----
+
+    @staticmethod
+    def begin_request(label: str) -> Token:
+        """请求开始：之后在同一上下文（包括 run_in_threadpool 的线程）中执行的查询计入该请求"""
+        return _current_request.set(RequestQueries(label))
+
+    @staticmethod
+    def end_request(token: Token) -> Optional[RequestQueries]:
+        queries = _current_request.get()
+        _current_request.reset(token)
+        return queries
+
+    def finish_request(self, method: str, route: str, queries: Optional[RequestQueries]) -> None:
+        """汇总请求的查询统计，检测 N+1"""
+        if queries is None or not queries.count:
+            return
+        suspects = [
+            (fp, count) for fp, count in queries.by_fingerprint.items()
+            if count > self.n_plus_one_threshold
+        ]
+        with self._lock:
+            row = self._routes.get((method, route))
+            if row is None:
+                row = self._routes[(method, route)] = {"requests": 0, "queries": 0, "db_ms": 0.0, "max_queries": 0}
+            row["requests"] += 1
+            row["queries"] += queries.count
+            row["db_ms"] += queries.seconds * 1000
+            row["max_queries"] = max(row["max_queries"], queries.count)
+            for fp, count in suspects:
+                item = self._n_plus_one.get((method, route, fp))
+                if item is None:
+                    item = self._n_plus_one[(method, route, fp)] = {
+                        "statement": self._fingerprints.get(fp, {}).get("statement"),
+                        "requests": 0,
+                        "max_count": 0,
+                    }
+                item["requests"] += 1
+                item["max_count"] = max(item["max_count"], count)
+                item["last_seen"] = time.time()
+        for fp, count in suspects:
+            logger.warning(
+                f"疑似N+1查询: {method} {route} 同一语句执行了 {count} 次 "
+                f"(指纹 {fp}): {self._fingerprints.get(fp, {}).get('statement', '')[:200]}"
+            )
+
+    # ---- 查询记录 ----
+
+    def record(self, conn, statement: str, parameters: Any, seconds: float, executemany: bool) -> None:
+        """记录一次语句执行（after_cursor_execute 中调用）"""
+        if getattr(self._explaining, "active", False):
+            return
+        fp, normalized = fingerprint(statement)
+        duration_ms = seconds * 1000
+        queries = _current_request.get()
+        with self._lock:
+            row = self._fingerprints.get(fp)
+            if row is None:
+                row = self._fingerprints[fp] = {"statement": normalized, "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            row["count"] += 1
+            row["total_ms"] += duration_ms
+            if duration_ms > row["max_ms"]:
+                row["max_ms"] = duration_ms
+            if queries is not None:
+                queries.count += 1
+                queries.seconds += seconds
+                queries.by_fingerprint[fp] += 1
+        if duration_ms >= self.slow_query_ms:
+            self._record_slow(conn, fp, statement, parameters, duration_ms, executemany, queries)
+
+    def _record_slow(self, conn, fp, statement, parameters, duration_ms, executemany, queries) -> None:
+        entry = {
+            "time": time.time(),
+            "duration_ms": round(duration_ms, 2),
+            "fingerprint": fp,
+            "statement": statement[:MAX_STATEMENT_LENGTH],
+            "request": queries.label if queries is not None else None,
+            "plan": None,
+        }
+        logger.warning(f"慢查询 {duration_ms:.0f}ms (指纹 {fp}): {statement[:200]}")
+        explain = (
+            not executemany
+            and conn.dialect.name == "postgresql"
+            and statement.lstrip()[:6].upper() == "SELECT"
+            and random.random() < self.explain_sample_rate
+        )
+        now = time.monotonic()
+        with self._lock:
+            self._slow.append(entry)
+            if explain and (
+                now - self._last_explain.get(fp, float("-inf")) < self.explain_interval
+                or self._explain_pending >= 5
+            ):
+                explain = False
+            if explain:
+                self._last_explain[fp] = now
+                self._explain_pending += 1
+                entry["plan"] = "pending"
+                if self._explain_executor is None:
+                    self._explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-explain")
+        if explain:
+            self._explain_executor.submit(self._explain, conn.engine, statement, parameters, entry)
+
+    def _explain(self, engine, statement: str, parameters: Any, entry: Dict[str, Any]) -> None:
+        """在后台线程中执行 EXPLAIN (ANALYZE, BUFFERS)，事务回滚，不影响数据"""
+        self._explaining.active = True
+        try:
+            with engine.connect() as conn:
+                timeout_ms = int(max(self.slow_query_ms * 20, 30000))
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+                plan = conn.exec_driver_sql(
+                    "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters or {}
+                ).scalar()
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"慢查询 EXPLAIN 失败 (指纹 {entry['fingerprint']}): {e}")
+            plan = f"EXPLAIN 失败: {e}"
+        finally:
+            self._explaining.active = False
+        with self._lock:
+            entry["plan"] = plan
+            self._explain_pending -= 1
+
+    # ---- 查询结果 ----
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        """按路由的查询统计、最耗时的语句指纹、最近的慢查询和 N+1 检测结果"""
+        with self._lock:
+            routes = [
+                {
+                    "method": method,
+                    "route": route,
+                    "requests": int(row["requests"]),
+                    "avg_queries": round(row["queries"] / row["requests"], 2),
+                    "max_queries": int(row["max_queries"]),
+                    "avg_db_ms": round(row["db_ms"] / row["requests"], 2),
+                    "total_db_ms": round(row["db_ms"], 2),
+                }
+                for (method, route), row in self._routes.items()
+            ]
+            fingerprints = [
+                {
+                    "fingerprint": fp,
+                    "statement": row["statement"][:MAX_STATEMENT_LENGTH],
+                    "count": row["count"],
+                    "total_ms": round(row["total_ms"], 2),
+                    "avg_ms": round(row["total_ms"] / row["count"], 3),
+                    "max_ms": round(row["max_ms"], 2),
+                }
+                for fp, row in self._fingerprints.items()
+            ]
+            n_plus_one = [
+                {"method": method, "route": route, "fingerprint": fp, **item}
+                for (method, route, fp), item in self._n_plus_one.items()
+            ]
+            slow = [dict(entry) for entry in reversed(self._slow)]
+
+        routes.sort(key=lambda item: item["total_db_ms"], reverse=True)
+        fingerprints.sort(key=lambda item: item["total_ms"], reverse=True)
+        n_plus_one.sort(key=lambda item: item["max_count"], reverse=True)
+        return {
+            "settings": {
+                "slow_query_ms": self.slow_query_ms,
+                "explain_sample_rate": self.explain_sample_rate,
+                "n_plus_one_threshold": self.n_plus_one_threshold,
+            },
+            "routes": routes[:top],
+            "fingerprints": fingerprints[:top],
+            "n_plus_one": n_plus_one,
+            "slow_queries": slow,
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._fingerprints.clear()
+            self._routes.clear()
+            self._n_plus_one.clear()
+            self._slow.clear()
+            self._last_explain.clear()
+
+
+# 全局实例
+query_profiler = QueryProfiler(
+    slow_query_ms=settings.SQL_SLOW_QUERY_MS,
+    explain_sample_rate=settings.SQL_EXPLAIN_SAMPLE_RATE,
+    explain_interval=settings.SQL_EXPLAIN_INTERVAL,
+    n_plus_one_threshold=settings.SQL_N_PLUS_ONE_THRESHOLD,
+)
@@ -5,6 +5,8 @@ from typing import Optional, Dict
 from collections import defaultdict
 from loguru import logger
 from app.core.config import settings
+from app.core.metrics import Metrics
+from app.core.tracing import tracer
 
 
 class TokenBucket:
@@ -48,6 +50,7 @@ class TokenBucket:
         Returns:
             是否成功获取令牌
         """
+        started = time.perf_counter()
         async with self._lock:
             # 先补充令牌
             self._refill()
@@ -59,6 +62,8 @@ class TokenBucket:
                     f"获取令牌成功 - Key: {self.key}, "
                     f"剩余令牌: {self.tokens:.2f}/{self.capacity}"
                 )
+                Metrics.observe_rate_limit(self.key, 0.0, self.tokens)
+                self._trace_wait(started)
                 return True
             
             # 令牌不足
@@ -89,12 +94,21 @@ class TokenBucket:
                     f"等待后获取令牌成功 - Key: {self.key}, "
                     f"剩余令牌: {self.tokens:.2f}/{self.capacity}"
                 )
+                Metrics.observe_rate_limit(self.key, wait_time, self.tokens)
+                self._trace_wait(started)
                 return True
             
             # 理论上不应该到这里
             logger.error(f"等待后仍无法获取令牌 - Key: {self.key}")
             return False
     
+    @staticmethod
+    def _trace_wait(started: float) -> None:
+        """等待（令牌不足或等待其他协程释放锁）计入当前追踪的限流等待"""
+        waited = time.perf_counter() - started
+        if waited >= 0.001:
+            tracer.add_phase("rate_limit_wait", waited)
+    
     def _refill(self):
         """补充令牌"""
         now = time.time()
@@ -151,6 +151,52 @@ class RedisClient:
             logger.warning(f"Redis检查缓存存在性失败: {key}, 错误: {e}")
             return False
     
+    @classmethod
+    def setex(cls, key: str, ttl: int, value: Any) -> bool:
+        """设置带过期时间的缓存（与 redis-py 的参数顺序一致）"""
+        return cls.set(key, value, ttl=ttl)
+    
+    @classmethod
+    def lpush(cls, key: str, *values: str) -> int:
+        """
+        从列表左侧插入元素
+        
+        Returns:
+            插入后列表长度，Redis不可用时返回0
+        """
+        try:
+            client = cls.get_client()
+            if client is None:
+                return 0
+            return client.lpush(key, *values)
+        except Exception as e:
+            logger.warning(f"Redis列表插入失败: {key}, 错误: {e}")
+            return 0
+    
+    @classmethod
+    def rpop(cls, key: str) -> Optional[str]:
+        """从列表右侧弹出元素，列表为空或Redis不可用时返回None"""
+        try:
+            client = cls.get_client()
+            if client is None:
+                return None
+            return client.rpop(key)
+        except Exception as e:
+            logger.warning(f"Redis列表弹出失败: {key}, 错误: {e}")
+            return None
+    
+    @classmethod
+    def llen(cls, key: str) -> int:
+        """获取列表长度，Redis不可用时返回0"""
+        try:
+            client = cls.get_client()
+            if client is None:
+                return 0
+            return client.llen(key)
+        except Exception as e:
+            logger.warning(f"Redis获取列表长度失败: {key}, 错误: {e}")
+            return 0
+    
     @classmethod
     def clear_all(cls) -> bool:
         """
@@ -0,0 +1,447 @@
+"""进程内采样分析器
+
+生产环境定位热点时不需要再手动 attach py-spy：
+- 后台采样线程按固定间隔读取所有线程的调用栈（sys._current_frames），只在有分析任务时运行
+- 按线程分组：事件循环（MainThread）、AnyIO 线程池、订单详情补齐线程（order-detail-worker）、
+  定时任务线程（按任务ID标记为 scheduler:<job_id>）
+- 结果保存为 speedscope JSON（https://www.speedscope.app 打开）和折叠栈文本（flamegraph.pl 生成火焰图）
+
+两种触发方式：
+- 管理员接口 POST /api/system/profiler/start：分析 N 秒；scope=all 时通过共享目录中的控制文件通知
+  gunicorn 的所有 worker（每个 worker 各生成一份结果）
+- 单个请求：请求头 X-Profile-Token 等于 PROFILER_REQUEST_TOKEN 时分析该请求，响应头 X-Profile-Id 返回结果ID。
+  只采样事件循环和 AnyIO 线程池，同一 worker 上并发的其他请求也会计入
+"""
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+# 单个请求分析时采样的线程（事件循环 + 同步端点/阻塞调用线程池）
+REQUEST_THREADS = ("MainThread", "AnyIO worker thread")
+
+# 调用栈最内层是这些函数时视为空闲等待（默认不计入）
+_IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+_PROFILE_ID_PATTERN = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+
+FORMATS = {"speedscope": ".speedscope.json", "folded": ".folded"}
+
+
+class ProfileSession:
+    """一次分析：按 (线程标签, 调用栈) 累计采样时间"""
+
+    def __init__(
+        self,
+        profile_id: str,
+        label: str,
+        seconds: float,
+        threads: Optional[Tuple[str, ...]] = None,
+        include_idle: bool = False
+    ):
+        """
+        Args:
+            profile_id: 结果ID（文件名）
+            label: 说明，如 "manual" 或 "GET /api/orders"
+            seconds: 最长分析时间（秒），到期后自动结束并保存
+            threads: 只采样名称（或标签，如 scheduler:）以这些前缀开头的线程（None 表示全部线程）
+            include_idle: 是否计入空闲等待的调用栈
+        """
+        self.id = profile_id
+        self.label = label
+        self.threads = threads
+        self.include_idle = include_idle
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.stopped_at: Optional[float] = None
+        self.samples = 0
+        # {(线程标签, 调用栈帧序号...): 累计秒数}
+        self.stacks: Dict[Tuple[Any, ...], float] = defaultdict(float)
+        self.done = threading.Event()
+
+    def accepts(self, thread_name: str) -> bool:
+        return self.threads is None or thread_name.startswith(self.threads)
+
+
+class SamplingProfiler:
+    """采样分析器（每个进程一个实例）"""
+
+    def __init__(self, output_dir: str, interval_ms: float = 10.0, max_seconds: float = 300.0, max_profiles: int = 50):
+        """
+        Args:
+            output_dir: 结果目录（gunicorn 多个 worker 共享）
+            interval_ms: 采样间隔（毫秒）
+            max_seconds: 单次分析的最长时间（秒）
+            max_profiles: 目录中最多保留的结果数，超过时删除最早的
+        """
+        self.output_dir = output_dir
+        self.interval = interval_ms / 1000
+        self.max_seconds = max_seconds
+        self.max_profiles = max_profiles
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 帧信息 (函数名, 文件, 行号) 与序号的映射，所有分析共用
+        self._frames: List[Tuple[str, str, int]] = []
+        self._frame_index: Dict[Any, int] = {}
+        self._control_thread: Optional[threading.Thread] = None
+        self._control_seen: Optional[str] = None
+
+    # ---------- 分析任务 ----------
+
+    def start(
+        self,
+        label: str,
+        seconds: float,
+        threads: Optional[Iterable[str]] = None,
+        include_idle: bool = False,
+        profile_id: Optional[str] = None
+    ) -> ProfileSession:
+        """开始一次分析（到期自动保存），返回分析任务"""
+        seconds = max(0.1, min(float(seconds), self.max_seconds))
+        session = ProfileSession(
+            profile_id or self._new_id(),
+            label,
+            seconds,
+            tuple(threads) if threads else None,
+            include_idle,
+        )
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._write_meta(session, "running")
+        logger.info(f"采样分析已开始: {session.id} ({label}), 最长 {seconds:g}秒, 采样间隔 {self.interval * 1000:g}ms")
+        return session
+
+    def stop(self, session: ProfileSession) -> Dict[str, Any]:
+        """提前结束分析并保存，返回结果信息"""
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+                finished = True
+            else:
+                finished = False
+        if finished:
+            self._finish(session)
+        session.done.wait(5)
+        return self._read_meta(session.id) or {"id": session.id}
+
+    def _run(self) -> None:
+        """采样线程：有分析任务时按间隔采样，没有时退出"""
+        own_ident = threading.get_ident()
+        last = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            with self._lock:
+                expired = [session for session in self._sessions if now >= session.deadline]
+                for session in expired:
+                    self._sessions.remove(session)
+                sessions = list(self._sessions)
+                if not sessions:
+                    self._thread = None
+                else:
+                    # 持有锁采样，stop() 移除任务后不会再有采样写入
+                    try:
+                        self._sample(sessions, elapsed, own_ident)
+                    except Exception as e:
+                        logger.debug(f"采样失败: {e}")
+            for session in expired:
+                self._finish(session)
+            if not sessions:
+                return
+
+    def _sample(self, sessions: List[ProfileSession], elapsed: float, own_ident: int) -> None:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        control_ident = self._control_thread.ident if self._control_thread else None
+        for ident, frame in sys._current_frames().items():
+            if ident in (own_ident, control_ident):
+                continue
+            name = names.get(ident, f"thread-{ident}")
+            stack: List[int] = []
+            idle = False
+            label = name
+            depth = 0
+            while frame is not None:
+                code = frame.f_code
+                if depth == 0:
+                    idle = (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCTIONS
+                if code.co_name == "run_job" and "apscheduler" in code.co_filename:
+                    job = frame.f_locals.get("job")
+                    label = f"scheduler:{getattr(job, 'id', name)}"
+                stack.append(self._frame_id(code))
+                frame = frame.f_back
+                depth += 1
+            stack.reverse()
+            key = (label, *stack)
+            for session in sessions:
+                if idle and not session.include_idle:
+                    continue
+                if session.accepts(name) or session.accepts(label):
+                    session.stacks[key] += elapsed
+        for session in sessions:
+            session.samples += 1
+
+    def _frame_id(self, code) -> int:
+        index = self._frame_index.get(code)
+        if index is None:
+            index = self._frame_index[code] = len(self._frames)
+            self._frames.append((code.co_name, self._short_path(code.co_filename), code.co_firstlineno))
+        return index
+
+    @staticmethod
+    def _short_path(filename: str) -> str:
+        """去掉 site-packages 和项目目录前缀，便于阅读"""
+        for marker in ("site-packages" + os.sep, "dist-packages" + os.sep):
+            position = filename.rfind(marker)
+            if position >= 0:
+                return filename[position + len(marker):]
+        cwd = os.getcwd() + os.sep
+        return filename[len(cwd):] if filename.startswith(cwd) else filename
+
+    # ---------- 保存 ----------
+
+    def _finish(self, session: ProfileSession) -> None:
+        session.stopped_at = time.time()
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, session.id)
+            with open(base + FORMATS["speedscope"], "w", encoding="utf-8") as f:
+                json.dump(self.to_speedscope(session), f, ensure_ascii=False)
+            with open(base + FORMATS["folded"], "w", encoding="utf-8") as f:
+                f.write(self.to_folded(session))
+            self._write_meta(session, "finished")
+            self._prune()
+            logger.info(
+                f"采样分析已完成: {session.id} ({session.label}), "
+                f"{session.stopped_at - session.started_at:.1f}秒, {session.samples}次采样"
+            )
+        except Exception as e:
+            logger.error(f"保存采样分析结果失败: {session.id} - {e}")
+        finally:
+            session.done.set()
+
+    def _frame_name(self, index: int) -> str:
+        name, filename, line = self._frames[index]
+        return f"{name} ({filename}:{line})"
+
+    def to_folded(self, session: ProfileSession) -> str:
+        """折叠栈格式：每行 "线程;外层函数;...;内层函数 采样数"（flamegraph.pl / speedscope 均可读取）"""
+        interval = self.interval
+        lines = []
+        for key, seconds in session.stacks.items():
+            frames = ";".join(self._frame_name(index).replace(";", ":") for index in key[1:])
+            count = max(1, round(seconds / interval))
+            lines.append(f"{key[0]};{frames} {count}")
+        lines.sort()
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, session: ProfileSession) -> Dict[str, Any]:
+        """speedscope 文件格式：每个线程一个 sampled profile，权重为采样时间（秒）"""
+        frames: List[Dict[str, Any]] = []
+        frame_map: Dict[int, int] = {}
+        by_thread: Dict[str, Tuple[List[List[int]], List[float]]] = {}
+        for key, seconds in session.stacks.items():
+            stack = []
+            for index in key[1:]:
+                if index not in frame_map:
+                    name, filename, line = self._frames[index]
+                    frame_map[index] = len(frames)
+                    frames.append({"name": name, "file": filename, "line": line})
+                stack.append(frame_map[index])
+            samples, weights = by_thread.setdefault(key[0], ([], []))
+            samples.append(stack)
+            weights.append(round(seconds, 6))
+
+        profiles = []
+        for thread, (samples, weights) in sorted(by_thread.items(), key=lambda item: -sum(item[1][1])):
+            profiles.append({
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{session.label} ({session.id})",
+            "exporter": f"{settings.APP_NAME} sampling profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def _meta_path(self, profile_id: str) -> str:
+        return os.path.join(self.output_dir, profile_id + ".json")
+
+    def _write_meta(self, session: ProfileSession, status: str) -> None:
+        meta = {
+            "id": session.id,
+            "label": session.label,
+            "status": status,
+            "pid": os.getpid(),
+            "threads": list(session.threads) if session.threads else None,
+            "interval_ms": self.interval * 1000,
+            "started_at": session.started_at,
+            "stopped_at": session.stopped_at,
+            "samples": session.samples,
+            "thread_seconds": {},
+        }
+        if status == "finished":
+            totals: Dict[str, float] = defaultdict(float)
+            for key, seconds in session.stacks.items():
+                totals[key[0]] += seconds
+            meta["thread_seconds"] = {name: round(value, 3) for name, value in sorted(totals.items(), key=lambda item: -item[1])}
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(self._meta_path(session.id), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"写入采样分析信息失败: {e}")
+
+    def _read_meta(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._meta_path(profile_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _prune(self) -> None:
+        profiles = self.list_profiles()
+        for meta in profiles[self.max_profiles:]:
+            if meta.get("status") != "finished":
+                continue
+            for suffix in (".json", *FORMATS.values()):
+                try:
+                    os.remove(os.path.join(self.output_dir, meta["id"] + suffix))
+                except OSError:
+                    pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """目录中的分析结果（所有 worker），按开始时间倒序"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        profiles = []
+        for filename in os.listdir(self.output_dir):
+            if filename.endswith(".json") and not filename.endswith(FORMATS["speedscope"]) and not filename.startswith("_"):
+                meta = self._read_meta(filename[:-len(".json")])
+                if meta:
+                    profiles.append(meta)
+        profiles.sort(key=lambda item: item.get("started_at") or 0, reverse=True)
+        return profiles
+
+    def get_profile_path(self, profile_id: str, fmt: str = "speedscope") -> Optional[str]:
+        """结果文件路径（ID不合法、格式不支持或文件不存在时返回 None）"""
+        if fmt not in FORMATS or not _PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.output_dir, profile_id + FORMATS[fmt])
+        return path if os.path.isfile(path) else None
+
+    @staticmethod
+    def _new_id() -> str:
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    # ---------- gunicorn 多 worker ----------
+
+    @property
+    def _control_file(self) -> str:
+        return os.path.join(self.output_dir, "_control.json")
+
+    def request_all_workers(self, seconds: float, threads: Optional[List[str]] = None, include_idle: bool = False) -> str:
+        """通知所有 worker 开始分析（写入控制文件，各 worker 的控制线程在1秒内读取），返回批次ID"""
+        seconds = max(0.1, min(float(seconds), self.max_seconds))
+        batch_id = f"{time.strftime('%Y%m%d-%H%M%S')}-all-{uuid.uuid4().hex[:6]}"
+        request = {
+            "id": batch_id,
+            "until": time.time() + seconds,
+            "threads": threads,
+            "include_idle": include_idle,
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        temp_path = f"{self._control_file}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(request, f)
+        os.replace(temp_path, self._control_file)
+        self._poll_control()
+        return batch_id
+
+    def start_control(self, poll_interval: float = 1.0) -> None:
+        """启动控制线程（每个 worker 在启动时调用）"""
+        if self._control_thread is not None and self._control_thread.is_alive():
+            return
+        request = self._read_control()
+        # 启动前已结束的批次不再执行
+        if request and request.get("until", 0) <= time.time():
+            self._control_seen = request.get("id")
+
+        def loop():
+            while True:
+                time.sleep(poll_interval)
+                try:
+                    self._poll_control()
+                except Exception as e:
+                    logger.debug(f"读取采样分析控制文件失败: {e}")
+
+        self._control_thread = threading.Thread(target=loop, name="sampling-profiler-control", daemon=True)
+        self._control_thread.start()
+
+    def _read_control(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._control_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _poll_control(self) -> None:
+        request = self._read_control()
+        if not request or request.get("id") == self._control_seen:
+            return
+        self._control_seen = request.get("id")
+        remaining = request.get("until", 0) - time.time()
+        if remaining <= 0:
+            return
+        self.start(
+            label=f"all workers ({request['id']})",
+            seconds=remaining,
+            threads=request.get("threads"),
+            include_idle=bool(request.get("include_idle")),
+            profile_id=f"{request['id']}-{os.getpid()}",
+        )
+
+    # ---------- 单个请求 ----------
+
+    @staticmethod
+    def request_token_matches(token: Optional[str]) -> bool:
+        """请求头中的分析令牌是否有效（未配置 PROFILER_REQUEST_TOKEN 时始终无效）"""
+        expected = settings.PROFILER_REQUEST_TOKEN
+        return bool(expected and token) and hmac.compare_digest(token.encode(), expected.encode())
+
+
+# 全局实例
+sampling_profiler = SamplingProfiler(
+    output_dir=settings.PROFILER_OUTPUT_DIR,
+    interval_ms=settings.PROFILER_SAMPLE_INTERVAL_MS,
+    max_seconds=settings.PROFILER_MAX_SECONDS,
+    max_profiles=settings.PROFILER_MAX_FILES,
+)
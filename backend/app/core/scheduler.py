@@ -1,23 +1,27 @@
 """定时任务调度器"""
 import asyncio
 from datetime import date, timedelta
+import time
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from loguru import logger
-from app.core.database import SessionLocal
+from app.core.database import BatchSessionLocal, WorkerSessionLocal
 from app.core.config import settings
+from app.core.metrics import Metrics
 from app.services.order_cost_service import OrderCostCalculationService
 from app.services.sync_service import SyncService
 from app.services.payout_service import PayoutService
 from app.services.report_service import ReportService
 from app.models.shop import Shop
+from app.models.report_snapshot import ReportType
 
 
 def update_order_costs_job():
     """定时任务：自动更新订单成本"""
     logger.info("开始执行定时任务：更新订单成本...")
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         service = OrderCostCalculationService(db)
         result = service.calculate_order_costs(force_recalculate=False)
@@ -37,7 +41,7 @@ def update_order_costs_job():
 def sync_orders_job():
     """定时任务：同步订单数据（增量同步）"""
     logger.info("开始执行定时任务：同步订单数据...")
-    db = SessionLocal()
+    db = WorkerSessionLocal()
     try:
         # 获取所有启用的店铺
         shops = db.query(Shop).filter(Shop.is_active == True).all()
@@ -92,7 +96,7 @@ def sync_orders_job():
 def sync_products_job():
     """定时任务：同步商品数据（增量同步）"""
     logger.info("开始执行定时任务：同步商品数据...")
-    db = SessionLocal()
+    db = WorkerSessionLocal()
     try:
         # 获取所有启用的店铺
         shops = db.query(Shop).filter(Shop.is_active == True).all()
@@ -143,9 +147,28 @@ def sync_products_job():
         db.close()
 
 
+def _register_job_metrics(scheduler: BackgroundScheduler) -> None:
+    """记录每次定时任务执行的耗时（提交时计时，执行完成或出错时上报）"""
+    started = {}
+
+    def on_submitted(event):
+        for run_time in event.scheduled_run_times:
+            started[(event.job_id, run_time)] = time.monotonic()
+
+    def on_finished(event):
+        start = started.pop((event.job_id, event.scheduled_run_time), None)
+        if start is not None:
+            status = "error" if event.exception else "success"
+            Metrics.observe_scheduler_job(event.job_id, status, time.monotonic() - start)
+
+    scheduler.add_listener(on_submitted, EVENT_JOB_SUBMITTED)
+    scheduler.add_listener(on_finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+
+
 def create_scheduler() -> BackgroundScheduler:
     """创建并配置调度器"""
     scheduler = BackgroundScheduler(timezone='Asia/Shanghai')
+    _register_job_metrics(scheduler)
     
     # 每30分钟执行一次订单成本更新（只更新没有成本的订单）
     scheduler.add_job(
@@ -245,7 +268,7 @@ def create_scheduler() -> BackgroundScheduler:
 def create_payouts_job():
     """定时任务：为昨日签收的订单创建回款计划"""
     logger.info("开始执行定时任务：生成回款计划...")
-    db = SessionLocal()
+    db = WorkerSessionLocal()
     try:
         service = PayoutService(db)
         yesterday = date.today() - timedelta(days=1)
@@ -267,10 +290,57 @@ def create_payouts_job():
         db.close()
 
 
+def _save_shop_reports(db, report_service, report_type, report_date, shops, metrics_by_shop) -> int:
+    """
+    保存多个店铺的报表快照
+    
+    如启用了报表AI总结，先按并发上限并发生成各店铺总结；所有快照通过一次多行 upsert 写入。
+    
+    Returns:
+        保存的快照数
+    """
+    ai_summaries = {}
+    if settings.REPORT_AI_SUMMARY_ENABLED:
+        try:
+            ai_summaries = asyncio.run(report_service.generate_ai_summaries(
+                report_type,
+                metrics_by_shop,
+                {shop.id: shop.shop_name for shop in shops},
+                settings.REPORT_AI_SUMMARY_CONCURRENCY
+            ))
+        except Exception as e:
+            logger.warning(f"报表AI总结生成失败，仅保存指标: {e}")
+    
+    items = [
+        {
+            'shop_id': shop_id,
+            'date': report_date,
+            'metrics': metrics,
+            'ai_summary': ai_summaries.get(shop_id),
+        }
+        for shop_id, metrics in metrics_by_shop.items()
+    ]
+    saved = report_service.bulk_save_reports(report_type, items)
+    db.commit()
+    return saved
+
+
+def _log_report_totals(report_name: str, metrics_by_shop) -> None:
+    """记录报表生成汇总日志"""
+    total_orders = sum(metrics.get('total_orders', 0) for metrics in metrics_by_shop.values())
+    total_gmv = sum(metrics.get('gmv', 0) for metrics in metrics_by_shop.values())
+    logger.info(
+        f"{report_name}生成完成 - "
+        f"店铺数: {len(metrics_by_shop)}, "
+        f"订单数: {total_orders}, "
+        f"GMV: {total_gmv}"
+    )
+
+
 def generate_daily_reports_job():
     """定时任务：生成运营日报（前一日）"""
     logger.info("开始执行定时任务：生成运营日报...")
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         # 获取所有启用的店铺
         shops = db.query(Shop).filter(Shop.is_active == True).all()
@@ -282,38 +352,17 @@ def generate_daily_reports_job():
         report_service = ReportService(db)
         yesterday = date.today() - timedelta(days=1)
         
-        total_generated = 0
-        total_failed = 0
-        
-        for shop in shops:
-            try:
-                logger.info(f"为店铺 {shop.shop_name} 生成日报 - 日期: {yesterday}")
-                
-                # 生成指标
-                metrics = report_service.generate_daily_metrics(shop.id, yesterday)
-                
-                # 保存报表快照
-                report_service.save_daily_report(shop.id, yesterday, metrics)
-                db.commit()
-                
-                total_generated += 1
-                logger.info(
-                    f"店铺 {shop.shop_name} 日报生成完成 - "
-                    f"订单数: {metrics.get('total_orders', 0)}, "
-                    f"GMV: {metrics.get('gmv', 0)}"
-                )
-            except Exception as e:
-                logger.error(f"店铺 {shop.shop_name} 日报生成失败: {e}")
-                db.rollback()
-                total_failed += 1
-                continue
+        logger.info(f"为 {len(shops)} 个店铺生成日报 - 日期: {yesterday}")
         
-        logger.info(
-            f"运营日报生成完成 - "
-            f"成功: {total_generated}, "
-            f"失败: {total_failed}"
+        # 所有店铺的指标一次聚合查询得到，再一次批量保存
+        metrics_by_shop = report_service.generate_daily_metrics_for_shops(
+            [shop.id for shop in shops], yesterday
         )
+        _save_shop_reports(db, report_service, ReportType.DAILY, yesterday, shops, metrics_by_shop)
+        
+        _log_report_totals("运营日报", metrics_by_shop)
     except Exception as e:
+        db.rollback()
         logger.error(f"运营日报生成任务执行失败: {e}")
         import traceback
         logger.error(traceback.format_exc())
@@ -324,7 +373,7 @@ def generate_daily_reports_job():
 def generate_weekly_reports_job():
     """定时任务：生成运营周报（上周）"""
     logger.info("开始执行定时任务：生成运营周报...")
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         # 获取所有启用的店铺
         shops = db.query(Shop).filter(Shop.is_active == True).all()
@@ -341,43 +390,19 @@ def generate_weekly_reports_job():
         last_monday = today - timedelta(days=days_since_monday + 7)
         last_sunday = last_monday + timedelta(days=6)
         
-        total_generated = 0
-        total_failed = 0
-        
-        for shop in shops:
-            try:
-                logger.info(
-                    f"为店铺 {shop.shop_name} 生成周报 - "
-                    f"日期范围: {last_monday} 至 {last_sunday}"
-                )
-                
-                # 生成指标
-                metrics = report_service.generate_weekly_metrics(
-                    shop.id, last_monday, last_sunday
-                )
-                
-                # 保存报表快照
-                report_service.save_weekly_report(shop.id, last_monday, metrics)
-                db.commit()
-                
-                total_generated += 1
-                logger.info(
-                    f"店铺 {shop.shop_name} 周报生成完成 - "
-                    f"订单数: {metrics.get('total_orders', 0)}, "
-                    f"GMV: {metrics.get('gmv', 0)}"
-                )
-            except Exception as e:
-                logger.error(f"店铺 {shop.shop_name} 周报生成失败: {e}")
-                db.rollback()
-                total_failed += 1
-                continue
-        
         logger.info(
-            f"运营周报生成完成 - "
-            f"成功: {total_generated}, "
-            f"失败: {total_failed}"
+            f"为 {len(shops)} 个店铺生成周报 - "
+            f"日期范围: {last_monday} 至 {last_sunday}"
+        )
+        
+        metrics_by_shop = report_service.generate_weekly_metrics_for_shops(
+            [shop.id for shop in shops], last_monday, last_sunday
         )
+        _save_shop_reports(db, report_service, ReportType.WEEKLY, last_monday, shops, metrics_by_shop)
+        
+        _log_report_totals("运营周报", metrics_by_shop)
     except Exception as e:
+        db.rollback()
         logger.error(f"运营周报生成任务执行失败: {e}")
         import traceback
         logger.error(traceback.format_exc())
@@ -388,7 +413,7 @@ def generate_weekly_reports_job():
 def generate_monthly_reports_job():
     """定时任务：生成运营月报（上月）"""
     logger.info("开始执行定时任务：生成运营月报...")
-    db = SessionLocal()
+    db = BatchSessionLocal()
     try:
         # 获取所有启用的店铺
         shops = db.query(Shop).filter(Shop.is_active == True).all()
@@ -405,43 +430,20 @@ def generate_monthly_reports_job():
         last_day_last_month = first_day_this_month - timedelta(days=1)
         first_day_last_month = last_day_last_month.replace(day=1)
         
-        total_generated = 0
-        total_failed = 0
-        
-        for shop in shops:
-            try:
-                logger.info(
-                    f"为店铺 {shop.shop_name} 生成月报 - "
-                    f"日期范围: {first_day_last_month} 至 {last_day_last_month}"
-                )
-                
-                # 生成指标
-                metrics = report_service.generate_monthly_metrics(
-                    shop.id, first_day_last_month, last_day_last_month
-                )
-                
-                # 保存报表快照
-                report_service.save_monthly_report(shop.id, first_day_last_month, metrics)
-                db.commit()
-                
-                total_generated += 1
-                logger.info(
-                    f"店铺 {shop.shop_name} 月报生成完成 - "
-                    f"订单数: {metrics.get('total_orders', 0)}, "
-                    f"GMV: {metrics.get('gmv', 0)}"
-                )
-            except Exception as e:
-                logger.error(f"店铺 {shop.shop_name} 月报生成失败: {e}")
-                db.rollback()
-                total_failed += 1
-                continue
-        
         logger.info(
-            f"运营月报生成完成 - "
-            f"成功: {total_generated}, "
-            f"失败: {total_failed}"
+            f"为 {len(shops)} 个店铺生成月报 - "
+            f"日期范围: {first_day_last_month} 至 {last_day_last_month}"
+        )
+        
+        # 由上月日报快照汇总
+        metrics_by_shop = report_service.generate_monthly_metrics_for_shops(
+            [shop.id for shop in shops], first_day_last_month, last_day_last_month
         )
+        _save_shop_reports(db, report_service, ReportType.MONTHLY, first_day_last_month, shops, metrics_by_shop)
+        
+        _log_report_totals("运营月报", metrics_by_shop)
     except Exception as e:
+        db.rollback()
         logger.error(f"运营月报生成任务执行失败: {e}")
         import traceback
         logger.error(traceback.format_exc())
@@ -452,7 +454,7 @@ def generate_monthly_reports_job():
 def update_order_status_job():
     """定时任务：更新未完成订单状态"""
     logger.info("开始执行定时任务：更新订单状态...")
-    db = SessionLocal()
+    db = WorkerSessionLocal()
     try:
         # 获取所有启用的店铺
         shops = db.query(Shop).filter(Shop.is_active == True).all()
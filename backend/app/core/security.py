@@ -6,6 +6,7 @@ import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from app.core.auth_cache import last_login_recorder, principal_cache
 from app.core.config import settings
 from app.core.database import get_db
 from app.models.user import User
@@ -102,24 +103,37 @@ def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
-    """获取当前用户"""
+    """
+    获取当前用户
+    
+    已解析的令牌和用户信息有短时缓存，命中时不访问数据库（返回的用户对象不属于当前会话，
+    需要修改用户时请按 id 重新查询）；last_login_at 合并后定期批量写入。
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    payload = verify_token(token)
+    payload = principal_cache.get_token(token)
     if payload is None:
-        raise credentials_exception
+        payload = verify_token(token)
+        if payload is None:
+            raise credentials_exception
+        principal_cache.set_token(token, payload)
     
     username: str = payload.get("sub")
     if username is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
+    principal = principal_cache.get_principal(username)
+    if principal is not None:
+        user = principal_cache.to_user(principal)
+    else:
+        user = db.query(User).filter(User.username == username).first()
+        if user is None:
+            raise credentials_exception
+        principal_cache.set_principal(user)
     
     if not user.is_active:
         raise HTTPException(
@@ -127,15 +141,8 @@ def get_current_user(
             detail="User is inactive"
         )
     
-    # 更新最后登录时间
-    try:
-        user.last_login_at = datetime.utcnow()
-        db.commit()
-    except Exception as e:
-        # 如果更新最后登录时间失败，记录错误但不影响认证
-        from loguru import logger
-        logger.warning(f"更新最后登录时间失败: {e}")
-        db.rollback()
+    # 记录最后登录时间（合并后由后台线程批量写入）
+    last_login_recorder.touch(user.id)
     
     return user
 
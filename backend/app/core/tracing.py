@@ -0,0 +1,374 @@
+"""同步任务的分段追踪
+
+订单同步按阶段记录耗时，找出时间花在 Temu API 等待、限流等待、原始订单写入、商品匹配还是事务提交上：
+- trace：一次同步（根 span），结束时生成耗时分布摘要（附加到同步日志、店铺同步状态），并导出
+- span：有明确起止时间的阶段，如拉取一页订单、处理一页订单，嵌套在当前 span 下
+- phase：在当前 span 内按名称累计的高频阶段（每个订单都会执行的写入、匹配），不单独生成 span，
+  导出为 span 的属性 phase.<名称>.ms / phase.<名称>.count
+
+当前上下文中没有 trace 时 span/phase 不做任何事情，可以直接放在公共代码（如限流器）中。
+
+导出格式为 OTLP/JSON（ExportTraceServiceRequest），不依赖 OpenTelemetry SDK：
+- TRACING_EXPORT_FILE：每个 trace 追加一行，OpenTelemetry Collector 的 otlpjsonfile 接收器可直接读取
+- TRACING_OTLP_ENDPOINT：在后台线程 POST 到 {endpoint}/v1/traces（Collector、Jaeger、Tempo 等）
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+# 摘要中时间线保留的顶层 span 数和最慢的 span 数
+TIMELINE_LIMIT = 60
+SLOWEST_LIMIT = 5
+
+
+class Span:
+    """一个阶段（时间使用 time.time_ns，导出时即为 Unix 纳秒时间戳）"""
+
+    __slots__ = ("trace", "name", "span_id", "parent", "start_ns", "end_ns", "attributes", "phases", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        # {名称: [次数, 秒]}
+        self.phases: Dict[str, List[float]] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def add_phase(self, name: str, seconds: float, count: int = 1) -> None:
+        item = self.phases.get(name)
+        if item is None:
+            self.phases[name] = [count, seconds]
+        else:
+            item[0] += count
+            item[1] += seconds
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+class Trace:
+    """一次追踪（根 span 及其全部子 span）"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.root = Span(self, name, None, attributes)
+        self.spans.append(self.root)
+        self.token = None
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_current_span", default=None)
+
+
+class Tracer:
+    """分段追踪器"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        export_file: Optional[str] = None,
+        otlp_endpoint: Optional[str] = None,
+        service_name: str = "temu-omni-backend"
+    ):
+        """
+        Args:
+            enabled: 是否启用（关闭后 trace 返回 None，span/phase 不记录）
+            export_file: OTLP/JSON 导出文件（每个 trace 一行），为空不导出到文件
+            otlp_endpoint: OTLP/HTTP 地址（如 http://otel-collector:4318），为空不发送
+            service_name: 导出的 service.name
+        """
+        self.enabled = enabled
+        self.export_file = export_file
+        self.otlp_endpoint = otlp_endpoint.rstrip("/") if otlp_endpoint else None
+        self.service_name = service_name
+        self._file_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # ---- 记录 ----
+
+    def start_trace(self, name: str, **attributes) -> Optional[Trace]:
+        """开始一个 trace（根 span 成为当前 span），需与 end_trace 成对调用"""
+        if not self.enabled:
+            return None
+        trace = Trace(name, attributes)
+        trace.token = _current_span.set(trace.root)
+        return trace
+
+    def end_trace(self, trace: Optional[Trace], error: Optional[BaseException] = None) -> Optional[Dict[str, Any]]:
+        """
+        结束 trace 并导出
+
+        Returns:
+            耗时分布摘要（见 summarize），未启用时返回None
+        """
+        if trace is None:
+            return None
+        root = trace.root
+        root.end_ns = time.time_ns()
+        if error is not None:
+            root.error = str(error)
+        if trace.token is not None:
+            try:
+                _current_span.reset(trace.token)
+            except ValueError:
+                # 在不同的上下文中结束（如在回调中），当前上下文中的 span 不需要恢复
+                pass
+        if self.export_file or self.otlp_endpoint:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+            self._executor.submit(self._export, trace)
+        return self.summarize(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Optional[Span]]:
+        """当前 span 下的子阶段（with 块内为当前 span）"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+        span = Span(parent.trace, name, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            parent.trace.add(span)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """在当前 span 中累计一个高频阶段的耗时"""
+        span = _current_span.get()
+        if span is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            span.add_phase(name, time.perf_counter() - started)
+
+    @staticmethod
+    def add_phase(name: str, seconds: float) -> None:
+        """在当前 span 中累计已测量的耗时（如限流器的等待时间）"""
+        span = _current_span.get()
+        if span is not None:
+            span.add_phase(name, seconds)
+
+    async def timed_iter(self, name: str, iterable: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """
+        为异步迭代中每次等待下一项的时间记录一个 span（如通过批量接口逐页拉取订单）
+
+        span 只覆盖等待时间，不在迭代期间成为当前 span，消费方处理每一项时仍在原来的 span 下。
+        """
+        parent = _current_span.get()
+        iterator = iterable.__aiter__()
+        index = 0
+        try:
+            while True:
+                start_ns = time.time_ns()
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                if parent is not None:
+                    span = Span(parent.trace, name, parent, {"index": index})
+                    span.start_ns = start_ns
+                    span.end_ns = time.time_ns()
+                    parent.trace.add(span)
+                index += 1
+                yield item
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    # ---- 摘要 ----
+
+    @staticmethod
+    def summarize(trace: Trace) -> Dict[str, Any]:
+        """
+        耗时分布摘要
+
+        - phases：按 span 名称和 phase 名称汇总的次数、总耗时、占总时长的比例
+          （span 的耗时包含其中的 phase；拉取与写入交替进行时合计可能超过100%）
+        - timeline：根 span 下前若干个子 span 的起始偏移和耗时（瀑布图）
+        - slowest：最慢的若干个子 span 及其 phase 耗时
+        """
+        root = trace.root
+        total_ms = root.duration_ms
+        with trace._lock:
+            spans = list(trace.spans)
+
+        totals: Dict[str, List[float]] = {}
+        for span in spans:
+            if span is not root:
+                item = totals.setdefault(span.name, [0, 0.0])
+                item[0] += 1
+                item[1] += span.duration_ms
+            for phase_name, (count, seconds) in span.phases.items():
+                item = totals.setdefault(phase_name, [0, 0.0])
+                item[0] += count
+                item[1] += seconds * 1000
+
+        def offset_ms(span: Span) -> float:
+            return round((span.start_ns - root.start_ns) / 1e6, 1)
+
+        def describe(span: Span) -> Dict[str, Any]:
+            entry = {
+                "name": span.name,
+                "offset_ms": offset_ms(span),
+                "duration_ms": round(span.duration_ms, 1),
+            }
+            if span.attributes:
+                entry["attributes"] = dict(span.attributes)
+            if span.phases:
+                entry["phases"] = {name: round(seconds * 1000, 1) for name, (_, seconds) in span.phases.items()}
+            if span.error:
+                entry["error"] = span.error
+            return entry
+
+        children = sorted((span for span in spans if span.parent is root), key=lambda span: span.start_ns)
+        slowest = sorted(children, key=lambda span: span.duration_ms, reverse=True)[:SLOWEST_LIMIT]
+        phases = [
+            {
+                "name": name,
+                "count": int(count),
+                "total_ms": round(ms, 1),
+                "percent": round(ms / total_ms * 100, 1) if total_ms else 0.0,
+            }
+            for name, (count, ms) in totals.items()
+        ]
+        phases.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {
+            "trace_id": trace.trace_id,
+            "name": root.name,
+            "started_at": datetime.fromtimestamp(root.start_ns / 1e9).isoformat(timespec="seconds"),
+            "duration_ms": round(total_ms, 1),
+            "attributes": dict(root.attributes),
+            "root_phases": {name: round(seconds * 1000, 1) for name, (_, seconds) in root.phases.items()},
+            "span_count": len(spans),
+            "error": root.error,
+            "phases": phases,
+            "timeline": [describe(span) for span in children[:TIMELINE_LIMIT]],
+            "slowest": [describe(span) for span in slowest],
+        }
+
+    @staticmethod
+    def format_summary(summary: Dict[str, Any], labels: Optional[Dict[str, str]] = None, limit: int = 10) -> List[str]:
+        """摘要转换为文本行（用于日志），labels 为阶段名称到显示名称的映射"""
+        labels = labels or {}
+        lines = [
+            f"⏱️  总耗时 {summary['duration_ms'] / 1000:.1f} 秒，{summary['span_count']} 个阶段"
+            f"（trace_id: {summary['trace_id']}）"
+        ]
+        for item in summary["phases"][:limit]:
+            bar = "█" * max(1, round(min(item["percent"], 100) / 5)) if item["total_ms"] else ""
+            lines.append(
+                f"   {labels.get(item['name'], item['name'])}: {item['total_ms'] / 1000:.2f}秒 "
+                f"({item['percent']:.1f}%, {item['count']}次) {bar}"
+            )
+        return lines
+
+    # ---- 导出 ----
+
+    def to_otlp(self, trace: Trace) -> Dict[str, Any]:
+        """转换为 OTLP/JSON 的 ExportTraceServiceRequest"""
+        with trace._lock:
+            spans = list(trace.spans)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "app.core.tracing"},
+                    "spans": [self._otlp_span(trace, span) for span in spans],
+                }],
+            }]
+        }
+
+    @staticmethod
+    def _otlp_span(trace: Trace, span: Span) -> Dict[str, Any]:
+        attributes = [_otlp_attribute(key, value) for key, value in span.attributes.items()]
+        for name, (count, seconds) in span.phases.items():
+            attributes.append(_otlp_attribute(f"phase.{name}.ms", round(seconds * 1000, 3)))
+            attributes.append(_otlp_attribute(f"phase.{name}.count", int(count)))
+        item = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": attributes,
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent is not None:
+            item["parentSpanId"] = span.parent.span_id
+        return item
+
+    def _export(self, trace: Trace) -> None:
+        payload = self.to_otlp(trace)
+        if self.export_file:
+            try:
+                directory = os.path.dirname(self.export_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                line = json.dumps(payload, ensure_ascii=False, default=str)
+                with self._file_lock, open(self.export_file, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except Exception as e:
+                logger.warning(f"写入追踪文件失败: {e}")
+        if self.otlp_endpoint:
+            try:
+                import httpx
+
+                response = httpx.post(f"{self.otlp_endpoint}/v1/traces", json=payload, timeout=10)
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"发送追踪数据失败 ({self.otlp_endpoint}): {e}")
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+# 全局实例
+tracer = Tracer(
+    enabled=settings.TRACING_ENABLED,
+    export_file=settings.TRACING_EXPORT_FILE,
+    otlp_endpoint=settings.TRACING_OTLP_ENDPOINT,
+    service_name=settings.TRACING_SERVICE_NAME,
+)
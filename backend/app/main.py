@@ -1,5 +1,5 @@
 """主应用入口"""
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from loguru import logger
@@ -7,7 +7,10 @@ import traceback
 
 from app.core.config import settings
 from app.core.database import engine, Base, check_database_connection
-from app.core.middleware import ExceptionHandlerMiddleware, RequestLoggingMiddleware, TimeoutMiddleware
+from app.core.middleware import RequestMiddleware
+from app.core.metrics import Metrics
+from app.core.concurrency import run_blocking
+from app.services.monitoring_service import MonitoringService
 from app.api import shops, orders, products, statistics, statistics_unified, sync, analytics, system, import_data, auth, order_costs, raw_data, payouts, reports, user_views, ai_data, frog_gpt, inventory_planning, profit_statement
 
 # 创建数据库表
@@ -34,17 +37,17 @@ app = FastAPI(
     debug=settings.DEBUG
 )
 
-# 添加中间件（顺序很重要，从外到内执行）
-# 1. 超时中间件（最外层）
-app.add_middleware(TimeoutMiddleware, timeout=300.0)
-
-# 2. 异常处理中间件
-app.add_middleware(ExceptionHandlerMiddleware)
-
-# 3. 请求日志中间件
-app.add_middleware(RequestLoggingMiddleware)
+# 添加中间件（后添加的在外层）
+# 1. 请求中间件（纯ASGI）：超时、异常处理、耗时直方图、采样访问日志
+app.add_middleware(
+    RequestMiddleware,
+    timeout=settings.REQUEST_TIMEOUT,
+    log_sample_rate=settings.ACCESS_LOG_SAMPLE_RATE,
+    slow_request_ms=settings.SLOW_REQUEST_MS,
+    debug=settings.DEBUG
+)
 
-# 4. CORS中间件
+# 2. CORS中间件
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS,
@@ -86,17 +89,21 @@ def root():
 
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """
     健康检查端点
     
-    检查数据库连接和应用状态
+    检查数据库连接和应用状态；当前工作进程的事件循环被阻塞、延迟过高或线程池排队时报告 degraded
     """
     try:
-        db_healthy = check_database_connection()
+        # 不占用默认线程池：默认线程池排满时健康检查仍能返回并报告排队情况
+        db_healthy = await run_blocking(check_database_connection)
+        responsiveness = MonitoringService.get_responsiveness_status()
+        healthy = db_healthy and responsiveness["status"] != "degraded"
         return {
-            "status": "healthy" if db_healthy else "degraded",
+            "status": "healthy" if healthy else "degraded",
             "database": "connected" if db_healthy else "disconnected",
+            "responsiveness": responsiveness,
             "version": settings.APP_VERSION
         }
     except Exception as e:
@@ -110,6 +117,16 @@ def health_check():
         )
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Prometheus 指标（gunicorn 多进程部署时汇总所有 worker）"""
+    if settings.METRICS_TOKEN:
+        if request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            return JSONResponse(status_code=401, content={"detail": "未授权"})
+    content, content_type = Metrics.render()
+    return Response(content=content, media_type=content_type)
+
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动事件"""
@@ -123,6 +140,14 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"初始化默认用户失败: {str(e)}")
 
+    # 启动事件循环延迟监控
+    from app.core.concurrency import loop_lag_monitor
+    loop_lag_monitor.start()
+
+    # 采样分析控制线程（接收 scope=all 的分析请求）
+    from app.core.sampling_profiler import sampling_profiler
+    sampling_profiler.start_control()
+
     # 启动定时任务调度器
     try:
         from app.core.scheduler import start_scheduler
@@ -137,6 +162,16 @@ async def shutdown_event():
     """应用关闭事件"""
     logger.info(f"{settings.APP_NAME} is shutting down...")
     
+    from app.core.concurrency import loop_lag_monitor
+    await loop_lag_monitor.stop()
+    
+    # 写入尚未落库的最后登录时间
+    from app.core.auth_cache import last_login_recorder
+    last_login_recorder.stop()
+    
+    from app.services.frog_gpt_service import frog_gpt_service
+    await frog_gpt_service.pool.aclose()
+    
     # 停止定时任务调度器
     try:
         from app.core.scheduler import stop_scheduler
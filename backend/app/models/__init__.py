@@ -3,7 +3,7 @@ from app.models.shop import Shop
 from app.models.order import Order
 from app.models.product import Product, ProductCost
 from app.models.activity import Activity
-from app.models.import_history import ImportHistory
+from app.models.import_history import ImportHistory, ImportRowHash
 from app.models.system_config import SystemConfig
 from app.models.user import User
 from app.models.user_view import UserView
@@ -15,7 +15,7 @@ from app.models.payout import Payout
 from app.models.report_snapshot import ReportSnapshot
 
 __all__ = [
-    "Shop", "Order", "Product", "ProductCost", "Activity", "ImportHistory", "User",
+    "Shop", "Order", "Product", "ProductCost", "Activity", "ImportHistory", "ImportRowHash", "User",
     "TemuOrdersRaw", "TemuProductsRaw", "OrderItem", "Payout", "ReportSnapshot"
 ]
 
@@ -1,5 +1,5 @@
 """导入历史记录模型"""
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -11,6 +11,7 @@ class ImportType(str, enum.Enum):
     ORDERS = "orders"  # 订单
     PRODUCTS = "products"  # 商品
     ACTIVITIES = "activities"  # 活动
+    ORDER_LIST = "order_list"  # 利润表-订单列表（包裹号、收货地址）
 
 
 class ImportStatus(str, enum.Enum):
@@ -27,13 +28,14 @@ class ImportHistory(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     
-    # 关联店铺
-    shop_id = Column(Integer, ForeignKey("shops.id"), nullable=False, comment="店铺ID")
+    # 关联店铺（跨店铺的导入，如利润表订单列表，为空）
+    shop_id = Column(Integer, ForeignKey("shops.id"), nullable=True, comment="店铺ID")
     
     # 导入信息
     import_type = Column(SQLEnum(ImportType), nullable=False, comment="导入类型")
     file_name = Column(String(255), nullable=False, comment="文件名")
     file_size = Column(Integer, comment="文件大小(字节)")
+    file_hash = Column(String(64), index=True, comment="文件内容SHA-256，用于识别重复上传")
     
     # 统计信息
     total_rows = Column(Integer, default=0, comment="总行数")
@@ -59,3 +61,29 @@ class ImportHistory(Base):
     def __repr__(self):
         return f"<ImportHistory {self.file_name} - {self.status}>"
 
+
+
+class ImportRowHash(Base):
+    """导入行哈希索引
+    
+    按自然键（订单号、SKU ID等）记录最近一次成功导入的行内容哈希，
+    再次导入时内容未变化的行直接跳过，不产生数据库写入。
+    """
+    __tablename__ = "import_row_hashes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    
+    import_type = Column(String(30), nullable=False, comment="导入类型")
+    shop_id = Column(Integer, nullable=False, default=0, comment="店铺ID（0表示不区分店铺）")
+    natural_key = Column(String(255), nullable=False, comment="自然键（order_sn/parent_order_sn/SKU ID）")
+    row_hash = Column(String(64), nullable=False, comment="行内容SHA-256")
+    import_id = Column(Integer, comment="最近一次写入该行的导入记录ID")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
+    
+    __table_args__ = (
+        UniqueConstraint('import_type', 'shop_id', 'natural_key', name='uq_import_row_hash_key'),
+        {'comment': '导入行哈希索引，用于增量导入'}
+    )
+    
+    def __repr__(self):
+        return f"<ImportRowHash {self.import_type}:{self.natural_key}>"
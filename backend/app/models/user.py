@@ -19,6 +19,9 @@ class User(Base):
     is_active = Column(Boolean, default=True, comment="是否启用")
     is_superuser = Column(Boolean, default=False, comment="是否为超级管理员")
     
+    # 偏好设置
+    frog_gpt_cache_enabled = Column(Boolean, default=True, server_default="true", nullable=False, comment="FrogGPT是否使用回答缓存")
+    
     # 时间戳
     created_at = Column(DateTime, default=datetime.utcnow, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, comment="更新时间")
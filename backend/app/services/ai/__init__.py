@@ -2,6 +2,7 @@
 from app.services.ai.base_provider import AIProvider, ChatMessage, ChatCompletionResponse
 from app.services.ai.deepseek_provider import DeepSeekProvider
 from app.services.ai.openai_provider import OpenAIProvider
+from app.services.ai.provider_pool import MockProvider, ProviderPool, provider_pool
 
 __all__ = [
     "AIProvider",
@@ -9,5 +10,8 @@ __all__ = [
     "ChatCompletionResponse",
     "DeepSeekProvider",
     "OpenAIProvider",
+    "MockProvider",
+    "ProviderPool",
+    "provider_pool",
 ]
 
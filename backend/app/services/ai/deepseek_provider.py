@@ -5,6 +5,7 @@ from typing import List, Optional, Iterator, Dict, Any
 from loguru import logger
 
 from app.services.ai.base_provider import AIProvider, ChatMessage, ChatCompletionResponse
+from app.services.ai.provider_pool import provider_pool
 from app.core.config import settings
 
 
@@ -79,35 +80,35 @@ class DeepSeekProvider(AIProvider):
         }
         
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
+            client = provider_pool.get_sync_client("deepseek")
+            response = client.post(url, json=payload, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
                 
-                data = response.json()
+            data = response.json()
                 
-                # 解析响应
-                choice = data.get("choices", [{}])[0]
-                message = choice.get("message", {})
-                usage = data.get("usage", {})
+            # 解析响应
+            choice = data.get("choices", [{}])[0]
+            message = choice.get("message", {})
+            usage = data.get("usage", {})
                 
-                # 检查是否有工具调用
-                tool_calls = message.get("tool_calls")
+            # 检查是否有工具调用
+            tool_calls = message.get("tool_calls")
                 
-                # 如果finish_reason是tool_calls，表示AI想要调用工具
-                response_content = message.get("content", "")
-                finish_reason = choice.get("finish_reason")
+            # 如果finish_reason是tool_calls，表示AI想要调用工具
+            response_content = message.get("content", "")
+            finish_reason = choice.get("finish_reason")
                 
-                return ChatCompletionResponse(
-                    content=response_content,
-                    model=data.get("model", model),
-                    usage={
-                        "prompt_tokens": usage.get("prompt_tokens", 0),
-                        "completion_tokens": usage.get("completion_tokens", 0),
-                        "total_tokens": usage.get("total_tokens", 0),
-                    },
-                    finish_reason=finish_reason,
-                    tool_calls=tool_calls  # 添加工具调用信息
-                )
+            return ChatCompletionResponse(
+                content=response_content,
+                model=data.get("model", model),
+                usage={
+                    "prompt_tokens": usage.get("prompt_tokens", 0),
+                    "completion_tokens": usage.get("completion_tokens", 0),
+                    "total_tokens": usage.get("total_tokens", 0),
+                },
+                finish_reason=finish_reason,
+                tool_calls=tool_calls  # 添加工具调用信息
+            )
                 
         except httpx.HTTPStatusError as e:
             error_detail = ""
@@ -186,60 +187,60 @@ class DeepSeekProvider(AIProvider):
         }
         
         try:
-            with httpx.Client(timeout=self.timeout * 2) as client:
-                with client.stream("POST", url, json=payload, headers=headers) as response:
-                    response.raise_for_status()
+            client = provider_pool.get_sync_client("deepseek")
+            with client.stream("POST", url, json=payload, headers=headers, timeout=self.timeout * 2) as response:
+                response.raise_for_status()
                     
-                    for line in response.iter_lines():
-                        if not line:
-                            continue
+                for line in response.iter_lines():
+                    if not line:
+                        continue
                         
-                        # 移除 "data: " 前缀
-                        if line.startswith("data: "):
-                            line = line[6:]
+                    # 移除 "data: " 前缀
+                    if line.startswith("data: "):
+                        line = line[6:]
                         
-                        # 检查是否是结束标记
-                        if line == "[DONE]":
-                            break
+                    # 检查是否是结束标记
+                    if line == "[DONE]":
+                        break
                         
-                        try:
-                            data = json.loads(line)
-                            choices = data.get("choices", [])
-                            if choices:
-                                delta = choices[0].get("delta", {})
-                                finish_reason = choices[0].get("finish_reason")
+                    try:
+                        data = json.loads(line)
+                        choices = data.get("choices", [])
+                        if choices:
+                            delta = choices[0].get("delta", {})
+                            finish_reason = choices[0].get("finish_reason")
                                 
-                                # 根据 DeepSeek 推理模型文档：
-                                # - reasoning_content 和 content 是同级字段
-                                # - 在流式响应中，delta.reasoning_content 和 delta.content 是分开的
-                                # - 需要分别处理这两个字段
+                            # 根据 DeepSeek 推理模型文档：
+                            # - reasoning_content 和 content 是同级字段
+                            # - 在流式响应中，delta.reasoning_content 和 delta.content 是分开的
+                            # - 需要分别处理这两个字段
                                 
-                                reasoning_content = delta.get("reasoning_content")
-                                content = delta.get("content")
+                            reasoning_content = delta.get("reasoning_content")
+                            content = delta.get("content")
                                 
-                                # 如果有思考内容，返回思考内容（标记为 thinking）
-                                if reasoning_content:
-                                    yield json.dumps({
-                                        "type": "thinking",
-                                        "content": reasoning_content
-                                    })
+                            # 如果有思考内容，返回思考内容（标记为 thinking）
+                            if reasoning_content:
+                                yield json.dumps({
+                                    "type": "thinking",
+                                    "content": reasoning_content
+                                })
                                 
-                                # 返回正常内容（注意：reasoning_content 和 content 可能同时存在）
-                                if content:
-                                    yield json.dumps({
-                                        "type": "content",
-                                        "content": content
-                                    })
+                            # 返回正常内容（注意：reasoning_content 和 content 可能同时存在）
+                            if content:
+                                yield json.dumps({
+                                    "type": "content",
+                                    "content": content
+                                })
                                 
-                                # 检查是否完成思考
-                                # 当 finish_reason 存在且不是 "thinking" 时，表示思考已完成
-                                if finish_reason and finish_reason not in ("thinking", None):
-                                    # 思考完成，发送思考结束标记
-                                    yield json.dumps({
-                                        "type": "thinking_end"
-                                    })
-                        except json.JSONDecodeError:
-                            continue
+                            # 检查是否完成思考
+                            # 当 finish_reason 存在且不是 "thinking" 时，表示思考已完成
+                            if finish_reason and finish_reason not in ("thinking", None):
+                                # 思考完成，发送思考结束标记
+                                yield json.dumps({
+                                    "type": "thinking_end"
+                                })
+                    except json.JSONDecodeError:
+                        continue
                             
         except httpx.HTTPStatusError as e:
             error_detail = ""
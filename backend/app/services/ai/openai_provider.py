@@ -5,6 +5,7 @@ from typing import List, Optional, Iterator, Dict, Any
 from loguru import logger
 
 from app.services.ai.base_provider import AIProvider, ChatMessage, ChatCompletionResponse
+from app.services.ai.provider_pool import provider_pool
 from app.core.config import settings
 
 
@@ -85,60 +86,60 @@ class OpenAIProvider(AIProvider):
         }
         
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(url, json=payload, headers=headers)
+            client = provider_pool.get_sync_client("openai")
+            response = client.post(url, json=payload, headers=headers, timeout=self.timeout)
                 
-                # 如果请求失败，记录详细错误信息
-                if response.status_code != 200:
-                    error_detail = "未知错误"
-                    try:
-                        error_data = response.json()
-                        error_detail = error_data.get("error", {}).get("message", str(error_data))
-                        logger.error(f"OpenAI API错误响应: {error_detail}, 状态码: {response.status_code}")
+            # 如果请求失败，记录详细错误信息
+            if response.status_code != 200:
+                error_detail = "未知错误"
+                try:
+                    error_data = response.json()
+                    error_detail = error_data.get("error", {}).get("message", str(error_data))
+                    logger.error(f"OpenAI API错误响应: {error_detail}, 状态码: {response.status_code}")
                         
-                        # 友好的错误提示
-                        if response.status_code == 429:
-                            if 'quota' in error_detail.lower() or 'billing' in error_detail.lower():
-                                raise ValueError("OpenAI API 配额已用完，请检查您的账户余额和账单设置。如需继续使用，请访问 https://platform.openai.com/account/billing 充值。")
-                            else:
-                                raise ValueError("OpenAI API 请求频率过高，请稍后再试。")
-                        elif response.status_code == 401:
-                            raise ValueError("OpenAI API Key 无效或已过期，请检查设置中的 API Key 是否正确。")
-                        elif response.status_code == 400:
-                            raise ValueError(f"OpenAI API 请求错误: {error_detail}")
-                    except ValueError:
-                        # 重新抛出友好的错误消息
-                        raise
-                    except:
-                        error_detail = response.text[:500] if response.text else "无错误详情"
-                        logger.error(f"OpenAI API错误响应: {error_detail}, 状态码: {response.status_code}")
-                        if response.status_code == 429:
-                            raise ValueError("OpenAI API 请求频率过高或配额已用完，请稍后再试或检查账户余额。")
-                        raise Exception(f"OpenAI API调用失败 (状态码 {response.status_code}): {error_detail}")
+                    # 友好的错误提示
+                    if response.status_code == 429:
+                        if 'quota' in error_detail.lower() or 'billing' in error_detail.lower():
+                            raise ValueError("OpenAI API 配额已用完，请检查您的账户余额和账单设置。如需继续使用，请访问 https://platform.openai.com/account/billing 充值。")
+                        else:
+                            raise ValueError("OpenAI API 请求频率过高，请稍后再试。")
+                    elif response.status_code == 401:
+                        raise ValueError("OpenAI API Key 无效或已过期，请检查设置中的 API Key 是否正确。")
+                    elif response.status_code == 400:
+                        raise ValueError(f"OpenAI API 请求错误: {error_detail}")
+                except ValueError:
+                    # 重新抛出友好的错误消息
+                    raise
+                except:
+                    error_detail = response.text[:500] if response.text else "无错误详情"
+                    logger.error(f"OpenAI API错误响应: {error_detail}, 状态码: {response.status_code}")
+                    if response.status_code == 429:
+                        raise ValueError("OpenAI API 请求频率过高或配额已用完，请稍后再试或检查账户余额。")
+                    raise Exception(f"OpenAI API调用失败 (状态码 {response.status_code}): {error_detail}")
                 
-                response.raise_for_status()
+            response.raise_for_status()
                 
-                data = response.json()
+            data = response.json()
                 
-                # 解析响应
-                choice = data.get("choices", [{}])[0]
-                message = choice.get("message", {})
-                usage = data.get("usage", {})
+            # 解析响应
+            choice = data.get("choices", [{}])[0]
+            message = choice.get("message", {})
+            usage = data.get("usage", {})
                 
-                # 检查是否有工具调用
-                tool_calls = message.get("tool_calls")
+            # 检查是否有工具调用
+            tool_calls = message.get("tool_calls")
                 
-                return ChatCompletionResponse(
-                    content=message.get("content", ""),
-                    model=data.get("model", model),
-                    usage={
-                        "prompt_tokens": usage.get("prompt_tokens", 0),
-                        "completion_tokens": usage.get("completion_tokens", 0),
-                        "total_tokens": usage.get("total_tokens", 0),
-                    },
-                    finish_reason=choice.get("finish_reason"),
-                    tool_calls=tool_calls  # 添加工具调用信息
-                )
+            return ChatCompletionResponse(
+                content=message.get("content", ""),
+                model=data.get("model", model),
+                usage={
+                    "prompt_tokens": usage.get("prompt_tokens", 0),
+                    "completion_tokens": usage.get("completion_tokens", 0),
+                    "total_tokens": usage.get("total_tokens", 0),
+                },
+                finish_reason=choice.get("finish_reason"),
+                tool_calls=tool_calls  # 添加工具调用信息
+            )
                 
         except httpx.HTTPError as e:
             logger.error(f"OpenAI API调用失败: {e}")
@@ -195,66 +196,66 @@ class OpenAIProvider(AIProvider):
         }
         
         try:
-            with httpx.Client(timeout=self.timeout * 2) as client:
-                with client.stream("POST", url, json=payload, headers=headers) as response:
-                    # 如果请求失败，记录详细错误信息
-                    if response.status_code != 200:
-                        error_detail = "未知错误"
-                        try:
-                            # 尝试读取错误响应
-                            error_text = ""
-                            for chunk in response.iter_bytes():
-                                error_text += chunk.decode('utf-8', errors='ignore')
-                                if len(error_text) > 1000:
-                                    break
-                            error_data = json.loads(error_text) if error_text else {}
-                            error_detail = error_data.get("error", {}).get("message", str(error_data))
-                            logger.error(f"OpenAI API流式调用错误响应: {error_detail}, 状态码: {response.status_code}")
+            client = provider_pool.get_sync_client("openai")
+            with client.stream("POST", url, json=payload, headers=headers, timeout=self.timeout * 2) as response:
+                # 如果请求失败，记录详细错误信息
+                if response.status_code != 200:
+                    error_detail = "未知错误"
+                    try:
+                        # 尝试读取错误响应
+                        error_text = ""
+                        for chunk in response.iter_bytes():
+                            error_text += chunk.decode('utf-8', errors='ignore')
+                            if len(error_text) > 1000:
+                                break
+                        error_data = json.loads(error_text) if error_text else {}
+                        error_detail = error_data.get("error", {}).get("message", str(error_data))
+                        logger.error(f"OpenAI API流式调用错误响应: {error_detail}, 状态码: {response.status_code}")
                             
-                            # 友好的错误提示
-                            if response.status_code == 429:
-                                if 'quota' in error_detail.lower() or 'billing' in error_detail.lower():
-                                    raise ValueError("OpenAI API 配额已用完，请检查您的账户余额和账单设置。如需继续使用，请访问 https://platform.openai.com/account/billing 充值。")
-                                else:
-                                    raise ValueError("OpenAI API 请求频率过高，请稍后再试。")
-                            elif response.status_code == 401:
-                                raise ValueError("OpenAI API Key 无效或已过期，请检查设置中的 API Key 是否正确。")
-                            elif response.status_code == 400:
-                                raise ValueError(f"OpenAI API 请求错误: {error_detail}")
-                        except ValueError:
-                            # 重新抛出友好的错误消息
-                            raise
-                        except:
-                            error_detail = f"HTTP {response.status_code}"
-                            logger.error(f"OpenAI API流式调用错误: {error_detail}")
-                            if response.status_code == 429:
-                                raise ValueError("OpenAI API 请求频率过高或配额已用完，请稍后再试或检查账户余额。")
-                            raise Exception(f"OpenAI API流式调用失败 (状态码 {response.status_code}): {error_detail}")
+                        # 友好的错误提示
+                        if response.status_code == 429:
+                            if 'quota' in error_detail.lower() or 'billing' in error_detail.lower():
+                                raise ValueError("OpenAI API 配额已用完，请检查您的账户余额和账单设置。如需继续使用，请访问 https://platform.openai.com/account/billing 充值。")
+                            else:
+                                raise ValueError("OpenAI API 请求频率过高，请稍后再试。")
+                        elif response.status_code == 401:
+                            raise ValueError("OpenAI API Key 无效或已过期，请检查设置中的 API Key 是否正确。")
+                        elif response.status_code == 400:
+                            raise ValueError(f"OpenAI API 请求错误: {error_detail}")
+                    except ValueError:
+                        # 重新抛出友好的错误消息
+                        raise
+                    except:
+                        error_detail = f"HTTP {response.status_code}"
+                        logger.error(f"OpenAI API流式调用错误: {error_detail}")
+                        if response.status_code == 429:
+                            raise ValueError("OpenAI API 请求频率过高或配额已用完，请稍后再试或检查账户余额。")
+                        raise Exception(f"OpenAI API流式调用失败 (状态码 {response.status_code}): {error_detail}")
                     
-                    response.raise_for_status()
+                response.raise_for_status()
                     
-                    for line in response.iter_lines():
-                        if not line:
-                            continue
+                for line in response.iter_lines():
+                    if not line:
+                        continue
                         
-                        # 移除 "data: " 前缀
-                        if line.startswith("data: "):
-                            line = line[6:]
+                    # 移除 "data: " 前缀
+                    if line.startswith("data: "):
+                        line = line[6:]
                         
-                        # 检查是否是结束标记
-                        if line == "[DONE]":
-                            break
+                    # 检查是否是结束标记
+                    if line == "[DONE]":
+                        break
                         
-                        try:
-                            data = json.loads(line)
-                            choices = data.get("choices", [])
-                            if choices:
-                                delta = choices[0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    yield content
-                        except json.JSONDecodeError:
-                            continue
+                    try:
+                        data = json.loads(line)
+                        choices = data.get("choices", [])
+                        if choices:
+                            delta = choices[0].get("delta", {})
+                            content = delta.get("content", "")
+                            if content:
+                                yield content
+                    except json.JSONDecodeError:
+                        continue
                             
         except httpx.HTTPError as e:
             logger.error(f"OpenAI API流式调用失败: {e}")
@@ -0,0 +1,442 @@
+"""AI Provider连接池
+
+为各AI供应商提供：
+- 共享的长连接HTTP客户端（每个供应商一个，复用TCP/TLS连接）
+- 每个供应商的并发上限和延迟统计（首token耗时、总耗时）
+- 可选的对冲请求：主供应商在首token耗时的P95内仍未返回token时，
+  向对冲目标发起第二个请求，先返回token的一方胜出，另一方立即取消。
+  只有慢尾请求才会触发对冲，并且有对冲比例上限，成本不会翻倍
+- 可注册本地模拟供应商替代真实请求，用于测试和压测
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+
+# 流式数据块中表示模型已开始输出的类型
+TOKEN_CHUNK_TYPES = ("content", "reasoning", "thinking")
+
+StreamFactory = Callable[[], AsyncIterator[Dict[str, Any]]]
+CompleteFactory = Callable[[], Awaitable[Dict[str, Any]]]
+
+_STREAM_END = object()
+
+
+class ProviderStats:
+    """单个供应商的延迟与调用统计（最近N次）"""
+
+    def __init__(self, window: int = 200):
+        self.first_token: Deque[float] = deque(maxlen=window)
+        self.total: Deque[float] = deque(maxlen=window)
+        # 最近的请求是否触发了对冲，用于限制对冲比例
+        self.hedge_history: Deque[bool] = deque(maxlen=100)
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.in_flight = 0
+
+    @staticmethod
+    def _percentile(samples: Deque[float], p: float) -> Optional[float]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def first_token_p95(self) -> Optional[float]:
+        if len(self.first_token) < settings.AI_HEDGE_MIN_SAMPLES:
+            return None
+        return self._percentile(self.first_token, 0.95)
+
+    def total_p95(self) -> Optional[float]:
+        if len(self.total) < settings.AI_HEDGE_MIN_SAMPLES:
+            return None
+        return self._percentile(self.total, 0.95)
+
+    def hedge_ratio(self) -> float:
+        if not self.hedge_history:
+            return 0.0
+        return sum(self.hedge_history) / len(self.hedge_history)
+
+    def to_dict(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "first_token_p50_ms": ms(self._percentile(self.first_token, 0.50)),
+            "first_token_p95_ms": ms(self._percentile(self.first_token, 0.95)),
+            "total_p50_ms": ms(self._percentile(self.total, 0.50)),
+            "total_p95_ms": ms(self._percentile(self.total, 0.95)),
+        }
+
+
+class MockProvider:
+    """
+    本地模拟供应商
+
+    通过 ProviderPool.set_mock(provider, MockProvider(...)) 替换真实供应商，
+    返回与真实供应商相同格式的响应/流式数据块。
+    """
+
+    def __init__(
+        self,
+        content: str = "OK",
+        first_token_delay: float = 0.0,
+        chunk_delay: float = 0.0,
+        chunk_chars: int = 8,
+        error: Optional[str] = None,
+        model: str = "mock/model"
+    ):
+        """
+        Args:
+            content: 回答内容
+            first_token_delay: 首token延迟（秒）
+            chunk_delay: 数据块间隔（秒）
+            chunk_chars: 每个数据块的字符数
+            error: 设置后返回错误
+            model: 响应中的模型名称
+        """
+        self.content = content
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = chunk_chars
+        self.error = error
+        self.model = model
+        self.calls = 0
+
+    async def complete(self, messages: List[Dict[str, Any]], **kwargs) -> Dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.first_token_delay)
+        if self.error:
+            raise ValueError(self.error)
+        return {
+            "id": f"mock-{self.calls}",
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    async def stream(self, messages: List[Dict[str, Any]], **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        self.calls += 1
+        await asyncio.sleep(self.first_token_delay)
+        if self.error:
+            yield {"type": "error", "error": self.error}
+            return
+        for start in range(0, len(self.content), self.chunk_chars):
+            if start and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield {
+                "type": "content",
+                "content": self.content[start:start + self.chunk_chars],
+                "id": f"mock-{self.calls}",
+                "model": self.model,
+            }
+        yield {"type": "done", "finish_reason": "stop"}
+
+
+class ProviderPool:
+    """AI供应商连接池"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._sync_clients: Dict[str, httpx.Client] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._stats: Dict[str, ProviderStats] = {}
+        self._mocks: Dict[str, MockProvider] = {}
+
+    @staticmethod
+    def _limits() -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=60.0
+        )
+
+    def get_client(self, provider: str) -> httpx.AsyncClient:
+        """获取供应商共享的异步HTTP客户端（长连接）"""
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=settings.OPENROUTER_TIMEOUT,
+                limits=self._limits(),
+                follow_redirects=True
+            )
+            self._clients[provider] = client
+        return client
+
+    def get_sync_client(self, provider: str) -> httpx.Client:
+        """获取供应商共享的同步HTTP客户端（供同步Provider使用）"""
+        client = self._sync_clients.get(provider)
+        if client is None or client.is_closed:
+            client = httpx.Client(
+                timeout=settings.OPENROUTER_TIMEOUT,
+                limits=self._limits(),
+                follow_redirects=True
+            )
+            self._sync_clients[provider] = client
+        return client
+
+    def get_stats(self, provider: str) -> ProviderStats:
+        stats = self._stats.get(provider)
+        if stats is None:
+            stats = self._stats[provider] = ProviderStats()
+        return stats
+
+    def get_all_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {provider: stats.to_dict() for provider, stats in self._stats.items()}
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = self._semaphores[provider] = asyncio.Semaphore(settings.AI_PROVIDER_CONCURRENCY)
+        return semaphore
+
+    def set_mock(self, provider: str, mock: MockProvider) -> None:
+        """用模拟供应商替代真实供应商"""
+        self._mocks[provider] = mock
+
+    def get_mock(self, provider: str) -> Optional[MockProvider]:
+        return self._mocks.get(provider)
+
+    def clear_mocks(self) -> None:
+        self._mocks.clear()
+
+    def _hedge_delay(self, stats: ProviderStats, p95: Optional[float]) -> Optional[float]:
+        """对冲等待时间：样本不足、未开启或近期对冲比例过高时不对冲"""
+        if not settings.AI_HEDGE_ENABLED or p95 is None:
+            return None
+        if stats.hedge_ratio() >= settings.AI_HEDGE_MAX_RATIO:
+            return None
+        return max(p95, settings.AI_HEDGE_MIN_DELAY)
+
+    async def _run_complete(self, provider: str, factory: CompleteFactory) -> Dict[str, Any]:
+        stats = self.get_stats(provider)
+        async with self._semaphore(provider):
+            stats.requests += 1
+            stats.in_flight += 1
+            started = time.monotonic()
+            try:
+                result = await factory()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                stats.failures += 1
+                raise
+            finally:
+                stats.in_flight -= 1
+            elapsed = time.monotonic() - started
+            stats.total.append(elapsed)
+            stats.first_token.append(elapsed)
+            return result
+
+    async def complete(
+        self,
+        provider: str,
+        factory: CompleteFactory,
+        hedge: Optional[Tuple[str, CompleteFactory]] = None
+    ) -> Dict[str, Any]:
+        """
+        执行非流式请求（受并发上限约束，记录耗时）
+
+        Args:
+            provider: 供应商名称
+            factory: 发起请求的协程工厂
+            hedge: 对冲目标 (供应商名称, 协程工厂)
+        """
+        stats = self.get_stats(provider)
+        delay = self._hedge_delay(stats, stats.total_p95()) if hedge else None
+        primary = asyncio.ensure_future(self._run_complete(provider, factory))
+        if delay is None:
+            stats.hedge_history.append(False)
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        stats.hedge_history.append(not done)
+        if done:
+            return primary.result()
+
+        hedge_provider, hedge_factory = hedge
+        stats.hedges += 1
+        logger.info(f"AI请求对冲: {provider} 超过 {delay:.2f}秒未返回，向 {hedge_provider} 发起对冲请求")
+        secondary = asyncio.ensure_future(self._run_complete(hedge_provider, hedge_factory))
+        pending = {primary, secondary}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            stats.hedge_wins += 1
+                        return task.result()
+            # 两个请求都失败，抛出主请求的异常
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _pump(self, provider: str, factory: StreamFactory, queue: asyncio.Queue) -> None:
+        """读取流式响应写入队列，记录首token和总耗时"""
+        stats = self.get_stats(provider)
+        async with self._semaphore(provider):
+            stats.requests += 1
+            stats.in_flight += 1
+            started = time.monotonic()
+            got_token = False
+            failed = False
+            try:
+                async for chunk in factory():
+                    chunk_type = chunk.get("type")
+                    if not got_token and chunk_type in TOKEN_CHUNK_TYPES:
+                        got_token = True
+                        stats.first_token.append(time.monotonic() - started)
+                    elif chunk_type == "error":
+                        failed = True
+                    queue.put_nowait(chunk)
+                if failed:
+                    stats.failures += 1
+                else:
+                    stats.total.append(time.monotonic() - started)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats.failures += 1
+                queue.put_nowait({"type": "error", "error": str(e)})
+            finally:
+                stats.in_flight -= 1
+                queue.put_nowait(_STREAM_END)
+
+    @staticmethod
+    async def _read_until_token(queue: asyncio.Queue, head: List[Any]) -> bool:
+        """
+        读取数据块直到出现token或流结束
+
+        Returns:
+            True 表示已读到token，False 表示流结束/出错且没有token
+        """
+        while True:
+            chunk = await queue.get()
+            head.append(chunk)
+            if chunk is _STREAM_END or chunk.get("type") == "error":
+                return False
+            if chunk.get("type") in TOKEN_CHUNK_TYPES:
+                return True
+
+    async def stream(
+        self,
+        provider: str,
+        factory: StreamFactory,
+        hedge: Optional[Tuple[str, StreamFactory]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        执行流式请求（受并发上限约束，记录首token耗时）
+
+        开启对冲且主供应商在首token P95内没有输出时，向对冲目标发起第二个请求，
+        先输出token的一方胜出，另一方取消。
+
+        Args:
+            provider: 供应商名称
+            factory: 返回流式数据块的异步生成器工厂
+            hedge: 对冲目标 (供应商名称, 异步生成器工厂)
+        """
+        stats = self.get_stats(provider)
+        delay = self._hedge_delay(stats, stats.first_token_p95()) if hedge else None
+
+        queues = {provider: asyncio.Queue()}
+        heads: Dict[str, List[Any]] = {provider: []}
+        pumps = {provider: asyncio.ensure_future(self._pump(provider, factory, queues[provider]))}
+        winner = provider
+        try:
+            if delay is not None:
+                try:
+                    await asyncio.wait_for(self._read_until_token(queues[provider], heads[provider]), delay)
+                    stats.hedge_history.append(False)
+                except asyncio.TimeoutError:
+                    stats.hedge_history.append(True)
+                    winner = await self._race_hedge(provider, delay, hedge, queues, heads, pumps)
+
+            for chunk in heads[winner]:
+                if chunk is _STREAM_END:
+                    return
+                yield chunk
+            while True:
+                chunk = await queues[winner].get()
+                if chunk is _STREAM_END:
+                    return
+                yield chunk
+        finally:
+            for task in pumps.values():
+                if not task.done():
+                    task.cancel()
+
+    async def _race_hedge(
+        self,
+        provider: str,
+        delay: float,
+        hedge: Tuple[str, StreamFactory],
+        queues: Dict[str, asyncio.Queue],
+        heads: Dict[str, List[Any]],
+        pumps: Dict[str, asyncio.Future]
+    ) -> str:
+        """主请求超时未输出token时发起对冲，返回先输出token的一方"""
+        stats = self.get_stats(provider)
+        hedge_provider, hedge_factory = hedge
+        # 同一供应商对冲时使用不同的键区分两个请求
+        hedge_key = hedge_provider if hedge_provider != provider else f"{provider}#hedge"
+        stats.hedges += 1
+        logger.info(f"AI流式请求对冲: {provider} 超过 {delay:.2f}秒未输出，向 {hedge_provider} 发起对冲请求")
+
+        queues[hedge_key] = asyncio.Queue()
+        heads[hedge_key] = []
+        pumps[hedge_key] = asyncio.ensure_future(self._pump(hedge_provider, hedge_factory, queues[hedge_key]))
+
+        readers = {
+            asyncio.ensure_future(self._read_until_token(queues[key], heads[key])): key
+            for key in (provider, hedge_key)
+        }
+        winner = provider
+        try:
+            pending = set(readers)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        winner = readers[task]
+                        if winner == hedge_key:
+                            stats.hedge_wins += 1
+                        return winner
+            # 两个请求都没有输出token：返回主请求的结果（包含错误信息）
+            return winner
+        finally:
+            for task in readers:
+                if not task.done():
+                    task.cancel()
+            for key, task in pumps.items():
+                if key != winner and not task.done():
+                    task.cancel()
+
+    async def aclose(self) -> None:
+        """关闭所有HTTP客户端"""
+        for client in self._clients.values():
+            await client.aclose()
+        for client in self._sync_clients.values():
+            client.close()
+        self._clients.clear()
+        self._sync_clients.clear()
+
+
+# 全局实例（供应用事件循环中的全局FrogGPT服务使用）
+provider_pool = ProviderPool()
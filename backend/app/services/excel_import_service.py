@@ -1,6 +1,6 @@
 """Excel导入服务"""
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 from datetime import datetime
 from sqlalchemy.orm import Session
 import json
@@ -12,6 +12,7 @@ from app.models.activity import Activity, ActivityType
 from app.models.product import Product
 from app.models.order import Order, OrderStatus
 from app.services.feishu_sheets_service import FeishuSheetsService
+from app.services.import_dedup_service import ImportDedupService
 
 
 class ExcelImportService:
@@ -21,6 +22,7 @@ class ExcelImportService:
         self.db = db
         self.shop = shop
         self.feishu_service = FeishuSheetsService()
+        self.dedup_service = ImportDedupService(db)
     
     def get_column_value(self, row, possible_names, default=''):
         """尝试多个可能的列名获取值（兼容pandas Series和dict）"""
@@ -40,6 +42,66 @@ class ExcelImportService:
                     continue
         return default
     
+    def _create_file_import_record(
+        self,
+        import_type: ImportType,
+        file_path: str,
+        file_name: str,
+        file_size: int
+    ) -> Tuple[ImportHistory, Optional[ImportHistory]]:
+        """
+        创建文件导入记录（带文件内容哈希）
+        
+        Returns:
+            (新的导入记录, 内容相同且已成功导入的历史记录或None)
+        """
+        file_hash = self.dedup_service.compute_file_hash(file_path)
+        previous = self.dedup_service.find_completed_import(import_type, file_hash, shop_id=self.shop.id)
+        
+        import_record = ImportHistory(
+            shop_id=self.shop.id,
+            import_type=import_type,
+            file_name=file_name,
+            file_size=file_size,
+            file_hash=file_hash,
+            status=ImportStatus.PROCESSING
+        )
+        self.db.add(import_record)
+        self.db.commit()
+        self.db.refresh(import_record)
+        return import_record, previous
+    
+    def _finish_duplicate_import(self, import_record: ImportHistory, previous: ImportHistory) -> ImportHistory:
+        """相同内容的文件已成功导入过：不再解析，所有行记为跳过"""
+        import_record.total_rows = previous.total_rows or 0
+        import_record.skipped_rows = import_record.total_rows
+        import_record.status = ImportStatus.SUCCESS
+        import_record.completed_at = datetime.utcnow()
+        import_record.success_log = json.dumps({
+            'items': [],
+            'duplicate_of': previous.id,
+            'stats': {'created': 0, 'updated': 0}
+        }, ensure_ascii=False)
+        self.db.commit()
+        
+        logger.info(
+            f"文件内容与导入记录#{previous.id}相同，跳过导入 - 店铺: {self.shop.shop_name}, "
+            f"类型: {import_record.import_type.value}, 行数: {import_record.total_rows}"
+        )
+        return import_record
+    
+    def _order_natural_key(self, row) -> str:
+        """订单行的自然键：订单号+SKU+SPU（与订单去重规则一致）"""
+        order_sn = str(row.get('订单编号', row.get('订单号', '')))
+        product_sku = self.get_column_value(row, ['SKUID', 'SKU ID'], '')
+        spu_id = self.get_column_value(row, ['SPUID', 'SPU ID'], '')
+        return f"{order_sn}|{product_sku}|{spu_id}"
+    
+    @staticmethod
+    async def _iter_single_chunk(df: pd.DataFrame) -> AsyncIterator[pd.DataFrame]:
+        """将整表DataFrame包装为单个分块，复用分块导入逻辑"""
+        yield df
+    
     async def import_activities_from_url(
         self,
         feishu_url: str,
@@ -68,11 +130,9 @@ class ExcelImportService:
         self.db.refresh(import_record)
         
         try:
-            # 从飞书表格读取数据
-            df = await self.feishu_service.read_sheet_from_url(feishu_url, password)
-            
-            # 使用通用导入逻辑
-            return await self._process_activities_dataframe(df, import_record)
+            # 从飞书表格分块读取数据，逐块导入
+            chunks = self.feishu_service.iter_sheet_from_url(feishu_url, password)
+            return await self._process_activities_chunks(chunks, import_record)
             
         except Exception as e:
             self.db.rollback()
@@ -100,17 +160,12 @@ class ExcelImportService:
         Returns:
             导入历史记录
         """
-        # 创建导入记录
-        import_record = ImportHistory(
-            shop_id=self.shop.id,
-            import_type=ImportType.ACTIVITIES,
-            file_name=file_name,
-            file_size=file_size,
-            status=ImportStatus.PROCESSING
+        # 创建导入记录（相同内容的文件已成功导入过则直接跳过）
+        import_record, previous = self._create_file_import_record(
+            ImportType.ACTIVITIES, file_path, file_name, file_size
         )
-        self.db.add(import_record)
-        self.db.commit()
-        self.db.refresh(import_record)
+        if previous:
+            return self._finish_duplicate_import(import_record, previous)
         
         errors = []
         success_items = []
@@ -148,17 +203,12 @@ class ExcelImportService:
         Returns:
             导入历史记录
         """
-        # 创建导入记录
-        import_record = ImportHistory(
-            shop_id=self.shop.id,
-            import_type=ImportType.PRODUCTS,
-            file_name=file_name,
-            file_size=file_size,
-            status=ImportStatus.PROCESSING
+        # 创建导入记录（相同内容的文件已成功导入过则直接跳过）
+        import_record, previous = self._create_file_import_record(
+            ImportType.PRODUCTS, file_path, file_name, file_size
         )
-        self.db.add(import_record)
-        self.db.commit()
-        self.db.refresh(import_record)
+        if previous:
+            return self._finish_duplicate_import(import_record, previous)
         
         try:
             # 读取Excel
@@ -188,74 +238,92 @@ class ExcelImportService:
             df: pandas DataFrame
             import_record: 导入记录
             
+        Returns:
+            更新后的导入记录
+        """
+        return await self._process_activities_chunks(self._iter_single_chunk(df), import_record)
+    
+    async def _process_activities_chunks(
+        self,
+        chunks: AsyncIterator[pd.DataFrame],
+        import_record: ImportHistory
+    ) -> ImportHistory:
+        """
+        逐块处理活动数据，每个分块处理完即提交
+        
+        Args:
+            chunks: DataFrame 分块的异步迭代器（索引为数据行号）
+            import_record: 导入记录
+            
         Returns:
             更新后的导入记录
         """
         errors = []
         success_items = []
         
-        import_record.total_rows = len(df)
-        self.db.commit()
+        logger.info(f"开始导入活动数据 - 店铺: {self.shop.shop_name}")
         
-        logger.info(f"开始导入活动数据 - 店铺: {self.shop.shop_name}, 总行数: {len(df)}")
+        async for df in chunks:
+            import_record.total_rows = (import_record.total_rows or 0) + len(df)
+            self.db.commit()
+            
+            # 处理每一行
+            for index, row in df.iterrows():
+                try:
+                    # 提取数据
+                    product_name = str(row.get('商品信息', ''))
+                    spu_id = str(row.get('SPU ID', ''))
+                    
+                    # 生成活动名称
+                    activity_name = f"活动推广 - {product_name[:50]}"
+                    
+                    # 检查是否已存在
+                    existing = self.db.query(Activity).filter(
+                        Activity.shop_id == self.shop.id,
+                        Activity.activity_name == activity_name
+                    ).first()
+                    
+                    if existing:
+                        import_record.skipped_rows += 1
+                        continue
+                    
+                    # 解析GMV和转化率
+                    gmv = float(row.get('活动 GMV', 0))
+                    click_rate = self._parse_percentage(row.get('活动商品点击转化率', '0%'))
+                    pay_rate = self._parse_percentage(row.get('活动商品支付转化率', '0%'))
+                    
+                    # 创建活动记录
+                    activity = Activity(
+                        shop_id=self.shop.id,
+                        activity_name=activity_name,
+                        activity_type=ActivityType.PROMOTION,
+                        start_time=datetime.now(),
+                        end_time=None,
+                        description=f"SPU: {spu_id}\n销量: {row.get('活动销量', 0)}\n曝光: {row.get('活动商品曝光用户数', 0)}\n点击: {row.get('活动商品点击用户数', 0)}",
+                        budget=gmv,
+                        actual_cost=gmv,
+                        is_active=True
+                    )
+                    
+                    self.db.add(activity)
+                    import_record.success_rows += 1
+                    success_items.append({
+                        'row': index + 1,
+                        'name': activity_name,
+                        'gmv': gmv
+                    })
+                    
+                except Exception as e:
+                    import_record.failed_rows += 1
+                    errors.append({
+                        'row': index + 1,
+                        'error': str(e),
+                        'data': row.to_dict() if hasattr(row, 'to_dict') else str(row)
+                    })
+                    logger.error(f"导入活动失败 - 行{index + 1}: {e}")
         
-        # 处理每一行
-        for index, row in df.iterrows():
-            try:
-                # 提取数据
-                product_name = str(row.get('商品信息', ''))
-                spu_id = str(row.get('SPU ID', ''))
-                
-                # 生成活动名称
-                activity_name = f"活动推广 - {product_name[:50]}"
-                
-                # 检查是否已存在
-                existing = self.db.query(Activity).filter(
-                    Activity.shop_id == self.shop.id,
-                    Activity.activity_name == activity_name
-                ).first()
-                
-                if existing:
-                    import_record.skipped_rows += 1
-                    continue
-                
-                # 解析GMV和转化率
-                gmv = float(row.get('活动 GMV', 0))
-                click_rate = self._parse_percentage(row.get('活动商品点击转化率', '0%'))
-                pay_rate = self._parse_percentage(row.get('活动商品支付转化率', '0%'))
-                
-                # 创建活动记录
-                activity = Activity(
-                    shop_id=self.shop.id,
-                    activity_name=activity_name,
-                    activity_type=ActivityType.PROMOTION,
-                    start_time=datetime.now(),
-                    end_time=None,
-                    description=f"SPU: {spu_id}\n销量: {row.get('活动销量', 0)}\n曝光: {row.get('活动商品曝光用户数', 0)}\n点击: {row.get('活动商品点击用户数', 0)}",
-                    budget=gmv,
-                    actual_cost=gmv,
-                    is_active=True
-                )
-                
-                self.db.add(activity)
-                import_record.success_rows += 1
-                success_items.append({
-                    'row': index + 1,
-                    'name': activity_name,
-                    'gmv': gmv
-                })
-                
-            except Exception as e:
-                import_record.failed_rows += 1
-                errors.append({
-                    'row': index + 1,
-                    'error': str(e),
-                    'data': row.to_dict() if hasattr(row, 'to_dict') else str(row)
-                })
-                logger.error(f"导入活动失败 - 行{index + 1}: {e}")
-        
-        # 提交所有更改
-        self.db.commit()
+            # 每个分块提交一次
+            self.db.commit()
         
         # 更新导入记录状态
         import_record.completed_at = datetime.utcnow()
@@ -308,11 +376,9 @@ class ExcelImportService:
         self.db.refresh(import_record)
         
         try:
-            # 从飞书表格读取数据
-            df = await self.feishu_service.read_sheet_from_url(feishu_url, password)
-            
-            # 使用通用导入逻辑
-            return await self._process_products_dataframe(df, import_record)
+            # 从飞书表格分块读取数据，逐块导入
+            chunks = self.feishu_service.iter_sheet_from_url(feishu_url, password)
+            return await self._process_products_chunks(chunks, import_record)
             
         except Exception as e:
             self.db.rollback()
@@ -376,16 +442,27 @@ class ExcelImportService:
         """
         处理商品数据DataFrame（通用逻辑）
         """
+        return await self._process_products_chunks(self._iter_single_chunk(df), import_record)
+    
+    async def _process_products_chunks(
+        self,
+        chunks: AsyncIterator[pd.DataFrame],
+        import_record: ImportHistory
+    ) -> ImportHistory:
+        """
+        逐块处理商品数据，每个分块处理完即提交
+        
+        Args:
+            chunks: DataFrame 分块的异步迭代器（索引为数据行号）
+            import_record: 导入记录
+            
+        Returns:
+            更新后的导入记录
+        """
         errors = []
         success_items = []
         
-        import_record.total_rows = len(df)
-        self.db.commit()
-        
-        logger.info(f"开始导入商品数据 - 店铺: {self.shop.shop_name}, 总行数: {len(df)}")
-        
-        # 打印所有列名以便调试
-        logger.info(f"Excel列名: {list(df.columns)}")
+        logger.info(f"开始导入商品数据 - 店铺: {self.shop.shop_name}")
         
         # 检查必要的字段是否存在（提前检测，避免事务失败）
         try:
@@ -409,204 +486,237 @@ class ExcelImportService:
                 ) from struct_error
             raise
         
-        # 处理每一行
-        for index, row in df.iterrows():
-            try:
-                product_name = str(row.get('商品名称', ''))
-                sku_id = str(row.get('SKU ID', ''))
-                spu_id = str(row.get('SPU ID', ''))
-                
-                # 解析价格
-                price_str = str(row.get('申报价格', '0'))
-                price = self._parse_price(price_str)
-                
-                # 检查商品是否已存在
-                existing = self.db.query(Product).filter(
-                    Product.shop_id == self.shop.id,
-                    Product.product_id == sku_id
-                ).first()
-                
-                if existing:
-                    # 更新商品信息
-                    sku_number = str(row.get('SKU货号', '')).strip()
-                    category = str(row.get('类目', '')).strip()
-                    # 负责人：Excel中没有该列或为空时，使用店铺默认负责人
-                    manager = str(row.get('负责人', '')).strip()
-                    if not manager or manager.lower() in ['nan', 'none', '']:
-                        manager = self.shop.default_manager or ''
-                    skc_id = str(row.get('SKC ID', '')).strip()
-                    # 尝试多个可能的列名来获取申报价格状态
-                    price_status_candidates = [
-                        '申报价格状态', '申报价格状态 ', ' 申报价格状态', 
-                        '价格状态', '申报状态', '价格状态 ', '申报状态 ',
-                        '申报价格 状态', '申报 价格状态'
-                    ]
-                    price_status = self.get_column_value(row, price_status_candidates, '')
-                    
-                    # 如果为空，尝试从所有包含"状态"的列获取
-                    if not price_status:
-                        status_cols = [col for col in df.columns if '状态' in str(col) and '申报' in str(col)]
-                        for status_col in status_cols:
-                            if status_col in row and pd.notna(row[status_col]):
-                                val = str(row[status_col]).strip()
-                                if val and val.lower() not in ['nan', 'none', '']:
-                                    price_status = val
-                                    logger.debug(f"行 {index + 1}: 从列 '{status_col}' 获取申报价格状态 = {price_status}")
-                                    break
-                    
-                    # 处理空值和'nan'字符串
-                    if sku_number and sku_number.lower() not in ['nan', 'none', '']:
-                        existing.sku = sku_number
-                    if category and category.lower() not in ['nan', 'none', '']:
-                        existing.category = category
-                    if manager and manager.lower() not in ['nan', 'none', '']:
-                        existing.manager = manager
-                    elif not existing.manager:
-                        # 如果没有负责人且店铺有默认负责人，使用默认负责人
-                        default_manager = getattr(self.shop, 'default_manager', None)
-                        if default_manager:
-                            existing.manager = default_manager
-                    
-                    # 更新SKC ID
-                    if skc_id and skc_id.lower() not in ['nan', 'none', '']:
-                        existing.skc_id = skc_id
+        async for df in chunks:
+            import_record.total_rows = (import_record.total_rows or 0) + len(df)
+            self.db.commit()
+            
+            # 打印所有列名以便调试（首个分块）
+            if import_record.total_rows == len(df):
+                logger.info(f"Excel列名: {list(df.columns)}")
+            
+            # 行内容哈希：按SKU ID记录，与上次成功导入相同的行直接跳过；
+            # SKU ID 为空的行没有可靠的自然键（不同的行会互相覆盖），不记录哈希，每次都照常处理
+            row_hashes = {}
+            for index, row in df.iterrows():
+                sku_key = str(row.get('SKU ID', ''))
+                if sku_key.strip() and sku_key.strip().lower() not in ('nan', 'none'):
+                    row_hashes[index] = (sku_key, self.dedup_service.compute_row_hash(row.to_dict()))
+            known_hashes = self.dedup_service.load_row_hashes(
+                ImportType.PRODUCTS, [key for key, _ in row_hashes.values()], shop_id=self.shop.id
+            )
+            chunk_hashes = {}
+            chunk_rolled_back = False
+            
+            # 处理每一行
+            for index, row in df.iterrows():
+                try:
+                    product_name = str(row.get('商品名称', ''))
+                    sku_id = str(row.get('SKU ID', ''))
+                    spu_id = str(row.get('SPU ID', ''))
                     
-                    # 更新申报价格状态（直接从表格导入，不自动设置）
-                    if price_status and price_status.lower() not in ['nan', 'none', '']:
-                        existing.price_status = price_status
+                    if index in row_hashes:
+                        natural_key, row_hash = row_hashes[index]
+                        if known_hashes.get(natural_key) == row_hash:
+                            import_record.skipped_rows += 1
+                            continue
+                        chunk_hashes[natural_key] = row_hash
                     
-                    # 更新状态（支持多种状态值）
-                    status_str = str(row.get('状态', '')).strip()
-                    is_published = (
-                        status_str == '已发布' or 
-                        status_str == '已发布到站点' or
-                        '已发布' in status_str
-                    )
-                    existing.is_active = is_published
+                    # 解析价格
+                    price_str = str(row.get('申报价格', '0'))
+                    price = self._parse_price(price_str)
                     
-                    # 更新价格和货币单位（申报价格单位是人民币）
-                    if price > 0:
-                        existing.current_price = price
-                    existing.currency = 'CNY'  # 申报价格单位是人民币，无论价格是否大于0
+                    # 检查商品是否已存在
+                    existing = self.db.query(Product).filter(
+                        Product.shop_id == self.shop.id,
+                        Product.product_id == sku_id
+                    ).first()
                     
-                    # 更新SPU ID（如果存在）
-                    if spu_id and spu_id.lower() not in ['nan', 'none', '']:
-                        spu_id_value = spu_id.strip()
-                        existing.spu_id = spu_id_value
-                        # 同时更新description中的SPU信息以便兼容
-                        existing.description = f"SPU: {spu_id_value}"
+                    if existing:
+                        # 更新商品信息
+                        sku_number = str(row.get('SKU货号', '')).strip()
+                        category = str(row.get('类目', '')).strip()
+                        # 负责人：Excel中没有该列或为空时，使用店铺默认负责人
+                        manager = str(row.get('负责人', '')).strip()
+                        if not manager or manager.lower() in ['nan', 'none', '']:
+                            manager = self.shop.default_manager or ''
+                        skc_id = str(row.get('SKC ID', '')).strip()
+                        # 尝试多个可能的列名来获取申报价格状态
+                        price_status_candidates = [
+                            '申报价格状态', '申报价格状态 ', ' 申报价格状态', 
+                            '价格状态', '申报状态', '价格状态 ', '申报状态 ',
+                            '申报价格 状态', '申报 价格状态'
+                        ]
+                        price_status = self.get_column_value(row, price_status_candidates, '')
+                        
+                        # 如果为空，尝试从所有包含"状态"的列获取
+                        if not price_status:
+                            status_cols = [col for col in df.columns if '状态' in str(col) and '申报' in str(col)]
+                            for status_col in status_cols:
+                                if status_col in row and pd.notna(row[status_col]):
+                                    val = str(row[status_col]).strip()
+                                    if val and val.lower() not in ['nan', 'none', '']:
+                                        price_status = val
+                                        logger.debug(f"行 {index + 1}: 从列 '{status_col}' 获取申报价格状态 = {price_status}")
+                                        break
+                        
+                        # 处理空值和'nan'字符串
+                        if sku_number and sku_number.lower() not in ['nan', 'none', '']:
+                            existing.sku = sku_number
+                        if category and category.lower() not in ['nan', 'none', '']:
+                            existing.category = category
+                        if manager and manager.lower() not in ['nan', 'none', '']:
+                            existing.manager = manager
+                        elif not existing.manager:
+                            # 如果没有负责人且店铺有默认负责人，使用默认负责人
+                            default_manager = getattr(self.shop, 'default_manager', None)
+                            if default_manager:
+                                existing.manager = default_manager
+                        
+                        # 更新SKC ID
+                        if skc_id and skc_id.lower() not in ['nan', 'none', '']:
+                            existing.skc_id = skc_id
+                        
+                        # 更新申报价格状态（直接从表格导入，不自动设置）
+                        if price_status and price_status.lower() not in ['nan', 'none', '']:
+                            existing.price_status = price_status
+                        
+                        # 更新状态（支持多种状态值）
+                        status_str = str(row.get('状态', '')).strip()
+                        is_published = (
+                            status_str == '已发布' or 
+                            status_str == '已发布到站点' or
+                            '已发布' in status_str
+                        )
+                        existing.is_active = is_published
+                        
+                        # 更新价格和货币单位（申报价格单位是人民币）
+                        if price > 0:
+                            existing.current_price = price
+                        existing.currency = 'CNY'  # 申报价格单位是人民币，无论价格是否大于0
+                        
+                        # 更新SPU ID（如果存在）
+                        if spu_id and spu_id.lower() not in ['nan', 'none', '']:
+                            spu_id_value = spu_id.strip()
+                            existing.spu_id = spu_id_value
+                            # 同时更新description中的SPU信息以便兼容
+                            existing.description = f"SPU: {spu_id_value}"
+                        
+                        import_record.success_rows += 1
+                        success_items.append({
+                            'row': index + 1,
+                            'name': product_name,
+                            'action': 'updated'
+                        })
+                    else:
+                        # 创建新商品
+                        sku_number = str(row.get('SKU货号', '')).strip()
+                        category = str(row.get('类目', '')).strip()
+                        # 负责人：Excel中没有该列或为空时，使用店铺默认负责人
+                        manager = str(row.get('负责人', '')).strip()
+                        if not manager or manager.lower() in ['nan', 'none', '']:
+                            manager = self.shop.default_manager or ''
+                        skc_id = str(row.get('SKC ID', '')).strip()
+                        # 尝试多个可能的列名来获取申报价格状态
+                        price_status_candidates = [
+                            '申报价格状态', '申报价格状态 ', ' 申报价格状态', 
+                            '价格状态', '申报状态', '价格状态 ', '申报状态 ',
+                            '申报价格 状态', '申报 价格状态'
+                        ]
+                        price_status = self.get_column_value(row, price_status_candidates, '')
+                        
+                        # 如果为空，尝试从所有包含"状态"的列获取
+                        if not price_status:
+                            status_cols = [col for col in df.columns if '状态' in str(col) and '申报' in str(col)]
+                            for status_col in status_cols:
+                                if status_col in row and pd.notna(row[status_col]):
+                                    val = str(row[status_col]).strip()
+                                    if val and val.lower() not in ['nan', 'none', '']:
+                                        price_status = val
+                                        logger.debug(f"行 {index + 1}: 从列 '{status_col}' 获取申报价格状态 = {price_status}")
+                                        break
+                        
+                        # 处理空值和'nan'字符串
+                        if sku_number.lower() in ['nan', 'none', '']:
+                            sku_number = None
+                        if category.lower() in ['nan', 'none', '']:
+                            category = None
+                        if manager.lower() in ['nan', 'none', '']:
+                            manager = getattr(self.shop, 'default_manager', None)
+                        if skc_id.lower() in ['nan', 'none', '']:
+                            skc_id = None
+                        if price_status.lower() in ['nan', 'none', '']:
+                            price_status = None
+                        
+                        # 处理SPU ID（保存到独立字段）
+                        spu_id_value = None
+                        if spu_id and spu_id.lower() not in ['nan', 'none', '']:
+                            spu_id_value = spu_id.strip()
+                        
+                        # description 仍然保存 SPU 信息以便兼容
+                        description = None
+                        if spu_id_value:
+                            description = f"SPU: {spu_id_value}"
+                        
+                        # 判断状态（支持多种状态值）
+                        status_str = str(row.get('状态', '')).strip()
+                        # 已发布的状态值包括：已发布、已发布到站点
+                        # 未发布的状态值包括：未发布、价格申报中、已下架
+                        is_published = (
+                            status_str == '已发布' or 
+                            status_str == '已发布到站点' or
+                            '已发布' in status_str
+                        )
+                        
+                        product = Product(
+                            shop_id=self.shop.id,
+                            product_id=sku_id,
+                            product_name=product_name,
+                            sku=sku_number,  # 设置SKU货号
+                            current_price=price if price > 0 else 0,
+                            currency='CNY',  # 申报价格单位是人民币
+                            category=category,
+                            is_active=is_published,
+                            description=description,
+                            manager=manager,
+                            skc_id=skc_id,
+                            spu_id=spu_id_value,  # 保存 SPU ID 到独立字段
+                            price_status=price_status,  # 直接使用从表格导入的值
+                            created_at=datetime.utcnow()
+                        )
+                        self.db.add(product)
+                        import_record.success_rows += 1
+                        success_items.append({
+                            'row': index + 1,
+                            'name': product_name,
+                            'action': 'created'
+                        })
                     
-                    import_record.success_rows += 1
-                    success_items.append({
+                except Exception as e:
+                    import_record.failed_rows += 1
+                    errors.append({
                         'row': index + 1,
-                        'name': product_name,
-                        'action': 'updated'
+                        'error': str(e),
+                        'data': row.to_dict() if hasattr(row, 'to_dict') else str(row)
                     })
-                else:
-                    # 创建新商品
-                    sku_number = str(row.get('SKU货号', '')).strip()
-                    category = str(row.get('类目', '')).strip()
-                    # 负责人：Excel中没有该列或为空时，使用店铺默认负责人
-                    manager = str(row.get('负责人', '')).strip()
-                    if not manager or manager.lower() in ['nan', 'none', '']:
-                        manager = self.shop.default_manager or ''
-                    skc_id = str(row.get('SKC ID', '')).strip()
-                    # 尝试多个可能的列名来获取申报价格状态
-                    price_status_candidates = [
-                        '申报价格状态', '申报价格状态 ', ' 申报价格状态', 
-                        '价格状态', '申报状态', '价格状态 ', '申报状态 ',
-                        '申报价格 状态', '申报 价格状态'
-                    ]
-                    price_status = self.get_column_value(row, price_status_candidates, '')
-                    
-                    # 如果为空，尝试从所有包含"状态"的列获取
-                    if not price_status:
-                        status_cols = [col for col in df.columns if '状态' in str(col) and '申报' in str(col)]
-                        for status_col in status_cols:
-                            if status_col in row and pd.notna(row[status_col]):
-                                val = str(row[status_col]).strip()
-                                if val and val.lower() not in ['nan', 'none', '']:
-                                    price_status = val
-                                    logger.debug(f"行 {index + 1}: 从列 '{status_col}' 获取申报价格状态 = {price_status}")
-                                    break
-                    
-                    # 处理空值和'nan'字符串
-                    if sku_number.lower() in ['nan', 'none', '']:
-                        sku_number = None
-                    if category.lower() in ['nan', 'none', '']:
-                        category = None
-                    if manager.lower() in ['nan', 'none', '']:
-                        manager = getattr(self.shop, 'default_manager', None)
-                    if skc_id.lower() in ['nan', 'none', '']:
-                        skc_id = None
-                    if price_status.lower() in ['nan', 'none', '']:
-                        price_status = None
-                    
-                    # 处理SPU ID（保存到独立字段）
-                    spu_id_value = None
-                    if spu_id and spu_id.lower() not in ['nan', 'none', '']:
-                        spu_id_value = spu_id.strip()
-                    
-                    # description 仍然保存 SPU 信息以便兼容
-                    description = None
-                    if spu_id_value:
-                        description = f"SPU: {spu_id_value}"
-                    
-                    # 判断状态（支持多种状态值）
-                    status_str = str(row.get('状态', '')).strip()
-                    # 已发布的状态值包括：已发布、已发布到站点
-                    # 未发布的状态值包括：未发布、价格申报中、已下架
-                    is_published = (
-                        status_str == '已发布' or 
-                        status_str == '已发布到站点' or
-                        '已发布' in status_str
-                    )
-                    
-                    product = Product(
-                        shop_id=self.shop.id,
-                        product_id=sku_id,
-                        product_name=product_name,
-                        sku=sku_number,  # 设置SKU货号
-                        current_price=price if price > 0 else 0,
-                        currency='CNY',  # 申报价格单位是人民币
-                        category=category,
-                        is_active=is_published,
-                        description=description,
-                        manager=manager,
-                        skc_id=skc_id,
-                        spu_id=spu_id_value,  # 保存 SPU ID 到独立字段
-                        price_status=price_status,  # 直接使用从表格导入的值
-                        created_at=datetime.utcnow()
+                    logger.error(f"导入商品失败 - 行{index + 1}: {e}")
+                    # 如果事务失败，回滚并尝试继续
+                    chunk_rolled_back = True
+                    try:
+                        self.db.rollback()
+                    except:
+                        pass
+        
+            # 每个分块提交一次；分块内发生过回滚时，已写入的行无法确认，不记录哈希
+            try:
+                if not chunk_rolled_back:
+                    self.dedup_service.save_row_hashes(
+                        ImportType.PRODUCTS, chunk_hashes, import_record.id, shop_id=self.shop.id
                     )
-                    self.db.add(product)
-                    import_record.success_rows += 1
-                    success_items.append({
-                        'row': index + 1,
-                        'name': product_name,
-                        'action': 'created'
-                    })
-                
+                self.db.commit()
             except Exception as e:
-                import_record.failed_rows += 1
-                errors.append({
-                    'row': index + 1,
-                    'error': str(e),
-                    'data': row.to_dict() if hasattr(row, 'to_dict') else str(row)
-                })
-                logger.error(f"导入商品失败 - 行{index + 1}: {e}")
-                # 如果事务失败，回滚并尝试继续
-                try:
-                    self.db.rollback()
-                except:
-                    pass
-        
-        # 提交所有更改
-        try:
-            self.db.commit()
-        except Exception as e:
-            self.db.rollback()
-            logger.error(f"提交商品数据失败: {e}")
-            raise
+                self.db.rollback()
+                logger.error(f"提交商品数据失败: {e}")
+                raise
         
         # 更新导入记录状态
         import_record.completed_at = datetime.utcnow()
@@ -649,8 +759,8 @@ class ExcelImportService:
         self.db.refresh(import_record)
         
         try:
-            df = await self.feishu_service.read_sheet_from_url(feishu_url, password)
-            return await self._process_orders_dataframe(df, import_record)
+            chunks = self.feishu_service.iter_sheet_from_url(feishu_url, password)
+            return await self._process_orders_chunks(chunks, import_record)
         except Exception as e:
             self.db.rollback()
             import_record.status = ImportStatus.FAILED
@@ -662,16 +772,11 @@ class ExcelImportService:
     
     async def import_orders(self, file_path: str, file_name: str, file_size: int) -> ImportHistory:
         """导入订单数据（Excel文件）"""
-        import_record = ImportHistory(
-            shop_id=self.shop.id,
-            import_type=ImportType.ORDERS,
-            file_name=file_name,
-            file_size=file_size,
-            status=ImportStatus.PROCESSING
+        import_record, previous = self._create_file_import_record(
+            ImportType.ORDERS, file_path, file_name, file_size
         )
-        self.db.add(import_record)
-        self.db.commit()
-        self.db.refresh(import_record)
+        if previous:
+            return self._finish_duplicate_import(import_record, previous)
         
         try:
             df = pd.read_excel(file_path)
@@ -687,162 +792,193 @@ class ExcelImportService:
     
     async def _process_orders_dataframe(self, df: pd.DataFrame, import_record: ImportHistory) -> ImportHistory:
         """处理订单数据DataFrame"""
+        return await self._process_orders_chunks(self._iter_single_chunk(df), import_record)
+    
+    async def _process_orders_chunks(
+        self,
+        chunks: AsyncIterator[pd.DataFrame],
+        import_record: ImportHistory
+    ) -> ImportHistory:
+        """逐块处理订单数据（支持在线表格分片读取）"""
         errors = []
         success_items = []
         
-        import_record.total_rows = len(df)
-        self.db.commit()
+        logger.info(f"开始导入订单 - 店铺: {self.shop.shop_name}")
         
-        logger.info(f"开始导入订单 - 店铺: {self.shop.shop_name}, 总行数: {len(df)}")
-        
-        for index, row in df.iterrows():
-            try:
-                # 订单编号（必需）
-                order_sn = str(row.get('订单编号', row.get('订单号', '')))
-                if not order_sn or order_sn == 'nan':
-                    import_record.failed_rows += 1
-                    errors.append({'row': index + 1, 'error': '缺少订单编号'})
-                    continue
-                
-                # 解析数据
-                product_name = self.get_column_value(row, ['商品名称', '商品'], '')
-                
-                # 获取数量（优先使用应履约件数）
-                quantity_str = self.get_column_value(row, ['应履约件数', '数量', '购买数量'], '1')
+        async for df in chunks:
+            import_record.total_rows = (import_record.total_rows or 0) + len(df)
+            self.db.commit()
+            
+            # 行内容哈希：与上次成功导入相同的行直接跳过，不产生写入
+            row_hashes = {
+                index: (self._order_natural_key(row), self.dedup_service.compute_row_hash(row.to_dict()))
+                for index, row in df.iterrows()
+            }
+            known_hashes = self.dedup_service.load_row_hashes(
+                ImportType.ORDERS, [key for key, _ in row_hashes.values()], shop_id=self.shop.id
+            )
+            committed_hashes = {}
+            
+            for index, row in df.iterrows():
                 try:
-                    quantity = int(float(quantity_str)) if quantity_str else 1
-                except (ValueError, TypeError):
-                    quantity = 1
-                
-                # 获取单价和总金额
-                # 注意：Excel中没有金额字段，因此单价和总金额默认为0
-                # 后续可以通过其他方式（如API、手动更新等）补充金额数据
-                unit_price_str = self.get_column_value(row, ['单价', '商品单价', '商品价格'], '0')
-                unit_price = self._parse_price(unit_price_str)
-                
-                total_price_str = self.get_column_value(row, ['订单金额', '总金额', '订单总价', '成交金额'], '0')
-                total_price = self._parse_price(total_price_str)
-                
-                # 如果总金额为0且单价也为0，则保持总金额为0（Excel中没有金额数据）
-                # 这样前端会显示"-"，表示金额待补充
-                
-                # 获取SKU（只使用SKUID，如果没有则保持为空）
-                product_sku = self.get_column_value(row, ['SKUID', 'SKU ID'], '')
-                if product_sku and product_sku.lower() in ['nan', 'none', '']:
-                    product_sku = ''
-                
-                # 获取SPU ID
-                spu_id = self.get_column_value(row, ['SPUID', 'SPU ID'], '')
-                if spu_id and spu_id.lower() in ['nan', 'none', '']:
-                    spu_id = ''
-                
-                # 去重规则：根据订单号+SKU+SPU组合查询（允许同一订单号下有不同SKU/SPU）
-                existing = self.db.query(Order).filter(
-                    Order.order_sn == order_sn,
-                    Order.product_sku == (product_sku if product_sku else None),
-                    Order.spu_id == (spu_id if spu_id else None)
-                ).first()
-                
-                # 获取订单时间（优先使用订单创建时间）
-                order_time_str = self.get_column_value(row, ['订单创建时间', '下单时间', '订单时间'], '')
-                order_time = self._parse_datetime(order_time_str)
-                if not order_time:
-                    order_time = datetime.utcnow()
-                
-                payment_time_str = self.get_column_value(row, ['支付时间', '付款时间'], '')
-                payment_time = self._parse_datetime(payment_time_str)
-                
-                status_str = self.get_column_value(row, ['订单状态', '状态'], 'PENDING')
-                status = self._parse_order_status(status_str)
-                
-                if existing:
-                    # 更新现有订单（基于订单号+SKU+SPU组合去重）
-                    existing.product_name = product_name
-                    existing.product_sku = product_sku
-                    existing.spu_id = spu_id if spu_id else None
-                    existing.quantity = quantity
-                    existing.unit_price = unit_price
-                    # 如果Excel中没有总金额，则尝试用单价*数量计算；如果单价也为0，则保持为0
-                    # 这样前端会显示"-"，表示金额待后续补充
-                    existing.total_price = total_price if total_price > 0 else (unit_price * quantity if unit_price > 0 else 0)
-                    existing.currency = 'CNY'  # 订单金额统一为人民币
-                    existing.status = status
-                    existing.order_time = order_time
-                    existing.payment_time = payment_time
-                    shipping_time_str = self.get_column_value(row, ['实际发货时间', '发货时间', '运送时间'], '')
-                    existing.shipping_time = self._parse_datetime(shipping_time_str)
+                    # 订单编号（必需）
+                    order_sn = str(row.get('订单编号', row.get('订单号', '')))
+                    if not order_sn or order_sn == 'nan':
+                        import_record.failed_rows += 1
+                        errors.append({'row': index + 1, 'error': '缺少订单编号'})
+                        continue
+                    
+                    natural_key, row_hash = row_hashes[index]
+                    if known_hashes.get(natural_key) == row_hash:
+                        import_record.skipped_rows += 1
+                        continue
                     
-                    delivery_time_str = self.get_column_value(row, ['送达时间', '交付时间'], '')
-                    existing.delivery_time = self._parse_datetime(delivery_time_str)
+                    # 解析数据
+                    product_name = self.get_column_value(row, ['商品名称', '商品'], '')
                     
-                    existing.customer_id = self.get_column_value(row, ['客户ID', '买家ID', '用户ID'], '')
+                    # 获取数量（优先使用应履约件数）
+                    quantity_str = self.get_column_value(row, ['应履约件数', '数量', '购买数量'], '1')
+                    try:
+                        quantity = int(float(quantity_str)) if quantity_str else 1
+                    except (ValueError, TypeError):
+                        quantity = 1
                     
-                    # 提取地址信息（城市级别 + 邮编，用于精确确定区域）
-                    # 存储：国家、省份、城市、邮编（有助于精确确定订单收货地址的区域）
-                    # 不存储：详细地址、电话、姓名等隐私信息
-                    shipping_country = self.get_column_value(row, ['国家', '收货国家', '收货人国家', 'Country'], '')
-                    shipping_city = self.get_column_value(row, ['城市', '收货城市', 'City'], '')
-                    shipping_province = self.get_column_value(row, ['省份', '州', '收货省份', '收货州', 'Province', 'State'], '')
-                    shipping_postal_code = self.get_column_value(row, ['邮编', '邮政编码', '收货邮编', 'Postal Code', 'Zip Code'], '')
+                    # 获取单价和总金额
+                    # 注意：Excel中没有金额字段，因此单价和总金额默认为0
+                    # 后续可以通过其他方式（如API、手动更新等）补充金额数据
+                    unit_price_str = self.get_column_value(row, ['单价', '商品单价', '商品价格'], '0')
+                    unit_price = self._parse_price(unit_price_str)
                     
-                    existing.shipping_country = shipping_country
-                    existing.shipping_city = shipping_city if shipping_city else None
-                    existing.shipping_province = shipping_province if shipping_province else None
-                    existing.shipping_postal_code = shipping_postal_code if shipping_postal_code else None
-                    existing.updated_at = datetime.utcnow()
+                    total_price_str = self.get_column_value(row, ['订单金额', '总金额', '订单总价', '成交金额'], '0')
+                    total_price = self._parse_price(total_price_str)
                     
-                    # 保存原始数据
-                    existing.raw_data = json.dumps(row.to_dict(), ensure_ascii=False, default=str)
+                    # 如果总金额为0且单价也为0，则保持总金额为0（Excel中没有金额数据）
+                    # 这样前端会显示"-"，表示金额待补充
                     
-                    import_record.success_rows += 1
-                    success_items.append({'row': index + 1, 'order_sn': order_sn, 'action': 'updated'})
-                else:
-                    # 创建新订单（允许同一订单号下有多个SKU/SPU）
-                    order = Order(
-                        shop_id=self.shop.id,
-                        order_sn=order_sn,
-                        product_name=product_name,
-                        product_sku=product_sku if product_sku else None,
-                        spu_id=spu_id if spu_id else None,
-                        quantity=quantity,
-                        unit_price=unit_price,
+                    # 获取SKU（只使用SKUID，如果没有则保持为空）
+                    product_sku = self.get_column_value(row, ['SKUID', 'SKU ID'], '')
+                    if product_sku and product_sku.lower() in ['nan', 'none', '']:
+                        product_sku = ''
+                    
+                    # 获取SPU ID
+                    spu_id = self.get_column_value(row, ['SPUID', 'SPU ID'], '')
+                    if spu_id and spu_id.lower() in ['nan', 'none', '']:
+                        spu_id = ''
+                    
+                    # 去重规则：根据订单号+SKU+SPU组合查询（允许同一订单号下有不同SKU/SPU）
+                    existing = self.db.query(Order).filter(
+                        Order.order_sn == order_sn,
+                        Order.product_sku == (product_sku if product_sku else None),
+                        Order.spu_id == (spu_id if spu_id else None)
+                    ).first()
+                    
+                    # 获取订单时间（优先使用订单创建时间）
+                    order_time_str = self.get_column_value(row, ['订单创建时间', '下单时间', '订单时间'], '')
+                    order_time = self._parse_datetime(order_time_str)
+                    if not order_time:
+                        order_time = datetime.utcnow()
+                    
+                    payment_time_str = self.get_column_value(row, ['支付时间', '付款时间'], '')
+                    payment_time = self._parse_datetime(payment_time_str)
+                    
+                    status_str = self.get_column_value(row, ['订单状态', '状态'], 'PENDING')
+                    status = self._parse_order_status(status_str)
+                    
+                    if existing:
+                        # 更新现有订单（基于订单号+SKU+SPU组合去重）
+                        existing.product_name = product_name
+                        existing.product_sku = product_sku
+                        existing.spu_id = spu_id if spu_id else None
+                        existing.quantity = quantity
+                        existing.unit_price = unit_price
                         # 如果Excel中没有总金额，则尝试用单价*数量计算；如果单价也为0，则保持为0
                         # 这样前端会显示"-"，表示金额待后续补充
-                        total_price=total_price if total_price > 0 else (unit_price * quantity if unit_price > 0 else 0),
-                        currency='CNY',  # 订单金额统一为人民币
-                        status=status,
-                        order_time=order_time,
-                        payment_time=payment_time,
-                    shipping_time=self._parse_datetime(self.get_column_value(row, ['实际发货时间', '发货时间', '运送时间'], '')),
-                    delivery_time=self._parse_datetime(self.get_column_value(row, ['送达时间', '交付时间'], '')),
-                    customer_id=self.get_column_value(row, ['客户ID', '买家ID', '用户ID'], ''),
-                    shipping_country=self.get_column_value(row, ['国家', '收货国家', '收货人国家', 'Country'], ''),
-                    shipping_city=self.get_column_value(row, ['城市', '收货城市', 'City'], '') or None,
-                    shipping_province=self.get_column_value(row, ['省份', '州', '收货省份', '收货州', 'Province', 'State'], '') or None,
-                    shipping_postal_code=self.get_column_value(row, ['邮编', '邮政编码', '收货邮编', 'Postal Code', 'Zip Code'], '') or None,
-                        raw_data=json.dumps(row.to_dict(), ensure_ascii=False, default=str),
-                        created_at=datetime.utcnow()
-                    )
+                        existing.total_price = total_price if total_price > 0 else (unit_price * quantity if unit_price > 0 else 0)
+                        existing.currency = 'CNY'  # 订单金额统一为人民币
+                        existing.status = status
+                        existing.order_time = order_time
+                        existing.payment_time = payment_time
+                        shipping_time_str = self.get_column_value(row, ['实际发货时间', '发货时间', '运送时间'], '')
+                        existing.shipping_time = self._parse_datetime(shipping_time_str)
+                        
+                        delivery_time_str = self.get_column_value(row, ['送达时间', '交付时间'], '')
+                        existing.delivery_time = self._parse_datetime(delivery_time_str)
+                        
+                        existing.customer_id = self.get_column_value(row, ['客户ID', '买家ID', '用户ID'], '')
+                        
+                        # 提取地址信息（城市级别 + 邮编，用于精确确定区域）
+                        # 存储：国家、省份、城市、邮编（有助于精确确定订单收货地址的区域）
+                        # 不存储：详细地址、电话、姓名等隐私信息
+                        shipping_country = self.get_column_value(row, ['国家', '收货国家', '收货人国家', 'Country'], '')
+                        shipping_city = self.get_column_value(row, ['城市', '收货城市', 'City'], '')
+                        shipping_province = self.get_column_value(row, ['省份', '州', '收货省份', '收货州', 'Province', 'State'], '')
+                        shipping_postal_code = self.get_column_value(row, ['邮编', '邮政编码', '收货邮编', 'Postal Code', 'Zip Code'], '')
+                        
+                        existing.shipping_country = shipping_country
+                        existing.shipping_city = shipping_city if shipping_city else None
+                        existing.shipping_province = shipping_province if shipping_province else None
+                        existing.shipping_postal_code = shipping_postal_code if shipping_postal_code else None
+                        existing.updated_at = datetime.utcnow()
+                        
+                        # 保存原始数据
+                        existing.raw_data = json.dumps(row.to_dict(), ensure_ascii=False, default=str)
+                        
+                        import_record.success_rows += 1
+                        success_items.append({'row': index + 1, 'order_sn': order_sn, 'action': 'updated'})
+                    else:
+                        # 创建新订单（允许同一订单号下有多个SKU/SPU）
+                        order = Order(
+                            shop_id=self.shop.id,
+                            order_sn=order_sn,
+                            product_name=product_name,
+                            product_sku=product_sku if product_sku else None,
+                            spu_id=spu_id if spu_id else None,
+                            quantity=quantity,
+                            unit_price=unit_price,
+                            # 如果Excel中没有总金额，则尝试用单价*数量计算；如果单价也为0，则保持为0
+                            # 这样前端会显示"-"，表示金额待后续补充
+                            total_price=total_price if total_price > 0 else (unit_price * quantity if unit_price > 0 else 0),
+                            currency='CNY',  # 订单金额统一为人民币
+                            status=status,
+                            order_time=order_time,
+                            payment_time=payment_time,
+                        shipping_time=self._parse_datetime(self.get_column_value(row, ['实际发货时间', '发货时间', '运送时间'], '')),
+                        delivery_time=self._parse_datetime(self.get_column_value(row, ['送达时间', '交付时间'], '')),
+                        customer_id=self.get_column_value(row, ['客户ID', '买家ID', '用户ID'], ''),
+                        shipping_country=self.get_column_value(row, ['国家', '收货国家', '收货人国家', 'Country'], ''),
+                        shipping_city=self.get_column_value(row, ['城市', '收货城市', 'City'], '') or None,
+                        shipping_province=self.get_column_value(row, ['省份', '州', '收货省份', '收货州', 'Province', 'State'], '') or None,
+                        shipping_postal_code=self.get_column_value(row, ['邮编', '邮政编码', '收货邮编', 'Postal Code', 'Zip Code'], '') or None,
+                            raw_data=json.dumps(row.to_dict(), ensure_ascii=False, default=str),
+                            created_at=datetime.utcnow()
+                        )
+                        
+                        self.db.add(order)
+                        import_record.success_rows += 1
+                        success_items.append({'row': index + 1, 'order_sn': order_sn, 'action': 'created'})
                     
-                    self.db.add(order)
-                    import_record.success_rows += 1
-                    success_items.append({'row': index + 1, 'order_sn': order_sn, 'action': 'created'})
-                
-                # 每处理一行就提交，避免批量提交时的冲突
-                try:
-                    self.db.commit()
-                except Exception as commit_error:
-                    logger.error(f"提交订单失败 - 行{index + 1}, 订单号{order_sn}: {commit_error}")
-                    self.db.rollback()
+                    # 每处理一行就提交，避免批量提交时的冲突
+                    try:
+                        self.db.commit()
+                        committed_hashes[natural_key] = row_hash
+                    except Exception as commit_error:
+                        logger.error(f"提交订单失败 - 行{index + 1}, 订单号{order_sn}: {commit_error}")
+                        self.db.rollback()
+                        import_record.failed_rows += 1
+                        import_record.success_rows -= 1  # 回退成功计数
+                        errors.append({'row': index + 1, 'order_sn': order_sn, 'error': str(commit_error)})
+                    
+                except Exception as e:
                     import_record.failed_rows += 1
-                    import_record.success_rows -= 1  # 回退成功计数
-                    errors.append({'row': index + 1, 'order_sn': order_sn, 'error': str(commit_error)})
-                
-            except Exception as e:
-                import_record.failed_rows += 1
-                errors.append({'row': index + 1, 'error': str(e)})
-                logger.error(f"导入订单失败 - 行{index + 1}: {e}")
-                self.db.rollback()  # 确保回滚
+                    errors.append({'row': index + 1, 'error': str(e)})
+                    logger.error(f"导入订单失败 - 行{index + 1}: {e}")
+                    self.db.rollback()  # 确保回滚
+            
+            # 记录本分块成功写入行的内容哈希
+            self.dedup_service.save_row_hashes(
+                ImportType.ORDERS, committed_hashes, import_record.id, shop_id=self.shop.id
+            )
+            self.db.commit()
         
         # 不需要再次批量提交，因为每行都已经单独提交
         
@@ -1,31 +1,60 @@
 """飞书在线表格服务"""
 import re
+import time
+import asyncio
+from collections import deque
 import httpx
 import pandas as pd
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from loguru import logger
 
+from app.core.config import settings
+
 
 class FeishuSheetsService:
     """飞书在线表格服务类"""
     
-    def __init__(self, app_id: Optional[str] = None, app_secret: Optional[str] = None):
+    # 租户访问令牌缓存（按app_id），值为 (token, 过期时间戳)
+    _token_cache: Dict[str, Tuple[str, float]] = {}
+    # 令牌提前刷新的余量（秒）
+    TOKEN_REFRESH_MARGIN = 300
+    
+    def __init__(
+        self,
+        app_id: Optional[str] = None,
+        app_secret: Optional[str] = None,
+        base_url: Optional[str] = None,
+        chunk_rows: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
         """
         初始化飞书API客户端
         
         Args:
-            app_id: 飞书应用ID（可选，使用环境变量）
-            app_secret: 飞书应用密钥（可选，使用环境变量）
+            app_id: 飞书应用ID（可选，默认读取 FEISHU_APP_ID）
+            app_secret: 飞书应用密钥（可选，默认读取 FEISHU_APP_SECRET）
+            base_url: 开放API地址（可选，便于指向本地桩服务）
+            chunk_rows: 每个分片读取的行数（可选）
+            concurrency: 并发读取的分片数（可选）
         """
-        self.app_id = app_id
-        self.app_secret = app_secret
-        self.base_url = "https://open.feishu.cn/open-apis"
+        self.app_id = app_id or settings.FEISHU_APP_ID
+        self.app_secret = app_secret or settings.FEISHU_APP_SECRET
+        self.base_url = (base_url or "https://open.feishu.cn/open-apis").rstrip('/')
+        self.chunk_rows = max(1, chunk_rows or settings.FEISHU_READ_CHUNK_ROWS)
+        self.concurrency = max(1, concurrency or settings.FEISHU_READ_CONCURRENCY)
         self.access_token = None
+        # 刷新令牌的锁在首次使用时创建（Python 3.9 的 asyncio.Lock 绑定创建时的事件循环，不能在导入时创建）
+        self._token_lock: Optional[asyncio.Lock] = None
     
-    async def get_access_token(self) -> str:
+    async def get_access_token(self, client: Optional[httpx.AsyncClient] = None) -> str:
         """
         获取飞书访问令牌
         
+        令牌按 app_id 缓存至过期前 TOKEN_REFRESH_MARGIN 秒，期间不再重复请求。
+        
+        Args:
+            client: 复用的HTTP客户端（可选）
+        
         Returns:
             访问令牌
         """
@@ -34,22 +63,48 @@ class FeishuSheetsService:
             logger.warning("飞书App ID和Secret未配置，将尝试使用公开分享链接")
             return ""
         
-        url = f"{self.base_url}/auth/v3/tenant_access_token/internal"
-        data = {
-            "app_id": self.app_id,
-            "app_secret": self.app_secret
-        }
+        cached = self._token_cache.get(self.app_id)
+        if cached and cached[1] > time.time():
+            self.access_token = cached[0]
+            return self.access_token
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data)
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            # 等待锁期间可能已被其他协程刷新
+            cached = self._token_cache.get(self.app_id)
+            if cached and cached[1] > time.time():
+                self.access_token = cached[0]
+                return self.access_token
+            
+            url = f"{self.base_url}/auth/v3/tenant_access_token/internal"
+            data = {
+                "app_id": self.app_id,
+                "app_secret": self.app_secret
+            }
+            
+            if client is not None:
+                response = await client.post(url, json=data)
+            else:
+                async with httpx.AsyncClient() as own_client:
+                    response = await own_client.post(url, json=data)
             result = response.json()
             
             if result.get("code") == 0:
                 self.access_token = result.get("tenant_access_token")
+                expire = int(result.get("expire") or 0)
+                expires_at = time.time() + max(expire - self.TOKEN_REFRESH_MARGIN, 0)
+                self._token_cache[self.app_id] = (self.access_token, expires_at)
                 return self.access_token
             else:
                 raise Exception(f"获取飞书访问令牌失败: {result.get('msg')}")
     
+    @classmethod
+    def invalidate_token(cls, app_id: Optional[str]) -> None:
+        """使缓存的访问令牌失效（令牌被服务端拒绝时调用）"""
+        if app_id:
+            cls._token_cache.pop(app_id, None)
+    
     def parse_feishu_url(self, url: str) -> Dict[str, str]:
         """
         解析飞书表格URL，提取spreadsheet_token和sheet_id
@@ -124,6 +179,46 @@ class FeishuSheetsService:
         # 方法2: 尝试通过导出链接读取（公开表格或密码保护表格）
         return await self._read_via_export(spreadsheet_token, sheet_id, password, host)
     
+    async def iter_sheet_data(
+        self,
+        spreadsheet_token: str,
+        sheet_id: Optional[str] = None,
+        password: Optional[str] = None,
+        host: Optional[str] = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        分块读取飞书表格数据
+        
+        配置了应用凭证时按行范围并发分片读取，逐块产出；否则回退为导出方式整表产出一次。
+        每个分块的索引为数据行号（从0开始，不含表头），与整表读取时一致。
+        
+        Args:
+            spreadsheet_token: 表格token
+            sheet_id: 工作表ID（可选）
+            password: 表格访问密码（可选）
+            host: 表格所在域名（可选）
+            
+        Yields:
+            pandas DataFrame 分块
+        """
+        if self.app_id and self.app_secret:
+            chunks = self._iter_via_api(spreadsheet_token, sheet_id)
+            yielded = False
+            try:
+                async for chunk in chunks:
+                    yielded = True
+                    yield chunk
+                return
+            except Exception as e:
+                # 已产出部分数据时无法回退，否则会重复导入
+                if yielded:
+                    raise
+                logger.warning(f"通过API读取失败: {e}，尝试使用导出方式")
+            finally:
+                await chunks.aclose()
+        
+        yield await self._read_via_export(spreadsheet_token, sheet_id, password, host)
+    
     async def _read_via_api(
         self, 
         spreadsheet_token: str, 
@@ -131,42 +226,153 @@ class FeishuSheetsService:
         range_notation: Optional[str] = None
     ) -> pd.DataFrame:
         """通过飞书API读取表格数据"""
-        if not self.access_token:
-            await self.get_access_token()
+        if range_notation:
+            return await self._read_range_via_api(spreadsheet_token, sheet_id, range_notation)
         
-        # 获取工作表元数据
-        if not sheet_id:
-            sheet_id = await self._get_first_sheet_id(spreadsheet_token)
+        chunks = [chunk async for chunk in self._iter_via_api(spreadsheet_token, sheet_id)]
+        if not chunks:
+            raise ValueError("表格数据为空")
+        return pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    
+    async def _read_range_via_api(
+        self,
+        spreadsheet_token: str,
+        sheet_id: Optional[str],
+        range_notation: str
+    ) -> pd.DataFrame:
+        """通过飞书API读取指定范围（首行作为列名）"""
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            await self.get_access_token(client)
+            if not sheet_id:
+                sheet_id = (await self._get_sheet_meta(client, spreadsheet_token))["sheetId"]
+            values = await self._fetch_range(client, spreadsheet_token, f"{sheet_id}!{range_notation}")
         
-        # 读取数据
-        url = f"{self.base_url}/sheets/v2/spreadsheets/{spreadsheet_token}/values/{sheet_id}"
-        if range_notation:
-            url += f"!{range_notation}"
+        if not values:
+            raise ValueError("表格数据为空")
         
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
+        # 第一行作为列名
+        columns = values[0]
+        rows = values[1:]
         
-        async with httpx.AsyncClient() as client:
+        # 创建DataFrame
+        return pd.DataFrame(rows, columns=columns)
+    
+    async def _iter_via_api(
+        self,
+        spreadsheet_token: str,
+        sheet_id: Optional[str] = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        通过飞书API分片读取表格
+        
+        先获取工作表行列数，再按 chunk_rows 切分行范围，在信号量限制下并发请求，
+        按行序产出。同时在途的分片不超过 concurrency 个，内存占用与表格大小无关。
+        """
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            await self.get_access_token(client)
+            meta = await self._get_sheet_meta(client, spreadsheet_token, sheet_id)
+            sheet_id = meta["sheetId"]
+            row_count = int(meta.get("rowCount") or 0)
+            column_count = int(meta.get("columnCount") or 0)
+            if row_count <= 0 or column_count <= 0:
+                raise ValueError("表格数据为空")
+            
+            last_column = self._column_letter(column_count)
+            header = await self._fetch_range(client, spreadsheet_token, f"{sheet_id}!A1:{last_column}1")
+            if not header or not header[0]:
+                raise ValueError("表格数据为空")
+            columns = header[0]
+            
+            logger.info(
+                f"分片读取飞书表格: sheet={sheet_id}, {row_count} 行 x {column_count} 列, "
+                f"分片={self.chunk_rows} 行, 并发={self.concurrency}"
+            )
+            
+            semaphore = asyncio.Semaphore(self.concurrency)
+            
+            async def fetch(start_row: int, end_row: int) -> List[List[Any]]:
+                async with semaphore:
+                    return await self._fetch_range(
+                        client, spreadsheet_token, f"{sheet_id}!A{start_row}:{last_column}{end_row}"
+                    )
+            
+            ranges = iter(
+                (start, min(start + self.chunk_rows - 1, row_count))
+                for start in range(2, row_count + 1, self.chunk_rows)
+            )
+            pending: deque = deque()
+            
+            def schedule_next() -> None:
+                next_range = next(ranges, None)
+                if next_range is not None:
+                    pending.append((next_range[0], asyncio.ensure_future(fetch(*next_range))))
+            
+            for _ in range(self.concurrency):
+                schedule_next()
+            
+            try:
+                while pending:
+                    start_row, task = pending.popleft()
+                    values = await task
+                    schedule_next()
+                    chunk = self._build_chunk(values, columns, start_row)
+                    if chunk is not None:
+                        yield chunk
+            finally:
+                for _, task in pending:
+                    task.cancel()
+    
+    @staticmethod
+    def _build_chunk(values: List[List[Any]], columns: List[Any], start_row: int) -> Optional[pd.DataFrame]:
+        """将分片值构造成DataFrame，跳过整行为空的行，索引为数据行号"""
+        width = len(columns)
+        rows = []
+        index = []
+        for offset, row in enumerate(values or []):
+            row = list(row or [])[:width]
+            if not any(cell not in (None, '') for cell in row):
+                continue
+            row.extend([None] * (width - len(row)))
+            rows.append(row)
+            index.append(start_row - 2 + offset)
+        if not rows:
+            return None
+        return pd.DataFrame(rows, columns=columns, index=index)
+    
+    async def _fetch_range(
+        self,
+        client: httpx.AsyncClient,
+        spreadsheet_token: str,
+        range_spec: str
+    ) -> List[List[Any]]:
+        """读取单个范围的值，令牌失效时刷新一次后重试"""
+        url = f"{self.base_url}/sheets/v2/spreadsheets/{spreadsheet_token}/values/{range_spec}"
+        for attempt in range(2):
+            headers = {
+                "Authorization": f"Bearer {self.access_token}"
+            }
             response = await client.get(url, headers=headers)
             result = response.json()
             
             if result.get("code") == 0:
                 data = result.get("data", {})
-                values = data.get("values", [])
-                
-                if not values:
-                    raise ValueError("表格数据为空")
-                
-                # 第一行作为列名
-                columns = values[0]
-                rows = values[1:]
-                
-                # 创建DataFrame
-                df = pd.DataFrame(rows, columns=columns)
-                return df
-            else:
-                raise Exception(f"读取表格数据失败: {result.get('msg')}")
+                value_range = data.get("valueRange", data)
+                return value_range.get("values") or []
+            if attempt == 0 and response.status_code == 401:
+                self.invalidate_token(self.app_id)
+                await self.get_access_token(client)
+                continue
+            raise Exception(f"读取表格数据失败: {result.get('msg')}")
+        return []
+    
+    @staticmethod
+    def _column_letter(column_count: int) -> str:
+        """列数转换为列字母（1 -> A, 27 -> AA）"""
+        letters = ''
+        while column_count > 0:
+            column_count, remainder = divmod(column_count - 1, 26)
+            letters = chr(ord('A') + remainder) + letters
+        return letters or 'A'
     
     async def _read_via_export(
         self, 
@@ -271,27 +477,41 @@ class FeishuSheetsService:
         
         raise Exception(error_msg)
     
-    async def _get_first_sheet_id(self, spreadsheet_token: str) -> str:
-        """获取表格的第一个工作表ID"""
+    async def _get_sheet_meta(
+        self,
+        client: httpx.AsyncClient,
+        spreadsheet_token: str,
+        sheet_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """获取工作表元数据（sheetId、rowCount、columnCount），未指定时取第一个工作表"""
         url = f"{self.base_url}/sheets/v2/spreadsheets/{spreadsheet_token}/metainfo"
         headers = {
             "Authorization": f"Bearer {self.access_token}"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            result = response.json()
+        response = await client.get(url, headers=headers)
+        result = response.json()
+        
+        if result.get("code") == 0:
+            data = result.get("data", {})
+            sheets = data.get("sheets", [])
             
-            if result.get("code") == 0:
-                data = result.get("data", {})
-                sheets = data.get("sheets", [])
-                
-                if sheets:
-                    return sheets[0].get("sheetId")
-                else:
-                    raise ValueError("表格中没有工作表")
-            else:
-                raise Exception(f"获取工作表信息失败: {result.get('msg')}")
+            if not sheets:
+                raise ValueError("表格中没有工作表")
+            if not sheet_id:
+                return sheets[0]
+            for sheet in sheets:
+                if sheet.get("sheetId") == sheet_id:
+                    return sheet
+            raise ValueError(f"表格中不存在工作表: {sheet_id}")
+        else:
+            raise Exception(f"获取工作表信息失败: {result.get('msg')}")
+    
+    async def _get_first_sheet_id(self, spreadsheet_token: str) -> str:
+        """获取表格的第一个工作表ID"""
+        async with httpx.AsyncClient() as client:
+            meta = await self._get_sheet_meta(client, spreadsheet_token)
+        return meta.get("sheetId")
     
     async def read_sheet_from_url(self, url: str, password: Optional[str] = None) -> pd.DataFrame:
         """
@@ -319,6 +539,39 @@ class FeishuSheetsService:
         
         return df
     
+    async def iter_sheet_from_url(
+        self,
+        url: str,
+        password: Optional[str] = None
+    ) -> AsyncIterator[pd.DataFrame]:
+        """
+        从飞书表格URL分块读取数据，供导入流程逐块处理
+        
+        Args:
+            url: 飞书表格完整URL
+            password: 表格访问密码（可选，用于密码保护的表格）
+            
+        Yields:
+            pandas DataFrame 分块
+        """
+        parsed = self.parse_feishu_url(url)
+        spreadsheet_token = parsed['spreadsheet_token']
+        sheet_id = parsed.get('sheet_id')
+        host = parsed.get('host')
+        
+        logger.info(f"准备分块读取飞书表格: token={spreadsheet_token}, sheet={sheet_id}, 密码保护={'是' if password else '否'}")
+        
+        total_rows = 0
+        chunks = self.iter_sheet_data(spreadsheet_token, sheet_id, password=password, host=host)
+        try:
+            async for chunk in chunks:
+                total_rows += len(chunk)
+                yield chunk
+        finally:
+            await chunks.aclose()
+        
+        logger.info(f"成功读取飞书表格数据: {total_rows} 行")
+    
     @staticmethod
     def validate_feishu_url(url: str) -> bool:
         """
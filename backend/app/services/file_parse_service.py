@@ -1,15 +1,197 @@
 """文件解析服务"""
 import os
 import json
+import math
+from datetime import date, datetime
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator
 from pathlib import Path
 from loguru import logger
 
+from app.core.redis_client import RedisClient
+
+
+class _RunningStats:
+    """单遍数值统计（Welford算法，按分块合并），内存占用与行数无关"""
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+    
+    def update(self, values: np.ndarray) -> None:
+        """合并一个分块的数值（已去除空值）"""
+        n_b = len(values)
+        if n_b == 0:
+            return
+        mean_b = float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+        n_a = self.count
+        total = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / total
+        self.m2 += m2_b + delta * delta * n_a * n_b / total
+        self.count = total
+        chunk_min = float(values.min())
+        chunk_max = float(values.max())
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """输出与 pandas describe 一致的统计（std 为样本标准差）"""
+        if self.count == 0:
+            return {'count': 0, 'mean': None, 'min': None, 'max': None, 'std': None}
+        std = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'std': std,
+        }
+
+
+class _StreamingProfiler:
+    """
+    流式文件画像
+    
+    逐块消费DataFrame：蓄水池抽样保留固定数量的行，数值列用Welford单遍统计，
+    空值按块累加。内存只与分块大小和抽样数量有关。
+    """
+    
+    def __init__(self, sample_size: int, max_cell_chars: int, seed: Optional[int] = None):
+        self.sample_size = sample_size
+        self.max_cell_chars = max_cell_chars
+        self.rng = np.random.default_rng(seed)
+        self.column_names: List[Any] = []
+        self.rows = 0
+        self.reservoir: List[tuple] = []  # (行号, 行数据)
+        self.numeric_stats: Dict[Any, _RunningStats] = {}
+        self.null_counts: Dict[Any, int] = {}
+    
+    def consume(self, chunk: pd.DataFrame) -> None:
+        """处理一个分块"""
+        if not self.column_names:
+            self.column_names = chunk.columns.tolist()
+        n = len(chunk)
+        if n == 0:
+            return
+        
+        # 空值计数
+        for col, null_count in chunk.isna().sum().items():
+            self.null_counts[col] = self.null_counts.get(col, 0) + int(null_count)
+        
+        # 数值列单遍统计
+        for col in chunk.select_dtypes(include=['number']).columns:
+            values = chunk[col].to_numpy(dtype='float64', na_value=np.nan)
+            values = values[~np.isnan(values)]
+            self.numeric_stats.setdefault(col, _RunningStats()).update(values)
+        
+        # 蓄水池抽样（Algorithm R，向量化）：第i行以 k/(i+1) 的概率替换蓄水池中的随机位置
+        positions = np.arange(self.rows, self.rows + n)
+        slots = np.where(
+            positions < self.sample_size,
+            positions,
+            np.floor(self.rng.random(n) * (positions + 1)).astype('int64')
+        )
+        for offset in np.nonzero(slots < self.sample_size)[0]:
+            entry = (int(positions[offset]), self._sample_row(chunk.iloc[offset]))
+            slot = int(slots[offset])
+            if slot < len(self.reservoir):
+                self.reservoir[slot] = entry
+            else:
+                self.reservoir.append(entry)
+        
+        self.rows += n
+    
+    def _sample_row(self, row: pd.Series) -> Dict[Any, Any]:
+        """抽样行转换为可JSON序列化的字典，超长文本截断"""
+        return {col: _to_jsonable(value, self.max_cell_chars) for col, value in row.items()}
+    
+    def sample_rows(self, limit: Optional[int] = None) -> List[Dict[Any, Any]]:
+        """
+        按原始行序排列的抽样行
+        
+        Args:
+            limit: 最多返回的行数；抽样行更多时按行序等间隔选取，覆盖整个文件而不是只取开头
+        """
+        rows = [row for _, row in sorted(self.reservoir, key=lambda item: item[0])]
+        if limit is None or len(rows) <= limit:
+            return rows
+        if limit <= 0:
+            return []
+        indices = np.linspace(0, len(rows) - 1, num=limit).round().astype('int64')
+        return [rows[i] for i in indices]
+    
+    def sample_frame(self) -> pd.DataFrame:
+        """抽样数据DataFrame"""
+        return pd.DataFrame(self.sample_rows(), columns=self.column_names)
+    
+    def infer_types(self) -> Dict[Any, str]:
+        """根据抽样数据推断列类型"""
+        sample = self.sample_frame()
+        data_types = {}
+        for col in self.column_names:
+            values = sample[col].dropna() if col in sample else pd.Series(dtype=object)
+            data_types[col] = _infer_column_type(values)
+        return data_types
+
+
+def _to_jsonable(value: Any, max_chars: int) -> Any:
+    """将单元格值转换为可JSON序列化的Python值"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (np.floating,)):
+        value = float(value)
+        return None if math.isnan(value) else value
+    if isinstance(value, (np.bool_,)):
+        return bool(value)
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (pd.Timestamp, datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (int, float, bool)):
+        return value
+    text = str(value)
+    return text if len(text) <= max_chars else text[:max_chars] + '...'
+
+
+def _infer_column_type(values: pd.Series) -> str:
+    """从抽样值推断列类型：integer/float/datetime/boolean/string"""
+    if values.empty:
+        return 'string'
+    if all(isinstance(v, (bool, np.bool_)) for v in values):
+        return 'boolean'
+    numeric = pd.to_numeric(values, errors='coerce')
+    if numeric.notna().all():
+        return 'integer' if (numeric % 1 == 0).all() else 'float'
+    if values.map(lambda v: isinstance(v, str)).all():
+        parsed = pd.to_datetime(values, errors='coerce', format='mixed')
+        if parsed.notna().all():
+            return 'datetime'
+    return 'string'
+
 
 class FileParseService:
     """文件解析服务类"""
     
+    # 流式画像参数：分块行数、蓄水池抽样行数、最多扫描行数、单元格文本截断长度
+    PROFILE_CHUNK_ROWS = 50000
+    PROFILE_SAMPLE_SIZE = 1000
+    PROFILE_MAX_SCAN_ROWS = 2000000
+    PROFILE_MAX_CELL_CHARS = 200
+    # 返回给调用方（AI上下文）的样例行数
+    PROFILE_OUTPUT_SAMPLE_ROWS = 5
+    # 画像结果缓存时间（秒）
+    PROFILE_CACHE_TTL = 86400
+    
     @staticmethod
     def parse_file(file_path: str, file_type: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -50,76 +232,147 @@ class FileParseService:
             raise
     
     @staticmethod
-    def _parse_excel(file_path: str) -> Dict[str, Any]:
+    def profile_file(file_path: str, file_type: Optional[str] = None) -> Dict[str, Any]:
         """
-        解析Excel文件
+        获取文件画像（按文件内容哈希缓存）
+        
+        与 parse_file 返回结构相同；相同内容的文件再次上传时直接返回缓存结果。
         
         Args:
-            file_path: Excel文件路径
+            file_path: 文件路径
+            file_type: 文件类型（自动识别，可手动指定）
             
         Returns:
             解析结果字典
         """
+        from app.services.import_dedup_service import ImportDedupService
+        
+        file_hash = ImportDedupService.compute_file_hash(file_path)
+        cache_key = f"file_profile:{file_hash}"
+        cached = RedisClient.get(cache_key)
+        if isinstance(cached, dict):
+            return cached
+        
+        result = FileParseService.parse_file(file_path, file_type)
+        RedisClient.set(cache_key, result, ttl=FileParseService.PROFILE_CACHE_TTL)
+        return result
+    
+    @staticmethod
+    def _build_profile_result(
+        profiler: _StreamingProfiler,
+        file_type: str,
+        label: str,
+        truncated: bool = False,
+        total_rows: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """根据流式画像构建与原解析结果一致的返回结构"""
+        column_names = profiler.column_names
+        data_types = profiler.infer_types()
+        
+        statistics = {}
+        for col in column_names:
+            if data_types.get(col) in ('integer', 'float') and col in profiler.numeric_stats:
+                statistics[col] = profiler.numeric_stats[col].to_dict()
+        
+        null_counts = {col: count for col, count in profiler.null_counts.items() if count > 0}
+        rows_count = total_rows if total_rows is not None else profiler.rows
+        sample_data = profiler.sample_rows(FileParseService.PROFILE_OUTPUT_SAMPLE_ROWS)
+        
+        summary = f"{label}，{rows_count}行 × {len(column_names)}列"
+        if truncated:
+            summary += f"（统计基于前{profiler.rows}行）"
+        
+        return {
+            "success": True,
+            "file_type": file_type,
+            "rows": rows_count,
+            "columns": len(column_names),
+            "column_names": column_names,
+            "data_types": data_types,
+            "sample_data": sample_data,
+            "statistics": statistics,
+            "null_counts": null_counts,
+            "rows_scanned": profiler.rows,
+            "truncated": truncated,
+            "summary": summary
+        }
+    
+    @staticmethod
+    def _new_profiler() -> _StreamingProfiler:
+        return _StreamingProfiler(
+            sample_size=FileParseService.PROFILE_SAMPLE_SIZE,
+            max_cell_chars=FileParseService.PROFILE_MAX_CELL_CHARS
+        )
+    
+    @staticmethod
+    def _iter_excel_chunks(file_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        """以只读模式逐行读取xlsx，按块产出DataFrame"""
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
         try:
-            # 读取Excel文件
-            df = pd.read_excel(file_path)
-            
-            # 获取基本信息
-            rows_count = len(df)
-            columns_count = len(df.columns)
-            column_names = df.columns.tolist()
+            worksheet = workbook.worksheets[0]
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
             
-            # 获取数据类型
-            data_types = {}
-            for col in column_names:
-                dtype = str(df[col].dtype)
-                # 简化数据类型名称
-                if 'int' in dtype:
-                    data_types[col] = 'integer'
-                elif 'float' in dtype:
-                    data_types[col] = 'float'
-                elif 'datetime' in dtype or 'date' in dtype:
-                    data_types[col] = 'datetime'
-                elif 'bool' in dtype:
-                    data_types[col] = 'boolean'
+            # 与 pandas 一致：空列名为 Unnamed: i，重复列名追加 .1/.2
+            columns = []
+            seen: Dict[str, int] = {}
+            for index, name in enumerate(header):
+                name = f"Unnamed: {index}" if name is None else name
+                if name in seen:
+                    seen[name] += 1
+                    name = f"{name}.{seen[name]}"
                 else:
-                    data_types[col] = 'string'
+                    seen[name] = 0
+                columns.append(name)
             
-            # 获取数据摘要（前5行）
-            sample_data = df.head(5).to_dict(orient='records')
+            buffer = []
+            for row in rows:
+                if row is None or all(cell is None for cell in row):
+                    continue
+                buffer.append(row[:len(columns)])
+                if len(buffer) >= chunk_rows:
+                    yield pd.DataFrame(buffer, columns=columns)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _parse_excel(file_path: str) -> Dict[str, Any]:
+        """
+        解析Excel文件
+        
+        xlsx以只读模式流式读取并抽样画像；xls（旧格式）仍整表读取后按同样方式画像。
+        
+        Args:
+            file_path: Excel文件路径
             
-            # 获取统计信息（数值列的统计）
-            statistics = {}
-            numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
-            if numeric_columns:
-                for col in numeric_columns:
-                    statistics[col] = {
-                        'count': int(df[col].count()),
-                        'mean': float(df[col].mean()) if df[col].count() > 0 else None,
-                        'min': float(df[col].min()) if df[col].count() > 0 else None,
-                        'max': float(df[col].max()) if df[col].count() > 0 else None,
-                        'std': float(df[col].std()) if df[col].count() > 0 else None,
-                    }
+        Returns:
+            解析结果字典
+        """
+        try:
+            profiler = FileParseService._new_profiler()
+            max_rows = FileParseService.PROFILE_MAX_SCAN_ROWS
+            truncated = False
             
-            # 检查空值
-            null_counts = {}
-            for col in column_names:
-                null_count = int(df[col].isnull().sum())
-                if null_count > 0:
-                    null_counts[col] = null_count
+            if Path(file_path).suffix.lower() == '.xls':
+                chunks = iter([pd.read_excel(file_path)])
+            else:
+                chunks = FileParseService._iter_excel_chunks(file_path, FileParseService.PROFILE_CHUNK_ROWS)
             
-            return {
-                "success": True,
-                "file_type": "excel",
-                "rows": rows_count,
-                "columns": columns_count,
-                "column_names": column_names,
-                "data_types": data_types,
-                "sample_data": sample_data,
-                "statistics": statistics,
-                "null_counts": null_counts,
-                "summary": f"Excel文件，{rows_count}行 × {columns_count}列"
-            }
+            for chunk in chunks:
+                if max_rows and profiler.rows + len(chunk) > max_rows:
+                    profiler.consume(chunk.iloc[:max_rows - profiler.rows])
+                    truncated = True
+                    break
+                profiler.consume(chunk)
+            
+            return FileParseService._build_profile_result(profiler, "excel", "Excel文件", truncated=truncated)
             
         except Exception as e:
             logger.error(f"解析Excel文件失败: {e}")
@@ -130,6 +383,8 @@ class FileParseService:
         """
         解析CSV文件
         
+        按块流式读取并抽样画像，整个文件不会同时载入内存。
+        
         Args:
             file_path: CSV文件路径
             
@@ -137,78 +392,30 @@ class FileParseService:
             解析结果字典
         """
         try:
-            # 读取CSV文件（尝试不同的编码）
+            # 读取CSV文件（尝试不同的编码，编码错误可能出现在任意分块，出错则整体重试）
             encodings = ['utf-8', 'gbk', 'gb2312', 'latin-1']
-            df = None
-            encoding_used = None
+            max_rows = FileParseService.PROFILE_MAX_SCAN_ROWS
             
             for encoding in encodings:
+                profiler = FileParseService._new_profiler()
+                truncated = False
                 try:
-                    df = pd.read_csv(file_path, encoding=encoding)
-                    encoding_used = encoding
-                    break
+                    reader = pd.read_csv(file_path, encoding=encoding, chunksize=FileParseService.PROFILE_CHUNK_ROWS)
+                    with reader:
+                        for chunk in reader:
+                            if max_rows and profiler.rows + len(chunk) > max_rows:
+                                profiler.consume(chunk.iloc[:max_rows - profiler.rows])
+                                truncated = True
+                                break
+                            profiler.consume(chunk)
                 except UnicodeDecodeError:
                     continue
+                
+                result = FileParseService._build_profile_result(profiler, "csv", "CSV文件", truncated=truncated)
+                result["encoding"] = encoding
+                return result
             
-            if df is None:
-                raise ValueError("无法读取CSV文件，尝试了多种编码格式")
-            
-            # 获取基本信息
-            rows_count = len(df)
-            columns_count = len(df.columns)
-            column_names = df.columns.tolist()
-            
-            # 获取数据类型
-            data_types = {}
-            for col in column_names:
-                dtype = str(df[col].dtype)
-                if 'int' in dtype:
-                    data_types[col] = 'integer'
-                elif 'float' in dtype:
-                    data_types[col] = 'float'
-                elif 'datetime' in dtype or 'date' in dtype:
-                    data_types[col] = 'datetime'
-                elif 'bool' in dtype:
-                    data_types[col] = 'boolean'
-                else:
-                    data_types[col] = 'string'
-            
-            # 获取数据摘要（前5行）
-            sample_data = df.head(5).to_dict(orient='records')
-            
-            # 获取统计信息
-            statistics = {}
-            numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
-            if numeric_columns:
-                for col in numeric_columns:
-                    statistics[col] = {
-                        'count': int(df[col].count()),
-                        'mean': float(df[col].mean()) if df[col].count() > 0 else None,
-                        'min': float(df[col].min()) if df[col].count() > 0 else None,
-                        'max': float(df[col].max()) if df[col].count() > 0 else None,
-                        'std': float(df[col].std()) if df[col].count() > 0 else None,
-                    }
-            
-            # 检查空值
-            null_counts = {}
-            for col in column_names:
-                null_count = int(df[col].isnull().sum())
-                if null_count > 0:
-                    null_counts[col] = null_count
-            
-            return {
-                "success": True,
-                "file_type": "csv",
-                "encoding": encoding_used,
-                "rows": rows_count,
-                "columns": columns_count,
-                "column_names": column_names,
-                "data_types": data_types,
-                "sample_data": sample_data,
-                "statistics": statistics,
-                "null_counts": null_counts,
-                "summary": f"CSV文件，{rows_count}行 × {columns_count}列"
-            }
+            raise ValueError("无法读取CSV文件，尝试了多种编码格式")
             
         except Exception as e:
             logger.error(f"解析CSV文件失败: {e}")
@@ -0,0 +1,266 @@
+"""FrogGPT 系统上下文快照服务
+
+预先计算并缓存 FrogGPT 系统上下文中的数据块（按店铺集合 + 天数窗口）：
+- 数据摘要块：运营总览、Top SKU、负责人、店铺、库存、实际SKU列表
+- 回款块：7/14/30 天回款汇总
+
+聊天请求只需读取并拼装这些块；快照在订单同步完成后于后台线程刷新，
+构建过程从不在事件循环线程中执行。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.core.database import WorkerSessionLocal
+from app.core.redis_client import RedisClient
+
+
+class FrogGPTContextService:
+    """FrogGPT 系统上下文快照服务"""
+
+    CACHE_PREFIX = "frog_gpt_context"
+    # 回款块预计算的天数
+    PAYMENT_WINDOWS = (7, 14, 30)
+
+    def __init__(self):
+        # Redis 不可用时的进程内缓存：{key: (过期时间戳, 快照)}
+        self._local_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        # 同一快照同时只构建一次
+        self._build_locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frog-gpt-context")
+
+    @staticmethod
+    def _shops_key(shop_ids: Optional[List[int]]) -> str:
+        return ",".join(str(sid) for sid in sorted(set(shop_ids))) if shop_ids else "all"
+
+    def _cache_key(self, shop_ids: Optional[List[int]], days: Optional[int]) -> str:
+        return f"{self.CACHE_PREFIX}:{self._shops_key(shop_ids)}:{days if days else 'all'}"
+
+    def _get_cached(self, key: str) -> Optional[Dict[str, Any]]:
+        cached = RedisClient.get(key)
+        if isinstance(cached, dict):
+            return cached
+        local = self._local_cache.get(key)
+        if local and local[0] > time.time():
+            return local[1]
+        return None
+
+    def _set_cached(self, key: str, snapshot: Dict[str, Any]) -> None:
+        ttl = settings.FROGGPT_CONTEXT_TTL
+        if not RedisClient.set(key, snapshot, ttl=ttl):
+            self._local_cache[key] = (time.time() + ttl, snapshot)
+
+    def _build_lock(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _compute_data_summary(db, shop_ids: Optional[List[int]], days: Optional[int]) -> Dict[str, Any]:
+        """计算运营数据摘要（总览、Top SKU、Top负责人）"""
+        from app.services.unified_statistics import UnifiedStatisticsService
+
+        start_dt, end_dt = UnifiedStatisticsService.parse_date_range(None, None, days)
+        filters = UnifiedStatisticsService.build_base_filters(
+            db, start_dt, end_dt, shop_ids, None, None, None
+        )
+        overview = UnifiedStatisticsService.calculate_order_statistics(db, filters)
+        profit_margin = (
+            (overview['total_profit'] / overview['total_gmv'] * 100)
+            if overview['total_gmv'] > 0 else 0
+        )
+        top_skus = UnifiedStatisticsService.get_sku_statistics(db, filters, limit=10)
+        top_managers = UnifiedStatisticsService.get_manager_statistics(db, filters)[:10]
+
+        return {
+            "overview": {
+                "total_orders": overview['order_count'],
+                "total_quantity": overview['total_quantity'],
+                "total_gmv": round(overview['total_gmv'], 2),
+                "total_cost": round(overview['total_cost'], 2),
+                "total_profit": round(overview['total_profit'], 2),
+                "profit_margin": round(profit_margin, 2),
+                "delay_rate": round(overview.get('delay_rate', 0), 2),
+                "delay_count": overview.get('delay_count', 0),
+            },
+            "top_skus": top_skus,
+            "top_managers": top_managers,
+        }
+
+    @staticmethod
+    def format_payment_context(payment_collection_data: Dict[str, Any]) -> str:
+        """将回款数据格式化为系统上下文块"""
+        payment_context = "\n\n## 回款数据（已自动查询）\n"
+        period = payment_collection_data.get('period', {})
+        payment_context += f"- **查询日期范围**: {period.get('start_date', 'N/A')} 至 {period.get('end_date', 'N/A')}\n"
+        summary = payment_collection_data.get('summary', {})
+        payment_context += f"- **总回款金额**: ¥{summary.get('total_amount', 0):,.2f}\n"
+        payment_context += f"- **总回款订单数**: {summary.get('total_orders', 0)}\n"
+
+        # 添加每日回款数据（最近7天）
+        table_data = payment_collection_data.get('table_data', [])
+        if table_data:
+            payment_context += "\n**最近7天回款明细**（按日期倒序）：\n"
+            for day_data in table_data[:7]:  # 已经是倒序排列
+                payment_context += f"- {day_data.get('date', 'N/A')}: ¥{day_data.get('total', 0):,.2f}\n"
+        return payment_context
+
+    def _build_snapshot(self, shop_ids: Optional[List[int]], days: Optional[int]) -> Dict[str, Any]:
+        """构建上下文快照（同步执行，使用独立的数据库会话）"""
+        from app.api.analytics import get_payment_collection
+        from app.services.frog_gpt_service import frog_gpt_service
+
+        started = time.monotonic()
+        db = WorkerSessionLocal()
+        try:
+            data_summary = self._compute_data_summary(db, shop_ids, days)
+            data_context = frog_gpt_service.build_data_context(data_summary, db=db)
+
+            payment_blocks = {}
+            for window in self.PAYMENT_WINDOWS:
+                try:
+                    payment_data = get_payment_collection(
+                        shop_ids=shop_ids,
+                        start_date=None,
+                        end_date=None,
+                        days=window,
+                        db=db,
+                        current_user=None
+                    )
+                    payment_blocks[str(window)] = self.format_payment_context(payment_data)
+                except Exception as e:
+                    logger.warning(f"预计算 {window} 天回款数据失败: {e}")
+        finally:
+            db.close()
+
+        built_at = datetime.utcnow()
+        snapshot = {
+            "version": built_at.strftime("%Y%m%d%H%M%S%f"),
+            "built_at": built_at.isoformat(),
+            "shop_ids": sorted(set(shop_ids)) if shop_ids else None,
+            "days": days,
+            "data_summary": data_summary,
+            "data_context": data_context,
+            "payment_blocks": payment_blocks,
+        }
+        logger.info(
+            f"FrogGPT上下文快照已构建: shops={self._shops_key(shop_ids)}, days={days}, "
+            f"耗时: {time.monotonic() - started:.2f}秒"
+        )
+        return snapshot
+
+    def get_snapshot(
+        self,
+        shop_ids: Optional[List[int]] = None,
+        days: Optional[int] = None,
+        force_refresh: bool = False
+    ) -> Dict[str, Any]:
+        """
+        获取上下文快照（同步，命中缓存直接返回，否则构建后缓存）
+
+        会访问数据库和Redis，异步代码中请使用 get_snapshot_async。
+        """
+        key = self._cache_key(shop_ids, days)
+        if not force_refresh:
+            snapshot = self._get_cached(key)
+            if snapshot:
+                return snapshot
+
+        with self._build_lock(key):
+            # 等锁期间可能已被其他请求构建
+            if not force_refresh:
+                snapshot = self._get_cached(key)
+                if snapshot:
+                    return snapshot
+            snapshot = self._build_snapshot(shop_ids, days)
+            self._set_cached(key, snapshot)
+            return snapshot
+
+    async def get_snapshot_async(
+        self,
+        shop_ids: Optional[List[int]] = None,
+        days: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """在有界线程池中获取上下文快照，不阻塞事件循环"""
+        return await run_blocking(self.get_snapshot, shop_ids, days)
+
+    @staticmethod
+    def assemble(snapshot: Dict[str, Any], payment_days: Optional[int] = None) -> str:
+        """
+        拼装系统上下文：系统提示词 + 数据块（+ 回款块）
+
+        Args:
+            snapshot: 上下文快照
+            payment_days: 需要注入的回款天数（None表示不注入）
+        """
+        from app.services.frog_gpt_service import FROG_GPT_SYSTEM_PROMPT
+
+        context = FROG_GPT_SYSTEM_PROMPT + snapshot.get("data_context", "")
+        if payment_days:
+            payment_block = snapshot.get("payment_blocks", {}).get(str(payment_days))
+            if payment_block:
+                context += payment_block
+                logger.info("已将回款数据注入系统上下文")
+        return context
+
+    async def get_system_context(
+        self,
+        shop_ids: Optional[List[int]] = None,
+        days: Optional[int] = None,
+        payment_days: Optional[int] = None
+    ) -> str:
+        """获取拼装好的系统上下文（快照读取/构建在线程池中执行）"""
+        snapshot = await self.get_snapshot_async(shop_ids, days)
+        return self.assemble(snapshot, payment_days)
+
+    def refresh(self, shop_ids_list: List[Optional[List[int]]]) -> None:
+        """重新构建指定店铺集合在所有预热窗口下的快照（同步）"""
+        for shop_ids in shop_ids_list:
+            for days in settings.FROGGPT_CONTEXT_WINDOWS:
+                try:
+                    self.get_snapshot(shop_ids, days or None, force_refresh=True)
+                except Exception as e:
+                    logger.warning(f"刷新FrogGPT上下文快照失败: shops={self._shops_key(shop_ids)}, days={days}, 错误: {e}")
+
+    def _invalidate_combinations(self, shop_id: int) -> None:
+        """删除包含该店铺的多店铺组合快照（单店铺和全部店铺快照由刷新覆盖）"""
+        def is_combination(key: str) -> bool:
+            shops = key.split(":")[1].split(",")
+            return len(shops) > 1 and str(shop_id) in shops
+
+        for key in [k for k in self._local_cache if is_combination(k)]:
+            self._local_cache.pop(key, None)
+
+        try:
+            client = RedisClient.get_client()
+            if client is None:
+                return
+            keys = [k for k in client.keys(f"{self.CACHE_PREFIX}:*") if is_combination(k)]
+            if keys:
+                client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"清除FrogGPT上下文快照失败: shop_id={shop_id}, 错误: {e}")
+
+    def schedule_refresh(self, shop_id: Optional[int] = None) -> None:
+        """
+        数据同步后在后台线程刷新快照（立即返回）
+
+        刷新全部店铺和该店铺的预热窗口；其他包含该店铺的组合快照直接失效，下次请求时重建。
+        """
+        if shop_id:
+            self._invalidate_combinations(shop_id)
+
+        targets: List[Optional[List[int]]] = [None]
+        if shop_id:
+            targets.append([shop_id])
+        self._refresh_executor.submit(self.refresh, targets)
+
+
+# 全局实例
+frog_gpt_context_service = FrogGPTContextService()
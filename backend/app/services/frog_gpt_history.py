@@ -0,0 +1,245 @@
+"""FrogGPT 对话历史压缩
+
+长对话每一轮都会把完整历史发给模型，提示词越来越长，延迟和费用线性增长。
+发送前对历史做压缩：
+- 本地估算token数（安装了 tiktoken 时使用 tiktoken，否则按中英文字符估算）
+- 系统上下文 + 最近的对话保持原文，总量控制在预算内
+- 更早的对话替换为滚动摘要：摘要按对话前缀缓存，新摘要在最近一次缓存的摘要基础上
+  只总结新增的对话；压缩边界按固定步长对齐，后续多轮对话会复用同一份摘要
+"""
+import hashlib
+import json
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.concurrency import run_blocking
+from app.core.config import settings
+from app.core.redis_client import RedisClient
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+# 生成摘要的协程：接收消息列表，返回摘要文本
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+SUMMARY_PROMPT = """你是对话记录整理助手。请将下面的对话压缩为一段简洁的中文摘要，供后续对话作为背景：
+- 保留用户关注的店铺、SKU、时间范围、指标和结论性数字
+- 保留用户提出的要求、偏好和尚未解决的问题
+- 不要编造对话中没有的信息，不要输出与摘要无关的内容"""
+
+SUMMARY_MESSAGE_PREFIX = "【之前对话的摘要】\n"
+
+
+class FrogGPTHistoryCompactor:
+    """FrogGPT 对话历史压缩"""
+
+    CACHE_PREFIX = "frog_gpt_history_summary"
+    # 每条消息的格式开销（角色、分隔符）
+    MESSAGE_OVERHEAD_TOKENS = 4
+    # 图片等非文本内容按固定token数估算
+    NON_TEXT_PART_TOKENS = 800
+    # Redis 不可用时进程内缓存的摘要数
+    LOCAL_CACHE_SIZE = 256
+
+    _CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+    _local_cache: "OrderedDict[str, str]" = OrderedDict()
+
+    @classmethod
+    def count_text_tokens(cls, text: str) -> int:
+        """估算文本的token数"""
+        if not text:
+            return 0
+        if _ENCODING is not None:
+            return len(_ENCODING.encode(text, disallowed_special=()))
+        # 中文约1字1token，其他字符约4字符1token
+        cjk = len(cls._CJK.findall(text))
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+    @staticmethod
+    def message_text(message: Dict[str, Any]) -> str:
+        """提取消息中的文本（多模态消息只取文本部分）"""
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        if isinstance(content, list):
+            return "\n".join(
+                part.get("text", "") for part in content
+                if isinstance(part, dict) and part.get("type") == "text"
+            )
+        return ""
+
+    @classmethod
+    def count_message_tokens(cls, message: Dict[str, Any]) -> int:
+        """估算单条消息的token数"""
+        tokens = cls.MESSAGE_OVERHEAD_TOKENS + cls.count_text_tokens(cls.message_text(message))
+        content = message.get("content")
+        if isinstance(content, list):
+            tokens += cls.NON_TEXT_PART_TOKENS * sum(
+                1 for part in content
+                if isinstance(part, dict) and part.get("type") != "text"
+            )
+        return tokens
+
+    @classmethod
+    def count_tokens(cls, messages: List[Dict[str, Any]]) -> int:
+        """估算消息列表的token数"""
+        return sum(cls.count_message_tokens(msg) for msg in messages)
+
+    @classmethod
+    def _prefix_digests(cls, conversation: List[Dict[str, Any]]) -> List[str]:
+        """每个对话前缀的链式摘要：digests[k] 对应前 k 条消息"""
+        digests = [hashlib.sha256(b"").hexdigest()]
+        for msg in conversation:
+            payload = json.dumps([msg.get("role"), cls.message_text(msg)], ensure_ascii=False)
+            digests.append(hashlib.sha256((digests[-1] + payload).encode("utf-8")).hexdigest())
+        return digests
+
+    @classmethod
+    def _cache_key(cls, model: str, digest: str) -> str:
+        return f"{cls.CACHE_PREFIX}:{hashlib.sha256(model.encode('utf-8')).hexdigest()[:8]}:{digest[:32]}"
+
+    @classmethod
+    def _get_summary(cls, key: str) -> Optional[str]:
+        cached = RedisClient.get(key)
+        if isinstance(cached, str):
+            return cached
+        return cls._local_cache.get(key)
+
+    @classmethod
+    def _set_summary(cls, key: str, summary: str) -> None:
+        if RedisClient.set(key, summary, ttl=settings.FROGGPT_HISTORY_SUMMARY_TTL):
+            return
+        cls._local_cache[key] = summary
+        cls._local_cache.move_to_end(key)
+        while len(cls._local_cache) > cls.LOCAL_CACHE_SIZE:
+            cls._local_cache.popitem(last=False)
+
+    @classmethod
+    def _find_cached(cls, model: str, digests: List[str], boundary: int) -> Tuple[int, Optional[str]]:
+        """查找边界以内最长的已缓存摘要前缀，返回 (前缀长度, 摘要)"""
+        step = max(1, settings.FROGGPT_HISTORY_SUMMARY_STEP)
+        for k in range(boundary, 0, -1):
+            # 摘要只在对齐到步长的边界上生成
+            if k != boundary and k % step:
+                continue
+            summary = cls._get_summary(cls._cache_key(model, digests[k]))
+            if summary:
+                return k, summary
+        return 0, None
+
+    @classmethod
+    def _split_boundary(cls, system_tokens: int, conversation: List[Dict[str, Any]]) -> int:
+        """
+        计算需要压缩的对话条数（对话开头的前N条）
+
+        从最新的消息往前保留原文，直到超出预算（预留摘要的token）；
+        边界向上对齐到步长，后续几轮对话的边界不变，可以复用同一份摘要。
+        """
+        budget = settings.FROGGPT_HISTORY_TOKEN_BUDGET - system_tokens - settings.FROGGPT_HISTORY_SUMMARY_MAX_TOKENS
+        keep_min = max(1, settings.FROGGPT_HISTORY_MIN_RECENT_MESSAGES)
+
+        used = 0
+        kept = 0
+        for msg in reversed(conversation):
+            tokens = cls.count_message_tokens(msg)
+            if kept >= keep_min and used + tokens > budget:
+                break
+            used += tokens
+            kept += 1
+
+        boundary = len(conversation) - kept
+        if boundary <= 0:
+            return 0
+        step = max(1, settings.FROGGPT_HISTORY_SUMMARY_STEP)
+        return min(math.ceil(boundary / step) * step, len(conversation) - keep_min)
+
+    @classmethod
+    def _render_turns(cls, turns: List[Dict[str, Any]]) -> str:
+        role_names = {"user": "用户", "assistant": "助手"}
+        return "\n\n".join(
+            f"{role_names.get(msg.get('role'), msg.get('role'))}: {cls.message_text(msg)}"
+            for msg in turns
+        )
+
+    @classmethod
+    async def _summarize(
+        cls,
+        previous_summary: Optional[str],
+        turns: List[Dict[str, Any]],
+        summarizer: Summarizer
+    ) -> str:
+        """在已有摘要的基础上总结新增的对话"""
+        parts = []
+        if previous_summary:
+            parts.append(f"已有摘要：\n{previous_summary}")
+        parts.append(f"需要合并进摘要的对话：\n{cls._render_turns(turns)}")
+        return (await summarizer([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": "\n\n".join(parts)},
+        ])).strip()
+
+    @classmethod
+    async def compact(
+        cls,
+        messages: List[Dict[str, Any]],
+        model: str,
+        summarizer: Summarizer
+    ) -> List[Dict[str, Any]]:
+        """
+        压缩对话历史，使系统上下文 + 摘要 + 最近对话不超过token预算
+
+        Args:
+            messages: 完整消息列表（系统消息在前）
+            model: 摘要缓存按模型区分
+            summarizer: 生成摘要的协程
+
+        Returns:
+            压缩后的消息列表；未超出预算时原样返回
+        """
+        if not settings.FROGGPT_HISTORY_COMPACTION_ENABLED:
+            return messages
+        total_tokens = cls.count_tokens(messages)
+        if total_tokens <= settings.FROGGPT_HISTORY_TOKEN_BUDGET:
+            return messages
+
+        system_messages = [msg for msg in messages if msg.get("role") == "system"]
+        conversation = [msg for msg in messages if msg.get("role") != "system"]
+        boundary = cls._split_boundary(cls.count_tokens(system_messages), conversation)
+        if boundary <= 0:
+            return messages
+
+        digests = cls._prefix_digests(conversation)
+        boundary_key = cls._cache_key(model, digests[boundary])
+        summary = await run_blocking(cls._get_summary, boundary_key)
+        if not summary:
+            cached_len, previous = await run_blocking(cls._find_cached, model, digests, boundary)
+            try:
+                summary = await cls._summarize(previous, conversation[cached_len:boundary], summarizer)
+                if summary:
+                    await run_blocking(cls._set_summary, boundary_key, summary)
+                    logger.info(
+                        f"FrogGPT对话摘要已更新: 新增 {boundary - cached_len} 条消息，"
+                        f"共覆盖 {boundary} 条消息"
+                    )
+            except Exception as e:
+                # 摘要失败时使用已有的较短摘要（不缓存），其余较早的消息丢弃
+                logger.warning(f"生成对话摘要失败，较早的 {boundary - cached_len} 条消息将被丢弃: {e}")
+                summary = previous
+
+        compacted = list(system_messages)
+        if summary:
+            compacted.append({"role": "system", "content": SUMMARY_MESSAGE_PREFIX + summary})
+        compacted.extend(conversation[boundary:])
+        logger.info(
+            f"FrogGPT对话历史已压缩: {len(messages)} -> {len(compacted)} 条消息, "
+            f"约 {total_tokens} -> {cls.count_tokens(compacted)} tokens"
+        )
+        return compacted
@@ -0,0 +1,194 @@
+"""FrogGPT 回答缓存
+
+运营人员经常针对同一份数据重复提问（"今天GMV多少"、"本周Top SKU"），
+对相同问题直接返回缓存的回答，不再请求模型：
+- 缓存范围（scope）：模型 + 数据快照版本 + 店铺/天数 + 之前的对话历史，
+  数据同步后快照版本变化，旧回答自然失效
+- 缓存键：范围 + 规范化后的最后一个用户问题
+- 可选的本地相似度匹配：字符 n-gram 哈希向量的余弦相似度，不依赖外部模型
+- 缓存时间默认与自动同步间隔一致
+"""
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from app.core.config import settings
+from app.core.redis_client import RedisClient
+
+
+class FrogGPTResponseCache:
+    """FrogGPT 回答缓存"""
+
+    CACHE_PREFIX = "frog_gpt_response"
+    # 每个缓存范围内参与相似度匹配的问题数上限
+    INDEX_MAX_ENTRIES = 200
+    # 相似度向量维度（字符 n-gram 哈希分桶数）
+    VECTOR_DIM = 1024
+    # 流式回放时每个数据块的字符数
+    REPLAY_CHUNK_CHARS = 24
+
+    _TRAILING_PUNCTUATION = "?？。.!！~～ "
+    _CJK_SPACE = re.compile(r"(?<=[\u4e00-\u9fff]) | (?=[\u4e00-\u9fff])")
+
+    @classmethod
+    def normalize_prompt(cls, text: str) -> str:
+        """规范化问题：全角转半角、小写、合并空白（去掉中文两侧的空白）、去掉句末标点"""
+        text = unicodedata.normalize("NFKC", text or "").lower()
+        text = re.sub(r"\s+", " ", text).strip()
+        text = cls._CJK_SPACE.sub("", text)
+        return text.rstrip(cls._TRAILING_PUNCTUATION)
+
+    @staticmethod
+    def get_ttl() -> int:
+        """缓存时间：未单独配置时与自动同步间隔一致"""
+        return settings.FROGGPT_RESPONSE_CACHE_TTL or settings.SYNC_INTERVAL_MINUTES * 60
+
+    @classmethod
+    def split_prompt(cls, messages: List[Dict[str, Any]]) -> Optional[tuple]:
+        """
+        拆分出最后一个用户问题和之前的对话历史
+
+        Returns:
+            (规范化问题, 历史摘要)；消息中包含非文本内容（图片等）或没有用户问题时返回None
+        """
+        conversation = [msg for msg in messages if msg.get("role") != "system"]
+        if not conversation or conversation[-1].get("role") != "user":
+            return None
+        if any(not isinstance(msg.get("content"), str) for msg in conversation):
+            return None
+
+        prompt = cls.normalize_prompt(conversation[-1]["content"])
+        if not prompt:
+            return None
+        history = [
+            [msg.get("role"), cls.normalize_prompt(msg["content"])]
+            for msg in conversation[:-1]
+        ]
+        history_digest = hashlib.sha256(
+            json.dumps(history, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        return prompt, history_digest
+
+    @staticmethod
+    def build_scope(
+        model: str,
+        snapshot_version: str,
+        history_digest: str,
+        shop_id: Optional[int] = None,
+        days: Optional[int] = None
+    ) -> str:
+        """缓存范围：范围内的问题才会互相命中"""
+        payload = f"{model}|{snapshot_version}|{shop_id or 'all'}|{days or 'all'}|{history_digest}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    @classmethod
+    def _entry_key(cls, scope: str, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:32]
+        return f"{cls.CACHE_PREFIX}:{scope}:{prompt_hash}"
+
+    @classmethod
+    def _index_key(cls, scope: str) -> str:
+        return f"{cls.CACHE_PREFIX}:index:{scope}"
+
+    @classmethod
+    def embed(cls, text: str) -> np.ndarray:
+        """字符 1-gram/2-gram 哈希向量（L2归一化），中英文都适用"""
+        vector = np.zeros(cls.VECTOR_DIM, dtype=np.float32)
+        grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        for gram in grams:
+            if gram.isspace():
+                continue
+            digest = hashlib.md5(gram.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % cls.VECTOR_DIM] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @classmethod
+    def _find_similar(cls, scope: str, prompt: str, threshold: float) -> Optional[str]:
+        """在缓存范围内查找相似度最高且不低于阈值的问题，返回其缓存键"""
+        index = RedisClient.get(cls._index_key(scope))
+        if not isinstance(index, list) or not index:
+            return None
+
+        query = cls.embed(prompt)
+        matrix = np.stack([cls.embed(item["prompt"]) for item in index])
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        logger.debug(f"FrogGPT回答缓存相似命中: score={scores[best]:.3f}, prompt={index[best]['prompt'][:50]}")
+        return index[best]["key"]
+
+    @classmethod
+    def get(cls, scope: str, prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存的回答（同步，会访问Redis）
+
+        先精确匹配规范化后的问题，未命中且开启相似度匹配时再做相似度查找。
+        """
+        entry = RedisClient.get(cls._entry_key(scope, prompt))
+        if isinstance(entry, dict):
+            return entry
+
+        threshold = settings.FROGGPT_RESPONSE_CACHE_SIMILARITY
+        if threshold > 0:
+            try:
+                similar_key = cls._find_similar(scope, prompt, threshold)
+                if similar_key:
+                    entry = RedisClient.get(similar_key)
+                    if isinstance(entry, dict):
+                        return entry
+            except Exception as e:
+                logger.warning(f"FrogGPT回答缓存相似度查找失败: {e}")
+        return None
+
+    @classmethod
+    def set(cls, scope: str, prompt: str, response: Dict[str, Any]) -> bool:
+        """
+        缓存回答（同步，会访问Redis）
+
+        Args:
+            scope: 缓存范围
+            prompt: 规范化后的问题
+            response: {"id", "model", "content", "usage"}
+        """
+        ttl = cls.get_ttl()
+        key = cls._entry_key(scope, prompt)
+        entry = {
+            "id": response.get("id", ""),
+            "model": response.get("model", ""),
+            "content": response.get("content", ""),
+            "usage": response.get("usage"),
+            "prompt": prompt,
+        }
+        if not RedisClient.set(key, entry, ttl=ttl):
+            return False
+
+        if settings.FROGGPT_RESPONSE_CACHE_SIMILARITY > 0:
+            index_key = cls._index_key(scope)
+            index = RedisClient.get(index_key)
+            index = [item for item in index if item.get("key") != key] if isinstance(index, list) else []
+            index.append({"prompt": prompt, "key": key})
+            RedisClient.set(index_key, index[-cls.INDEX_MAX_ENTRIES:], ttl=ttl)
+        return True
+
+    @classmethod
+    async def replay_stream(cls, entry: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """将缓存的回答按流式数据块格式回放"""
+        content = entry.get("content", "")
+        for start in range(0, len(content), cls.REPLAY_CHUNK_CHARS):
+            yield {
+                "type": "content",
+                "content": content[start:start + cls.REPLAY_CHUNK_CHARS],
+                "id": entry.get("id"),
+                "model": entry.get("model"),
+                "cached": True,
+            }
+        if entry.get("usage"):
+            yield {"type": "usage", "usage": entry["usage"], "cached": True}
+        yield {"type": "done", "finish_reason": "stop", "cached": True}
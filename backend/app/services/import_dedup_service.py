@@ -0,0 +1,151 @@
+"""导入内容去重服务
+
+为上传文件提供内容寻址：
+- 文件级：整个文件的SHA-256记录在 ImportHistory.file_hash，相同文件再次上传直接短路
+- 行级：按自然键（order_sn/parent_order_sn/SKU ID）记录行内容哈希，只写入内容有变化的行
+"""
+import hashlib
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.models.import_history import ImportHistory, ImportRowHash, ImportStatus, ImportType
+
+
+class ImportDedupService:
+    """导入内容去重服务"""
+
+    # IN 查询/批量写入的分批大小，避免单条SQL参数过多
+    BATCH_SIZE = 1000
+    # 文件哈希读取块大小
+    READ_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, db: Session):
+        """
+        初始化导入去重服务
+
+        Args:
+            db: 数据库会话
+        """
+        self.db = db
+
+    @classmethod
+    def compute_file_hash(cls, file_path: str) -> str:
+        """流式计算文件内容的SHA-256"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(cls.READ_BLOCK_SIZE), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def compute_row_hash(row: Dict[str, Any]) -> str:
+        """
+        计算行内容哈希
+
+        列顺序、NaN/None 差异不影响结果，同一内容始终得到同一哈希。
+        """
+        normalized = {}
+        for key, value in row.items():
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+            normalized[str(key)] = value
+        payload = json.dumps(normalized, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def find_completed_import(
+        self,
+        import_type: ImportType,
+        file_hash: str,
+        shop_id: Optional[int] = None
+    ) -> Optional[ImportHistory]:
+        """
+        查找相同内容且已完整成功的导入记录
+
+        部分成功/失败的导入不算，重新上传时需要重试失败的行。
+        """
+        query = self.db.query(ImportHistory).filter(
+            ImportHistory.import_type == import_type,
+            ImportHistory.file_hash == file_hash,
+            ImportHistory.status == ImportStatus.SUCCESS
+        )
+        if shop_id is not None:
+            query = query.filter(ImportHistory.shop_id == shop_id)
+        else:
+            query = query.filter(ImportHistory.shop_id.is_(None))
+        return query.order_by(ImportHistory.id.desc()).first()
+
+    def load_row_hashes(
+        self,
+        import_type: ImportType,
+        keys: Iterable[str],
+        shop_id: Optional[int] = None
+    ) -> Dict[str, str]:
+        """
+        批量读取自然键对应的已知行哈希
+
+        Returns:
+            {natural_key: row_hash}
+        """
+        keys = list({key[:255] for key in keys if key})
+        known: Dict[str, str] = {}
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[start:start + self.BATCH_SIZE]
+            rows = self.db.query(ImportRowHash.natural_key, ImportRowHash.row_hash).filter(
+                ImportRowHash.import_type == import_type.value,
+                ImportRowHash.shop_id == (shop_id or 0),
+                ImportRowHash.natural_key.in_(batch)
+            ).all()
+            known.update({natural_key: row_hash for natural_key, row_hash in rows})
+        return known
+
+    def save_row_hashes(
+        self,
+        import_type: ImportType,
+        hashes: Dict[str, str],
+        import_id: Optional[int] = None,
+        shop_id: Optional[int] = None
+    ) -> int:
+        """
+        批量写入（upsert）行哈希，调用方负责提交事务
+
+        只应传入已成功写入数据库的行，失败或未匹配的行下次导入时需要重新处理。
+
+        Returns:
+            写入的行数
+        """
+        if not hashes:
+            return 0
+
+        now = datetime.utcnow()
+        items = list(hashes.items())
+        for start in range(0, len(items), self.BATCH_SIZE):
+            values = [
+                {
+                    "import_type": import_type.value,
+                    "shop_id": shop_id or 0,
+                    "natural_key": natural_key[:255],
+                    "row_hash": row_hash,
+                    "import_id": import_id,
+                    "updated_at": now,
+                }
+                for natural_key, row_hash in items[start:start + self.BATCH_SIZE]
+            ]
+            stmt = pg_insert(ImportRowHash).values(values)
+            stmt = stmt.on_conflict_do_update(
+                constraint="uq_import_row_hash_key",
+                set_={
+                    "row_hash": stmt.excluded.row_hash,
+                    "import_id": stmt.excluded.import_id,
+                    "updated_at": stmt.excluded.updated_at,
+                }
+            )
+            self.db.execute(stmt)
+
+        logger.debug(f"记录行哈希 - 类型: {import_type.value}, 店铺: {shop_id or 0}, 行数: {len(items)}")
+        return len(items)
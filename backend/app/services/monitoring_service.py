@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from loguru import logger
 
+from app.core.concurrency import loop_lag_monitor
 from app.models.shop import Shop
 from app.models.order_detail_task import OrderDetailTask, TaskStatus
 from app.services.order_detail_enrichment_service import OrderDetailEnrichmentService
@@ -233,6 +234,16 @@ class MonitoringService:
             "timestamp": datetime.now().isoformat()
         }
     
+    @staticmethod
+    def get_responsiveness_status() -> Dict[str, Any]:
+        """
+        获取当前工作进程的响应能力
+        
+        Returns:
+            status 为 ok / degraded / unknown，reasons 为下降原因（事件循环阻塞、延迟过高、线程池排队）
+        """
+        return loop_lag_monitor.get_health()
+    
     def get_health_status(self) -> Dict[str, Any]:
         """
         获取系统健康状态
@@ -255,6 +266,9 @@ class MonitoringService:
                 if s.sync_status == "error" or s.product_sync_status == "error"
             ])
             
+            # 当前工作进程的响应能力（事件循环延迟、线程池排队）
+            responsiveness = self.get_responsiveness_status()
+            
             # 计算健康分数（0-100）
             health_score = 100
             if not worker_running:
@@ -265,6 +279,8 @@ class MonitoringService:
                 health_score -= 20
             if task_stats.get("failed", 0) > 0:
                 health_score -= 10
+            if responsiveness["status"] == "degraded":
+                health_score -= 20
             
             health_score = max(0, health_score)
             
@@ -275,6 +291,7 @@ class MonitoringService:
                 "task_stats": task_stats,
                 "shops_total": len(shops),
                 "shops_with_errors": shops_with_errors,
+                "responsiveness": responsiveness,
                 "timestamp": datetime.now().isoformat()
             }
         except Exception as e:
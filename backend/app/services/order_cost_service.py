@@ -1,13 +1,11 @@
 """订单成本计算服务"""
 from typing import Dict, Any, Optional, List
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from decimal import Decimal
+from sqlalchemy import and_, or_, func, text
 from datetime import datetime
 from loguru import logger
 
 from app.models.order import Order, OrderStatus
-from app.models.product import Product, ProductCost
 from app.models.shop import Shop
 
 
@@ -23,145 +21,128 @@ class OrderCostCalculationService:
         """
         self.db = db
     
-    def _get_product_cost(
-        self,
-        shop_id: int,
-        product_sku: Optional[str],
-        product_sku_id: Optional[str],
-        spu_id: Optional[str],
-        order_time: Optional[datetime] = None
-    ) -> Optional[Dict[str, Any]]:
-        """
-        获取商品成本价格
-        
-        匹配优先级：
-        1. productSkuId (product_id)
-        2. extCode (SKU货号)
-        3. spu_id
-        
-        Args:
-            shop_id: 店铺ID
-            product_sku: SKU货号 (extCode)
-            product_sku_id: 产品SKU ID (productSkuId)
-            spu_id: SPU ID
-            order_time: 订单时间，用于获取历史成本价
-            
-        Returns:
-            商品成本信息字典或None
-        """
-        product = None
-        match_method = None
-        
-        # 优先级1：通过 productSkuId 匹配
-        if product_sku_id:
-            product = self.db.query(Product).filter(
-                Product.shop_id == shop_id,
-                Product.product_id == str(product_sku_id)
-            ).first()
-            
-            if product:
-                match_method = "productSkuId"
-                logger.debug(f"✅ 通过productSkuId匹配到商品: {product_sku_id} -> {product.sku}")
-        
-        # 优先级2：通过 extCode (SKU货号) 匹配
-        if not product and product_sku:
-            product = self.db.query(Product).filter(
-                Product.shop_id == shop_id,
-                Product.sku == product_sku
-            ).first()
-            
-            if product:
-                match_method = "extCode"
-                logger.debug(f"✅ 通过extCode (SKU货号)匹配到商品: {product_sku} -> {product.product_id}")
-        
-        # 优先级3：通过 spu_id 匹配（备用）
-        if not product and spu_id:
-            product = self.db.query(Product).filter(
-                Product.shop_id == shop_id,
-                Product.spu_id == spu_id
-            ).first()
-            
-            if product:
-                match_method = "spu_id"
-                logger.debug(f"✅ 通过spu_id匹配到商品: {spu_id} -> {product.sku}")
-        
-        if not product:
-            logger.debug(
-                f"❌ 未找到匹配的商品 - "
-                f"productSkuId: {product_sku_id}, extCode: {product_sku}, spu_id: {spu_id}"
-            )
-            return None
-        
-        # 获取供货价
-        supply_price = product.current_price
-        
-        # 获取订单时间有效的成本价
-        cost_price = None
-        cost_record = None
-        
-        if order_time:
-            # 查询在订单时间有效的成本记录
-            cost_record = self.db.query(ProductCost).filter(
-                ProductCost.product_id == product.id,
-                ProductCost.effective_from <= order_time,
-                (ProductCost.effective_to.is_(None)) | (ProductCost.effective_to > order_time)
-            ).order_by(ProductCost.effective_from.desc()).first()
-            
-            if cost_record:
-                cost_price = cost_record.cost_price
-                logger.debug(
-                    f"找到商品 {product.sku} 在 {order_time} 的有效成本价: {cost_price}"
-                )
-        
-        # 如果没有找到订单时间的成本价，则使用当前最新的成本价（fallback）
-        if not cost_record:
-            cost_record = self.db.query(ProductCost).filter(
-                ProductCost.product_id == product.id,
-                ProductCost.effective_to.is_(None)
-            ).order_by(ProductCost.effective_from.desc()).first()
-            
-            if cost_record:
-                cost_price = cost_record.cost_price
-                if order_time:
-                    logger.debug(
-                        f"未找到订单时间的成本价，使用当前成本价: {product.sku} = {cost_price}"
-                    )
-        
-        # 如果没有找到成本价，记录日志
-        if not cost_price:
-            logger.debug(
-                f"商品 {product.sku} 没有成本价 - "
-                f"匹配方式: {match_method}"
+    # 按店铺分块执行的集合式成本更新
+    #
+    # 商品匹配优先级：productSkuId → extCode → spu_id，
+    # 同一键匹配到多个商品时取ID最小的一个；成本价优先取订单时间有效的记录，
+    # 没有则取当前生效（effective_to 为空）的最新记录。供货价/成本价统一换算为CNY。
+    # 返回更新的订单数，以及匹配到商品但数量为空、无法计算的订单数。
+    _COST_UPDATE_SQL = """
+        WITH candidates AS (
+            SELECT o.id, o.product_sku, o.spu_id, o.order_time, o.quantity,
+                   NULLIF(sp.product_id, '') AS product_sku_id
+            FROM orders o
+            LEFT JOIN products sp ON sp.id = o.product_id
+            WHERE {conditions}
+        ),
+        by_sku_id AS (
+            SELECT DISTINCT ON (product_id) product_id AS match_key, id
+            FROM products
+            WHERE shop_id = :shop_id AND product_id IS NOT NULL AND product_id <> ''
+            ORDER BY product_id, id
+        ),
+        by_ext_code AS (
+            SELECT DISTINCT ON (sku) sku AS match_key, id
+            FROM products
+            WHERE shop_id = :shop_id AND sku IS NOT NULL AND sku <> ''
+            ORDER BY sku, id
+        ),
+        by_spu AS (
+            SELECT DISTINCT ON (spu_id) spu_id AS match_key, id
+            FROM products
+            WHERE shop_id = :shop_id AND spu_id IS NOT NULL AND spu_id <> ''
+            ORDER BY spu_id, id
+        ),
+        matched AS (
+            SELECT c.id, c.order_time, c.quantity,
+                   COALESCE(m1.id, m2.id, m3.id) AS matched_product_id
+            FROM candidates c
+            LEFT JOIN by_sku_id m1 ON m1.match_key = c.product_sku_id
+            LEFT JOIN by_ext_code m2 ON m2.match_key = NULLIF(c.product_sku, '')
+            LEFT JOIN by_spu m3 ON m3.match_key = NULLIF(c.spu_id, '')
+        ),
+        effective_cost AS (
+            SELECT DISTINCT ON (m.id) m.id, pc.cost_price, pc.currency
+            FROM matched m
+            JOIN product_costs pc ON pc.product_id = m.matched_product_id
+            WHERE pc.effective_from <= m.order_time
+              AND (pc.effective_to IS NULL OR pc.effective_to > m.order_time)
+            ORDER BY m.id, pc.effective_from DESC
+        ),
+        current_cost AS (
+            SELECT DISTINCT ON (pc.product_id) pc.product_id, pc.cost_price, pc.currency
+            FROM product_costs pc
+            WHERE pc.effective_to IS NULL
+              AND pc.product_id IN (SELECT matched_product_id FROM matched)
+            ORDER BY pc.product_id, pc.effective_from DESC
+        ),
+        priced AS (
+            SELECT m.id, m.matched_product_id,
+                   CASE
+                       WHEN p.current_price IS NULL OR p.current_price = 0 THEN NULL
+                       WHEN p.currency = 'USD' THEN p.current_price * :usd_rate
+                       ELSE p.current_price
+                   END AS supply_price,
+                   CASE
+                       WHEN ec.id IS NOT NULL THEN
+                           CASE
+                               WHEN ec.cost_price = 0 THEN NULL
+                               WHEN ec.currency = 'USD' THEN ec.cost_price * :usd_rate
+                               ELSE ec.cost_price
+                           END
+                       WHEN cc.cost_price IS NULL OR cc.cost_price = 0 THEN NULL
+                       WHEN cc.currency = 'USD' THEN cc.cost_price * :usd_rate
+                       ELSE cc.cost_price
+                   END AS cost_price
+            FROM matched m
+            JOIN products p ON p.id = m.matched_product_id
+            LEFT JOIN effective_cost ec ON ec.id = m.id
+            LEFT JOIN current_cost cc ON cc.product_id = m.matched_product_id
+        ),
+        updated AS (
+            UPDATE orders o SET
+                unit_price = CASE WHEN pr.supply_price > 0 THEN pr.supply_price ELSE o.unit_price END,
+                total_price = CASE WHEN pr.supply_price > 0 THEN pr.supply_price * o.quantity ELSE o.total_price END,
+                currency = CASE WHEN pr.supply_price > 0 THEN 'CNY' ELSE o.currency END,
+                unit_cost = CASE WHEN pr.cost_price > 0 THEN pr.cost_price ELSE o.unit_cost END,
+                total_cost = CASE WHEN pr.cost_price > 0 THEN pr.cost_price * o.quantity ELSE o.total_cost END,
+                profit = CASE
+                    WHEN pr.cost_price > 0 THEN
+                        (CASE WHEN pr.supply_price > 0 THEN pr.supply_price * o.quantity
+                              ELSE COALESCE(o.total_price, 0) END)
+                        - pr.cost_price * o.quantity
+                    ELSE o.profit
+                END,
+                product_id = COALESCE(o.product_id, pr.matched_product_id),
+                updated_at = :now
+            FROM priced pr
+            WHERE o.id = pr.id
+              AND o.quantity IS NOT NULL
+              AND (pr.supply_price > 0 OR pr.cost_price > 0)
+            RETURNING o.id
+        )
+        SELECT
+            (SELECT count(*) FROM updated) AS updated,
+            (SELECT count(*) FROM matched WHERE quantity IS NULL AND matched_product_id IS NOT NULL) AS missing_quantity
+    """
+    
+    @staticmethod
+    def _candidate_conditions(
+        order_ids: Optional[List[int]],
+        force_recalculate: bool
+    ) -> str:
+        """待计算订单的SQL条件（与 calculate_order_costs 的ORM过滤条件保持一致）"""
+        conditions = [
+            "o.shop_id = :shop_id",
+            "o.status NOT IN (:cancelled_status, :refunded_status)",
+        ]
+        if order_ids:
+            conditions.append("o.id = ANY(:order_ids)")
+        if not force_recalculate:
+            conditions.append(
+                "(o.unit_cost IS NULL OR o.total_cost IS NULL OR o.total_price = 0 OR o.unit_price = 0)"
             )
-        
-        # 货币转换 - 统一转换为CNY
-        from app.utils.currency import CurrencyConverter
-        usd_to_cny_rate = CurrencyConverter.USD_TO_CNY_RATE
-        
-        # 转换供货价为CNY
-        supply_price_cny = None
-        if supply_price:
-            if product.currency == 'USD':
-                supply_price_cny = float(supply_price) * usd_to_cny_rate
-            else:
-                supply_price_cny = float(supply_price)
-        
-        # 转换成本价为CNY
-        cost_price_cny = None
-        if cost_price:
-            cost_currency = cost_record.currency if cost_record else product.currency
-            if cost_currency == 'USD':
-                cost_price_cny = float(cost_price) * usd_to_cny_rate
-            else:
-                cost_price_cny = float(cost_price)
-        
-        return {
-            'product_id': product.id,
-            'supply_price': supply_price_cny,  # 已转换为CNY
-            'cost_price': cost_price_cny,  # 已转换为CNY
-            'currency': 'CNY',  # 统一为CNY
-            'match_method': match_method
-        }
+        return " AND ".join(conditions)
     
     def calculate_order_costs(
         self,
@@ -172,6 +153,10 @@ class OrderCostCalculationService:
         """
         计算订单成本和利润
         
+        按店铺分块，每个店铺执行一条 UPDATE ... FROM（商品/成本匹配CTE），
+        在数据库内完成匹配与金额计算，每个店铺单独提交。
+        匹配到商品但数量为空的订单计入失败，未匹配到商品或没有价格的订单计入跳过。
+        
         Args:
             shop_id: 店铺ID，None表示所有店铺
             order_ids: 订单ID列表，None表示所有订单
@@ -180,6 +165,8 @@ class OrderCostCalculationService:
         Returns:
             计算结果统计
         """
+        from app.utils.currency import CurrencyConverter
+        
         logger.info("开始计算订单成本和利润...")
         
         # 构建查询条件
@@ -206,12 +193,16 @@ class OrderCostCalculationService:
                 )
             )
         
-        # 查询需要计算的订单
-        orders = self.db.query(Order).filter(and_(*filters)).all()
+        # 按店铺统计需要计算的订单数
+        shop_counts = self.db.query(
+            Order.shop_id,
+            func.count(Order.id)
+        ).filter(and_(*filters)).group_by(Order.shop_id).all()
         
-        logger.info(f"找到 {len(orders)} 个需要计算成本的订单")
+        total_count = sum(count for _, count in shop_counts)
+        logger.info(f"找到 {total_count} 个需要计算成本的订单（{len(shop_counts)} 个店铺）")
         
-        if not orders:
+        if not total_count:
             return {
                 'total': 0,
                 'success': 0,
@@ -223,104 +214,45 @@ class OrderCostCalculationService:
         failed_count = 0
         skipped_count = 0
         
-        for order in orders:
+        statement = text(self._COST_UPDATE_SQL.format(
+            conditions=self._candidate_conditions(order_ids, force_recalculate)
+        ))
+        params = {
+            'usd_rate': CurrencyConverter.get_usd_to_cny_rate(),
+            'cancelled_status': OrderStatus.CANCELLED.name,
+            'refunded_status': OrderStatus.REFUNDED.name,
+            'now': datetime.utcnow(),
+        }
+        if order_ids:
+            params['order_ids'] = list(order_ids)
+        
+        for chunk_shop_id, shop_total in shop_counts:
             try:
-                # 获取商品成本信息
-                # 从订单的 product_id (Temu商品ID) 获取 product_sku_id
-                product_sku_id = None
-                if order.product:
-                    product_sku_id = order.product.product_id
-                
-                cost_info = self._get_product_cost(
-                    shop_id=order.shop_id,
-                    product_sku=order.product_sku,
-                    product_sku_id=product_sku_id,
-                    spu_id=order.spu_id,
-                    order_time=order.order_time
-                )
-                
-                # 如果没有找到匹配的商品或价格信息，跳过
-                if not cost_info:
-                    logger.debug(
-                        f"订单 {order.order_sn} 未找到匹配的商品 - "
-                        f"SKU: {order.product_sku}, SPU: {order.spu_id}"
-                    )
-                    skipped_count += 1
-                    continue
-                
-                # 获取供货价格和成本价格
-                supply_price = cost_info.get('supply_price')
-                cost_price = cost_info.get('cost_price')
-                
-                quantity = Decimal(str(order.quantity))
-                has_supply_price = supply_price is not None and Decimal(str(supply_price)) > 0
-                has_cost_price = cost_price is not None and Decimal(str(cost_price)) > 0
-                
-                # 如果既没有供货价格也没有成本价格，跳过
-                if not has_supply_price and not has_cost_price:
-                    logger.debug(
-                        f"订单 {order.order_sn} 没有供货价格和成本价格 - "
-                        f"SKU: {order.product_sku}"
-                    )
-                    skipped_count += 1
-                    continue
-                
-                # 计算订单金额（供货价格 × 数量）- 统一为CNY
-                if has_supply_price:
-                    unit_price = Decimal(str(supply_price))
-                    total_price = unit_price * quantity
-                    
-                    # 更新订单价格（统一为CNY）
-                    order.unit_price = unit_price
-                    order.total_price = total_price
-                    order.currency = 'CNY'  # 统一货币单位为CNY
-                else:
-                    # 如果没有供货价格，使用现有的订单金额（如果有）
-                    total_price = order.total_price if order.total_price else Decimal('0')
-                
-                # 计算成本和利润（统一为CNY）
-                if has_cost_price:
-                    unit_cost = Decimal(str(cost_price))
-                    total_cost = unit_cost * quantity
-                    profit = total_price - total_cost
-                    
-                    # 更新订单成本和利润
-                    order.unit_cost = unit_cost
-                    order.total_cost = total_cost
-                    order.profit = profit
-                
-                # 如果找到匹配的商品，更新 product_id 关联
-                if cost_info.get('product_id') and not order.product_id:
-                    order.product_id = cost_info['product_id']
-                
-                self.db.add(order)
-                success_count += 1
-                
-                logger.debug(
-                    f"✅ 订单 {order.order_sn} 计算完成 - "
-                    f"订单金额: {order.total_price}, 成本: {order.total_cost}, 利润: {order.profit} "
-                    f"(匹配方式: {cost_info.get('match_method', 'unknown')})"
-                )
-                
+                updated, missing_quantity = self.db.execute(statement, {**params, 'shop_id': chunk_shop_id}).one()
+                self.db.commit()
             except Exception as e:
-                logger.error(f"计算订单 {order.order_sn} 成本失败: {e}")
-                failed_count += 1
+                self.db.rollback()
+                logger.error(f"计算店铺 {chunk_shop_id} 订单成本失败: {e}")
+                failed_count += shop_total
                 continue
-        
-        # 提交事务
-        try:
-            self.db.commit()
-            logger.info(
-                f"订单成本计算完成 - "
-                f"成功: {success_count}, 失败: {failed_count}, 跳过: {skipped_count}"
+            
+            success_count += updated
+            failed_count += missing_quantity
+            # 未匹配到商品，或既没有供货价也没有成本价的订单
+            skipped_count += shop_total - missing_quantity - updated
+            
+            logger.debug(
+                f"店铺 {chunk_shop_id} 订单成本计算完成 - "
+                f"订单: {shop_total}, 更新: {updated}, 跳过: {shop_total - missing_quantity - updated}"
             )
-        except Exception as e:
-            self.db.rollback()
-            logger.error(f"提交订单成本更新失败: {e}")
-            raise
+        
+        logger.info(
+            f"订单成本计算完成 - "
+            f"成功: {success_count}, 失败: {failed_count}, 跳过: {skipped_count}"
+        )
         
         return {
-            'total': len(orders),
+            'total': total_count,
             'success': success_count,
             'failed': failed_count,
             'skipped': skipped_count
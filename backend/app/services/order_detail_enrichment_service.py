@@ -1,6 +1,5 @@
 """订单详情补齐服务 - 异步获取包裹号"""
 import json
-import asyncio
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
@@ -167,6 +166,8 @@ class OrderDetailEnrichmentService:
         """
         批量处理任务（从Redis队列获取）
         
+        同一店铺的任务通过代理的批量接口一次请求获取全部订单详情，每个详情返回后立即写入。
+        
         Args:
             batch_size: 每批处理的父订单数量
             max_concurrent: 最大并发数（同时进行的API调用数，默认5）
@@ -204,27 +205,25 @@ class OrderDetailEnrichmentService:
             
             logger.info(f"从队列获取到 {len(tasks_data)} 个任务，开始处理（最大并发: {max_concurrent}）...")
             
-            # 使用信号量控制并发数，避免瞬间消耗所有API限流令牌
-            semaphore = asyncio.Semaphore(max_concurrent)
-            
-            async def process_with_semaphore(task_data):
-                """带信号量控制的任务处理"""
-                async with semaphore:
-                    return await self._process_single_task(task_data)
+            # 领取任务（加锁、标记为处理中），按店铺分组
+            tasks_by_shop: Dict[int, List[Dict[str, Any]]] = {}
+            for task_data in tasks_data:
+                try:
+                    claimed = self._claim_task(task_data)
+                except Exception as e:
+                    logger.error(f"领取任务失败: {e}, 任务数据: {task_data}")
+                    stats["failed"] += 1
+                    continue
+                if claimed:
+                    tasks_by_shop.setdefault(claimed["shop_id"], []).append(claimed)
             
-            # 并发处理任务（受信号量控制）
-            results = await asyncio.gather(
-                *[process_with_semaphore(task_data) for task_data in tasks_data],
-                return_exceptions=True
-            )
+            # 每个店铺一次批量请求获取订单详情
+            results = []
+            for shop_id, claimed_tasks in tasks_by_shop.items():
+                results.extend(await self._process_shop_tasks(shop_id, claimed_tasks, max_concurrent))
             
             # 统计结果
             for result in results:
-                if isinstance(result, Exception):
-                    logger.error(f"处理任务异常: {result}")
-                    stats["failed"] += 1
-                    continue
-                
                 if result:
                     if result.get("status") == "completed":
                         stats["completed"] += 1
@@ -247,20 +246,20 @@ class OrderDetailEnrichmentService:
             logger.error(traceback.format_exc())
             return stats
     
-    async def _process_single_task(self, task_data: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    def _claim_task(self, task_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
-        处理单个任务
+        领取单个任务：校验任务数据、设置任务锁并标记为处理中
         
         Args:
             task_data: 任务数据
             
         Returns:
-            处理结果
+            领取的任务 {task_data, task, shop_id, parent_order_sn, lock_key}；
+            任务无效或正在被处理时返回None
         """
         task_id = task_data.get("task_id")
         shop_id = task_data.get("shop_id")
         parent_order_sn = task_data.get("parent_order_sn")
-        order_ids = task_data.get("order_ids", [])
         
         if not all([task_id, shop_id, parent_order_sn]):
             logger.error(f"任务数据不完整: {task_data}")
@@ -278,111 +277,209 @@ class OrderDetailEnrichmentService:
             return None
         
         lock_key = f"{self.TASK_LOCK_KEY_PREFIX}{parent_order_sn}"
-        if self.redis and RedisClient.exists(lock_key):
+        if not self._acquire_lock(lock_key, task_id):
             logger.debug(f"父订单 {parent_order_sn} 正在处理中，跳过")
             # 将任务重新放回队列
-            RedisClient.lpush(self.QUEUE_KEY, json.dumps(task_data, ensure_ascii=False))
+            self.redis.lpush(self.QUEUE_KEY, json.dumps(task_data, ensure_ascii=False))
             return None
         
         try:
-            # 设置任务锁
-            if self.redis:
-                RedisClient.setex(lock_key, self.LOCK_TTL, str(task_id))
-            
             # 更新任务状态为处理中
             task.status = TaskStatus.PROCESSING
             self.db.commit()
+        except Exception:
+            self.db.rollback()
+            self._release_lock(lock_key)
+            raise
+        
+        return {
+            "task_data": task_data,
+            "task": task,
+            "shop_id": shop_id,
+            "parent_order_sn": parent_order_sn,
+            "lock_key": lock_key,
+        }
+    
+    async def _process_shop_tasks(
+        self,
+        shop_id: int,
+        claimed_tasks: List[Dict[str, Any]],
+        max_concurrent: int
+    ) -> List[Dict[str, Any]]:
+        """
+        处理同一店铺的任务：一次批量请求获取所有父订单的详情，按返回顺序逐个写入
+        
+        Args:
+            shop_id: 店铺ID
+            claimed_tasks: 已领取的任务
+            max_concurrent: 代理端的并发调用数
             
+        Returns:
+            每个任务的处理结果
+        """
+        results = []
+        # 同一父订单在领取时已加锁去重
+        pending = {claimed["parent_order_sn"]: claimed for claimed in claimed_tasks}
+        
+        try:
             # 获取店铺信息
             shop = self.db.query(Shop).filter(Shop.id == shop_id).first()
             if not shop:
                 raise ValueError(f"店铺不存在: shop_id={shop_id}")
             
-            # 调用详情接口获取包裹号
+            # 调用详情接口获取包裹号（批量）
             temu_service = get_temu_service(shop)
             try:
-                order_detail = await temu_service.get_order_detail(parent_order_sn)
-                
-                # 从详情中提取包裹号
-                package_sn = None
-                order_list = order_detail.get('orderList', [])
-                if order_list:
-                    first_order = order_list[0]
-                    package_sn_info = first_order.get('packageSnInfo')
-                    if package_sn_info:
-                        if isinstance(package_sn_info, list) and len(package_sn_info) > 0:
-                            package_sn = package_sn_info[0].get('packageSn') if isinstance(package_sn_info[0], dict) else None
-                        elif isinstance(package_sn_info, dict):
-                            package_sn = package_sn_info.get('packageSn')
-                
-                if package_sn:
-                    # 更新订单的包裹号
-                    orders = self.db.query(Order).filter(Order.id.in_(order_ids)).all()
-                    for order in orders:
-                        order.package_sn = package_sn
-                    
-                    # 标记任务为完成
-                    task.mark_completed(package_sn)
-                    self.db.commit()
-                    
-                    # 更新任务状态
-                    self._set_task_status(task_id, {
-                        "status": "completed",
-                        "package_sn": package_sn,
-                        "completed_at": datetime.utcnow().isoformat()
-                    })
-                    
-                    logger.info(f"✅ 任务完成: 父订单 {parent_order_sn}, 包裹号: {package_sn}")
-                    return {"status": "completed", "package_sn": package_sn}
-                else:
-                    # 成功获取了订单详情，但详情中没有包裹号
-                    # 这种情况直接标记为完成（不重试，不计入失败）
-                    # 可能原因：订单确实没有包裹号（如已取消但未发货的订单）
-                    task.mark_completed(None)  # package_sn 为 None
-                    task.error_message = "订单详情中未包含包裹号信息（订单可能未发货或已取消）"
-                    self.db.commit()
-                    
-                    # 更新任务状态
-                    self._set_task_status(task_id, {
-                        "status": "completed",
-                        "package_sn": None,
-                        "note": "订单详情中未包含包裹号信息",
-                        "completed_at": datetime.utcnow().isoformat()
-                    })
-                    
-                    logger.info(f"✅ 任务完成（无包裹号）: 父订单 {parent_order_sn}, 详情已获取但无包裹号")
-                    return {"status": "completed", "package_sn": None, "note": "订单详情中未包含包裹号信息"}
-                
+                async for parent_order_sn, order_detail in temu_service.iter_order_details(
+                    list(pending.keys()),
+                    concurrency=max_concurrent
+                ):
+                    claimed = pending.pop(parent_order_sn, None)
+                    if claimed is None:
+                        continue
+                    try:
+                        if isinstance(order_detail, Exception):
+                            raise order_detail
+                        results.append(self._apply_order_detail(claimed, order_detail))
+                    except Exception as e:
+                        results.append(self._handle_task_error(claimed, str(e)))
+                    finally:
+                        self._release_lock(claimed["lock_key"])
             finally:
                 await temu_service.close()
                 
         except Exception as e:
-            error_msg = str(e)
-            logger.error(f"处理任务失败: 父订单 {parent_order_sn}, 错误: {error_msg}")
+            # 店铺不可用或批量请求整体失败，剩余任务按失败处理（可重试的重新入队）
+            logger.error(f"批量获取订单详情失败: shop_id={shop_id}, 剩余 {len(pending)} 个任务, 错误: {e}")
+            for claimed in pending.values():
+                try:
+                    results.append(self._handle_task_error(claimed, str(e)))
+                finally:
+                    self._release_lock(claimed["lock_key"])
+        
+        return results
+    
+    def _apply_order_detail(self, claimed: Dict[str, Any], order_detail: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        从订单详情中提取包裹号，更新订单并完成任务
+        
+        Args:
+            claimed: 已领取的任务
+            order_detail: 订单详情
             
-            if task.can_retry():
-                task.increment_retry()
-                task.status = TaskStatus.PENDING
-                task.error_message = error_msg
-                self.db.commit()
-                # 重新加入队列（延迟重试）
-                if self.redis:
-                    self.redis.lpush(self.QUEUE_KEY, json.dumps(task_data, ensure_ascii=False))
-                logger.warning(f"⚠️ 任务重试: 父订单 {parent_order_sn}, 重试次数: {task.retry_count}")
-                return {"status": "retried", "retry_count": task.retry_count}
-            else:
-                task.mark_failed(error_msg)
-                self.db.commit()
-                logger.error(f"❌ 任务失败（超过最大重试次数）: 父订单 {parent_order_sn}")
-                return {"status": "failed", "error": error_msg}
+        Returns:
+            处理结果
+        """
+        task = claimed["task"]
+        task_id = claimed["task_data"].get("task_id")
+        order_ids = claimed["task_data"].get("order_ids", [])
+        parent_order_sn = claimed["parent_order_sn"]
         
-        finally:
-            # 释放任务锁
-            try:
-                if self.redis:
-                    RedisClient.delete(lock_key)
-            except Exception:
-                pass
+        # 从详情中提取包裹号
+        package_sn = None
+        order_list = order_detail.get('orderList', [])
+        if order_list:
+            first_order = order_list[0]
+            package_sn_info = first_order.get('packageSnInfo')
+            if package_sn_info:
+                if isinstance(package_sn_info, list) and len(package_sn_info) > 0:
+                    package_sn = package_sn_info[0].get('packageSn') if isinstance(package_sn_info[0], dict) else None
+                elif isinstance(package_sn_info, dict):
+                    package_sn = package_sn_info.get('packageSn')
+        
+        if package_sn:
+            # 更新订单的包裹号
+            orders = self.db.query(Order).filter(Order.id.in_(order_ids)).all()
+            for order in orders:
+                order.package_sn = package_sn
+            
+            # 标记任务为完成
+            task.mark_completed(package_sn)
+            self.db.commit()
+            
+            # 更新任务状态
+            self._set_task_status(task_id, {
+                "status": "completed",
+                "package_sn": package_sn,
+                "completed_at": datetime.utcnow().isoformat()
+            })
+            
+            logger.info(f"✅ 任务完成: 父订单 {parent_order_sn}, 包裹号: {package_sn}")
+            return {"status": "completed", "package_sn": package_sn}
+        else:
+            # 成功获取了订单详情，但详情中没有包裹号
+            # 这种情况直接标记为完成（不重试，不计入失败）
+            # 可能原因：订单确实没有包裹号（如已取消但未发货的订单）
+            task.mark_completed(None)  # package_sn 为 None
+            task.error_message = "订单详情中未包含包裹号信息（订单可能未发货或已取消）"
+            self.db.commit()
+            
+            # 更新任务状态
+            self._set_task_status(task_id, {
+                "status": "completed",
+                "package_sn": None,
+                "note": "订单详情中未包含包裹号信息",
+                "completed_at": datetime.utcnow().isoformat()
+            })
+            
+            logger.info(f"✅ 任务完成（无包裹号）: 父订单 {parent_order_sn}, 详情已获取但无包裹号")
+            return {"status": "completed", "package_sn": None, "note": "订单详情中未包含包裹号信息"}
+    
+    def _handle_task_error(self, claimed: Dict[str, Any], error_msg: str) -> Dict[str, Any]:
+        """
+        任务失败：未超过最大重试次数时重新入队，否则标记为失败
+        
+        Args:
+            claimed: 已领取的任务
+            error_msg: 错误信息
+            
+        Returns:
+            处理结果
+        """
+        task = claimed["task"]
+        task_data = claimed["task_data"]
+        parent_order_sn = claimed["parent_order_sn"]
+        logger.error(f"处理任务失败: 父订单 {parent_order_sn}, 错误: {error_msg}")
+        
+        # 同一会话中其他任务的写入失败不应影响本任务的状态更新
+        self.db.rollback()
+        
+        if task.can_retry():
+            task.increment_retry()
+            task.status = TaskStatus.PENDING
+            task.error_message = error_msg
+            self.db.commit()
+            # 重新加入队列（延迟重试）
+            if self.redis:
+                self.redis.lpush(self.QUEUE_KEY, json.dumps(task_data, ensure_ascii=False))
+            logger.warning(f"⚠️ 任务重试: 父订单 {parent_order_sn}, 重试次数: {task.retry_count}")
+            return {"status": "retried", "retry_count": task.retry_count}
+        else:
+            task.mark_failed(error_msg)
+            self.db.commit()
+            logger.error(f"❌ 任务失败（超过最大重试次数）: 父订单 {parent_order_sn}")
+            return {"status": "failed", "error": error_msg}
+    
+    def _acquire_lock(self, lock_key: str, task_id: int) -> bool:
+        """
+        设置任务锁（SET NX，与 _release_lock 使用同一个Redis客户端）
+        
+        Returns:
+            是否获得锁；锁已存在（任务正在被处理）或Redis不可用时返回False
+        """
+        redis_client = self.redis
+        if not redis_client:
+            return False
+        return bool(redis_client.set(lock_key, str(task_id), nx=True, ex=self.LOCK_TTL))
+    
+    def _release_lock(self, lock_key: str):
+        """释放任务锁"""
+        try:
+            redis_client = self.redis
+            if redis_client:
+                redis_client.delete(lock_key)
+        except Exception:
+            pass
     
     def _set_task_status(self, task_id: int, status_data: Dict[str, Any]):
         """设置任务状态到Redis"""
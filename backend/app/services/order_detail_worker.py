@@ -5,7 +5,7 @@ import time
 from typing import Optional
 from sqlalchemy.orm import Session
 from loguru import logger
-from app.core.database import SessionLocal
+from app.core.database import WorkerSessionLocal
 from app.services.order_detail_enrichment_service import OrderDetailEnrichmentService
 
 
@@ -35,7 +35,7 @@ class OrderDetailWorker:
             return
         
         self.running = True
-        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread = threading.Thread(target=self._run, name="order-detail-worker", daemon=True)
         self.thread.start()
         logger.info(f"订单详情补齐工作线程已启动 (批量大小: {self.batch_size}, 最大并发: {self.max_concurrent}, 轮询间隔: {self.poll_interval}秒)")
     
@@ -81,7 +81,7 @@ class OrderDetailWorker:
         while self.running:
             try:
                 # 创建数据库会话
-                db = SessionLocal()
+                db = WorkerSessionLocal()
                 try:
                     # 创建服务实例
                     service = OrderDetailEnrichmentService(db)
@@ -2,7 +2,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, cast, select, insert, literal, Date
 from loguru import logger
 
 from app.models.payout import Payout, PayoutStatus
@@ -13,6 +13,9 @@ from app.core.config import settings
 class PayoutService:
     """回款计划服务"""
     
+    # 批量创建回款计划时每条 INSERT 覆盖的最大订单数
+    PAYOUT_CHUNK_SIZE = 5000
+    
     def __init__(self, db: Session):
         """
         初始化回款计划服务
@@ -68,65 +71,170 @@ class PayoutService:
         
         return payout
     
-    def create_payouts_for_delivered_orders(
+    def _undelivered_payout_filters(
         self,
         shop_id: Optional[int] = None,
         delivery_date: Optional[date] = None
-    ) -> Dict[str, int]:
-        """
-        为已签收的订单批量创建回款计划
-        
-        Args:
-            shop_id: 店铺ID（可选，None表示所有店铺）
-            delivery_date: 签收日期（可选，None表示所有已签收订单）
-            
-        Returns:
-            统计信息
-        """
-        # 查询已签收但未创建回款计划的订单
-        query = self.db.query(Order).filter(
+    ) -> List[Any]:
+        """已签收但未创建回款计划的订单过滤条件（需配合 LEFT JOIN payouts）"""
+        filters = [
             Order.delivery_time.isnot(None),
-            ~Order.id.in_(
-                self.db.query(Payout.order_id).subquery()
-            )
-        )
+            Payout.id.is_(None),
+        ]
         
         if shop_id:
-            query = query.filter(Order.shop_id == shop_id)
+            filters.append(Order.shop_id == shop_id)
         
         if delivery_date:
             # 查询指定日期签收的订单
             start_datetime = datetime.combine(delivery_date, datetime.min.time())
             end_datetime = datetime.combine(delivery_date, datetime.max.time())
-            query = query.filter(
+            filters.append(
                 and_(
                     Order.delivery_time >= start_datetime,
                     Order.delivery_time <= end_datetime
                 )
             )
         
-        orders = query.all()
+        return filters
+    
+    def _plan_payout_chunks(self, counts: List[Any]) -> List[Dict[str, Any]]:
+        """
+        将按（店铺, 签收日期）分组的订单数合并为写入分块
         
+        同一店铺的连续签收日期合并，直到分块订单数达到 PAYOUT_CHUNK_SIZE。
+        """
+        chunks: List[Dict[str, Any]] = []
+        current: Optional[Dict[str, Any]] = None
+        
+        for chunk_shop_id, delivery_day, count in counts:
+            if (
+                current is None
+                or current['shop_id'] != chunk_shop_id
+                or current['count'] >= self.PAYOUT_CHUNK_SIZE
+            ):
+                current = {
+                    'shop_id': chunk_shop_id,
+                    'start_date': delivery_day,
+                    'end_date': delivery_day,
+                    'count': 0,
+                }
+                chunks.append(current)
+            current['end_date'] = delivery_day
+            current['count'] += count
+        
+        return chunks
+    
+    def create_payouts_for_delivered_orders(
+        self,
+        shop_id: Optional[int] = None,
+        delivery_date: Optional[date] = None
+    ) -> Dict[str, int]:
+        """
+        为已签收的订单批量创建回款计划
+        
+        先按（店铺, 签收日期）统计待处理订单，再按店铺和签收日期区间分块，
+        每块执行一条 INSERT INTO payouts SELECT ... FROM orders LEFT JOIN payouts，
+        数据库往返次数只与分块数有关，与订单量无关。
+        
+        Args:
+            shop_id: 店铺ID（可选，None表示所有店铺）
+            delivery_date: 签收日期（可选，None表示所有已签收订单）
+            
+        Returns:
+            统计信息
+        """
+        filters = self._undelivered_payout_filters(shop_id, delivery_date)
+        delivery_day = cast(Order.delivery_time, Date)
+        
+        # 按店铺和签收日期统计待创建回款计划的订单
+        counts = self.db.query(
+            Order.shop_id,
+            delivery_day,
+            func.count(Order.id)
+        ).outerjoin(
+            Payout, Payout.order_id == Order.id
+        ).filter(*filters).group_by(
+            Order.shop_id, delivery_day
+        ).order_by(
+            Order.shop_id, delivery_day
+        ).all()
+        
+        total = sum(count for _, _, count in counts)
         created = 0
-        skipped = 0
         
-        for order in orders:
+        if not total:
+            return {
+                'total': 0,
+                'created': 0,
+                'skipped': 0
+            }
+        
+        now = datetime.utcnow()
+        status_type = Payout.__table__.c.status.type
+        
+        for chunk in self._plan_payout_chunks(counts):
+            chunk_start = datetime.combine(chunk['start_date'], datetime.min.time())
+            chunk_end = datetime.combine(chunk['end_date'] + timedelta(days=1), datetime.min.time())
+            
+            # 回款日期 = 签收日期 + 回款天数
+            source = select(
+                Order.shop_id,
+                Order.id,
+                delivery_day + literal(self.settlement_days),
+                Order.total_price,
+                func.coalesce(Order.currency, 'USD'),
+                literal(PayoutStatus.PENDING, type_=status_type),
+                Order.raw_data_id,
+                literal(now),
+                literal(now)
+            ).select_from(Order).outerjoin(
+                Payout, Payout.order_id == Order.id
+            ).where(
+                *filters,
+                Order.shop_id == chunk['shop_id'],
+                Order.delivery_time >= chunk_start,
+                Order.delivery_time < chunk_end
+            )
+            
+            stmt = insert(Payout).from_select(
+                [
+                    Payout.shop_id,
+                    Payout.order_id,
+                    Payout.payout_date,
+                    Payout.payout_amount,
+                    Payout.currency,
+                    Payout.status,
+                    Payout.raw_data_id,
+                    Payout.created_at,
+                    Payout.updated_at,
+                ],
+                source
+            )
+            
             try:
-                payout = self.create_payout_for_order(order)
-                if payout:
-                    created += 1
-                else:
-                    skipped += 1
+                result = self.db.execute(stmt)
+                self.db.commit()
             except Exception as e:
-                logger.error(f"为订单 {order.order_sn} 创建回款计划失败: {e}")
-                skipped += 1
+                self.db.rollback()
+                logger.error(
+                    f"为店铺 {chunk['shop_id']} 创建回款计划失败 "
+                    f"({chunk['start_date']} ~ {chunk['end_date']}): {e}"
+                )
+                continue
+            
+            created += result.rowcount or 0
+            logger.debug(
+                f"店铺 {chunk['shop_id']} 创建回款计划 {result.rowcount} 条 "
+                f"({chunk['start_date']} ~ {chunk['end_date']})"
+            )
         
-        self.db.commit()
+        logger.info(f"批量创建回款计划完成 - 订单: {total}, 创建: {created}")
         
         return {
-            'total': len(orders),
+            'total': total,
             'created': created,
-            'skipped': skipped
+            'skipped': total - created
         }
     
     def get_payouts(
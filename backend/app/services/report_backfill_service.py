@@ -0,0 +1,222 @@
+"""报表快照回填服务
+
+在成本、商品映射等修正后重新生成历史报表：
+- 日报：按日期分块，每块对所有店铺执行一次分组聚合查询，批量 upsert 快照
+- 周报/月报：由日报快照汇总得到，不重新扫描订单
+- 进度按任务ID记录在Redis中，中断后用相同参数重新执行会从上次完成的日期继续；
+  所有写入都是 upsert，重复执行结果一致
+- 执行中每完成一个分块/汇总周期刷新进度的 updated_at，进程崩溃或被杀后超过 STALE_SECONDS
+  未刷新的 running 任务视为已中断，可以重新提交继续
+"""
+import hashlib
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.core.redis_client import RedisClient
+from app.models.report_snapshot import ReportType
+from app.models.shop import Shop
+from app.services.report_service import ReportService
+
+
+class ReportBackfillService:
+    """报表快照回填服务"""
+
+    # 每个分块覆盖的天数（一次分组聚合查询）
+    CHUNK_DAYS = 31
+    # 回填进度保留时间（秒）
+    PROGRESS_TTL = 7 * 24 * 3600
+    # running 状态超过该时间（秒）未刷新进度视为已中断（执行进程崩溃或被杀）
+    STALE_SECONDS = 15 * 60
+
+    def __init__(self, db: Session):
+        """
+        初始化报表回填服务
+
+        Args:
+            db: 数据库会话
+        """
+        self.db = db
+        self.report_service = ReportService(db)
+
+    @staticmethod
+    def make_job_id(
+        start_date: date,
+        end_date: date,
+        shop_ids: Optional[List[int]] = None,
+        include_rollups: bool = True
+    ) -> str:
+        """根据回填参数生成任务ID，相同参数得到相同ID，用于断点续跑"""
+        shops = ",".join(str(sid) for sid in sorted(shop_ids)) if shop_ids else "all"
+        payload = f"{start_date.isoformat()}|{end_date.isoformat()}|{shops}|rollups={int(include_rollups)}"
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _progress_key(job_id: str) -> str:
+        return f"report_backfill:{job_id}"
+
+    @classmethod
+    def get_progress(cls, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取回填进度"""
+        return RedisClient.get(cls._progress_key(job_id))
+
+    @classmethod
+    def is_running(cls, progress: Optional[Dict[str, Any]]) -> bool:
+        """任务是否仍在执行（running 且进度在 STALE_SECONDS 内刷新过）"""
+        if not progress or progress.get("status") != "running":
+            return False
+        try:
+            updated_at = datetime.fromisoformat(progress["updated_at"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return (datetime.utcnow() - updated_at).total_seconds() < cls.STALE_SECONDS
+
+    @classmethod
+    def _save_progress(cls, job_id: str, progress: Dict[str, Any]) -> None:
+        progress["updated_at"] = datetime.utcnow().isoformat()
+        RedisClient.set(cls._progress_key(job_id), progress, ttl=cls.PROGRESS_TTL)
+
+    @staticmethod
+    def _week_ranges(start_date: date, end_date: date, today: date) -> List[Tuple[date, date]]:
+        """与回填范围相交、且已经结束的自然周（周一至周日）"""
+        ranges = []
+        week_start = start_date - timedelta(days=start_date.weekday())
+        while week_start <= end_date:
+            week_end = week_start + timedelta(days=6)
+            if week_end < today:
+                ranges.append((week_start, week_end))
+            week_start += timedelta(days=7)
+        return ranges
+
+    @staticmethod
+    def _month_ranges(start_date: date, end_date: date, today: date) -> List[Tuple[date, date]]:
+        """与回填范围相交、且已经结束的自然月"""
+        ranges = []
+        month_start = start_date.replace(day=1)
+        while month_start <= end_date:
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            month_end = next_month - timedelta(days=1)
+            if month_end < today:
+                ranges.append((month_start, month_end))
+            month_start = next_month
+        return ranges
+
+    def run(
+        self,
+        start_date: date,
+        end_date: date,
+        shop_ids: Optional[List[int]] = None,
+        include_rollups: bool = True,
+        resume: bool = True
+    ) -> Dict[str, Any]:
+        """
+        回填日期范围内的报表快照
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期（含）
+            shop_ids: 店铺ID列表，None表示所有启用的店铺
+            include_rollups: 是否由日报汇总生成周报/月报
+            resume: 是否从上次中断处继续（相同参数的任务）
+
+        Returns:
+            回填进度/结果
+        """
+        if start_date > end_date:
+            raise ValueError("开始日期不能晚于结束日期")
+
+        job_id = self.make_job_id(start_date, end_date, shop_ids, include_rollups)
+        if not shop_ids:
+            shop_ids = [sid for (sid,) in self.db.query(Shop.id).filter(Shop.is_active == True).all()]
+
+        previous = self.get_progress(job_id) if resume else None
+        progress = {
+            "job_id": job_id,
+            "status": "running",
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "shop_count": len(shop_ids),
+            "completed_through": None,
+            "daily_saved": 0,
+            "weekly_saved": 0,
+            "monthly_saved": 0,
+            "rollups_done": False,
+            "error": None,
+        }
+        if previous and previous.get("status") != "completed":
+            for key in ("completed_through", "daily_saved", "weekly_saved", "monthly_saved", "rollups_done"):
+                progress[key] = previous.get(key, progress[key])
+            logger.info(f"报表回填 {job_id} 从 {progress['completed_through'] or start_date} 继续")
+        progress["resumed_from"] = progress["completed_through"]
+
+        if not shop_ids:
+            progress["status"] = "completed"
+            self._save_progress(job_id, progress)
+            return progress
+
+        started = time.monotonic()
+        self._save_progress(job_id, progress)
+
+        try:
+            # 日报：按分块聚合，每块提交后记录进度
+            chunk_start = start_date
+            if progress["completed_through"]:
+                chunk_start = max(start_date, date.fromisoformat(progress["completed_through"]) + timedelta(days=1))
+
+            while chunk_start <= end_date:
+                chunk_end = min(chunk_start + timedelta(days=self.CHUNK_DAYS - 1), end_date)
+                metrics = self.report_service.generate_daily_metrics_range(shop_ids, chunk_start, chunk_end)
+                items = [
+                    {"shop_id": sid, "date": day, "metrics": day_metrics}
+                    for (sid, day), day_metrics in metrics.items()
+                ]
+                progress["daily_saved"] += self.report_service.bulk_save_reports(ReportType.DAILY, items)
+                self.db.commit()
+
+                progress["completed_through"] = chunk_end.isoformat()
+                self._save_progress(job_id, progress)
+                logger.info(f"报表回填 {job_id} 日报完成至 {chunk_end}（{len(items)} 条）")
+                chunk_start = chunk_end + timedelta(days=1)
+
+            # 周报/月报：由日报快照汇总
+            if include_rollups and not progress["rollups_done"]:
+                today = date.today()
+                for week_start, week_end in self._week_ranges(start_date, end_date, today):
+                    weekly = self.report_service.rollup_weekly_metrics_for_shops(shop_ids, week_start, week_end)
+                    progress["weekly_saved"] += self.report_service.bulk_save_reports(
+                        ReportType.WEEKLY,
+                        [{"shop_id": sid, "date": week_start, "metrics": m} for sid, m in weekly.items()]
+                    )
+                    self._save_progress(job_id, progress)
+                self.db.commit()
+
+                for month_start, month_end in self._month_ranges(start_date, end_date, today):
+                    monthly = self.report_service.generate_monthly_metrics_for_shops(shop_ids, month_start, month_end)
+                    progress["monthly_saved"] += self.report_service.bulk_save_reports(
+                        ReportType.MONTHLY,
+                        [{"shop_id": sid, "date": month_start, "metrics": m} for sid, m in monthly.items()]
+                    )
+                    self._save_progress(job_id, progress)
+                self.db.commit()
+                progress["rollups_done"] = True
+
+            progress["status"] = "completed"
+        except Exception as e:
+            self.db.rollback()
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            logger.error(f"报表回填 {job_id} 失败: {e}")
+            raise
+        finally:
+            progress["elapsed_seconds"] = round(time.monotonic() - started, 2)
+            self._save_progress(job_id, progress)
+
+        logger.info(
+            f"报表回填 {job_id} 完成 - 日报: {progress['daily_saved']}, "
+            f"周报: {progress['weekly_saved']}, 月报: {progress['monthly_saved']}, "
+            f"耗时: {progress['elapsed_seconds']}秒"
+        )
+        return progress
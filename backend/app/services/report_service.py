@@ -1,10 +1,14 @@
 """报表服务"""
-from typing import Dict, Any, Optional, List
+import asyncio
+import json
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, date, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import and_, func, cast, select, literal, Date
 from loguru import logger
 
+from app.core.config import settings
 from app.models.report_snapshot import ReportSnapshot, ReportType
 from app.models.order import Order, OrderStatus
 from app.models.shop import Shop
@@ -13,6 +17,13 @@ from app.models.shop import Shop
 class ReportService:
     """报表服务"""
     
+    # Top商品数量：日报/周报10个，月报20个
+    DAILY_TOP_PRODUCTS = 10
+    WEEKLY_TOP_PRODUCTS = 10
+    MONTHLY_TOP_PRODUCTS = 20
+    # 批量保存快照时每条 INSERT 的行数
+    BULK_SAVE_BATCH_SIZE = 500
+    
     def __init__(self, db: Session):
         """
         初始化报表服务
@@ -22,6 +33,314 @@ class ReportService:
         """
         self.db = db
     
+    @staticmethod
+    def _empty_totals() -> Dict[str, Any]:
+        """空的汇总指标"""
+        return {
+            'total_orders': 0,
+            'gmv': 0.0,
+            'refund_count': 0,
+            'refund_amount': 0.0,
+            'total_cost': 0.0,
+            'total_profit': 0.0,
+            'status_counts': {status.value: 0 for status in OrderStatus},
+        }
+    
+    @staticmethod
+    def _merge_totals(target: Dict[str, Any], source: Dict[str, Any]) -> None:
+        """将 source 的汇总指标累加到 target（兼容旧快照缺失的字段）"""
+        for key in ('total_orders', 'gmv', 'refund_count', 'refund_amount', 'total_cost', 'total_profit'):
+            target[key] += source.get(key) or 0
+        for status, count in (source.get('status_counts') or {}).items():
+            target['status_counts'][status] = target['status_counts'].get(status, 0) + (count or 0)
+    
+    @staticmethod
+    def _with_rates(totals: Dict[str, Any]) -> Dict[str, Any]:
+        """根据汇总值计算退款率和利润率"""
+        total_orders = totals['total_orders']
+        gmv = totals['gmv']
+        return {
+            'total_orders': total_orders,
+            'gmv': gmv,
+            'refund_count': totals['refund_count'],
+            'refund_rate': totals['refund_count'] / total_orders if total_orders > 0 else 0,
+            'refund_amount': totals['refund_amount'],
+            'total_cost': totals['total_cost'],
+            'total_profit': totals['total_profit'],
+            'profit_rate': totals['total_profit'] / gmv if gmv > 0 else 0,
+            'status_counts': totals['status_counts'],
+        }
+    
+    @staticmethod
+    def _order_time_filters(shop_ids: List[int], start_date: date, end_date: date) -> List[Any]:
+        """订单时间范围过滤条件（含 end_date 当天）"""
+        return [
+            Order.shop_id.in_(shop_ids),
+            Order.order_time >= datetime.combine(start_date, datetime.min.time()),
+            Order.order_time < datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+        ]
+    
+    def _query_daily_totals(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[Tuple[int, date], Dict[str, Any]]:
+        """
+        按（店铺, 日期）汇总订单指标
+        
+        一条 GROUP BY shop_id, 日期, status 的聚合查询，状态计数、退款、成本、利润都由分组结果累加得到。
+        没有订单的（店铺, 日期）不出现在结果中。回填长时间范围时分组行数很多，结果用服务端游标分批读取。
+        """
+        order_day = cast(Order.order_time, Date)
+        rows = self.db.query(
+            Order.shop_id,
+            order_day,
+            Order.status,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_price), 0),
+            func.coalesce(func.sum(Order.total_cost), 0),
+            func.coalesce(func.sum(Order.profit), 0)
+        ).filter(
+            *self._order_time_filters(shop_ids, start_date, end_date)
+        ).group_by(
+            Order.shop_id, order_day, Order.status
+        ).yield_per(settings.DB_BATCH_FETCH_SIZE)
+        
+        totals: Dict[Tuple[int, date], Dict[str, Any]] = {}
+        for row_shop_id, row_day, status, count, amount, cost, profit in rows:
+            entry = totals.setdefault((row_shop_id, row_day), self._empty_totals())
+            entry['total_orders'] += count
+            entry['gmv'] += float(amount)
+            entry['total_cost'] += float(cost)
+            entry['total_profit'] += float(profit)
+            if status is not None:
+                entry['status_counts'][status.value] = entry['status_counts'].get(status.value, 0) + count
+            if status == OrderStatus.REFUNDED:
+                entry['refund_count'] += count
+                entry['refund_amount'] += float(amount)
+        
+        return totals
+    
+    def _query_top_products(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date,
+        limit: int,
+        by_day: bool = False
+    ) -> Dict[Tuple[int, Optional[date]], List[Dict[str, Any]]]:
+        """
+        查询Top商品（按数量）
+        
+        商品按 SKU（为空时用商品名）分组，ROW_NUMBER() 窗口函数在每个店铺（by_day 时为每个店铺每天）
+        内排名，只返回前 limit 个。
+        
+        Returns:
+            {(shop_id, 日期或None): [商品汇总, ...]}
+        """
+        product_key = func.coalesce(
+            func.nullif(Order.product_sku, ''),
+            func.nullif(Order.product_name, ''),
+            'Unknown'
+        )
+        quantity = func.sum(func.coalesce(Order.quantity, 0))
+        amount = func.sum(Order.total_price)
+        
+        partition = [Order.shop_id]
+        group_columns = [Order.shop_id]
+        if by_day:
+            order_day = cast(Order.order_time, Date)
+            partition.append(order_day)
+            group_columns.append(order_day)
+        
+        ranked = select(
+            Order.shop_id.label('shop_id'),
+            (group_columns[1] if by_day else literal(None, type_=Date)).label('day'),
+            func.min(Order.product_name).label('product_name'),
+            func.min(Order.product_sku).label('product_sku'),
+            quantity.label('quantity'),
+            amount.label('amount'),
+            func.row_number().over(
+                partition_by=partition,
+                order_by=[quantity.desc(), amount.desc(), product_key]
+            ).label('rank')
+        ).where(
+            *self._order_time_filters(shop_ids, start_date, end_date)
+        ).group_by(
+            *group_columns, product_key
+        ).subquery()
+        
+        rows = self.db.execute(
+            select(ranked).where(ranked.c.rank <= limit).order_by(ranked.c.shop_id, ranked.c.day, ranked.c.rank),
+            execution_options={"yield_per": settings.DB_BATCH_FETCH_SIZE}
+        )
+        
+        top_products: Dict[Tuple[int, Optional[date]], List[Dict[str, Any]]] = {}
+        for row in rows:
+            top_products.setdefault((row.shop_id, row.day), []).append({
+                'product_name': row.product_name,
+                'product_sku': row.product_sku,
+                'quantity': int(row.quantity or 0),
+                'amount': float(row.amount or 0),
+            })
+        return top_products
+    
+    def _compute_daily_metrics(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[Tuple[int, date], Dict[str, Any]]:
+        """
+        计算日期范围内每个店铺每天的日报指标
+        
+        无论店铺数量和天数多少，只执行两条聚合查询；没有订单的日期返回全零指标。
+        
+        Returns:
+            {(shop_id, 日期): 日报指标}
+        """
+        totals = self._query_daily_totals(shop_ids, start_date, end_date)
+        top_products = self._query_top_products(
+            shop_ids, start_date, end_date, self.DAILY_TOP_PRODUCTS, by_day=True
+        )
+        
+        metrics: Dict[Tuple[int, date], Dict[str, Any]] = {}
+        day = start_date
+        while day <= end_date:
+            for sid in shop_ids:
+                metrics[(sid, day)] = {
+                    'date': day.isoformat(),
+                    **self._with_rates(totals.get((sid, day)) or self._empty_totals()),
+                    'top_products': top_products.get((sid, day), []),
+                }
+            day += timedelta(days=1)
+        return metrics
+    
+    def _compute_period_metrics(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date,
+        top_limit: int
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        计算时间段（周/月）内每个店铺的汇总指标及每日明细
+        
+        Returns:
+            {shop_id: {'totals': 汇总指标, 'daily': {日期: 当日汇总}, 'top_products': [...]}}
+        """
+        daily_totals = self._query_daily_totals(shop_ids, start_date, end_date)
+        top_products = self._query_top_products(shop_ids, start_date, end_date, top_limit)
+        
+        result = {
+            sid: {'totals': self._empty_totals(), 'daily': {}, 'top_products': top_products.get((sid, None), [])}
+            for sid in shop_ids
+        }
+        for (sid, day), totals in sorted(daily_totals.items(), key=lambda item: item[0][1]):
+            self._merge_totals(result[sid]['totals'], totals)
+            result[sid]['daily'][day] = totals
+        return result
+    
+    def _load_daily_metrics(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[Tuple[int, date], Dict[str, Any]]:
+        """
+        读取日期范围内的日报快照指标
+        
+        缺失的日报按订单聚合补算（不落库），保证汇总完整。
+        
+        Returns:
+            {(shop_id, 日期): 日报指标}
+        """
+        snapshots = self.db.query(
+            ReportSnapshot.shop_id,
+            ReportSnapshot.date,
+            ReportSnapshot.metrics
+        ).filter(
+            ReportSnapshot.shop_id.in_(shop_ids),
+            ReportSnapshot.type == ReportType.DAILY.value,
+            ReportSnapshot.date >= start_date,
+            ReportSnapshot.date <= end_date
+        ).yield_per(settings.DB_BATCH_FETCH_SIZE)
+        daily = {(sid, day): metrics or {} for sid, day, metrics in snapshots}
+        
+        missing = []
+        day = start_date
+        while day <= end_date:
+            missing.extend((sid, day) for sid in shop_ids if (sid, day) not in daily)
+            day += timedelta(days=1)
+        
+        if missing:
+            missing_shops = sorted({sid for sid, _ in missing})
+            missing_start = min(day for _, day in missing)
+            missing_end = max(day for _, day in missing)
+            logger.debug(
+                f"日报快照缺失 {len(missing)} 个，按订单补算: "
+                f"shops={missing_shops}, {missing_start} ~ {missing_end}"
+            )
+            computed = self._compute_daily_metrics(missing_shops, missing_start, missing_end)
+            for key in missing:
+                daily[key] = computed[key]
+        
+        return daily
+    
+    def _rollup_daily_metrics(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date,
+        top_limit: int,
+        bucket: str
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        由日报快照汇总出周报/月报指标
+        
+        可累加的指标（订单数、GMV、退款、成本、利润、状态计数）直接累加日报；
+        Top商品无法由各日Top合并得到准确结果，用一条窗口函数聚合查询计算。
+        
+        Args:
+            bucket: 明细粒度，'day' 生成 daily_stats，'week' 生成 weekly_stats
+            
+        Returns:
+            {shop_id: 指标数据}
+        """
+        daily = self._load_daily_metrics(shop_ids, start_date, end_date)
+        top_products = self._query_top_products(shop_ids, start_date, end_date, top_limit)
+        
+        result = {}
+        for sid in shop_ids:
+            totals = self._empty_totals()
+            buckets: Dict[date, Dict[str, Any]] = {}
+            
+            day = start_date
+            while day <= end_date:
+                metrics = daily.get((sid, day)) or {}
+                day_orders = metrics.get('total_orders') or 0
+                if day_orders:
+                    self._merge_totals(totals, metrics)
+                    bucket_start = day if bucket == 'day' else day - timedelta(days=day.weekday())
+                    if bucket_start not in buckets:
+                        key_name = 'date' if bucket == 'day' else 'week_start'
+                        buckets[bucket_start] = {key_name: bucket_start.isoformat(), 'orders': 0, 'gmv': 0, 'profit': 0}
+                    buckets[bucket_start]['orders'] += day_orders
+                    buckets[bucket_start]['gmv'] += metrics.get('gmv') or 0
+                    buckets[bucket_start]['profit'] += metrics.get('total_profit') or 0
+                day += timedelta(days=1)
+            
+            stats_key = 'daily_stats' if bucket == 'day' else 'weekly_stats'
+            result[sid] = {
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                **self._with_rates(totals),
+                stats_key: list(buckets.values()),
+                'top_products': top_products.get((sid, None), []),
+            }
+        return result
+    
     def generate_daily_metrics(self, shop_id: int, report_date: date) -> Dict[str, Any]:
         """
         生成日报指标
@@ -33,75 +352,158 @@ class ReportService:
         Returns:
             日报指标数据
         """
-        # 计算日期范围
-        start_datetime = datetime.combine(report_date, datetime.min.time())
-        end_datetime = datetime.combine(report_date, datetime.max.time())
+        return self.generate_daily_metrics_for_shops([shop_id], report_date)[shop_id]
+    
+    def generate_daily_metrics_for_shops(
+        self,
+        shop_ids: List[int],
+        report_date: date
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        一次性生成多个店铺的日报指标（聚合查询按店铺分组）
         
-        # 查询订单
-        orders = self.db.query(Order).filter(
-            and_(
-                Order.shop_id == shop_id,
-                Order.order_time >= start_datetime,
-                Order.order_time <= end_datetime
-            )
-        ).all()
-        
-        # 计算指标
-        total_orders = len(orders)
-        gmv = sum(float(order.total_price) for order in orders)
-        
-        # 按状态统计
-        status_counts = {}
-        for status in OrderStatus:
-            status_counts[status.value] = sum(1 for o in orders if o.status == status)
-        
-        # 退款订单
-        refunded_orders = [o for o in orders if o.status == OrderStatus.REFUNDED]
-        refund_count = len(refunded_orders)
-        refund_rate = refund_count / total_orders if total_orders > 0 else 0
-        refund_amount = sum(float(o.total_price) for o in refunded_orders)
-        
-        # 成本和利润
-        total_cost = sum(float(o.total_cost or 0) for o in orders)
-        total_profit = sum(float(o.profit or 0) for o in orders)
-        profit_rate = total_profit / gmv if gmv > 0 else 0
-        
-        # Top商品（按数量）
-        product_sales = {}
-        for order in orders:
-            key = order.product_sku or order.product_name or 'Unknown'
-            if key not in product_sales:
-                product_sales[key] = {
-                    'product_name': order.product_name,
-                    'product_sku': order.product_sku,
-                    'quantity': 0,
-                    'amount': 0
+        Args:
+            shop_ids: 店铺ID列表
+            report_date: 报表日期
+            
+        Returns:
+            {shop_id: 日报指标数据}
+        """
+        metrics = self._compute_daily_metrics(shop_ids, report_date, report_date)
+        return {sid: metrics[(sid, report_date)] for sid in shop_ids}
+    
+    def generate_daily_metrics_range(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[Tuple[int, date], Dict[str, Any]]:
+        """
+        生成日期范围内多个店铺每天的日报指标（用于批量回填）
+        
+        Returns:
+            {(shop_id, 日期): 日报指标数据}
+        """
+        return self._compute_daily_metrics(shop_ids, start_date, end_date)
+    
+    def bulk_save_reports(
+        self,
+        report_type: ReportType,
+        items: List[Dict[str, Any]]
+    ) -> int:
+        """
+        批量保存报表快照（多行 upsert，冲突键 uq_report_shop_date_type），调用方负责提交事务
+        
+        未提供 ai_summary 时保留已有的AI总结。
+        
+        Args:
+            report_type: 报表类型
+            items: [{'shop_id', 'date', 'metrics', 'ai_summary'(可选)}, ...]
+            
+        Returns:
+            写入的快照数
+        """
+        if not items:
+            return 0
+        
+        now = datetime.utcnow()
+        for start in range(0, len(items), self.BULK_SAVE_BATCH_SIZE):
+            values = [
+                {
+                    'shop_id': item['shop_id'],
+                    'date': item['date'],
+                    'type': report_type.value,
+                    'metrics': item['metrics'],
+                    'ai_summary': item.get('ai_summary'),
+                    'created_at': now,
+                    'updated_at': now,
                 }
-            product_sales[key]['quantity'] += order.quantity
-            product_sales[key]['amount'] += float(order.total_price)
-        
-        top_products = sorted(
-            product_sales.values(),
-            key=lambda x: x['quantity'],
-            reverse=True
-        )[:10]
-        
-        # 构建指标数据
-        metrics = {
-            'date': report_date.isoformat(),
-            'total_orders': total_orders,
-            'gmv': gmv,
-            'refund_count': refund_count,
-            'refund_rate': refund_rate,
-            'refund_amount': refund_amount,
-            'total_cost': total_cost,
-            'total_profit': total_profit,
-            'profit_rate': profit_rate,
-            'status_counts': status_counts,
-            'top_products': top_products,
-        }
+                for item in items[start:start + self.BULK_SAVE_BATCH_SIZE]
+            ]
+            stmt = pg_insert(ReportSnapshot).values(values)
+            stmt = stmt.on_conflict_do_update(
+                constraint='uq_report_shop_date_type',
+                set_={
+                    'metrics': stmt.excluded.metrics,
+                    'ai_summary': func.coalesce(stmt.excluded.ai_summary, ReportSnapshot.ai_summary),
+                    'updated_at': stmt.excluded.updated_at,
+                }
+            )
+            self.db.execute(stmt)
         
-        return metrics
+        logger.info(f"批量保存{report_type.value}报表快照: {len(items)} 条")
+        return len(items)
+    
+    def build_ai_summary_prompt(
+        self,
+        report_type: ReportType,
+        shop_name: str,
+        metrics: Dict[str, Any]
+    ) -> List[Dict[str, str]]:
+        """构建报表AI总结的对话消息"""
+        period_name = {
+            ReportType.DAILY: '日报',
+            ReportType.WEEKLY: '周报',
+            ReportType.MONTHLY: '月报',
+        }[report_type]
+        return [
+            {
+                'role': 'system',
+                'content': '你是Temu跨境电商运营分析师，请根据报表指标用简洁的中文总结经营情况、异常和建议，不超过200字。'
+            },
+            {
+                'role': 'user',
+                'content': f"店铺「{shop_name}」{period_name}指标:\n{json.dumps(metrics, ensure_ascii=False, default=str)}"
+            },
+        ]
+    
+    async def generate_ai_summaries(
+        self,
+        report_type: ReportType,
+        metrics_by_shop: Dict[int, Dict[str, Any]],
+        shop_names: Dict[int, str],
+        concurrency: int
+    ) -> Dict[int, str]:
+        """
+        并发生成多个店铺的报表AI总结，并发数不超过 concurrency
+        
+        单个店铺失败只记录日志，不影响其他店铺和报表保存。
+        开始前读取默认模型所用供应商的API Key并结束当前事务，AI请求期间不占用数据库连接，
+        调用方在此之前的写入需已提交。
+        
+        Returns:
+            {shop_id: AI总结}，失败的店铺不包含在内
+        """
+        from app.services.frog_gpt_service import FrogGPTService
+        
+        # 独立的客户端实例，避免与Web进程中的全局客户端共享事件循环
+        ai_service = FrogGPTService()
+        api_key = ai_service.get_api_key(self.db, ai_service._route_provider(ai_service.default_model))
+        self.db.commit()
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def summarize(sid: int) -> Optional[str]:
+            async with semaphore:
+                response = await ai_service.chat_completion(
+                    messages=self.build_ai_summary_prompt(report_type, shop_names.get(sid, str(sid)), metrics_by_shop[sid]),
+                    temperature=0.3,
+                    api_key=api_key
+                )
+                return response['choices'][0]['message']['content']
+        
+        try:
+            shop_ids = list(metrics_by_shop.keys())
+            results = await asyncio.gather(*(summarize(sid) for sid in shop_ids), return_exceptions=True)
+        finally:
+            await ai_service.close()
+        
+        summaries = {}
+        for sid, result in zip(shop_ids, results):
+            if isinstance(result, Exception):
+                logger.warning(f"店铺 {sid} {report_type.value}报表AI总结生成失败: {result}")
+            elif result:
+                summaries[sid] = result
+        return summaries
     
     def save_daily_report(
         self,
@@ -300,92 +702,52 @@ class ReportService:
         Returns:
             周报指标数据
         """
-        # 计算日期范围
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        return self.generate_weekly_metrics_for_shops([shop_id], start_date, end_date)[shop_id]
+    
+    def generate_weekly_metrics_for_shops(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        一次性生成多个店铺的周报指标
         
-        # 查询订单
-        orders = self.db.query(Order).filter(
-            and_(
-                Order.shop_id == shop_id,
-                Order.order_time >= start_datetime,
-                Order.order_time <= end_datetime
-            )
-        ).all()
-        
-        # 计算指标（与日报类似，但按周汇总）
-        total_orders = len(orders)
-        gmv = sum(float(order.total_price) for order in orders)
-        
-        # 按状态统计
-        status_counts = {}
-        for status in OrderStatus:
-            status_counts[status.value] = sum(1 for o in orders if o.status == status)
-        
-        # 退款订单
-        refunded_orders = [o for o in orders if o.status == OrderStatus.REFUNDED]
-        refund_count = len(refunded_orders)
-        refund_rate = refund_count / total_orders if total_orders > 0 else 0
-        refund_amount = sum(float(o.total_price) for o in refunded_orders)
-        
-        # 成本和利润
-        total_cost = sum(float(o.total_cost or 0) for o in orders)
-        total_profit = sum(float(o.profit or 0) for o in orders)
-        profit_rate = total_profit / gmv if gmv > 0 else 0
-        
-        # 按日期统计（每日GMV）
-        daily_stats = {}
-        for order in orders:
-            order_date = order.order_time.date()
-            if order_date not in daily_stats:
-                daily_stats[order_date] = {
-                    'date': order_date.isoformat(),
-                    'orders': 0,
-                    'gmv': 0,
-                    'profit': 0
-                }
-            daily_stats[order_date]['orders'] += 1
-            daily_stats[order_date]['gmv'] += float(order.total_price)
-            daily_stats[order_date]['profit'] += float(order.profit or 0)
-        
-        # Top商品（按数量）
-        product_sales = {}
-        for order in orders:
-            key = order.product_sku or order.product_name or 'Unknown'
-            if key not in product_sales:
-                product_sales[key] = {
-                    'product_name': order.product_name,
-                    'product_sku': order.product_sku,
-                    'quantity': 0,
-                    'amount': 0
-                }
-            product_sales[key]['quantity'] += order.quantity
-            product_sales[key]['amount'] += float(order.total_price)
-        
-        top_products = sorted(
-            product_sales.values(),
-            key=lambda x: x['quantity'],
-            reverse=True
-        )[:10]
-        
-        # 构建指标数据
-        metrics = {
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'total_orders': total_orders,
-            'gmv': gmv,
-            'refund_count': refund_count,
-            'refund_rate': refund_rate,
-            'refund_amount': refund_amount,
-            'total_cost': total_cost,
-            'total_profit': total_profit,
-            'profit_rate': profit_rate,
-            'status_counts': status_counts,
-            'daily_stats': list(daily_stats.values()),
-            'top_products': top_products,
-        }
+        Args:
+            shop_ids: 店铺ID列表
+            start_date: 周开始日期
+            end_date: 周结束日期
+            
+        Returns:
+            {shop_id: 周报指标数据}
+        """
+        periods = self._compute_period_metrics(
+            shop_ids, start_date, end_date, self.WEEKLY_TOP_PRODUCTS
+        )
         
-        return metrics
+        result = {}
+        for sid, period in periods.items():
+            # 按日期统计（每日GMV）
+            daily_stats = [
+                {
+                    'date': day.isoformat(),
+                    'orders': totals['total_orders'],
+                    'gmv': totals['gmv'],
+                    'profit': totals['total_profit']
+                }
+                for day, totals in period['daily'].items()
+            ]
+            
+            # 构建指标数据
+            result[sid] = {
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                **self._with_rates(period['totals']),
+                'daily_stats': daily_stats,
+                'top_products': period['top_products'],
+            }
+        
+        return result
     
     def save_weekly_report(
         self,
@@ -447,6 +809,8 @@ class ReportService:
         """
         生成月报指标
         
+        汇总指标由当月日报快照累加得到（缺失的日报按订单补算），Top商品单独聚合查询。
+        
         Args:
             shop_id: 店铺ID
             start_date: 月开始日期
@@ -455,96 +819,44 @@ class ReportService:
         Returns:
             月报指标数据
         """
-        # 计算日期范围
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
+        return self.generate_monthly_metrics_for_shops([shop_id], start_date, end_date)[shop_id]
+    
+    def generate_monthly_metrics_for_shops(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        一次性生成多个店铺的月报指标（由日报快照汇总）
         
-        # 查询订单
-        orders = self.db.query(Order).filter(
-            and_(
-                Order.shop_id == shop_id,
-                Order.order_time >= start_datetime,
-                Order.order_time <= end_datetime
-            )
-        ).all()
-        
-        # 计算指标（与周报类似，但按月汇总）
-        total_orders = len(orders)
-        gmv = sum(float(order.total_price) for order in orders)
-        
-        # 按状态统计
-        status_counts = {}
-        for status in OrderStatus:
-            status_counts[status.value] = sum(1 for o in orders if o.status == status)
-        
-        # 退款订单
-        refunded_orders = [o for o in orders if o.status == OrderStatus.REFUNDED]
-        refund_count = len(refunded_orders)
-        refund_rate = refund_count / total_orders if total_orders > 0 else 0
-        refund_amount = sum(float(o.total_price) for o in refunded_orders)
-        
-        # 成本和利润
-        total_cost = sum(float(o.total_cost or 0) for o in orders)
-        total_profit = sum(float(o.profit or 0) for o in orders)
-        profit_rate = total_profit / gmv if gmv > 0 else 0
-        
-        # 按周统计（每周GMV）
-        weekly_stats = {}
-        for order in orders:
-            order_date = order.order_time.date()
-            # 计算该日期所在周的周一
-            days_since_monday = order_date.weekday()
-            week_start = order_date - timedelta(days=days_since_monday)
+        Args:
+            shop_ids: 店铺ID列表
+            start_date: 月开始日期
+            end_date: 月结束日期
             
-            if week_start not in weekly_stats:
-                weekly_stats[week_start] = {
-                    'week_start': week_start.isoformat(),
-                    'orders': 0,
-                    'gmv': 0,
-                    'profit': 0
-                }
-            weekly_stats[week_start]['orders'] += 1
-            weekly_stats[week_start]['gmv'] += float(order.total_price)
-            weekly_stats[week_start]['profit'] += float(order.profit or 0)
-        
-        # Top商品（按数量）
-        product_sales = {}
-        for order in orders:
-            key = order.product_sku or order.product_name or 'Unknown'
-            if key not in product_sales:
-                product_sales[key] = {
-                    'product_name': order.product_name,
-                    'product_sku': order.product_sku,
-                    'quantity': 0,
-                    'amount': 0
-                }
-            product_sales[key]['quantity'] += order.quantity
-            product_sales[key]['amount'] += float(order.total_price)
-        
-        top_products = sorted(
-            product_sales.values(),
-            key=lambda x: x['quantity'],
-            reverse=True
-        )[:20]  # 月报显示Top 20商品
-        
-        # 构建指标数据
-        metrics = {
-            'start_date': start_date.isoformat(),
-            'end_date': end_date.isoformat(),
-            'total_orders': total_orders,
-            'gmv': gmv,
-            'refund_count': refund_count,
-            'refund_rate': refund_rate,
-            'refund_amount': refund_amount,
-            'total_cost': total_cost,
-            'total_profit': total_profit,
-            'profit_rate': profit_rate,
-            'status_counts': status_counts,
-            'weekly_stats': list(weekly_stats.values()),
-            'top_products': top_products,
-        }
+        Returns:
+            {shop_id: 月报指标数据}
+        """
+        return self._rollup_daily_metrics(
+            shop_ids, start_date, end_date, self.MONTHLY_TOP_PRODUCTS, bucket='week'
+        )
+    
+    def rollup_weekly_metrics_for_shops(
+        self,
+        shop_ids: List[int],
+        start_date: date,
+        end_date: date
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        由日报快照汇总多个店铺的周报指标（结构与 generate_weekly_metrics 相同）
         
-        return metrics
+        Returns:
+            {shop_id: 周报指标数据}
+        """
+        return self._rollup_daily_metrics(
+            shop_ids, start_date, end_date, self.WEEKLY_TOP_PRODUCTS, bucket='day'
+        )
     
     def save_monthly_report(
         self,
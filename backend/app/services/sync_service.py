@@ -13,6 +13,9 @@ from app.models.product import Product, ProductCost
 from app.models.temu_orders_raw import TemuOrdersRaw
 from app.models.temu_products_raw import TemuProductsRaw
 from app.services.temu_service import TemuService, get_temu_service
+from app.temu.client import proxy_transfer_stats
+from app.core.metrics import Metrics
+from app.core.tracing import tracer
 from app.services.data_mapping_service import DataMappingService, DataMappingError
 from app.core.redis_client import RedisClient
 from app.core.config import settings
@@ -20,6 +23,20 @@ from app.core.config import settings
 # 北京时间时区（UTC+8）
 BEIJING_TIMEZONE = pytz.timezone(getattr(settings, 'TIMEZONE', 'Asia/Shanghai'))
 
+# 订单同步追踪中各阶段的名称（span 的耗时包含其中的 phase）
+SYNC_PHASE_LABELS = {
+    "temu.get_orders": "Temu API 首页",
+    "temu.fetch_page": "Temu API 拉取分页（等待）",
+    "rate_limit_wait": "限流等待",
+    "sync.page": "处理订单页",
+    "preload_orders": "预加载已有订单",
+    "raw_upsert": "原始订单写入",
+    "order_write": "订单映射写入（含商品匹配）",
+    "product_match": "商品匹配",
+    "db_commit": "提交事务",
+    "progress_callback": "进度回调",
+}
+
 
 class SyncService:
     """数据同步服务"""
@@ -36,6 +53,8 @@ class SyncService:
         self.shop = shop
         self.temu_service = get_temu_service(shop)
         self.mapping_service = DataMappingService(db)
+        # 最近一次订单同步的耗时分布摘要（见 app.core.tracing）
+        self.last_trace: Optional[Dict[str, Any]] = None
     
     def _get_product_price_by_sku(
         self, 
@@ -157,6 +176,9 @@ class SyncService:
         self._current_stats = stats  # 用于在_process_order中更新统计
         self._progress_callback = progress_callback  # 保存回调函数
         self._sync_start_time = datetime.now()  # 记录同步开始时间
+        wire_before, decoded_before = proxy_transfer_stats.totals()
+        trace = tracer.start_trace("sync_orders", **{"shop.id": self.shop.id, "sync.full": full_sync})
+        sync_error = None
         
         try:
             # 设置结束时间为当前时间
@@ -187,180 +209,231 @@ class SyncService:
                 f"通过代理: 是（订单API必须通过代理服务器）"
             )
             
-            page_number = 1
             page_size = 100
-            total_items = 0  # 总订单数
             
-            while True:
-                try:
-                    # 获取订单列表（添加超时保护）
+            # 第一页：获取订单总数
+            try:
+                with tracer.span("temu.get_orders", page=1):
                     result = await self.temu_service.get_orders(
                         begin_time=begin_time,
                         end_time=end_time,
-                        page_number=page_number,
+                        page_number=1,
                         page_size=page_size
                     )
-                    
-                    total_items = result.get('totalItemNum', 0)
-                    page_items = result.get('pageItems', [])
-                    
-                    # 首次获取到总数时更新进度
-                    if page_number == 1 and total_items > 0 and progress_callback:
-                        progress_callback(20, f"发现 {total_items} 个订单，开始同步...", None)
-                        logger.info(f"发现 {total_items} 个订单，开始同步...")
-                    
-                    if not page_items:
-                        break
-                except Exception as e:
-                    logger.error(f"获取订单列表失败 (页码: {page_number}): {e}")
-                    # 如果获取订单列表失败，尝试跳过当前页继续
-                    if page_number == 1:
-                        # 第一页失败，无法继续
-                        raise
-                    else:
-                        # 非第一页失败，记录错误但继续尝试下一页
-                        logger.warning(f"跳过第 {page_number} 页，继续同步...")
-                        page_number += 1
-                        continue
-                
-                # 性能优化：批量预加载当前页的订单ID，减少数据库查询
-                order_sns = [item.get('orderSn') or item.get('order_sn') for item in page_items if item.get('orderSn') or item.get('order_sn')]
-                existing_orders_map = {}
-                if order_sns:
-                    # 批量查询当前页可能存在的订单
-                    existing_orders = self.db.query(Order).filter(
-                        Order.shop_id == self.shop.id,
-                        Order.temu_order_id.in_(order_sns)
-                    ).all()
-                    # 构建订单SN到订单对象的映射
-                    for order in existing_orders:
-                        existing_orders_map[order.temu_order_id] = order
-                
-                # 批量处理订单（每100个提交一次，提高性能）
-                batch_size = 100
-                batch_count = 0
-                
-                # 处理每个订单
-                for item in page_items:
-                    try:
-                        # 传递预加载的订单映射，减少查询
-                        self._process_order(item, existing_orders_map=existing_orders_map)
-                        batch_count += 1
-                        stats["total"] += 1
-                        
-                        # 批量提交：每100个订单提交一次，或处理完当前页时提交
-                        if batch_count >= batch_size or item == page_items[-1]:
-                            try:
-                                self.db.commit()
-                            except Exception as commit_error:
-                                logger.error(f"提交数据库事务失败: {commit_error}")
-                                self.db.rollback()
-                                # 继续处理下一个订单，不中断整个同步过程
-                            batch_count = 0
-                        
-                        # 优化进度更新频率：每50个订单更新一次（减少回调开销）
-                        if progress_callback and total_items > 0 and stats["total"] % 50 == 0:
-                            progress_percent = 20 + int((stats["total"] / total_items) * 40)
-                            
-                            # 计算处理速度和剩余时间
-                            current_time = datetime.now()
-                            start_time = getattr(self, '_sync_start_time', current_time)
-                            elapsed_time = (current_time - start_time).total_seconds()
-                            
-                            # 构建时间信息
-                            time_info = None
-                            if elapsed_time > 0 and stats["total"] > 0:
-                                processing_speed = stats["total"] / elapsed_time
-                                remaining_items = total_items - stats["total"]
-                                estimated_remaining_seconds = remaining_items / processing_speed if processing_speed > 0 else 0
-                                
-                                time_info = {
-                                    "elapsed_seconds": elapsed_time,
-                                    "processing_speed": processing_speed,
-                                    "estimated_remaining_seconds": estimated_remaining_seconds,
-                                    "processed_count": stats["total"],
-                                    "total_count": total_items
-                                }
-                                
-                                # 每处理100个订单记录一次详细日志
-                                if stats["total"] % 100 == 0:
-                                    # 格式化剩余时间
-                                    if estimated_remaining_seconds < 60:
-                                        time_str = f"{int(estimated_remaining_seconds)}秒"
-                                    elif estimated_remaining_seconds < 3600:
-                                        minutes = int(estimated_remaining_seconds // 60)
-                                        seconds = int(estimated_remaining_seconds % 60)
-                                        time_str = f"{minutes}分{seconds}秒"
-                                    else:
-                                        hours = int(estimated_remaining_seconds // 3600)
-                                        minutes = int((estimated_remaining_seconds % 3600) // 60)
-                                        time_str = f"{hours}小时{minutes}分钟"
-                                    
-                                    log_msg = (
-                                        f"正在同步订单: {stats['total']}/{total_items} | "
-                                        f"速度: {processing_speed:.1f} 订单/秒 | "
-                                        f"剩余时间: {time_str} | "
-                                        f"新增: {stats['new']}, 更新: {stats['updated']}"
-                                    )
-                                    # 通过回调函数记录日志
-                                    if hasattr(progress_callback, '_log_callback'):
-                                        progress_callback._log_callback(log_msg)
-                            
-                            progress_callback(
-                                progress_percent,
-                                f"正在同步订单: {stats['total']}/{total_items} (新增: {stats['new']}, 更新: {stats['updated']})",
-                                time_info
-                            )
-                            
-                    except Exception as e:
-                        logger.error(f"处理订单失败: {e}, 订单数据: {item}")
-                        try:
-                            self.db.rollback()  # 回滚失败的订单
-                        except Exception as rollback_error:
-                            logger.error(f"回滚事务失败: {rollback_error}")
-                            # 尝试重新创建数据库会话
-                            try:
-                                self.db.close()
-                                from app.core.database import SessionLocal
-                                self.db = SessionLocal()
-                                logger.info("已重新创建数据库会话")
-                            except Exception as reconnect_error:
-                                logger.error(f"重新创建数据库会话失败: {reconnect_error}")
-                        stats["failed"] += 1
-                        batch_count = 0  # 重置批量计数
-                        # 继续处理下一个订单，不中断整个同步过程
-                
-                # 确保当前页的所有订单都已提交
-                if batch_count > 0:
-                    self.db.commit()
-                    batch_count = 0
-                
-                # 检查是否还有更多页
-                if page_number * page_size >= total_items:
-                    break
+            except Exception as e:
+                # 第一页失败，无法继续
+                logger.error(f"获取订单列表失败 (页码: 1): {e}")
+                raise
+            
+            total_items = result.get('totalItemNum', 0)  # 总订单数
+            page_items = result.get('pageItems', [])
+            
+            if total_items > 0 and progress_callback:
+                progress_callback(20, f"发现 {total_items} 个订单，开始同步...", None)
+                logger.info(f"发现 {total_items} 个订单，开始同步...")
+            
+            if page_items:
+                with tracer.span("sync.page", page=1, orders=len(page_items)):
+                    self._process_order_page(page_items, stats, total_items, progress_callback)
                 
-                page_number += 1
+                # 其余分页通过代理的批量接口并发拉取（每批 TEMU_BATCH_SIZE 页），
+                # 每页返回后立即写入，写入与其他分页的拉取重叠进行
+                total_pages = (total_items + page_size - 1) // page_size
+                if total_pages > 1:
+                    pages = self.temu_service.iter_order_pages(
+                        begin_time=begin_time,
+                        end_time=end_time,
+                        page_numbers=list(range(2, total_pages + 1)),
+                        page_size=page_size
+                    )
+                    async for page_number, result in tracer.timed_iter("temu.fetch_page", pages):
+                        if isinstance(result, Exception):
+                            # 非第一页失败，记录错误但继续处理其他页
+                            logger.error(f"获取订单列表失败 (页码: {page_number}): {result}")
+                            logger.warning(f"跳过第 {page_number} 页，继续同步...")
+                            continue
+                        page_items = result.get('pageItems', [])
+                        if page_items:
+                            with tracer.span("sync.page", page=page_number, orders=len(page_items)):
+                                self._process_order_page(page_items, stats, total_items, progress_callback)
             
             # 更新店铺最后同步时间
             self.shop.last_sync_at = datetime.now()
             self.db.commit()
             
+            elapsed_seconds = (datetime.now() - self._sync_start_time).total_seconds()
+            if elapsed_seconds > 0:
+                Metrics.set_sync_speed(self.shop.id, stats["total"] / elapsed_seconds)
+            wire_after, decoded_after = proxy_transfer_stats.totals()
             logger.info(
                 f"订单同步完成 - 店铺: {self.shop.shop_name}, "
-                f"总数: {stats['total']}, 失败: {stats['failed']}"
+                f"总数: {stats['total']}, 失败: {stats['failed']}, "
+                f"代理传输: {(wire_after - wire_before) / 1024:.1f}KB "
+                f"(解压后 {(decoded_after - decoded_before) / 1024:.1f}KB)"
             )
             
+            # 后台刷新FrogGPT上下文快照（不阻塞同步流程）
+            try:
+                from app.services.frog_gpt_context_service import frog_gpt_context_service
+                frog_gpt_context_service.schedule_refresh(self.shop.id)
+            except Exception as e:
+                logger.warning(f"调度FrogGPT上下文刷新失败: {e}")
+            
             return stats
             
         except Exception as e:
+            sync_error = e
             self.db.rollback()
             logger.error(f"订单同步失败 - 店铺: {self.shop.shop_name}, 错误: {e}")
             import traceback
             logger.error(traceback.format_exc())
             raise
         finally:
-            # 确保数据库会话正确关闭（虽然依赖注入会处理，但这里确保资源释放）
-            pass
+            # 结束追踪：耗时分布摘要供同步日志和同步状态展示
+            self.last_trace = tracer.end_trace(trace, sync_error)
+            if self.last_trace:
+                logger.info(
+                    f"订单同步耗时分布 - 店铺: {self.shop.shop_name}\n"
+                    + "\n".join(tracer.format_summary(self.last_trace, SYNC_PHASE_LABELS))
+                )
+    
+    def _process_order_page(
+        self,
+        page_items: List[Dict[str, Any]],
+        stats: Dict[str, int],
+        total_items: int,
+        progress_callback: Optional[callable] = None
+    ):
+        """
+        处理一页订单数据并提交
+        
+        Args:
+            page_items: 当前页的订单数据
+            stats: 同步统计（原地更新）
+            total_items: 订单总数（用于进度计算）
+            progress_callback: 进度回调函数
+        """
+        processed_before = stats["total"]
+        
+        # 性能优化：批量预加载当前页的订单ID，减少数据库查询
+        order_sns = [item.get('orderSn') or item.get('order_sn') for item in page_items if item.get('orderSn') or item.get('order_sn')]
+        existing_orders_map = {}
+        if order_sns:
+            # 批量查询当前页可能存在的订单
+            with tracer.phase("preload_orders"):
+                existing_orders = self.db.query(Order).filter(
+                    Order.shop_id == self.shop.id,
+                    Order.temu_order_id.in_(order_sns)
+                ).all()
+            # 构建订单SN到订单对象的映射
+            for order in existing_orders:
+                existing_orders_map[order.temu_order_id] = order
+        
+        # 批量处理订单（每100个提交一次，提高性能）
+        batch_size = 100
+        batch_count = 0
+        
+        # 处理每个订单
+        for item in page_items:
+            try:
+                # 传递预加载的订单映射，减少查询
+                self._process_order(item, existing_orders_map=existing_orders_map)
+                batch_count += 1
+                stats["total"] += 1
+                
+                # 批量提交：每100个订单提交一次，或处理完当前页时提交
+                if batch_count >= batch_size or item == page_items[-1]:
+                    try:
+                        with tracer.phase("db_commit"):
+                            self.db.commit()
+                    except Exception as commit_error:
+                        logger.error(f"提交数据库事务失败: {commit_error}")
+                        self.db.rollback()
+                        # 继续处理下一个订单，不中断整个同步过程
+                    batch_count = 0
+                
+                # 优化进度更新频率：每50个订单更新一次（减少回调开销）
+                if progress_callback and total_items > 0 and stats["total"] % 50 == 0:
+                    progress_percent = 20 + int((stats["total"] / total_items) * 40)
+                    
+                    # 计算处理速度和剩余时间
+                    current_time = datetime.now()
+                    start_time = getattr(self, '_sync_start_time', current_time)
+                    elapsed_time = (current_time - start_time).total_seconds()
+                    
+                    # 构建时间信息
+                    time_info = None
+                    if elapsed_time > 0 and stats["total"] > 0:
+                        processing_speed = stats["total"] / elapsed_time
+                        remaining_items = total_items - stats["total"]
+                        estimated_remaining_seconds = remaining_items / processing_speed if processing_speed > 0 else 0
+                        
+                        time_info = {
+                            "elapsed_seconds": elapsed_time,
+                            "processing_speed": processing_speed,
+                            "estimated_remaining_seconds": estimated_remaining_seconds,
+                            "processed_count": stats["total"],
+                            "total_count": total_items
+                        }
+                        
+                        # 每处理100个订单记录一次详细日志
+                        if stats["total"] % 100 == 0:
+                            # 格式化剩余时间
+                            if estimated_remaining_seconds < 60:
+                                time_str = f"{int(estimated_remaining_seconds)}秒"
+                            elif estimated_remaining_seconds < 3600:
+                                minutes = int(estimated_remaining_seconds // 60)
+                                seconds = int(estimated_remaining_seconds % 60)
+                                time_str = f"{minutes}分{seconds}秒"
+                            else:
+                                hours = int(estimated_remaining_seconds // 3600)
+                                minutes = int((estimated_remaining_seconds % 3600) // 60)
+                                time_str = f"{hours}小时{minutes}分钟"
+                            
+                            log_msg = (
+                                f"正在同步订单: {stats['total']}/{total_items} | "
+                                f"速度: {processing_speed:.1f} 订单/秒 | "
+                                f"剩余时间: {time_str} | "
+                                f"新增: {stats['new']}, 更新: {stats['updated']}"
+                            )
+                            # 通过回调函数记录日志
+                            if hasattr(progress_callback, '_log_callback'):
+                                progress_callback._log_callback(log_msg)
+                    
+                    with tracer.phase("progress_callback"):
+                        progress_callback(
+                            progress_percent,
+                            f"正在同步订单: {stats['total']}/{total_items} (新增: {stats['new']}, 更新: {stats['updated']})",
+                            time_info
+                        )
+            
+            except Exception as e:
+                logger.error(f"处理订单失败: {e}, 订单数据: {item}")
+                try:
+                    self.db.rollback()  # 回滚失败的订单
+                except Exception as rollback_error:
+                    logger.error(f"回滚事务失败: {rollback_error}")
+                    # 尝试重新创建数据库会话
+                    try:
+                        bind = self.db.get_bind()
+                        self.db.close()
+                        from app.core.database import SessionLocal
+                        # 保持原来的连接池（API / 后台工作）
+                        self.db = SessionLocal(bind=bind)
+                        logger.info("已重新创建数据库会话")
+                    except Exception as reconnect_error:
+                        logger.error(f"重新创建数据库会话失败: {reconnect_error}")
+                stats["failed"] += 1
+                batch_count = 0  # 重置批量计数
+                # 继续处理下一个订单，不中断整个同步过程
+        
+        # 确保当前页的所有订单都已提交
+        if batch_count > 0:
+            with tracer.phase("db_commit"):
+                self.db.commit()
+            batch_count = 0
+        
+        Metrics.add_sync_orders(self.shop.id, stats["total"] - processed_before)
     
     def _process_order(self, order_data: Dict[str, Any], existing_orders_map: Optional[Dict[str, Any]] = None):
         """
@@ -389,13 +462,15 @@ class SyncService:
                 continue
             
             # 步骤1: 先保存原始数据到raw表
-            raw_order = self._save_order_to_raw(order_sn, order_data, order_item, parent_order)
+            with tracer.phase("raw_upsert"):
+                raw_order = self._save_order_to_raw(order_sn, order_data, order_item, parent_order)
             if not raw_order:
                 logger.error(f"保存订单原始数据失败: {order_sn}")
                 continue
             
             # 步骤2: 使用原有逻辑处理订单（保持稳定性），但关联raw_data_id
-            self._process_order_legacy(order_item, parent_order, order_data, raw_order, existing_orders_map)
+            with tracer.phase("order_write"):
+                self._process_order_legacy(order_item, parent_order, order_data, raw_order, existing_orders_map)
     
     def _save_order_to_raw(
         self, 
@@ -634,6 +709,12 @@ class SyncService:
         # 映射订单状态
         order_status = self._map_order_status(parent_order.get('parentOrderStatus', 0))
         
+        # 提取包裹号（从order_item或parent_order的packageSnInfo中提取，取第一个包裹号）
+        package_sn = None
+        package_sn_info = order_item.get('packageSnInfo') or parent_order.get('packageSnInfo')
+        if package_sn_info and isinstance(package_sn_info, list) and len(package_sn_info) > 0:
+            package_sn = package_sn_info[0].get('packageSn') if isinstance(package_sn_info[0], dict) else None
+        
         # 提取时间信息（支持秒和毫秒时间戳）
         # 根据 API 文档，时间字段在 parentOrderMap 中
         order_time = self._parse_timestamp(parent_order.get('parentOrderTime'))
@@ -705,12 +786,13 @@ class SyncService:
         matched_product_id = None
         
         # 尝试匹配商品
-        price_info = self._get_product_price_by_sku(
-            product_sku=product_sku,  # extCode (SKU货号)
-            order_time=order_time,
-            product_sku_id=product_sku_id,  # productSkuId (优先级1)
-            spu_id=spu_id  # SPU ID (优先级3)
-        )
+        with tracer.phase("product_match"):
+            price_info = self._get_product_price_by_sku(
+                product_sku=product_sku,  # extCode (SKU货号)
+                order_time=order_time,
+                product_sku_id=product_sku_id,  # productSkuId (优先级1)
+                spu_id=spu_id  # SPU ID (优先级3)
+            )
         
         if price_info:
             # 匹配到商品，计算并存储GMV、成本、利润
@@ -997,12 +1079,13 @@ class SyncService:
                 item_spu_id = order.spu_id or ''
             
             # 尝试匹配商品（使用完整的匹配逻辑，优先级：productSkuId > extCode > spu_id）
-            price_info = self._get_product_price_by_sku(
-                product_sku=product_sku,  # extCode (SKU货号) - 优先级2
-                order_time=order.order_time,
-                product_sku_id=product_sku_id,  # productSkuId (优先级1)
-                spu_id=item_spu_id  # SPU ID (优先级3)
-            )
+            with tracer.phase("product_match"):
+                price_info = self._get_product_price_by_sku(
+                    product_sku=product_sku,  # extCode (SKU货号) - 优先级2
+                    order_time=order.order_time,
+                    product_sku_id=product_sku_id,  # productSkuId (优先级1)
+                    spu_id=item_spu_id  # SPU ID (优先级3)
+                )
             
             if price_info:
                 # 使用商品的供货价（current_price）更新订单价格
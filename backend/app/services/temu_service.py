@@ -1,5 +1,5 @@
 """Temu API服务层 - 支持多店铺、多区域、环境切换"""
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from loguru import logger
@@ -229,6 +229,69 @@ class TemuService:
             logger.error(f"获取订单详情失败 - 父订单号: {parent_order_sn}, 错误: {e}")
             raise
     
+    async def iter_order_details(
+        self,
+        parent_order_sns: List[str],
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        批量获取订单详情（通过代理的批量接口），按完成顺序返回
+        
+        Args:
+            parent_order_sns: 父订单编号列表
+            concurrency: 并发调用数，默认 TEMU_BATCH_CONCURRENCY
+            
+        Yields:
+            (父订单编号, 订单详情)；获取失败时详情为异常对象
+        """
+        standard_client = self._get_standard_client()
+        try:
+            async for parent_order_sn, order in standard_client.iter_order_details(
+                access_token=self.access_token,
+                parent_order_sns=parent_order_sns,
+                concurrency=concurrency
+            ):
+                if isinstance(order, Exception):
+                    logger.error(f"获取订单详情失败 - 父订单号: {parent_order_sn}, 错误: {order}")
+                yield parent_order_sn, order
+        finally:
+            await standard_client.close()
+    
+    async def iter_order_pages(
+        self,
+        begin_time: int,
+        end_time: int,
+        page_numbers: List[int],
+        page_size: int = 100,
+        order_status: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        批量获取订单列表的多个分页（通过代理的批量接口），按完成顺序返回
+        
+        Args:
+            begin_time: 开始时间（Unix时间戳）
+            end_time: 结束时间（Unix时间戳）
+            page_numbers: 页码列表
+            page_size: 每页数量
+            order_status: 订单状态
+            
+        Yields:
+            (页码, 订单数据)；获取失败时数据为异常对象
+        """
+        standard_client = self._get_standard_client()
+        try:
+            async for page_number, orders in standard_client.iter_order_pages(
+                access_token=self.access_token,
+                begin_time=begin_time,
+                end_time=end_time,
+                page_numbers=page_numbers,
+                page_size=page_size,
+                order_status=order_status
+            ):
+                yield page_number, orders
+        finally:
+            await standard_client.close()
+    
     async def get_products(
         self,
         page_number: int = 1,
@@ -2,17 +2,82 @@
 import asyncio
 import hashlib
 import json
+import threading
 import time
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 import httpx
 from loguru import logger
 from app.core.config import settings
+from app.core.metrics import Metrics
 from app.core.rate_limiter import get_rate_limiter
 
+try:
+    import zstandard  # noqa: F401  安装后 httpx 可解压 zstd 响应
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+def accept_encoding() -> str:
+    """请求代理服务器时的 Accept-Encoding（关闭压缩时为 identity）"""
+    if not settings.TEMU_PROXY_COMPRESSION:
+        return "identity"
+    return "zstd, gzip" if ZSTD_AVAILABLE else "gzip"
+
+
+class ProxyTransferStats:
+    """代理响应的传输统计：实际传输字节数（压缩后）与解压后字节数（进程内）"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {编码: {responses, wire_bytes, decoded_bytes}}
+        self._data: Dict[str, Dict[str, int]] = {}
+    
+    def record(self, response: httpx.Response, decoded_bytes: int) -> None:
+        """记录一个已读取完的响应"""
+        encoding = response.headers.get("content-encoding", "identity") or "identity"
+        with self._lock:
+            row = self._data.setdefault(encoding, {"responses": 0, "wire_bytes": 0, "decoded_bytes": 0})
+            row["responses"] += 1
+            row["wire_bytes"] += response.num_bytes_downloaded
+            row["decoded_bytes"] += decoded_bytes
+    
+    def totals(self) -> Tuple[int, int]:
+        """(传输字节数, 解压后字节数)"""
+        with self._lock:
+            return (
+                sum(row["wire_bytes"] for row in self._data.values()),
+                sum(row["decoded_bytes"] for row in self._data.values()),
+            )
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            data = {encoding: dict(row) for encoding, row in self._data.items()}
+        wire = sum(row["wire_bytes"] for row in data.values())
+        decoded = sum(row["decoded_bytes"] for row in data.values())
+        return {
+            "accept_encoding": accept_encoding(),
+            "wire_bytes": wire,
+            "decoded_bytes": decoded,
+            "saved_ratio": round(1 - wire / decoded, 4) if decoded else 0.0,
+            "by_encoding": data,
+        }
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# 全局实例
+proxy_transfer_stats = ProxyTransferStats()
+
 
 class TemuAPIClient:
     """Temu API客户端"""
     
+    # 不支持批量接口的代理服务器地址（旧版本代理返回404），之后的批量调用直接逐个发送
+    _batch_unsupported_proxies: set = set()
+    
     def __init__(self, app_key: str = None, app_secret: str = None, proxy_url: str = None):
         """
         初始化Temu API客户端
@@ -43,10 +108,12 @@ class TemuAPIClient:
             max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
             max_connections=settings.HTTP_MAX_CONNECTIONS
         )
+        # 代理服务器按 Accept-Encoding 压缩响应，httpx 自动解压
         self.client = httpx.AsyncClient(
             timeout=timeout,
             limits=limits,
-            follow_redirects=True
+            follow_redirects=True,
+            headers={"Accept-Encoding": accept_encoding()}
         )
         self.rate_limiter = get_rate_limiter()
         self._closed = False
@@ -129,6 +196,7 @@ class TemuAPIClient:
                 await self.rate_limiter.acquire(tokens=1, wait=True)
                 
                 headers = {"Content-Type": "application/json"}
+                started = time.perf_counter()
                 response = await self.client.post(
                     f"{self.proxy_url}/api/proxy",
                     headers=headers,
@@ -136,7 +204,11 @@ class TemuAPIClient:
                 )
                 
                 response.raise_for_status()
+                proxy_transfer_stats.record(response, len(response.content))
                 result = response.json()
+                Metrics.observe_temu_request(
+                    api_type, "success" if result.get("success", False) else "error", time.perf_counter() - started
+                )
                 
                 # 检查代理响应
                 if not result.get("success", False):
@@ -161,6 +233,7 @@ class TemuAPIClient:
                 
             except httpx.HTTPStatusError as e:
                 # HTTP状态错误（如429限流、500服务器错误等）
+                Metrics.observe_temu_request(api_type, f"http_{e.response.status_code}", time.perf_counter() - started)
                 if self._is_retryable_http_error(e.response.status_code) and attempt < max_attempts:
                     delay = initial_delay * (backoff_factor ** (attempt - 1))
                     logger.warning(
@@ -175,6 +248,7 @@ class TemuAPIClient:
                 
             except httpx.RequestError as e:
                 # 网络请求错误（连接超时、网络不可达等）
+                Metrics.observe_temu_request(api_type, "network", time.perf_counter() - started)
                 if attempt < max_attempts:
                     delay = initial_delay * (backoff_factor ** (attempt - 1))
                     logger.warning(
@@ -264,6 +338,7 @@ class TemuAPIClient:
                 
                 # 直接发送POST请求到 Temu API
                 headers = {"Content-Type": "application/json"}
+                started = time.perf_counter()
                 response = await self.client.post(
                     url, 
                     headers=headers,
@@ -272,6 +347,9 @@ class TemuAPIClient:
                 
                 response.raise_for_status()
                 result = response.json()
+                Metrics.observe_temu_request(
+                    api_type, "success" if result.get("success", False) else "error", time.perf_counter() - started
+                )
                 
                 # 检查业务错误
                 if not result.get("success", False):
@@ -295,6 +373,7 @@ class TemuAPIClient:
                 
             except httpx.HTTPStatusError as e:
                 # HTTP状态错误（如429限流、500服务器错误等）
+                Metrics.observe_temu_request(api_type, f"http_{e.response.status_code}", time.perf_counter() - started)
                 if self._is_retryable_http_error(e.response.status_code) and attempt < max_attempts:
                     delay = initial_delay * (backoff_factor ** (attempt - 1))
                     logger.warning(
@@ -309,6 +388,7 @@ class TemuAPIClient:
                 
             except httpx.RequestError as e:
                 # 网络请求错误（连接超时、网络不可达等）
+                Metrics.observe_temu_request(api_type, "network", time.perf_counter() - started)
                 if attempt < max_attempts:
                     delay = initial_delay * (backoff_factor ** (attempt - 1))
                     logger.warning(
@@ -331,6 +411,150 @@ class TemuAPIClient:
             raise last_exception
         raise Exception("请求失败：达到最大重试次数")
     
+    async def batch(
+        self,
+        calls: List[Dict[str, Any]],
+        access_token: Optional[str] = None,
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        批量调用API，按完成顺序逐个返回结果
+        
+        配置了代理时每 TEMU_BATCH_SIZE 个调用合并为一个 /api/proxy/batch 请求，代理并发请求上游
+        并以 NDJSON 流式返回；可重试的失败调用单独重试。未配置代理、关闭批量或代理不支持批量接口时，
+        并发逐个发送。
+        
+        Args:
+            calls: 调用列表，每项包含 api_type、request_data，可选 flat_params、access_token
+            access_token: 调用未指定 access_token 时使用的访问令牌
+            concurrency: 并发调用数，默认 TEMU_BATCH_CONCURRENCY
+            
+        Yields:
+            (调用在 calls 中的序号, 结果)；调用失败时结果为异常对象
+        """
+        if not calls:
+            return
+        concurrency = max(1, concurrency or settings.TEMU_BATCH_CONCURRENCY)
+        
+        if not self.proxy_url or not settings.TEMU_BATCH_ENABLED or self.proxy_url in self._batch_unsupported_proxies:
+            async for item in self._run_calls(list(enumerate(calls)), access_token, concurrency):
+                yield item
+            return
+        
+        batch_size = max(1, settings.TEMU_BATCH_SIZE)
+        for offset in range(0, len(calls), batch_size):
+            chunk = list(enumerate(calls[offset:offset + batch_size], start=offset))
+            async for item in self._batch_via_proxy(chunk, access_token, concurrency):
+                yield item
+    
+    async def _batch_via_proxy(
+        self,
+        indexed_calls: List[Tuple[int, Dict[str, Any]]],
+        access_token: Optional[str],
+        concurrency: int
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """发送一个批量请求并解析NDJSON结果；可重试的失败和未返回的调用单独重试"""
+        for _ in indexed_calls:
+            await self.rate_limiter.acquire(tokens=1, wait=True)
+        
+        batch_request = {
+            "app_key": self.app_key,
+            "app_secret": self.app_secret,
+            "access_token": access_token,
+            "concurrency": concurrency,
+            "calls": [
+                {
+                    "api_type": call["api_type"],
+                    "request_data": call.get("request_data"),
+                    "access_token": call.get("access_token"),
+                    "flat_params": call.get("flat_params", False),
+                }
+                for _, call in indexed_calls
+            ]
+        }
+        pending = dict(indexed_calls)
+        positions = [index for index, _ in indexed_calls]
+        retry: List[Tuple[int, Dict[str, Any]]] = []
+        
+        started = time.perf_counter()
+        try:
+            async with self.client.stream(
+                "POST",
+                f"{self.proxy_url}/api/proxy/batch",
+                json=batch_request
+            ) as response:
+                if response.status_code in (404, 405):
+                    self._batch_unsupported_proxies.add(self.proxy_url)
+                    logger.warning(f"代理服务器不支持批量接口，改为逐个发送: {self.proxy_url}")
+                response.raise_for_status()
+                
+                decoded_bytes = 0
+                async for line in response.aiter_lines():
+                    decoded_bytes += len(line.encode("utf-8")) + 1
+                    if not line.strip():
+                        continue
+                    item = json.loads(line)
+                    index = positions[item["index"]]
+                    call = pending.pop(index, None)
+                    if call is None:
+                        continue
+                    # 批量调用的耗时为批量请求发出到该调用结果返回
+                    Metrics.observe_temu_request(
+                        call["api_type"], "success" if item.get("success") else "error", time.perf_counter() - started
+                    )
+                    if item.get("success"):
+                        yield index, item.get("result") or {}
+                        continue
+                    
+                    error_code = item.get("error_code", "未知")
+                    error_msg = item.get("error_msg", "未知错误")
+                    if self._is_retryable_error(str(error_code), str(error_msg)):
+                        retry.append((index, call))
+                    else:
+                        logger.error(f"代理服务器错误: {call['api_type']} [{error_code}] {error_msg}")
+                        yield index, Exception(f"代理服务器错误: [{error_code}] {error_msg}")
+                proxy_transfer_stats.record(response, decoded_bytes)
+        except (httpx.HTTPStatusError, httpx.RequestError, ValueError) as e:
+            # 批量请求本身失败（代理不支持批量接口、网络中断、响应无法解析等），剩余调用逐个发送
+            if pending:
+                logger.warning(f"批量请求失败，剩余 {len(pending)} 个调用逐个发送: {e}")
+        
+        # 可重试的失败和流中断时未返回的调用，单独发送（_request 自带重试）
+        retry.extend(pending.items())
+        if retry:
+            retry.sort(key=lambda item: item[0])
+            async for item in self._run_calls(retry, access_token, concurrency):
+                yield item
+    
+    async def _run_calls(
+        self,
+        indexed_calls: List[Tuple[int, Dict[str, Any]]],
+        access_token: Optional[str],
+        concurrency: int
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """并发逐个发送调用，按完成顺序返回 (序号, 结果或异常)"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run(index: int, call: Dict[str, Any]) -> Tuple[int, Any]:
+            async with semaphore:
+                try:
+                    return index, await self._request(
+                        call["api_type"],
+                        call.get("request_data"),
+                        call.get("access_token") or access_token,
+                        call.get("flat_params", False)
+                    )
+                except Exception as e:
+                    return index, e
+        
+        tasks = [asyncio.ensure_future(run(index, call)) for index, call in indexed_calls]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+    
     def _is_retryable_error(self, error_code: str, error_msg: str) -> bool:
         """
         判断错误是否可重试
@@ -409,6 +633,43 @@ class TemuAPIClient:
         
         return await self._request("bg.order.list.v2.get", data, access_token)
     
+    async def iter_order_pages(
+        self,
+        access_token: str,
+        begin_time: int,
+        end_time: int,
+        page_numbers: List[int],
+        page_size: int = 100,
+        order_status: Optional[int] = None
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        批量获取订单列表的多个分页，按完成顺序返回
+        
+        Args:
+            access_token: 访问令牌
+            begin_time: 开始时间（Unix时间戳）
+            end_time: 结束时间（Unix时间戳）
+            page_numbers: 页码列表
+            page_size: 每页数量
+            order_status: 订单状态筛选
+            
+        Yields:
+            (页码, 订单列表数据)；获取失败时数据为异常对象
+        """
+        calls = []
+        for page_number in page_numbers:
+            data = {
+                "beginTime": begin_time,
+                "endTime": end_time,
+                "pageNumber": page_number,
+                "pageSize": page_size,
+            }
+            if order_status is not None:
+                data["orderStatus"] = order_status
+            calls.append({"api_type": "bg.order.list.v2.get", "request_data": data})
+        async for index, result in self.batch(calls, access_token):
+            yield page_numbers[index], result
+    
     async def get_order_detail(
         self,
         access_token: str,
@@ -429,6 +690,30 @@ class TemuAPIClient:
         data = {"parentOrderSn": parent_order_sn}
         return await self._request("bg.order.detail.v2.get", data, access_token)
     
+    async def iter_order_details(
+        self,
+        access_token: str,
+        parent_order_sns: List[str],
+        concurrency: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        批量获取订单详情，按完成顺序返回
+        
+        Args:
+            access_token: 访问令牌
+            parent_order_sns: 父订单编号列表
+            concurrency: 并发调用数，默认 TEMU_BATCH_CONCURRENCY
+            
+        Yields:
+            (父订单编号, 订单详情)；获取失败时详情为异常对象
+        """
+        calls = [
+            {"api_type": "bg.order.detail.v2.get", "request_data": {"parentOrderSn": sn}}
+            for sn in parent_order_sns
+        ]
+        async for index, result in self.batch(calls, access_token, concurrency):
+            yield parent_order_sns[index], result
+    
     async def get_products(
         self,
         access_token: str,
@@ -0,0 +1 @@
+"""性能基准测试（合成数据 + 模拟 Temu API），见 benchmarks/README.md"""
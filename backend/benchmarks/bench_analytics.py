@@ -0,0 +1,65 @@
+"""数据分析和统计接口（不使用缓存）
+
+每个接口默认查询最近30天；按月/周的接口使用默认周期数。
+"""
+import pytest
+
+from benchmarks.datagen import MANAGERS
+
+pytestmark = pytest.mark.benchmark(group="analytics")
+
+ENDPOINTS = [
+    ("/api/analytics/gmv-table", {"period_type": "month", "periods": 12}),
+    ("/api/analytics/gmv-table", {"period_type": "day", "periods": 30}),
+    ("/api/analytics/sku-sales", {"limit": 20}),
+    ("/api/analytics/hot-seller-ranking", {}),
+    ("/api/analytics/manager-sku-details", {"manager": MANAGERS[0]}),
+    ("/api/analytics/sales-overview", {"days": 30, "refresh_cache": "true"}),
+    ("/api/analytics/sku-sales-ranking", {"days": 30}),
+    ("/api/analytics/spu-sales-ranking", {"days": 30}),
+    ("/api/analytics/manager-sales", {"days": 30}),
+    ("/api/analytics/payment-collection", {"days": 30}),
+    ("/api/analytics/delay-rate", {"days": 30}),
+    ("/api/statistics/overview/", {}),
+    ("/api/statistics/daily/", {"days": 30}),
+    ("/api/statistics/weekly/", {"weeks": 12}),
+    ("/api/statistics/monthly/", {"months": 12}),
+    ("/api/statistics/shops/comparison/", {}),
+    ("/api/statistics/trend/", {"days": 30}),
+    ("/api/statistics/unified/overview", {"days": 30, "use_cache": "false"}),
+    ("/api/statistics/unified/daily", {"days": 30, "use_cache": "false"}),
+    ("/api/statistics/unified/sku-ranking", {"days": 30, "use_cache": "false"}),
+    ("/api/statistics/unified/manager-ranking", {"days": 30, "use_cache": "false"}),
+    ("/api/statistics/unified/summary", {"use_cache": "false"}),
+]
+
+
+def _endpoint_id(endpoint) -> str:
+    path, params = endpoint
+    name = path.replace("/api/", "").strip("/")
+    if "period_type" in params:
+        name += f"[{params['period_type']}]"
+    return name
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS, ids=[_endpoint_id(endpoint) for endpoint in ENDPOINTS])
+def bench_endpoint(benchmark, client, endpoint):
+    path, params = endpoint
+
+    def run():
+        response = client.get(path, params=params)
+        assert response.status_code == 200, response.text[:500]
+        return response
+
+    benchmark(run)
+
+
+def bench_sales_overview_by_shop(benchmark, client, shop_ids):
+    """单个店铺 + 负责人筛选（筛选条件下的索引使用情况）"""
+    params = {"days": 90, "shop_ids": shop_ids[:1], "manager": MANAGERS[0], "refresh_cache": "true"}
+
+    def run():
+        response = client.get("/api/analytics/sales-overview", params=params)
+        assert response.status_code == 200, response.text[:500]
+
+    benchmark(run)
@@ -0,0 +1,62 @@
+"""Excel 商品导入：同步店铺的全部商品（已存在的商品逐行更新）"""
+import pytest
+from sqlalchemy import text
+
+from benchmarks import datagen
+from benchmarks.conftest import ROUNDS
+
+pytestmark = pytest.mark.benchmark(group="import")
+
+
+@pytest.fixture(scope="module")
+def products_file(tmp_path_factory, dataset):
+    import pandas as pd
+
+    scale = dataset["scale"]
+    rows = [
+        {
+            "商品名称": product["name"],
+            "SKU ID": product["product_sku_id"],
+            "SPU ID": product["spu_id"],
+            "申报价格": product["price"],
+            "SKU货号": product["sku"],
+            "类目": product["category"],
+            "负责人": product["manager"],
+            "SKC ID": product["skc_id"],
+            "状态": "已发布",
+        }
+        for product in datagen.shop_products(scale, scale.sync_shop_index)
+    ]
+    path = tmp_path_factory.mktemp("import") / "products.xlsx"
+    pd.DataFrame(rows).to_excel(path, index=False)
+    return path
+
+
+def bench_import_products(benchmark, loop, db_session, sync_shop_id, products_file):
+    from app.core.database import SessionLocal
+    from app.models.shop import Shop
+    from app.services.excel_import_service import ExcelImportService
+
+    results = []
+
+    def setup():
+        # 导入按文件哈希和行哈希去重，每轮清空导入记录，保证每行都被处理
+        db_session.execute(text("DELETE FROM import_row_hashes WHERE shop_id = :shop_id"), {"shop_id": sync_shop_id})
+        db_session.execute(text("DELETE FROM import_history WHERE shop_id = :shop_id"), {"shop_id": sync_shop_id})
+        db_session.commit()
+
+    def run():
+        db = SessionLocal()
+        try:
+            shop = db.query(Shop).filter(Shop.id == sync_shop_id).one()
+            record = loop.run_until_complete(ExcelImportService(db, shop).import_products(
+                str(products_file), products_file.name, products_file.stat().st_size
+            ))
+            results.append((record.total_rows, record.success_rows, record.failed_rows))
+        finally:
+            db.close()
+
+    benchmark.pedantic(run, setup=setup, rounds=ROUNDS, iterations=1)
+    total_rows, success_rows, failed_rows = results[-1]
+    benchmark.extra_info.update({"rows": total_rows, "success_rows": success_rows, "failed_rows": failed_rows})
+    assert success_rows == total_rows
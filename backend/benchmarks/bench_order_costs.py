@@ -0,0 +1,23 @@
+"""订单成本计算：全部订单强制重新计算"""
+import pytest
+
+from benchmarks.conftest import ROUNDS
+
+pytestmark = pytest.mark.benchmark(group="order_costs")
+
+
+def bench_calculate_order_costs(benchmark, dataset):
+    from app.core.database import BatchSessionLocal
+    from app.services.order_cost_service import OrderCostCalculationService
+
+    results = []
+
+    def run():
+        db = BatchSessionLocal()
+        try:
+            results.append(OrderCostCalculationService(db).calculate_order_costs(force_recalculate=True))
+        finally:
+            db.close()
+
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+    benchmark.extra_info["result"] = results[-1]
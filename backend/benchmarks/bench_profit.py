@@ -0,0 +1,55 @@
+"""利润计算：结算表 + 头程运费表 + 延迟扣款表（默认5000行、1轮，接口耗时随行数超线性增长）"""
+import os
+import random
+
+import pytest
+from sqlalchemy import text
+
+pytestmark = pytest.mark.benchmark(group="profit")
+
+SETTLEMENT_ROWS = int(os.environ.get("BENCH_SETTLEMENT_ROWS", "5000"))
+# 单轮即需数分钟，不使用 BENCH_ROUNDS
+PROFIT_ROUNDS = int(os.environ.get("BENCH_PROFIT_ROUNDS", "1"))
+
+
+@pytest.fixture(scope="module")
+def settlement(db_session, shop_ids):
+    """按已生成订单的父订单号构造结算数据（80%有头程运费，5%有延迟扣款）"""
+    parent_sns = [
+        row[0] for row in db_session.execute(
+            text(
+                "SELECT DISTINCT parent_order_sn FROM orders "
+                "WHERE shop_id = ANY(:shop_ids) AND parent_order_sn IS NOT NULL "
+                "ORDER BY parent_order_sn DESC LIMIT :limit"
+            ),
+            {"shop_ids": list(shop_ids), "limit": SETTLEMENT_ROWS},
+        )
+    ]
+    rnd = random.Random(7)
+    collection, shipping, deduction = [], [], []
+    for parent_sn in parent_sns:
+        sales = round(rnd.uniform(5, 80), 2)
+        shipping_fee = round(rnd.uniform(0, 6), 2)
+        collection.append({
+            "parent_order_sn": parent_sn,
+            "sales_collection": sales,
+            "sales_collection_after_discount": round(sales * 0.95, 2),
+            "sales_reversal": 0.0,
+            "shipping_collection": shipping_fee,
+            "shipping_collection_after_discount": shipping_fee,
+        })
+        if rnd.random() < 0.8:
+            shipping.append({"parent_order_sn": parent_sn, "shipping_cost": round(rnd.uniform(5, 25), 2)})
+        if rnd.random() < 0.05:
+            deduction.append({"parent_order_sn": parent_sn, "deduction": round(rnd.uniform(1, 10), 2)})
+    return {"collection_data": collection, "shipping_data": shipping, "deduction_data": deduction}
+
+
+def bench_calculate_profit(benchmark, client, settlement):
+    benchmark.extra_info["settlement_rows"] = len(settlement["collection_data"])
+
+    def run():
+        response = client.post("/api/profit-statement/calculate", json=settlement)
+        assert response.status_code == 200, response.text[:500]
+
+    benchmark.pedantic(run, rounds=PROFIT_ROUNDS, iterations=1)
@@ -0,0 +1,17 @@
+"""运营报表生成（定时任务：日报、周报、月报）"""
+import pytest
+
+from benchmarks.conftest import ROUNDS
+
+pytestmark = pytest.mark.benchmark(group="reports")
+
+
+@pytest.mark.parametrize("job_name", [
+    "generate_daily_reports_job",
+    "generate_weekly_reports_job",
+    "generate_monthly_reports_job",
+])
+def bench_report_job(benchmark, dataset, job_name):
+    from app.core import scheduler
+
+    benchmark.pedantic(getattr(scheduler, job_name), rounds=ROUNDS, iterations=1)
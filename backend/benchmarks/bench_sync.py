@@ -0,0 +1,89 @@
+"""订单同步：全量同步和增量同步（模拟 Temu API，包含分页、批量接口和限流）"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from benchmarks.conftest import ROUNDS
+
+pytestmark = pytest.mark.benchmark(group="sync")
+
+INCREMENTAL_DAYS = int(os.environ.get("BENCH_INCREMENTAL_DAYS", "7"))
+
+
+def _clear_sync_shop(db, shop_id: int) -> None:
+    db.execute(text("DELETE FROM orders WHERE shop_id = :shop_id"), {"shop_id": shop_id})
+    db.execute(text("DELETE FROM temu_orders_raw WHERE shop_id = :shop_id"), {"shop_id": shop_id})
+    db.commit()
+
+
+@pytest.fixture(scope="module")
+def sync_shop(db_session, sync_shop_id):
+    """同步期间启用同步店铺（平时禁用，不参与报表等按启用店铺执行的任务），结束后清空同步的订单"""
+    db_session.execute(text("UPDATE shops SET is_active = TRUE WHERE id = :shop_id"), {"shop_id": sync_shop_id})
+    db_session.commit()
+    yield sync_shop_id
+    _clear_sync_shop(db_session, sync_shop_id)
+    db_session.execute(
+        text("UPDATE shops SET is_active = FALSE, last_sync_at = NULL WHERE id = :shop_id"), {"shop_id": sync_shop_id}
+    )
+    db_session.commit()
+
+
+def _run_sync(loop, shop_id: int, full_sync: bool, last_sync_at=None):
+    from app.core.database import WorkerSessionLocal
+    from app.models.shop import Shop
+    from app.services.sync_service import SyncService
+
+    db = WorkerSessionLocal()
+    try:
+        shop = db.query(Shop).filter(Shop.id == shop_id).one()
+        if last_sync_at is not None:
+            shop.last_sync_at = last_sync_at
+            db.commit()
+        return loop.run_until_complete(SyncService(db, shop).sync_orders(full_sync=full_sync))
+    finally:
+        db.close()
+
+
+def _record_stats(benchmark, fake_temu, results) -> None:
+    stats = fake_temu["stats"]()
+    benchmark.extra_info["orders"] = results[-1]["total"] if results else 0
+    benchmark.extra_info["api_calls_per_round"] = stats["total_calls"] // max(len(results), 1)
+    benchmark.extra_info["rate_limited_per_round"] = stats["rate_limited"] // max(len(results), 1)
+
+
+def bench_sync_orders_full(benchmark, loop, db_session, sync_shop, fake_temu):
+    """全量同步：清空同步店铺的订单后拉取最近1年的全部订单"""
+    results = []
+
+    def setup():
+        _clear_sync_shop(db_session, sync_shop)
+
+    def run():
+        results.append(_run_sync(loop, sync_shop, full_sync=True))
+
+    fake_temu["reset"]()
+    benchmark.pedantic(run, setup=setup, rounds=ROUNDS, iterations=1)
+    _record_stats(benchmark, fake_temu, results)
+    assert results[-1]["total"] > 0
+
+
+def bench_sync_orders_incremental(benchmark, loop, db_session, sync_shop, fake_temu):
+    """增量同步：订单已存在，拉取最近 BENCH_INCREMENTAL_DAYS 天的订单并更新"""
+    exists = db_session.execute(
+        text("SELECT 1 FROM orders WHERE shop_id = :shop_id LIMIT 1"), {"shop_id": sync_shop}
+    ).scalar()
+    if not exists:
+        _run_sync(loop, sync_shop, full_sync=True)
+    results = []
+
+    def run():
+        last_sync_at = datetime.now() - timedelta(days=INCREMENTAL_DAYS)
+        results.append(_run_sync(loop, sync_shop, full_sync=False, last_sync_at=last_sync_at))
+
+    fake_temu["reset"]()
+    benchmark.pedantic(run, rounds=ROUNDS, iterations=1)
+    _record_stats(benchmark, fake_temu, results)
+    assert results[-1]["total"] > 0
@@ -0,0 +1,212 @@
+"""基准测试公共夹具
+
+环境变量（均可选，BENCH_DATABASE_URL 除外）:
+    BENCH_DATABASE_URL          基准测试数据库（名称必须包含 bench，会被清空重建）
+    BENCH_ORDERS                父订单数，默认 100000
+    BENCH_SHOPS                 业务店铺数，默认 5
+    BENCH_PRODUCTS_PER_SHOP     每个店铺的商品数，默认 2000
+    BENCH_DAYS                  订单时间跨度（天），默认 365
+    BENCH_SEED                  随机种子，默认 42
+    BENCH_REGENERATE            设为 1 时强制重新生成数据
+    BENCH_MAX_DATASET_AGE_DAYS  数据集超过该天数后重新生成（按天统计的接口依赖当前日期），默认 7
+    BENCH_SYNC_ORDERS           模拟 Temu API 中同步店铺的订单数，默认 5000
+    BENCH_RATE_LIMIT            模拟 Temu API 每个店铺每秒允许的调用次数，默认 20（0表示不限流）
+    BENCH_LATENCY_MS            模拟 Temu API 每次调用的延迟，默认 30
+    BENCH_ROUNDS                耗时较长的场景（同步、成本计算、导入、报表）的轮数，默认 3
+
+应用配置在导入时读取环境变量，所以这里先设置 DATABASE_URL、TEMU_API_PROXY_URL 等再导入 app。
+"""
+import asyncio
+import dataclasses
+import multiprocessing
+import os
+import socket
+import time
+
+import httpx
+import pytest
+
+from benchmarks import datagen
+
+BENCH_DATABASE_URL = os.environ.get("BENCH_DATABASE_URL")
+if not BENCH_DATABASE_URL:
+    pytest.exit("请设置 BENCH_DATABASE_URL（名称包含 bench 的 PostgreSQL 数据库，会被清空），见 benchmarks/README.md", returncode=4)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+FAKE_TEMU_PORT = _free_port()
+
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+os.environ["TEMU_API_PROXY_URL"] = f"http://127.0.0.1:{FAKE_TEMU_PORT}"
+os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+# 后端自身的限流放宽，由模拟 Temu API 的限流决定同步速度
+os.environ.setdefault("API_RATE_LIMIT_PER_MINUTE", "6000")
+
+ROUNDS = int(os.environ.get("BENCH_ROUNDS", "3"))
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _requested_scale() -> datagen.Scale:
+    return datagen.Scale(
+        orders=_env_int("BENCH_ORDERS", 100_000),
+        shops=_env_int("BENCH_SHOPS", 5),
+        products_per_shop=_env_int("BENCH_PRODUCTS_PER_SHOP", 2_000),
+        days=_env_int("BENCH_DAYS", 365),
+        seed=_env_int("BENCH_SEED", 42),
+    )
+
+
+def _dataset_matches(dataset, scale: datagen.Scale) -> bool:
+    if not dataset or os.environ.get("BENCH_REGENERATE") == "1":
+        return False
+    existing = dict(dataset["scale"])
+    expected = dataclasses.asdict(scale)
+    max_age = _env_int("BENCH_MAX_DATASET_AGE_DAYS", 7) * 86400
+    if time.time() - existing.pop("end_time") > max_age:
+        return False
+    expected.pop("end_time")
+    return existing == expected
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    """基准测试数据集（规模不一致或过旧时重新生成）"""
+    scale = _requested_scale()
+    info = datagen.load_dataset_info(BENCH_DATABASE_URL)
+    if not _dataset_matches(info, scale):
+        info = datagen.generate(BENCH_DATABASE_URL, scale)
+    info["scale"] = datagen.Scale(**info["scale"])
+    return info
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _disable_redis():
+    """不使用 Redis 缓存，测量的是未命中缓存的计算路径（同步后的后台刷新线程可能在会话结束后仍在运行，不恢复）"""
+    from app.core.redis_client import RedisClient
+
+    RedisClient.get_client = classmethod(lambda cls: None)
+
+
+@pytest.fixture(autouse=True)
+def _dataset_extra_info(request, dataset):
+    """每条基准结果记录数据集规模，便于对比不同规模的结果"""
+    if "benchmark" in request.fixturenames:
+        benchmark = request.getfixturevalue("benchmark")
+        benchmark.extra_info["dataset"] = {
+            "scale": dataclasses.asdict(dataset["scale"]),
+            "rows": dataset["rows"],
+        }
+
+
+@pytest.fixture(scope="session")
+def loop():
+    """整个会话共用一个事件循环（限流器、HTTP 客户端绑定在创建它们的事件循环上）"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def db_session(dataset):
+    from app.core.database import SessionLocal
+
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture(scope="session")
+def shop_ids(dataset):
+    """业务店铺ID（不含同步店铺）"""
+    return dataset["shop_ids"][:-1]
+
+
+@pytest.fixture(scope="session")
+def sync_shop_id(dataset):
+    return dataset["shop_ids"][-1]
+
+
+@pytest.fixture(scope="session")
+def fake_temu(dataset):
+    """在独立进程中运行模拟 Temu API，返回 {"url", "stats", "reset"}"""
+    from benchmarks import fake_temu as fake_temu_module
+
+    scale = dataset["scale"]
+    # 同步店铺的订单截止到当前时间，全量同步（最近1年）能拉取到全部订单
+    sync_scale = dataclasses.replace(scale, end_time=0, days=min(scale.days, 360))
+    orders_per_shop = {scale.sync_shop_index: _env_int("BENCH_SYNC_ORDERS", 5_000)}
+    process = multiprocessing.get_context("spawn").Process(
+        target=fake_temu_module.run,
+        args=(
+            FAKE_TEMU_PORT, sync_scale, orders_per_shop,
+            float(os.environ.get("BENCH_RATE_LIMIT", "20")), 20, _env_int("BENCH_LATENCY_MS", 30) / 1000,
+        ),
+        daemon=True,
+    )
+    process.start()
+    url = os.environ["TEMU_API_PROXY_URL"]
+    deadline = time.time() + 30
+    while True:
+        try:
+            httpx.get(f"{url}/health", timeout=1).raise_for_status()
+            break
+        except httpx.HTTPError:
+            if time.time() > deadline or not process.is_alive():
+                process.terminate()
+                pytest.fail("模拟 Temu API 启动失败")
+            time.sleep(0.2)
+
+    yield {
+        "url": url,
+        "stats": lambda: httpx.get(f"{url}/__stats").json(),
+        "reset": lambda: httpx.post(f"{url}/__reset").json(),
+    }
+    process.terminate()
+    process.join(5)
+
+
+class ApiClient:
+    """在会话事件循环上通过 ASGI 调用应用（requirements 中的 httpx 0.28 与 starlette 0.27 的 TestClient 不兼容）"""
+
+    def __init__(self, app, loop):
+        self.loop = loop
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.loop.run_until_complete(self.client.get(url, **kwargs))
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.loop.run_until_complete(self.client.post(url, **kwargs))
+
+    def close(self) -> None:
+        self.loop.run_until_complete(self.client.aclose())
+
+
+@pytest.fixture(scope="session")
+def client(dataset, loop):
+    """API 客户端（认证依赖替换为基准测试用户；不触发 startup 事件，不启动定时任务）"""
+    from app.core.database import SessionLocal
+    from app.core.security import get_current_user
+    from app.main import app
+    from app.models.user import User
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == datagen.BENCH_USERNAME).one()
+        db.expunge(user)
+    finally:
+        db.close()
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    api_client = ApiClient(app, loop)
+    yield api_client
+    api_client.close()
+    app.dependency_overrides.pop(get_current_user, None)
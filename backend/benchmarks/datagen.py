@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""合成 Temu 数据生成器
+
+按指定规模生成店铺、商品、成本、temu_orders_raw 原始订单和 orders 业务订单，用于基准测试。
+订单内容由 (种子, 店铺序号, 订单序号) 确定，模拟 Temu API（fake_temu.py）返回的分页数据与写入
+数据库的数据一致，不需要把订单保存在内存中，可以生成 10M 级别的数据。
+
+- 每个父订单包含 1~3 个子订单（75% / 20% / 5%）
+- 商品销量按幂律分布（少数热销SKU占大部分订单），每3个SKU属于同一个SPU
+- 订单状态：已送达60%、已发货20%、未发货10%、已取消7%、待处理3%
+- 20% 的商品在时间范围中间调整过成本价（两条成本记录）
+- 除业务店铺外，额外生成一个只有商品和成本、没有订单的同步店铺，供同步基准测试使用
+
+写入使用 COPY，按块提交。生成前清空相关表，只允许写入名称包含 "bench" 的数据库。
+
+示例:
+    python -m benchmarks.datagen --database-url postgresql://postgres@localhost/temu_bench --orders 1000000
+    python -m benchmarks.datagen --orders 10000000 --shops 20 --products-per-shop 5000 --no-raw
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+MANAGERS = ["张伟", "李娜", "王芳", "刘洋", "陈静", "杨帆", "赵磊", "黄敏"]
+CATEGORIES = ["家居收纳", "厨房用品", "宠物用品", "户外运动", "汽车配件", "母婴用品", "数码配件", "节日装饰"]
+CITIES = [("US", "CA", "Los Angeles"), ("US", "NY", "New York"), ("US", "TX", "Houston"), ("US", "FL", "Miami"),
+          ("US", "IL", "Chicago"), ("US", "WA", "Seattle"), ("US", "AZ", "Phoenix"), ("US", "GA", "Atlanta")]
+
+# Temu 父订单状态码及其权重（与 SyncService._map_order_status 对应）
+PARENT_STATUS_WEIGHTS = ((5, 60), (4, 20), (2, 10), (3, 7), (1, 3))
+ORDER_STATUS_BY_CODE = {1: "PENDING", 2: "PROCESSING", 3: "CANCELLED", 4: "SHIPPED", 5: "DELIVERED"}
+
+BENCH_USERNAME = "bench"
+DATASET_CONFIG_KEY = "bench_dataset"
+
+
+@dataclass
+class Scale:
+    """数据规模"""
+
+    orders: int = 100_000  # 父订单数（所有业务店铺合计）
+    shops: int = 5  # 业务店铺数（另有一个同步店铺）
+    products_per_shop: int = 2_000
+    days: int = 365  # 订单时间跨度（天）
+    seed: int = 42
+    end_time: int = 0  # 最晚下单时间（Unix秒），0表示当前整点
+
+    def __post_init__(self):
+        if not self.end_time:
+            self.end_time = int(time.time()) // 3600 * 3600
+
+    @property
+    def sync_shop_index(self) -> int:
+        """同步店铺的序号（排在业务店铺之后）"""
+        return self.shops
+
+    def orders_for_shop(self, shop_index: int) -> int:
+        """业务店铺的父订单数"""
+        base, extra = divmod(self.orders, self.shops)
+        return base + (1 if shop_index < extra else 0)
+
+
+# ---- 确定性的数据内容 ----
+
+def shop_code(shop_index: int) -> str:
+    return f"{shop_index:03d}"
+
+
+def access_token(shop_index: int) -> str:
+    """店铺的访问令牌（模拟 Temu API 用它识别店铺）"""
+    return f"bench-token-{shop_code(shop_index)}"
+
+
+def shop_index_from_token(token: str) -> Optional[int]:
+    if not token or not token.startswith("bench-token-"):
+        return None
+    try:
+        return int(token.rsplit("-", 1)[1])
+    except ValueError:
+        return None
+
+
+def product_info(scale: Scale, shop_index: int, product_index: int) -> Dict[str, Any]:
+    """商品信息（供货价和成本价单位为人民币）"""
+    rnd = random.Random(scale.seed * 7_919 + shop_index * 1_000_003 + product_index)
+    price = round(rnd.uniform(15, 220), 2)
+    spu_index = product_index // 3
+    return {
+        "product_sku_id": f"{shop_index + 1}{product_index:08d}",
+        "sku": f"SKU-{shop_code(shop_index)}-{product_index:06d}",
+        "spu_id": str(600_000_000 + shop_index * 1_000_000 + spu_index),
+        "skc_id": str(700_000_000 + shop_index * 1_000_000 + product_index),
+        "name": f"{CATEGORIES[spu_index % len(CATEGORIES)]} 商品 {spu_index:05d} 规格{product_index % 3 + 1}",
+        "category": CATEGORIES[spu_index % len(CATEGORIES)],
+        "manager": MANAGERS[spu_index % len(MANAGERS)],
+        "price": price,
+        "cost": round(price * rnd.uniform(0.35, 0.7), 2),
+        "cost_changed": rnd.random() < 0.2,
+        "new_cost": round(price * rnd.uniform(0.35, 0.7), 2),
+    }
+
+
+def parent_order_sn(shop_index: int, local_index: int) -> str:
+    return f"PO-{shop_code(shop_index)}-{local_index:09d}"
+
+
+def order_timestamp(scale: Scale, local_index: int, shop_total: int) -> int:
+    """店铺内第 local_index 个订单的下单时间：在时间跨度内均匀分布，序号越大越新"""
+    span = scale.days * 86400
+    return scale.end_time - span + int((local_index + 0.5) * span / max(shop_total, 1))
+
+
+def order_index_range(scale: Scale, shop_total: int, begin_time: int, end_time: int) -> Tuple[int, int]:
+    """下单时间在 [begin_time, end_time] 内的订单序号范围 [lo, hi)（下单时间随序号单调递增，二分查找）"""
+    def first_after(limit: int) -> int:
+        lo, hi = 0, shop_total
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if order_timestamp(scale, mid, shop_total) > limit:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    return first_after(begin_time - 1), first_after(end_time)
+
+
+def _weighted(rnd: random.Random, weights) -> int:
+    target = rnd.random() * sum(weight for _, weight in weights)
+    for value, weight in weights:
+        target -= weight
+        if target < 0:
+            return value
+    return weights[-1][0]
+
+
+def shop_products(scale: Scale, shop_index: int) -> List[Dict[str, Any]]:
+    """店铺的全部商品信息（按商品序号）"""
+    return [product_info(scale, shop_index, i) for i in range(scale.products_per_shop)]
+
+
+def parent_order_payload(
+    scale: Scale,
+    shop_index: int,
+    local_index: int,
+    shop_total: int,
+    products: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    一个父订单的 Temu API 数据（bg.order.list.v2.get 的 pageItems 元素）
+
+    Args:
+        scale: 数据规模
+        shop_index: 店铺序号
+        local_index: 店铺内的订单序号
+        shop_total: 店铺的订单总数
+        products: 店铺的商品信息（shop_products 的结果，批量生成时传入避免重复计算）
+    """
+    return _build_parent_order(scale, shop_index, local_index, shop_total, products)[0]
+
+
+def _build_parent_order(
+    scale: Scale,
+    shop_index: int,
+    local_index: int,
+    shop_total: int,
+    products: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[Dict[str, Any], List[int]]:
+    """返回 (父订单数据, 各子订单的商品序号)"""
+    rnd = random.Random((scale.seed * 1_000_003 + shop_index) * 100_000_007 + local_index)
+    created = order_timestamp(scale, local_index, shop_total)
+    status = _weighted(rnd, PARENT_STATUS_WEIGHTS)
+    country, province, city = CITIES[rnd.randrange(len(CITIES))]
+    parent_sn = parent_order_sn(shop_index, local_index)
+    sub_count = 1 if rnd.random() < 0.75 else (2 if rnd.random() < 0.8 else 3)
+
+    parent = {
+        "parentOrderSn": parent_sn,
+        "parentOrderStatus": status,
+        "parentOrderTime": created,
+        "paymentTime": created + rnd.randint(10, 600),
+        "expectShipLatestTime": created + 2 * 86400,
+        "latestDeliveryTime": created + 12 * 86400,
+        "updateTime": min(created + rnd.randint(3, 10) * 86400, scale.end_time),
+        "regionId": 211,
+        "siteId": 100,
+        "fulfillmentWarning": [],
+    }
+    if status in (4, 5):
+        parent["parentShippingTime"] = created + rnd.randint(6, 40) * 3600
+        parent["packageSnInfo"] = [{"packageSn": f"PK{shop_index:03d}{local_index:011d}", "packageDeliveryType": 1}]
+
+    order_list = []
+    product_indices = []
+    for k in range(sub_count):
+        product_index = int(scale.products_per_shop * rnd.random() ** 2.5)
+        product = products[product_index] if products else product_info(scale, shop_index, product_index)
+        quantity = 1 if rnd.random() < 0.85 else rnd.randint(2, 4)
+        product_indices.append(product_index)
+        order_list.append({
+            "orderSn": f"{parent_sn}-{k + 1}",
+            "orderStatus": status,
+            "goodsId": int(product["spu_id"]),
+            "goodsName": product["name"],
+            "spec": f"规格{product_index % 3 + 1}",
+            "goodsNumber": quantity,
+            "quantity": quantity,
+            "fulfillmentType": "fulfillBySeller",
+            "productList": [{
+                "productSkuId": int(product["product_sku_id"]),
+                "extCode": product["sku"],
+                "productId": int(product["spu_id"]),
+                "soldFactor": 1,
+            }],
+        })
+    payload = {
+        "parentOrderMap": parent,
+        "orderList": order_list,
+        "shippingAddress": {"regionName1": country, "regionName2": province, "regionName3": city},
+    }
+    return payload, product_indices
+
+
+def orders_page(
+    scale: Scale,
+    shop_index: int,
+    shop_total: int,
+    begin_time: int,
+    end_time: int,
+    page_number: int,
+    page_size: int,
+    products: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """bg.order.list.v2.get 的返回结果（按下单时间窗口过滤后分页）"""
+    lo, hi = order_index_range(scale, shop_total, begin_time, end_time)
+    start = lo + (max(page_number, 1) - 1) * page_size
+    stop = min(hi, start + page_size)
+    return {
+        "totalItemNum": hi - lo,
+        "pageItems": [
+            parent_order_payload(scale, shop_index, i, shop_total, products) for i in range(start, stop)
+        ],
+    }
+
+
+def beijing_datetime(timestamp: int) -> datetime:
+    """与 SyncService._parse_timestamp 一致：naive datetime，表示北京时间"""
+    return datetime.fromtimestamp(timestamp, tz=BEIJING_TZ).replace(tzinfo=None)
+
+
+# ---- 写入数据库 ----
+
+class _CopyWriter:
+    """按块通过 COPY 写入一张表"""
+
+    def __init__(self, raw_conn, table: str, columns: List[str], chunk_rows: int = 50_000):
+        self.raw_conn = raw_conn
+        self.sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = 0
+
+    def add(self, row) -> None:
+        self._writer.writerow(row)
+        self._pending += 1
+        if self._pending >= self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self._buffer.seek(0)
+        with self.raw_conn.cursor() as cursor:
+            cursor.copy_expert(self.sql, self._buffer)
+        self.raw_conn.commit()
+        self.rows += self._pending
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = 0
+
+
+BENCH_TABLES = (
+    "payouts", "order_items", "orders", "temu_orders_raw", "product_costs", "products",
+    "report_snapshots", "import_row_hashes", "import_history", "activities", "temu_products_raw", "shops",
+)
+
+
+def check_bench_database(database_url: str) -> None:
+    """只允许写入名称包含 bench 的数据库，避免误清空业务数据"""
+    from sqlalchemy.engine import make_url
+
+    name = make_url(database_url).database or ""
+    if "bench" not in name:
+        raise SystemExit(f"拒绝写入数据库 '{name}'：基准测试数据库名称必须包含 'bench'")
+
+
+def _create_shops(db, scale: Scale) -> List[int]:
+    from app.models.shop import Shop, ShopEnvironment, ShopRegion
+
+    shop_ids = []
+    for shop_index in range(scale.shops + 1):
+        is_sync_shop = shop_index == scale.sync_shop_index
+        shop = Shop(
+            shop_id=f"bench-mall-{shop_code(shop_index)}",
+            shop_name="基准测试同步店铺" if is_sync_shop else f"基准测试店铺 {shop_index + 1}",
+            region=ShopRegion.US,
+            environment=ShopEnvironment.PRODUCTION,
+            entity="基准测试",
+            default_manager=MANAGERS[shop_index % len(MANAGERS)],
+            app_key="bench-app-key",
+            app_secret="bench-app-secret",
+            access_token=access_token(shop_index),
+            is_active=not is_sync_shop,
+        )
+        db.add(shop)
+        db.flush()
+        shop_ids.append(shop.id)
+    db.commit()
+    return shop_ids
+
+
+def _ensure_bench_user(db) -> None:
+    from app.core.security import get_password_hash
+    from app.models.user import User
+
+    if not db.query(User).filter(User.username == BENCH_USERNAME).first():
+        db.add(User(
+            username=BENCH_USERNAME,
+            email="bench@example.com",
+            hashed_password=get_password_hash("bench"),
+            is_active=True,
+            is_superuser=True,
+        ))
+        db.commit()
+
+
+def generate(database_url: str, scale: Scale, with_raw: bool = True, log=print) -> Dict[str, Any]:
+    """
+    清空并生成基准测试数据
+
+    Returns:
+        数据集信息（规模和各表行数），同时保存到 system_configs 的 bench_dataset
+    """
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.database import Base
+    from app.models.system_config import SystemConfig
+    import app.models  # noqa: F401  注册所有模型
+
+    check_bench_database(database_url)
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    started = time.time()
+
+    with engine.begin() as conn:
+        existing = [table for table in BENCH_TABLES if engine.dialect.has_table(conn, table)]
+        conn.execute(text(f"TRUNCATE {', '.join(existing)} RESTART IDENTITY CASCADE"))
+        conn.execute(text("DELETE FROM system_configs WHERE key = :key"), {"key": DATASET_CONFIG_KEY})
+
+    db = sessionmaker(bind=engine)()
+    try:
+        _ensure_bench_user(db)
+        shop_ids = _create_shops(db, scale)
+    finally:
+        db.close()
+
+    start_dt = beijing_datetime(scale.end_time - scale.days * 86400)
+    mid_dt = beijing_datetime(scale.end_time - scale.days * 86400 // 2)
+    now = datetime.utcnow()
+
+    raw_conn = engine.raw_connection()
+    try:
+        products = _CopyWriter(raw_conn, "products", [
+            "id", "shop_id", "product_id", "product_name", "sku", "current_price", "currency", "stock_quantity",
+            "total_sales", "is_active", "category", "manager", "skc_id", "spu_id", "price_status",
+            "created_at", "updated_at",
+        ])
+        costs = _CopyWriter(raw_conn, "product_costs", [
+            "product_id", "cost_price", "currency", "effective_from", "effective_to", "notes", "created_at",
+        ])
+        # {(店铺序号, 商品序号): 商品表ID}
+        product_ids: Dict[Tuple[int, int], int] = {}
+        next_product_id = 1
+        products_by_shop = [shop_products(scale, shop_index) for shop_index in range(len(shop_ids))]
+        for shop_index, shop_id in enumerate(shop_ids):
+            for product_index, info in enumerate(products_by_shop[shop_index]):
+                product_ids[(shop_index, product_index)] = next_product_id
+                products.add((
+                    next_product_id, shop_id, info["product_sku_id"], info["name"], info["sku"], info["price"],
+                    "CNY", 500, 0, True, info["category"], info["manager"], info["skc_id"], info["spu_id"],
+                    "已生效", now, now,
+                ))
+                if info["cost_changed"]:
+                    costs.add((next_product_id, info["cost"], "CNY", start_dt - timedelta(days=30), mid_dt, "初始成本", now))
+                    costs.add((next_product_id, info["new_cost"], "CNY", mid_dt, None, "调价", now))
+                else:
+                    costs.add((next_product_id, info["cost"], "CNY", start_dt - timedelta(days=30), None, "初始成本", now))
+                next_product_id += 1
+        products.flush()
+        costs.flush()
+        log(f"商品: {products.rows} 行, 成本记录: {costs.rows} 行")
+
+        raw = _CopyWriter(raw_conn, "temu_orders_raw", [
+            "id", "shop_id", "external_order_id", "raw_json", "fetched_at", "created_at",
+        ], chunk_rows=20_000)
+        orders = _CopyWriter(raw_conn, "orders", [
+            "shop_id", "order_sn", "temu_order_id", "parent_order_sn", "package_sn", "product_id", "product_name",
+            "product_sku", "spu_id", "quantity", "unit_price", "total_price", "currency", "unit_cost", "total_cost",
+            "profit", "status", "order_time", "payment_time", "shipping_time", "expect_ship_latest_time",
+            "delivery_time", "shipping_country", "shipping_city", "shipping_province", "raw_data_id",
+            "created_at", "updated_at",
+        ])
+        next_raw_id = 1
+        for shop_index in range(scale.shops):
+            shop_id = shop_ids[shop_index]
+            shop_total = scale.orders_for_shop(shop_index)
+            for local_index in range(shop_total):
+                payload, product_indices = _build_parent_order(
+                    scale, shop_index, local_index, shop_total, products_by_shop[shop_index]
+                )
+                parent = payload["parentOrderMap"]
+                address = payload["shippingAddress"]
+                order_time = beijing_datetime(parent["parentOrderTime"])
+                payment_time = beijing_datetime(parent["paymentTime"])
+                shipping_time = beijing_datetime(parent["parentShippingTime"]) if "parentShippingTime" in parent else None
+                if parent["parentOrderStatus"] == 5:
+                    delivery_time = beijing_datetime(parent["updateTime"])
+                else:
+                    delivery_time = beijing_datetime(parent["latestDeliveryTime"])
+                package_sn = parent["packageSnInfo"][0]["packageSn"] if "packageSnInfo" in parent else None
+                status = ORDER_STATUS_BY_CODE[parent["parentOrderStatus"]]
+                for item, product_index in zip(payload["orderList"], product_indices):
+                    info = products_by_shop[shop_index][product_index]
+                    unit_cost = info["new_cost"] if info["cost_changed"] and order_time >= mid_dt else info["cost"]
+                    quantity = item["goodsNumber"]
+                    total_price = round(info["price"] * quantity, 2)
+                    total_cost = round(unit_cost * quantity, 2)
+                    raw_data_id = None
+                    if with_raw:
+                        raw_data_id = next_raw_id
+                        raw.add((
+                            next_raw_id, shop_id, item["orderSn"],
+                            json.dumps({"parentOrderMap": parent, "orderItem": item, "fullOrderData": payload},
+                                       ensure_ascii=False, separators=(",", ":")),
+                            now, now,
+                        ))
+                        next_raw_id += 1
+                    orders.add((
+                        shop_id, item["orderSn"], item["orderSn"], parent["parentOrderSn"], package_sn,
+                        product_ids[(shop_index, product_index)], info["name"], info["sku"], info["spu_id"], quantity,
+                        info["price"], total_price, "CNY", unit_cost, total_cost, round(total_price - total_cost, 2),
+                        status, order_time, payment_time, shipping_time,
+                        beijing_datetime(parent["expectShipLatestTime"]), delivery_time,
+                        address["regionName1"], address["regionName3"], address["regionName2"], raw_data_id,
+                        now, now,
+                    ))
+                if local_index and local_index % 100_000 == 0:
+                    log(f"店铺 {shop_index + 1}/{scale.shops}: 已生成 {local_index}/{shop_total} 个父订单")
+        raw.flush()
+        orders.flush()
+        log(f"原始订单: {raw.rows} 行, 业务订单: {orders.rows} 行")
+
+        with raw_conn.cursor() as cursor:
+            for table in ("products", "temu_orders_raw"):
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), GREATEST((SELECT MAX(id) FROM {table}), 1))")
+            cursor.execute("ANALYZE")
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+    dataset = {
+        "scale": asdict(scale),
+        "with_raw": with_raw,
+        "rows": {"products": products.rows, "product_costs": costs.rows, "temu_orders_raw": raw.rows, "orders": orders.rows},
+        "shop_ids": shop_ids,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "seconds": round(time.time() - started, 1),
+    }
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add(SystemConfig(key=DATASET_CONFIG_KEY, value=json.dumps(dataset), description="基准测试数据集信息"))
+        db.commit()
+    finally:
+        db.close()
+    engine.dispose()
+    log(f"数据生成完成，耗时 {dataset['seconds']} 秒")
+    return dataset
+
+
+def load_dataset_info(database_url: str) -> Optional[Dict[str, Any]]:
+    """读取已生成的数据集信息（未生成时返回None）"""
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            if not engine.dialect.has_table(conn, "system_configs"):
+                return None
+            value = conn.execute(
+                text("SELECT value FROM system_configs WHERE key = :key"), {"key": DATASET_CONFIG_KEY}
+            ).scalar()
+        return json.loads(value) if value else None
+    finally:
+        engine.dispose()
+
+
+def main():
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+    parser = argparse.ArgumentParser(description="生成基准测试用的合成 Temu 数据")
+    parser.add_argument("--database-url", default=os.environ.get("BENCH_DATABASE_URL"),
+                        help="基准测试数据库（名称必须包含 bench），默认读取 BENCH_DATABASE_URL")
+    parser.add_argument("--orders", type=int, default=100_000, help="父订单数（所有店铺合计）")
+    parser.add_argument("--shops", type=int, default=5, help="业务店铺数")
+    parser.add_argument("--products-per-shop", type=int, default=2_000, help="每个店铺的商品数")
+    parser.add_argument("--days", type=int, default=365, help="订单时间跨度（天）")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--no-raw", action="store_true", help="不生成 temu_orders_raw（大规模时节省空间）")
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error("请通过 --database-url 或 BENCH_DATABASE_URL 指定基准测试数据库")
+
+    # 应用配置在导入时读取 DATABASE_URL
+    os.environ["DATABASE_URL"] = args.database_url
+    scale = Scale(orders=args.orders, shops=args.shops, products_per_shop=args.products_per_shop,
+                  days=args.days, seed=args.seed)
+    dataset = generate(args.database_url, scale, with_raw=not args.no_raw)
+    print(json.dumps(dataset["rows"], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
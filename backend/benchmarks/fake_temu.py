@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""模拟 Temu API / 代理服务器
+
+同一个应用同时提供两种协议，订单数据由 datagen 按 (种子, 店铺序号, 订单序号) 实时生成：
+- 代理服务器协议：POST /api/proxy、POST /api/proxy/batch（NDJSON），后端 TEMU_API_PROXY_URL 直接指向本服务
+- Temu 开放平台协议：POST /openapi/router，可放在真实代理服务器（proxy-server）后面，测量包含代理的链路
+
+行为:
+- 按 access_token（bench-token-<店铺序号>）识别店铺，bg.order.list.v2.get 按 beginTime/endTime
+  过滤下单时间后分页（pageSize 最大100），与生成到数据库的数据一致
+- 每个 access_token 一个令牌桶，超过频率限制时返回 Temu 的限流错误（客户端会按可重试错误退避重试）
+- 每次调用固定延迟，模拟公网往返
+- GET /__stats 返回调用次数、限流次数，POST /__reset 清零
+
+示例:
+    python -m benchmarks.fake_temu --port 9100 --orders-per-shop 20000 --rate-limit 20 --latency 30
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from benchmarks.datagen import Scale, orders_page, parent_order_sn, shop_index_from_token, shop_products
+
+RATE_LIMIT_ERROR_CODE = 4000004
+MAX_PAGE_SIZE = 100
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class FakeTemu:
+    """模拟的 Temu API：按店铺生成订单数据、限流、统计调用次数"""
+
+    def __init__(
+        self,
+        scale: Scale,
+        orders_per_shop: Optional[Dict[int, int]] = None,
+        rate_limit: float = 20.0,
+        burst: int = 20,
+        latency: float = 0.03
+    ):
+        """
+        Args:
+            scale: 数据规模（与 datagen 生成数据库时相同）
+            orders_per_shop: {店铺序号: 订单数}，覆盖按规模计算的订单数（如同步店铺）
+            rate_limit: 每个 access_token 每秒允许的调用次数（0表示不限流）
+            burst: 令牌桶容量
+            latency: 每次调用的固定延迟（秒）
+        """
+        self.scale = scale
+        self.orders_per_shop = orders_per_shop or {}
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.rate_limited = 0
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._products: Dict[int, List[Dict[str, Any]]] = {}
+
+    def shop_total(self, shop_index: int) -> int:
+        if shop_index in self.orders_per_shop:
+            return self.orders_per_shop[shop_index]
+        if shop_index < self.scale.shops:
+            return self.scale.orders_for_shop(shop_index)
+        return 0
+
+    def products(self, shop_index: int) -> List[Dict[str, Any]]:
+        if shop_index not in self._products:
+            self._products[shop_index] = shop_products(self.scale, shop_index)
+        return self._products[shop_index]
+
+    async def call(self, api_type: str, data: Dict[str, Any], token: Optional[str]) -> Dict[str, Any]:
+        """执行一次调用，返回 Temu 协议的响应 {success, result} 或 {success: False, errorCode, errorMsg}"""
+        self.calls[api_type] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_limit:
+            bucket = self._buckets.get(token or "")
+            if bucket is None:
+                bucket = self._buckets[token or ""] = _TokenBucket(self.rate_limit, self.burst)
+            if not bucket.try_acquire():
+                self.rate_limited += 1
+                return {"success": False, "errorCode": RATE_LIMIT_ERROR_CODE, "errorMsg": "rate limit exceeded, please retry later"}
+
+        shop_index = shop_index_from_token(token)
+        if shop_index is None:
+            return {"success": False, "errorCode": 7000015, "errorMsg": "access_token is invalid"}
+
+        if api_type == "bg.order.list.v2.get":
+            page_size = min(int(data.get("pageSize") or MAX_PAGE_SIZE), MAX_PAGE_SIZE)
+            result = orders_page(
+                self.scale, shop_index, self.shop_total(shop_index),
+                int(data.get("beginTime") or 0), int(data.get("endTime") or time.time()),
+                int(data.get("pageNumber") or 1), page_size, self.products(shop_index),
+            )
+            return {"success": True, "result": result}
+        if api_type == "bg.order.detail.v2.get":
+            return {"success": True, "result": self._order_detail(shop_index, str(data.get("parentOrderSn", "")))}
+        if api_type == "bg.open.accesstoken.info.get":
+            return {"success": True, "result": {"mallId": f"bench-mall-{shop_index:03d}", "expiredTime": int(time.time()) + 86400}}
+        return {"success": False, "errorCode": 3000000, "errorMsg": f"unsupported api type: {api_type}"}
+
+    def _order_detail(self, shop_index: int, parent_sn: str) -> Dict[str, Any]:
+        from benchmarks.datagen import parent_order_payload
+
+        try:
+            local_index = int(parent_sn.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return {}
+        if parent_sn != parent_order_sn(shop_index, local_index):
+            return {}
+        return parent_order_payload(self.scale, shop_index, local_index, self.shop_total(shop_index), self.products(shop_index))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": dict(self.calls), "total_calls": sum(self.calls.values()), "rate_limited": self.rate_limited}
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.rate_limited = 0
+        self._buckets.clear()
+
+
+def _to_proxy_response(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Temu 响应转换为代理服务器的响应格式"""
+    if not result.get("success"):
+        return {"success": False, "result": None, "error_code": str(result.get("errorCode")), "error_msg": result.get("errorMsg")}
+    return {"success": True, "result": result.get("result"), "error_code": None, "error_msg": None}
+
+
+def build_app(fake: FakeTemu) -> FastAPI:
+    app = FastAPI(title="Fake Temu API")
+
+    @app.post("/api/proxy")
+    async def proxy(request: Request):
+        body = await request.json()
+        result = await fake.call(body["api_type"], body.get("request_data") or {}, body.get("access_token"))
+        return _to_proxy_response(result)
+
+    @app.post("/api/proxy/batch")
+    async def proxy_batch(request: Request):
+        body = await request.json()
+        calls = body.get("calls", [])
+        semaphore = asyncio.Semaphore(int(body.get("concurrency") or 10))
+
+        async def run(index: int, call: Dict[str, Any]) -> bytes:
+            async with semaphore:
+                result = await fake.call(
+                    call["api_type"], call.get("request_data") or {}, call.get("access_token") or body.get("access_token")
+                )
+            return (json.dumps({"index": index, **_to_proxy_response(result)}, ensure_ascii=False) + "\n").encode("utf-8")
+
+        async def generate():
+            tasks = [asyncio.ensure_future(run(index, call)) for index, call in enumerate(calls)]
+            try:
+                for future in asyncio.as_completed(tasks):
+                    yield await future
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    @app.post("/openapi/router")
+    async def router(request: Request):
+        body = await request.json()
+        data = body.get("request") if isinstance(body.get("request"), dict) else body
+        return await fake.call(body.get("type", ""), data, body.get("access_token"))
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/__stats")
+    async def stats():
+        return fake.stats()
+
+    @app.post("/__reset")
+    async def reset():
+        fake.reset()
+        return fake.stats()
+
+    return app
+
+
+def run(port: int, scale: Scale, orders_per_shop: Optional[Dict[int, int]] = None, rate_limit: float = 20.0,
+        burst: int = 20, latency: float = 0.03) -> None:
+    """在当前进程中运行（基准测试在独立进程中调用，避免与被测代码争用GIL）"""
+    import uvicorn
+
+    fake = FakeTemu(scale, orders_per_shop, rate_limit=rate_limit, burst=burst, latency=latency)
+    uvicorn.run(build_app(fake), host="127.0.0.1", port=port, log_level="warning")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟 Temu API / 代理服务器")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--orders", type=int, default=100_000, help="父订单数（所有店铺合计，与 datagen 一致）")
+    parser.add_argument("--shops", type=int, default=5)
+    parser.add_argument("--products-per-shop", type=int, default=2_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--orders-per-shop", type=int, default=None, help="同步店铺（序号=店铺数）的订单数")
+    parser.add_argument("--rate-limit", type=float, default=20.0, help="每个 access_token 每秒调用次数，0表示不限流")
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=30.0, help="每次调用的延迟（毫秒）")
+    args = parser.parse_args()
+
+    scale = Scale(orders=args.orders, shops=args.shops, products_per_shop=args.products_per_shop,
+                  days=args.days, seed=args.seed)
+    orders_per_shop = {scale.sync_shop_index: args.orders_per_shop} if args.orders_per_shop else None
+    run(args.port, scale, orders_per_shop, args.rate_limit, args.burst, args.latency / 1000)
+
+
+if __name__ == "__main__":
+    main()
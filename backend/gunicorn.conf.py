@@ -0,0 +1,25 @@
+"""gunicorn 配置（命令行参数见 Dockerfile.prod）
+
+gunicorn 启动时自动加载工作目录下的本文件，这里只处理 Prometheus 多进程指标目录：
+- 启动时清空目录，避免上次运行残留的指标文件被汇总进来
+- worker 退出（包括 --max-requests 触发的重启）时清理该进程的 livesum 类指标
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
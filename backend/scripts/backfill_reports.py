@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""回填历史报表快照（日报，并由日报汇总周报/月报）"""
+import sys
+import argparse
+from datetime import date
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 加载环境变量
+try:
+    from dotenv import load_dotenv
+    env_path = project_root / '.env'
+    if env_path.exists():
+        load_dotenv(env_path)
+    else:
+        root_env = project_root.parent / '.env'
+        if root_env.exists():
+            load_dotenv(root_env)
+except ImportError:
+    pass
+
+from app.core.database import BatchSessionLocal
+from app.services.report_backfill_service import ReportBackfillService
+
+
+def backfill_reports(start_date: date, end_date: date, shop_ids=None, include_rollups: bool = True, resume: bool = True):
+    """回填报表快照"""
+    db = BatchSessionLocal()
+    try:
+        print("=" * 80)
+        print(f"回填报表快照: {start_date} 至 {end_date}")
+        print("=" * 80)
+        
+        result = ReportBackfillService(db).run(
+            start_date,
+            end_date,
+            shop_ids=shop_ids,
+            include_rollups=include_rollups,
+            resume=resume
+        )
+        
+        print(f"\n✅ 回填完成（任务ID: {result['job_id']}）")
+        if result.get('resumed_from'):
+            print(f"   从 {result['resumed_from']} 之后继续")
+        print(f"   店铺数: {result['shop_count']}")
+        print(f"   日报: {result['daily_saved']}")
+        print(f"   周报: {result['weekly_saved']}")
+        print(f"   月报: {result['monthly_saved']}")
+        print(f"   耗时: {result.get('elapsed_seconds')}秒")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="回填历史报表快照")
+    parser.add_argument(
+        "--start-date",
+        type=date.fromisoformat,
+        required=True,
+        help="开始日期 (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--end-date",
+        type=date.fromisoformat,
+        required=True,
+        help="结束日期 (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--shop-id",
+        type=int,
+        action="append",
+        dest="shop_ids",
+        help="店铺ID（可多次指定），默认所有启用的店铺"
+    )
+    parser.add_argument(
+        "--no-rollups",
+        action="store_true",
+        help="只回填日报，不生成周报/月报"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="忽略上次进度，从头开始"
+    )
+    
+    args = parser.parse_args()
+    backfill_reports(
+        args.start_date,
+        args.end_date,
+        shop_ids=args.shop_ids,
+        include_rollups=not args.no_rollups,
+        resume=not args.restart
+    )
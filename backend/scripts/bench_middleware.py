@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""中间件开销基准测试
+
+对比三种中间件配置下每个请求的额外开销（直接调用ASGI应用，不经过网络和HTTP客户端）：
+- none:   不加中间件（基线）
+- legacy: 原来的 Timeout/ExceptionHandler/RequestLogging 三个 BaseHTTPMiddleware
+- asgi:   纯ASGI的 RequestMiddleware
+
+同时测量流式响应（10个数据块，块间隔10ms）的首块到达时间，确认中间件不会缓冲流式响应。
+
+示例:
+    python scripts/bench_middleware.py --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from loguru import logger
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.middleware import RequestMetrics, RequestMiddleware
+
+
+# ---- 原来的三个 BaseHTTPMiddleware（按原实现的行为复刻，仅用于对比） ----
+
+class LegacyExceptionHandlerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            logger.error(f"未处理的异常: {e}")
+            return JSONResponse(status_code=500, content={"detail": "服务器内部错误"})
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        logger.info(
+            f"请求开始: {request.method} {request.url.path} - "
+            f"客户端: {request.client.host if request.client else 'unknown'}"
+        )
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.info(
+            f"请求完成: {request.method} {request.url.path} - "
+            f"状态码: {response.status_code} - 耗时: {process_time:.3f}秒"
+        )
+        response.headers["X-Process-Time"] = str(process_time)
+        return response
+
+
+class LegacyTimeoutMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, timeout: float = 300.0):
+        super().__init__(app)
+        self.timeout = timeout
+
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await asyncio.wait_for(call_next(request), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code=504, content={"detail": "请求处理超时"})
+
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        return {"id": item_id, "name": f"item-{item_id}"}
+
+    @app.get("/stream")
+    async def stream():
+        async def generate():
+            for i in range(10):
+                yield f"data: {i}\n\n"
+                await asyncio.sleep(0.01)
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    if mode == "legacy":
+        app.add_middleware(LegacyTimeoutMiddleware, timeout=300.0)
+        app.add_middleware(LegacyExceptionHandlerMiddleware)
+        app.add_middleware(LegacyRequestLoggingMiddleware)
+    elif mode == "asgi":
+        app.add_middleware(RequestMiddleware, timeout=300.0, log_sample_rate=0.01, metrics=RequestMetrics())
+    return app
+
+
+async def call(app, path: str) -> tuple:
+    """直接调用ASGI应用，返回 (状态码, 首个响应体数据块的到达时间, 数据块数)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    received = False
+    result = {"status": None, "first_body": None, "chunks": 0}
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and message.get("body"):
+            result["chunks"] += 1
+            if result["first_body"] is None:
+                result["first_body"] = time.perf_counter()
+
+    await app(scope, receive, send)
+    return result["status"], result["first_body"], result["chunks"]
+
+
+async def bench_requests(app, path: str, count: int) -> list:
+    # 预热（路由、依赖解析等首次开销）
+    for _ in range(50):
+        await call(app, path)
+    durations = []
+    for _ in range(count):
+        started = time.perf_counter()
+        await call(app, path)
+        durations.append((time.perf_counter() - started) * 1e6)
+    return durations
+
+
+async def bench_stream(app, rounds: int) -> dict:
+    first_chunk = []
+    chunks = 0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        _, first_body, chunks = await call(app, "/stream")
+        first_chunk.append((first_body - started) * 1000)
+    return {"first_chunk_ms": statistics.median(first_chunk), "chunks": chunks}
+
+
+async def main(args):
+    # 日志写入空输出，保留格式化开销但不刷屏
+    logger.remove()
+    logger.add(lambda message: None, level="INFO")
+
+    results = {}
+    for mode in ("none", "legacy", "asgi"):
+        app = build_app(mode)
+        results[mode] = {
+            "ping": await bench_requests(app, "/ping", args.requests),
+            "sync": await bench_requests(app, "/items/42", args.requests),
+            "stream": await bench_stream(app, args.stream_rounds),
+        }
+
+    print("=" * 80)
+    print(f"每请求耗时（微秒，{args.requests} 次请求；开销 = 相对无中间件的增加）")
+    print("=" * 80)
+    for endpoint, label in (("ping", "async 端点 /ping"), ("sync", "sync 端点 /items/{id}")):
+        base = statistics.median(results["none"][endpoint])
+        print(label)
+        for mode in ("none", "legacy", "asgi"):
+            samples = results[mode][endpoint]
+            median = statistics.median(samples)
+            p99 = sorted(samples)[int(len(samples) * 0.99)]
+            print(f"  {mode:<7} 中位数={median:8.1f}µs  P99={p99:8.1f}µs  开销={median - base:+8.1f}µs")
+
+    print("=" * 80)
+    print("流式响应（10个数据块，块间隔10ms）")
+    print("=" * 80)
+    for mode in ("none", "legacy", "asgi"):
+        stream = results[mode]["stream"]
+        print(f"  {mode:<7} 首块到达={stream['first_chunk_ms']:.2f}ms  数据块={stream['chunks']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="中间件每请求开销基准测试")
+    parser.add_argument("--requests", type=int, default=3000, help="每种配置每个端点的请求数")
+    parser.add_argument("--stream-rounds", type=int, default=20, help="流式响应测量轮数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""并发流式聊天探测：验证SSE输出在并发下不会因事件循环阻塞而卡顿
+
+同时发起若干个 /api/frog-gpt/chat/stream 请求（可同时发起数据摘要请求制造数据库负载），
+统计每个流的首块时间和最大块间隔，并读取 /api/system/event-loop 的事件循环延迟分布。
+
+示例:
+    python scripts/probe_sse_loop_lag.py --base-url http://localhost:8000 --token <JWT> --streams 8 --summary-load 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+async def run_stream(client: httpx.AsyncClient, index: int, message: str, model: str = None) -> dict:
+    """发起一个流式聊天请求，记录数据块到达间隔"""
+    payload = {
+        "messages": [{"role": "user", "content": message}],
+        "include_system_data": True,
+    }
+    if model:
+        payload["model"] = model
+
+    started = time.monotonic()
+    first_chunk = None
+    last_chunk = None
+    max_gap = 0.0
+    chunks = 0
+    error = None
+    async with client.stream("POST", "/api/frog-gpt/chat/stream", json=payload) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            now = time.monotonic()
+            if first_chunk is None:
+                first_chunk = now
+            elif last_chunk is not None:
+                max_gap = max(max_gap, now - last_chunk)
+            last_chunk = now
+            chunks += 1
+            try:
+                data = json.loads(line[6:])
+                if isinstance(data, dict) and data.get("type") == "error":
+                    error = data.get("error")
+            except ValueError:
+                pass
+
+    return {
+        "stream": index,
+        "chunks": chunks,
+        "first_chunk_ms": round((first_chunk - started) * 1000) if first_chunk else None,
+        "max_gap_ms": round(max_gap * 1000),
+        "total_ms": round((time.monotonic() - started) * 1000),
+        "error": error,
+    }
+
+
+async def run_summary_load(client: httpx.AsyncClient, rounds: int) -> int:
+    """重复请求数据摘要，制造数据库聚合负载"""
+    done = 0
+    for day_window in [None, 7, 30] * rounds:
+        params = {"days": day_window} if day_window else {}
+        await client.get("/api/frog-gpt/data-summary", params=params)
+        done += 1
+    return done
+
+
+async def main(args):
+    headers = {"Authorization": f"Bearer {args.token}"}
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=timeout) as client:
+        tasks = [
+            run_stream(client, i, args.message, args.model)
+            for i in range(args.streams)
+        ]
+        tasks += [run_summary_load(client, args.summary_rounds) for _ in range(args.summary_load)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        loop_status = (await client.get("/api/system/event-loop")).json()
+
+    print("=" * 80)
+    print("流式响应")
+    print("=" * 80)
+    for result in results[:args.streams]:
+        if isinstance(result, Exception):
+            print(f"  请求失败: {result}")
+        else:
+            print(
+                f"  #{result['stream']:<3} chunks={result['chunks']:<5} "
+                f"首块={result['first_chunk_ms']}ms  最大块间隔={result['max_gap_ms']}ms  "
+                f"总耗时={result['total_ms']}ms" + (f"  错误: {result['error']}" if result['error'] else "")
+            )
+
+    print("=" * 80)
+    print("事件循环延迟（服务端，最近统计窗口）")
+    print("=" * 80)
+    print(json.dumps(loop_status, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并发流式聊天探测事件循环延迟")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="后端地址")
+    parser.add_argument("--token", required=True, help="登录后的JWT访问令牌")
+    parser.add_argument("--streams", type=int, default=8, help="并发流式聊天数")
+    parser.add_argument("--summary-load", type=int, default=4, help="并发数据摘要请求的协程数")
+    parser.add_argument("--summary-rounds", type=int, default=5, help="每个协程的数据摘要请求轮数")
+    parser.add_argument("--message", default="请总结最近30天的运营情况和回款数据", help="聊天内容")
+    parser.add_argument("--model", default=None, help="模型名称（默认使用系统默认模型）")
+    parser.add_argument("--timeout", type=float, default=120.0, help="请求超时时间（秒）")
+    asyncio.run(main(parser.parse_args()))
@@ -9,7 +9,7 @@ from decimal import Decimal
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from app.core.database import SessionLocal
+from app.core.database import BatchSessionLocal
 from app.models.shop import Shop
 from app.models.order import Order
 from app.models.product import Product, ProductCost
@@ -23,7 +23,7 @@ def update_order_costs(shop_id: int = None):
     Args:
         shop_id: 店铺ID，如果为None则更新所有店铺的订单
     """
-    db = SessionLocal()
+    db = BatchSessionLocal()
     
     try:
         print("=" * 80)
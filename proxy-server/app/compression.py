@@ -0,0 +1,200 @@
+"""响应压缩中间件（gzip/zstd）
+
+订单列表等响应是较大的JSON，从代理返回后端要经过公网。按请求的 Accept-Encoding 协商压缩：
+- 优先 zstd（安装了 zstandard 时），其次 gzip
+- 小于阈值的完整响应不压缩（压缩收益抵不上开销）
+- 流式响应（如批量接口的 NDJSON）每个数据块压缩后立即刷新，不影响逐行返回
+- 统计压缩前后的字节数，用于评估带宽节省
+"""
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """服务端支持的压缩算法（按优先级）"""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str, supported: Tuple[str, ...]) -> Optional[str]:
+    """按 Accept-Encoding 选择压缩算法（q=0 表示不接受），多个可接受时按服务端优先级"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+    for encoding in supported:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionStats:
+    """压缩统计（压缩前字节数 / 实际发送字节数）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {编码: {responses, raw_bytes, sent_bytes}}，identity 表示未压缩
+        self._data: Dict[str, Dict[str, int]] = {}
+
+    def record(self, encoding: str, raw_bytes: int, sent_bytes: int, responses: int = 0) -> None:
+        with self._lock:
+            row = self._data.setdefault(encoding, {"responses": 0, "raw_bytes": 0, "sent_bytes": 0})
+            row["responses"] += responses
+            row["raw_bytes"] += raw_bytes
+            row["sent_bytes"] += sent_bytes
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            data = {encoding: dict(row) for encoding, row in self._data.items()}
+        raw = sum(row["raw_bytes"] for row in data.values())
+        sent = sum(row["sent_bytes"] for row in data.values())
+        return {
+            "raw_bytes": raw,
+            "sent_bytes": sent,
+            "saved_ratio": round(1 - sent / raw, 4) if raw else 0.0,
+            "by_encoding": data,
+        }
+
+
+class _Compressor:
+    """gzip/zstd 增量压缩"""
+
+    def __init__(self, encoding: str, gzip_level: int, zstd_level: int):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._zstd = zstandard.ZstdCompressor(level=zstd_level).compressobj()
+        else:
+            self._gzip = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        """压缩数据块；flush=True 时刷新输出，客户端可立即解出该数据块"""
+        if self.encoding == "zstd":
+            output = self._zstd.compress(data)
+            if flush:
+                output += self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            return output
+        output = self._gzip.compress(data)
+        if flush:
+            output += self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        return output
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "zstd":
+            return self._zstd.compress(data) + self._zstd.flush()
+        return self._gzip.compress(data) + self._gzip.flush()
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 协商的响应压缩（纯ASGI）"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+        stats: Optional[CompressionStats] = None
+    ):
+        """
+        Args:
+            app: 下游ASGI应用
+            minimum_size: 完整响应小于该字节数时不压缩（流式响应总是压缩）
+            gzip_level: gzip 压缩级别（1-9）
+            zstd_level: zstd 压缩级别
+            stats: 压缩统计
+        """
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        self.stats = stats or CompressionStats()
+        self.supported = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.supported)
+        if encoding is None:
+            await self.app(scope, receive, self._counting_send(send))
+            return
+
+        # 响应开始消息推迟到第一个数据块，由数据块大小决定是否压缩；压缩器为None表示不压缩
+        start: List[Optional[Message]] = [None]
+        compressor: List[Optional[_Compressor]] = [None]
+        decided = [False]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                start[0] = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if not decided[0]:
+                decided[0] = True
+                headers = MutableHeaders(raw=list(start[0]["headers"]))
+                # 已压缩的响应、或不需要压缩的小响应原样返回
+                if "content-encoding" in headers or (not more_body and len(body) < self.minimum_size):
+                    self.stats.record("identity", len(body), len(body), responses=1)
+                    await send(start[0])
+                    await send(message)
+                    return
+                compressor[0] = _Compressor(encoding, self.gzip_level, self.zstd_level)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    output = compressor[0].compress(body, flush=True)
+                else:
+                    output = compressor[0].finish(body)
+                    headers["Content-Length"] = str(len(output))
+                self.stats.record(encoding, len(body), len(output), responses=1)
+                await send({**start[0], "headers": headers.raw})
+                await send({"type": "http.response.body", "body": output, "more_body": more_body})
+                return
+
+            if compressor[0] is None:
+                self.stats.record("identity", len(body), len(body))
+                await send(message)
+                return
+            output = compressor[0].compress(body, flush=True) if more_body else compressor[0].finish(body)
+            self.stats.record(encoding, len(body), len(output))
+            await send({"type": "http.response.body", "body": output, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _counting_send(self, send: Send) -> Send:
+        """客户端不接受压缩时只统计字节数"""
+        first = [True]
+
+        async def wrapper(message: Message) -> None:
+            if message["type"] == "http.response.body":
+                size = len(message.get("body", b""))
+                self.stats.record("identity", size, size, responses=1 if first[0] else 0)
+                first[0] = False
+            await send(message)
+
+        return wrapper
@@ -1,15 +1,27 @@
-"""Temu API 代理服务器主应用"""
+"""Temu API 代理服务器主应用
+
+- 启动时创建长连接HTTP客户端（安装 h2 时使用HTTP/2），所有请求复用到Temu的连接，
+  不再每个请求重新握手TCP+TLS
+- 并发到达的相同查询请求（相同应用、令牌、接口和业务参数）合并为一次上游调用
+- /api/proxy/batch 一次接收多个调用，按 app_key 限流并发请求上游，
+  每个调用完成后立即以 NDJSON 行返回
+- 返回后端的响应按 Accept-Encoding 协商 gzip/zstd 压缩
+"""
+import asyncio
 import hashlib
 import json
 import time
 import os
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import httpx
 from loguru import logger
 from pydantic import BaseModel
 
+from app.compression import CompressionMiddleware, CompressionStats, available_encodings
+
 
 class ProxyRequest(BaseModel):
     """代理请求模型"""
@@ -22,6 +34,16 @@ class ProxyRequest(BaseModel):
     flat_params: Optional[bool] = False  # 是否将业务参数平铺在顶层
 
 
+class BatchProxyRequest(BaseModel):
+    """批量代理请求模型（调用中未提供的 app_key/app_secret/access_token/region 使用批量请求中的值）"""
+    calls: List[ProxyRequest]
+    app_key: Optional[str] = None
+    app_secret: Optional[str] = None
+    access_token: Optional[str] = None
+    region: Optional[str] = None
+    concurrency: Optional[int] = None  # 本批的上游并发数，默认 PROXY_BATCH_CONCURRENCY
+
+
 class ProxyResponse(BaseModel):
     """代理响应模型"""
     success: bool
@@ -46,6 +68,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩（gzip/zstd，按 Accept-Encoding 协商）：开关、最小压缩字节数、压缩级别
+COMPRESSION_ENABLED = os.getenv("PROXY_COMPRESSION", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("PROXY_COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("PROXY_GZIP_LEVEL", "6"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("PROXY_ZSTD_LEVEL", "3"))
+compression_stats = CompressionStats()
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=COMPRESSION_MIN_SIZE,
+        gzip_level=COMPRESSION_GZIP_LEVEL,
+        zstd_level=COMPRESSION_ZSTD_LEVEL,
+        stats=compression_stats
+    )
+
 # Temu API 基础 URL（根据区域选择）
 TEMU_API_BASE_URL_US = "https://openapi-b-us.temu.com/openapi/router"
 TEMU_API_BASE_URL_EU = "https://openapi-b-eu.temu.com/openapi/router"
@@ -56,6 +94,8 @@ DEFAULT_REGION = os.getenv("TEMU_API_REGION", "us").lower()
 
 def get_api_base_url(region: Optional[str] = None) -> str:
     """根据区域获取 API 基础 URL"""
+    if UPSTREAM_URL_OVERRIDE:
+        return UPSTREAM_URL_OVERRIDE
     region = (region or DEFAULT_REGION).lower()
     if region == "eu":
         return TEMU_API_BASE_URL_EU
@@ -68,6 +108,141 @@ def get_api_base_url(region: Optional[str] = None) -> str:
 DEFAULT_APP_KEY = os.getenv("TEMU_APP_KEY", "")
 DEFAULT_APP_SECRET = os.getenv("TEMU_APP_SECRET", "")
 
+# 上游连接池配置
+UPSTREAM_TIMEOUT = float(os.getenv("PROXY_UPSTREAM_TIMEOUT", "30"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("PROXY_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("PROXY_MAX_KEEPALIVE_CONNECTIONS", "50"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("PROXY_KEEPALIVE_EXPIRY", "60"))
+UPSTREAM_HTTP2 = os.getenv("PROXY_HTTP2", "true").lower() in ("1", "true", "yes")
+# 是否合并并发的相同查询请求
+COALESCE_ENABLED = os.getenv("PROXY_COALESCE", "true").lower() in ("1", "true", "yes")
+# 批量接口：每批最大调用数、默认上游并发数
+BATCH_MAX_CALLS = int(os.getenv("PROXY_BATCH_MAX_CALLS", "200"))
+BATCH_CONCURRENCY = int(os.getenv("PROXY_BATCH_CONCURRENCY", "10"))
+# 批量接口按 app_key 限流：每秒请求数（<=0 表示不限流）和突发容量
+APP_KEY_RATE_LIMIT = float(os.getenv("PROXY_APP_KEY_RATE_LIMIT", "20"))
+APP_KEY_BURST = int(os.getenv("PROXY_APP_KEY_BURST", "20"))
+# 覆盖上游地址（仅用于本地压测指向模拟的Temu服务；设置后忽略请求的 region）
+UPSTREAM_URL_OVERRIDE = os.getenv("PROXY_UPSTREAM_URL_OVERRIDE", "")
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 共享的上游HTTP客户端（启动时创建）
+_http_client: Optional[httpx.AsyncClient] = None
+# 正在进行的上游请求：{合并键: Future}
+_inflight: Dict[str, asyncio.Future] = {}
+# 上游调用统计
+_stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0, "batches": 0, "batch_calls": 0, "rate_limited_seconds": 0.0}
+
+
+class AppKeyRateLimiter:
+    """按 app_key 的令牌桶限流（单事件循环内使用，不需要加锁）"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        # {app_key: [当前令牌数, 上次补充时间]}
+        self._buckets: Dict[str, List[float]] = {}
+    
+    async def acquire(self, app_key: str) -> float:
+        """获取一个令牌，令牌不足时等待；返回等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            bucket = self._buckets.get(app_key)
+            if bucket is None:
+                bucket = self._buckets[app_key] = [float(self.burst), now]
+            bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return waited
+            delay = (1 - bucket[0]) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+app_key_limiter = AppKeyRateLimiter(APP_KEY_RATE_LIMIT, APP_KEY_BURST)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的上游HTTP客户端（未在启动时创建则立即创建）"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        http2 = UPSTREAM_HTTP2 and HTTP2_AVAILABLE
+        if UPSTREAM_HTTP2 and not HTTP2_AVAILABLE:
+            logger.warning("未安装 h2，上游连接使用 HTTP/1.1 长连接。启用HTTP/2请安装: pip install httpx[http2]")
+        _http_client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+            ),
+            headers={"Content-Type": "application/json"}
+        )
+    return _http_client
+
+
+def is_read_api(api_type: str) -> bool:
+    """是否为查询类接口（只有查询类接口的并发请求会被合并）"""
+    return any(part in ("get", "query", "list", "search") for part in api_type.lower().split("."))
+
+
+def coalesce_key(api_base_url: str, params: Dict[str, Any], app_secret: str) -> str:
+    """
+    合并键：上游地址 + 除时间戳外的全部参数 + 密钥摘要
+    
+    时间戳不同但其他参数相同的请求视为同一请求；密钥参与计算，
+    密钥错误的请求不会拿到其他请求的结果。
+    """
+    payload = {key: value for key, value in params.items() if key != "timestamp"}
+    raw = json.dumps([api_base_url, payload, app_secret], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def call_upstream(api_base_url: str, request_payload: Dict[str, Any]) -> Dict[str, Any]:
+    """发送请求到 Temu API（使用共享连接池），返回解析后的响应"""
+    _stats["upstream_calls"] += 1
+    response = await get_http_client().post(api_base_url, json=request_payload)
+    response.raise_for_status()
+    return response.json()
+
+
+def _release_inflight(key: str, future: asyncio.Future) -> None:
+    if _inflight.get(key) is future:
+        _inflight.pop(key, None)
+    # 所有等待方都已取消时避免 "exception was never retrieved" 警告
+    if not future.cancelled():
+        future.exception()
+
+
+async def call_upstream_coalesced(
+    key: Optional[str],
+    api_base_url: str,
+    request_payload: Dict[str, Any]
+) -> Dict[str, Any]:
+    """相同合并键的并发请求共享一次上游调用（只合并进行中的请求，不缓存结果）"""
+    if key is None:
+        return await call_upstream(api_base_url, request_payload)
+    
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(call_upstream(api_base_url, request_payload))
+        _inflight[key] = future
+        future.add_done_callback(lambda f: _release_inflight(key, f))
+    else:
+        _stats["coalesced"] += 1
+    # 单个客户端断开不会取消其他请求共享的上游调用
+    return await asyncio.shield(future)
+
 
 def generate_sign(app_secret: str, params: Dict[str, Any]) -> str:
     """
@@ -101,6 +276,95 @@ def generate_sign(app_secret: str, params: Dict[str, Any]) -> str:
     return sign
 
 
+def build_upstream_request(request: ProxyRequest) -> Tuple[str, str, Dict[str, Any], Optional[str]]:
+    """
+    构建上游请求：确定应用凭证、组装参数并签名
+    
+    Returns:
+        (app_key, API地址, 签名后的请求体, 合并键)；非查询类接口或关闭合并时合并键为 None
+    """
+    # 确定使用的 app_key 和 app_secret
+    # 优先使用客户端提供的，否则使用环境变量中的默认值
+    app_key = request.app_key or DEFAULT_APP_KEY
+    app_secret = request.app_secret or DEFAULT_APP_SECRET
+    
+    if not app_key or not app_secret:
+        raise HTTPException(
+            status_code=400,
+            detail="缺少 app_key 或 app_secret。请在请求中提供，或在代理服务器环境变量中配置 TEMU_APP_KEY 和 TEMU_APP_SECRET"
+        )
+    
+    # 构建通用参数
+    timestamp = int(time.time())
+    common_params = {
+        "app_key": app_key,
+        "data_type": "JSON",
+        "timestamp": timestamp,
+        "type": request.api_type,
+        "version": "V1"
+    }
+    
+    # 添加 access_token（如果提供）
+    if request.access_token:
+        common_params["access_token"] = request.access_token
+    
+    # 合并所有参数
+    all_params = {**common_params}
+    if request.request_data:
+        # 根据官方文档，某些API的参数应该直接放在顶层，而不是在request对象中
+        # 例如：bg.order.detail.v2.get 和 bg.order.list.v2.get 的参数应该直接放在顶层
+        # 检查是否是这些特殊API，或者客户端明确指定了 flat_params=True
+        apis_with_top_level_params = [
+            "bg.order.detail.v2.get",
+            "bg.order.list.v2.get",
+            "bg.order.shippinginfo.v2.get",  # 地址查询API也需要顶层参数
+            # 可以在这里添加其他需要顶层参数的API
+        ]
+        
+        # 如果客户端指定了 flat_params=True，或者API在列表中，则将参数放在顶层
+        if request.flat_params or request.api_type in apis_with_top_level_params:
+            # 对于这些API，将参数直接放在顶层
+            all_params.update(request.request_data)
+        else:
+            # 其他API，业务参数放在 request 字段中
+            all_params["request"] = request.request_data
+    
+    # 生成签名
+    sign = generate_sign(app_secret, all_params)
+    
+    # 最终请求体
+    request_payload = {**all_params, "sign": sign}
+    
+    # 确定使用的 API URL（根据区域）
+    api_base_url = get_api_base_url(request.region)
+    
+    key = None
+    if COALESCE_ENABLED and is_read_api(request.api_type):
+        key = coalesce_key(api_base_url, all_params, app_secret)
+    return app_key, api_base_url, request_payload, key
+
+
+def to_proxy_response(api_type: str, result: Dict[str, Any]) -> ProxyResponse:
+    """将 Temu API 响应转换为代理响应（业务错误转换为 error_code/error_msg）"""
+    if not result.get("success", False):
+        error_code = result.get("errorCode", "未知")
+        error_msg = result.get("errorMsg", "未知错误")
+        # 将 error_code 转换为字符串（如果它是数字）
+        if isinstance(error_code, (int, float)):
+            error_code = str(error_code)
+        logger.error(f"Temu API 错误: {api_type} [{error_code}] {error_msg}")
+        return ProxyResponse(
+            success=False,
+            error_code=error_code,
+            error_msg=error_msg
+        )
+    
+    return ProxyResponse(
+        success=True,
+        result=result.get("result", {})
+    )
+
+
 @app.post("/api/proxy", response_model=ProxyResponse)
 async def proxy_request(request: ProxyRequest):
     """
@@ -113,98 +377,23 @@ async def proxy_request(request: ProxyRequest):
     2. 客户端只提供 access_token，app_key/app_secret 从代理服务器环境变量读取（推荐，简化客户端调用）
     """
     try:
-        # 确定使用的 app_key 和 app_secret
-        # 优先使用客户端提供的，否则使用环境变量中的默认值
-        app_key = request.app_key or DEFAULT_APP_KEY
-        app_secret = request.app_secret or DEFAULT_APP_SECRET
-        
-        if not app_key or not app_secret:
-            raise HTTPException(
-                status_code=400,
-                detail="缺少 app_key 或 app_secret。请在请求中提供，或在代理服务器环境变量中配置 TEMU_APP_KEY 和 TEMU_APP_SECRET"
-            )
-        
-        # 构建通用参数
-        timestamp = int(time.time())
-        common_params = {
-            "app_key": app_key,
-            "data_type": "JSON",
-            "timestamp": timestamp,
-            "type": request.api_type,
-            "version": "V1"
-        }
-        
-        # 添加 access_token（如果提供）
-        if request.access_token:
-            common_params["access_token"] = request.access_token
-        
-        # 合并所有参数
-        all_params = {**common_params}
-        if request.request_data:
-            # 根据官方文档，某些API的参数应该直接放在顶层，而不是在request对象中
-            # 例如：bg.order.detail.v2.get 和 bg.order.list.v2.get 的参数应该直接放在顶层
-            # 检查是否是这些特殊API，或者客户端明确指定了 flat_params=True
-            apis_with_top_level_params = [
-                "bg.order.detail.v2.get",
-                "bg.order.list.v2.get",
-                "bg.order.shippinginfo.v2.get",  # 地址查询API也需要顶层参数
-                # 可以在这里添加其他需要顶层参数的API
-            ]
-            
-            # 如果客户端指定了 flat_params=True，或者API在列表中，则将参数放在顶层
-            if request.flat_params or request.api_type in apis_with_top_level_params:
-                # 对于这些API，将参数直接放在顶层
-                all_params.update(request.request_data)
-            else:
-                # 其他API，业务参数放在 request 字段中
-                all_params["request"] = request.request_data
-        
-        # 生成签名
-        sign = generate_sign(app_secret, all_params)
-        
-        # 最终请求体
-        request_payload = {**all_params, "sign": sign}
+        _, api_base_url, request_payload, key = build_upstream_request(request)
         
         logger.info(f"代理请求: {request.api_type}")
         logger.debug(f"请求参数: {json.dumps(request_payload, ensure_ascii=False, indent=2)}")
-        
-        # 确定使用的 API URL（根据区域）
-        api_base_url = get_api_base_url(request.region)
         logger.info(f"使用 API URL: {api_base_url} (区域: {request.region or DEFAULT_REGION})")
         
-        # 发送 POST 请求到 Temu API
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            headers = {"Content-Type": "application/json"}
-            response = await client.post(
-                api_base_url,
-                headers=headers,
-                json=request_payload
-            )
-            
-            response.raise_for_status()
-            result = response.json()
-            
-            logger.info(f"代理响应: {request.api_type} - 成功: {result.get('success', False)}")
-            
-            # 检查业务错误
-            if not result.get("success", False):
-                error_code = result.get("errorCode", "未知")
-                error_msg = result.get("errorMsg", "未知错误")
-                # 将 error_code 转换为字符串（如果它是数字）
-                if isinstance(error_code, (int, float)):
-                    error_code = str(error_code)
-                logger.error(f"Temu API 错误: [{error_code}] {error_msg}")
-                return ProxyResponse(
-                    success=False,
-                    error_code=error_code,
-                    error_msg=error_msg
-                )
-            
-            return ProxyResponse(
-                success=True,
-                result=result.get("result", {})
-            )
+        # 发送 POST 请求到 Temu API（共享连接池；并发的相同查询请求合并为一次调用）
+        _stats["requests"] += 1
+        result = await call_upstream_coalesced(key, api_base_url, request_payload)
+        
+        logger.info(f"代理响应: {request.api_type} - 成功: {result.get('success', False)}")
+        
+        # 检查业务错误
+        return to_proxy_response(request.api_type, result)
             
+    except HTTPException:
+        raise
     except httpx.HTTPError as e:
         logger.error(f"HTTP 错误: {e}")
         raise HTTPException(
@@ -219,6 +408,82 @@ async def proxy_request(request: ProxyRequest):
         )
 
 
+async def run_batch_call(request: ProxyRequest) -> Dict[str, Any]:
+    """
+    执行批量请求中的单个调用（先按 app_key 限流），错误转换为失败结果而不是异常
+    
+    上游网络错误返回 error_code "502"，客户端可据此单独重试该调用
+    """
+    try:
+        app_key, api_base_url, request_payload, key = build_upstream_request(request)
+        # 会合并到进行中请求的调用不产生上游请求，不消耗令牌
+        if key is None or key not in _inflight:
+            _stats["rate_limited_seconds"] += await app_key_limiter.acquire(app_key)
+        result = await call_upstream_coalesced(key, api_base_url, request_payload)
+        return to_proxy_response(request.api_type, result).model_dump()
+    except HTTPException as e:
+        return ProxyResponse(success=False, error_code=str(e.status_code), error_msg=str(e.detail)).model_dump()
+    except httpx.HTTPError as e:
+        logger.error(f"批量调用 HTTP 错误: {request.api_type} - {e}")
+        return ProxyResponse(success=False, error_code="502", error_msg=f"代理请求失败: {str(e)}").model_dump()
+    except Exception as e:
+        logger.error(f"批量调用异常: {request.api_type} - {e}")
+        return ProxyResponse(success=False, error_code="500", error_msg=f"代理请求异常: {str(e)}").model_dump()
+
+
+async def iter_batch_results(calls: List[ProxyRequest], concurrency: int) -> AsyncIterator[bytes]:
+    """并发执行批量调用，按完成顺序逐行输出 NDJSON"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run(index: int, call: ProxyRequest) -> Dict[str, Any]:
+        async with semaphore:
+            return {"index": index, **(await run_batch_call(call))}
+    
+    tasks = [asyncio.ensure_future(run(index, call)) for index, call in enumerate(calls)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            yield (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8")
+    finally:
+        # 客户端断开时取消尚未完成的调用
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/api/proxy/batch")
+async def proxy_batch(request: BatchProxyRequest):
+    """
+    批量代理 Temu API 请求
+    
+    一次请求携带多个调用，代理按 app_key 限流并发请求上游，每个调用完成后立即返回一行 JSON（NDJSON）：
+    {"index": 调用序号, "success": ..., "result": ..., "error_code": ..., "error_msg": ...}
+    
+    结果按完成顺序返回，客户端按 index 对应到调用。
+    """
+    if not request.calls:
+        raise HTTPException(status_code=400, detail="calls 不能为空")
+    if len(request.calls) > BATCH_MAX_CALLS:
+        raise HTTPException(status_code=400, detail=f"单批最多 {BATCH_MAX_CALLS} 个调用，实际 {len(request.calls)} 个")
+    
+    calls = [
+        call.model_copy(update={
+            "app_key": call.app_key or request.app_key,
+            "app_secret": call.app_secret or request.app_secret,
+            "access_token": call.access_token or request.access_token,
+            "region": call.region or request.region,
+        })
+        for call in request.calls
+    ]
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY, len(calls)))
+    
+    _stats["batches"] += 1
+    _stats["batch_calls"] += len(calls)
+    _stats["requests"] += len(calls)
+    logger.info(f"批量代理请求: {len(calls)} 个调用, 并发 {concurrency}")
+    
+    return StreamingResponse(iter_batch_results(calls, concurrency), media_type="application/x-ndjson")
+
+
 @app.get("/")
 def root():
     """根路径"""
@@ -236,17 +501,46 @@ def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/stats")
+async def proxy_stats():
+    """代理统计：请求数、上游调用数、合并的请求数、批量请求数、限流等待时间、进行中的上游请求数、压缩前后字节数"""
+    return {
+        **_stats,
+        "inflight": len(_inflight),
+        "http2": UPSTREAM_HTTP2 and HTTP2_AVAILABLE,
+        "coalesce_enabled": COALESCE_ENABLED,
+        "app_key_rate_limit": APP_KEY_RATE_LIMIT,
+        "compression": {
+            "enabled": COMPRESSION_ENABLED,
+            "encodings": list(available_encodings()),
+            "min_size": COMPRESSION_MIN_SIZE,
+            **compression_stats.snapshot(),
+        },
+    }
+
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动事件"""
     logger.info("Temu API 代理服务器启动中...")
-    logger.info(f"Temu API 基础 URL: {TEMU_API_BASE_URL}")
+    logger.info(f"Temu API 基础 URL: {get_api_base_url()}")
+    get_http_client()
+    logger.info(
+        f"上游连接池: HTTP/2={'是' if UPSTREAM_HTTP2 and HTTP2_AVAILABLE else '否'}, "
+        f"最大连接数={UPSTREAM_MAX_CONNECTIONS}, 请求合并={'开启' if COALESCE_ENABLED else '关闭'}"
+    )
+    logger.info(
+        f"响应压缩: {'/'.join(available_encodings()) if COMPRESSION_ENABLED else '关闭'}, "
+        f"最小压缩字节数={COMPRESSION_MIN_SIZE}"
+    )
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """应用关闭事件"""
     logger.info("Temu API 代理服务器关闭中...")
+    if _http_client is not None:
+        await _http_client.aclose()
 
 
 if __name__ == "__main__":
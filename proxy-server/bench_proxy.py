@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""代理服务器本地压测（模拟 Temu API）
+
+在本机启动模拟的 Temu API（固定延迟）和代理服务器（各自独立进程），以指定并发发送代理请求，
+统计吞吐量、延迟分布、上游调用次数（请求合并）和上游TCP连接数（连接复用）。
+
+示例:
+    python bench_proxy.py --requests 2000 --concurrency 50 --pages 20
+    python bench_proxy.py --legacy            # 对比：每个请求新建HTTP客户端（旧实现）
+    python bench_proxy.py --no-coalesce       # 对比：关闭请求合并
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_fake_temu(latency: float) -> FastAPI:
+    """模拟 Temu API：固定延迟后返回订单列表，记录请求数和来源连接"""
+    fake = FastAPI()
+    fake.state.calls = 0
+    fake.state.connections = set()
+
+    @fake.get("/__stats")
+    async def stats():
+        return {"calls": fake.state.calls, "connections": len(fake.state.connections)}
+
+    @fake.post("/openapi/router")
+    async def router(request: Request):
+        fake.state.calls += 1
+        fake.state.connections.add(request.client)
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        page = payload.get("pageNumber", 1)
+        return {
+            "success": True,
+            "result": {
+                "totalItemNum": 1000,
+                "pageItems": [{"parentOrderMap": {"parentOrderSn": f"PO-{page}-{i}"}} for i in range(50)],
+            },
+        }
+
+    return fake
+
+
+def run_fake_temu(port: int, latency: float) -> None:
+    """模拟 Temu API 在独立进程中运行，避免与代理争用GIL"""
+    uvicorn.run(build_fake_temu(latency), host="127.0.0.1", port=port, log_level="warning")
+
+
+def run_proxy(port: int, legacy: bool) -> None:
+    """代理服务器在独立进程中运行"""
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import main as proxy_main
+    if legacy:
+        patch_legacy(proxy_main)
+    uvicorn.run(proxy_main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def wait_for_port(port: int) -> None:
+    while True:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+
+def patch_legacy(proxy_main) -> None:
+    """旧实现：每个请求新建 httpx.AsyncClient"""
+    async def call_upstream(api_base_url, request_payload):
+        proxy_main._stats["upstream_calls"] += 1
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.post(api_base_url, headers={"Content-Type": "application/json"}, json=request_payload)
+            response.raise_for_status()
+            return response.json()
+
+    proxy_main.call_upstream = call_upstream
+
+
+async def run_load(proxy_url: str, total: int, concurrency: int, pages: int) -> list:
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async with httpx.AsyncClient(
+        base_url=proxy_url,
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    ) as client:
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                payload = {
+                    "api_type": "bg.order.list.v2.get",
+                    "access_token": "bench-token",
+                    "request_data": {"pageNumber": i % pages + 1, "pageSize": 50},
+                }
+                started = time.perf_counter()
+                response = await client.post("/api/proxy", json=payload)
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.text
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return latencies
+
+
+def main(args):
+    fake_port, proxy_port = free_port(), free_port()
+    os.environ["PROXY_UPSTREAM_URL_OVERRIDE"] = f"http://127.0.0.1:{fake_port}/openapi/router"
+    os.environ.setdefault("TEMU_APP_KEY", "bench-key")
+    os.environ.setdefault("TEMU_APP_SECRET", "bench-secret")
+    os.environ["PROXY_COALESCE"] = "false" if args.no_coalesce else "true"
+
+    fake = multiprocessing.Process(target=run_fake_temu, args=(fake_port, args.upstream_latency / 1000), daemon=True)
+    proxy = multiprocessing.Process(target=run_proxy, args=(proxy_port, args.legacy), daemon=True)
+    fake.start()
+    proxy.start()
+    wait_for_port(fake_port)
+    wait_for_port(proxy_port)
+
+    started = time.perf_counter()
+    latencies = asyncio.run(run_load(f"http://127.0.0.1:{proxy_port}", args.requests, args.concurrency, args.pages))
+    elapsed = time.perf_counter() - started
+
+    upstream = httpx.get(f"http://127.0.0.1:{fake_port}/__stats").json()
+    proxy_stats = httpx.get(f"http://127.0.0.1:{proxy_port}/stats").json()
+    proxy.terminate()
+    fake.terminate()
+
+    ordered = sorted(latencies)
+    mode = "legacy（每请求新建客户端）" if args.legacy else "pooled（共享连接池）"
+    print("=" * 70)
+    print(f"模式: {mode}, 请求合并: {'关闭' if args.no_coalesce else '开启'}")
+    print(f"请求数: {args.requests}, 并发: {args.concurrency}, 不同页数: {args.pages}, 上游延迟: {args.upstream_latency}ms")
+    print("=" * 70)
+    print(f"吞吐量:     {args.requests / elapsed:8.1f} req/s")
+    print(f"延迟 P50:   {statistics.median(ordered):8.1f} ms")
+    print(f"延迟 P99:   {ordered[int(len(ordered) * 0.99)]:8.1f} ms")
+    print(f"上游调用:   {upstream['calls']:8d}  (合并 {proxy_stats['coalesced']} 个请求)")
+    print(f"上游连接:   {upstream['connections']:8d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="代理服务器本地压测（模拟 Temu API）")
+    parser.add_argument("--requests", type=int, default=2000, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数")
+    parser.add_argument("--pages", type=int, default=20, help="不同的请求数（页码），越少合并越多")
+    parser.add_argument("--upstream-latency", type=float, default=50.0, help="模拟Temu API的延迟（毫秒）")
+    parser.add_argument("--legacy", action="store_true", help="使用旧实现：每个请求新建HTTP客户端")
+    parser.add_argument("--no-coalesce", action="store_true", help="关闭请求合并")
+    main(parser.parse_args())